@@ -10,6 +10,12 @@ import admin_panel
 from config import Config
 import template_handler
 import smart_rules
+import backfill
+import broadcaster
+import scheduler
+import stage_metrics
+import stats_timeseries
+import channel_pipelines
 from models import db, SmartRule, User
 from main import app
 
@@ -56,6 +62,9 @@ def get_admin_stats_markup():
         types.InlineKeyboardButton("♻️ إعادة تعيين الإحصائيات", callback_data="admin_reset_stats"),
         types.InlineKeyboardButton("📊 إحصائيات مفصلة", callback_data="admin_detailed_stats")
     )
+    markup.add(
+        types.InlineKeyboardButton("📅 التقرير اليومي", callback_data="admin_daily_report")
+    )
     markup.add(
         types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_panel")
     )
@@ -317,11 +326,69 @@ def get_admin_broadcast_menu_markup():
     markup.add(
         types.InlineKeyboardButton("🎯 تحديد فئة محددة", callback_data="admin_target_broadcast")
     )
+    markup.add(
+        types.InlineKeyboardButton("📊 حالة البث", callback_data="admin_broadcast_status")
+    )
     markup.add(
         types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_panel")
     )
     return markup
 
+BROADCAST_STATE_LABELS = {
+    'running': "🟢 قيد الإرسال",
+    'paused': "⏸️ متوقف مؤقتاً",
+    'completed': "✅ مكتمل",
+    'cancelled': "⛔ ملغى"
+}
+
+def get_broadcast_status_message(requested_states=None):
+    """
+    إنشاء رسالة حالة آخر البث الجماعي مع أزرار التحكم
+
+    Args:
+        requested_states: الحالات التي طلبها المشرف للتو {معرف البث: الحالة}
+            (يحفظ العامل حالة الإيقاف بعد إنهاء الرسائل الجارية)
+
+    Returns:
+        tuple: (نص الرسالة، الأزرار)
+    """
+    requested_states = requested_states or {}
+    broadcasts = broadcaster.list_broadcasts(limit=5)
+    markup = types.InlineKeyboardMarkup(row_width=3)
+    if not broadcasts:
+        markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_broadcast_menu"))
+        return "📊 *حالة البث الجماعي*\n\nلا يوجد بث جماعي حتى الآن.", markup
+
+    status_text = "📊 *حالة البث الجماعي*\n\n"
+    for broadcast in broadcasts:
+        broadcast_id = broadcast['id']
+        state = requested_states.get(broadcast_id, broadcast['state'])
+        preview = (broadcast['text'] or "")[:30]
+        status_text += (
+            f"*#{broadcast_id}* {BROADCAST_STATE_LABELS.get(state, state)}\n"
+            f"`{preview}`\n"
+            f"التقدم: {broadcast['done']}/{broadcast['total']} ({broadcast['percent']}%)\n"
+            f"✅ {broadcast['sent_count']} | ❌ {broadcast['failed_count']} | "
+            f"🚫 {broadcast['blocked_count']} | ⏭️ {broadcast['skipped_count']}\n"
+            f"المعدل: {broadcast['rate_per_second']} رسالة/ثانية\n\n"
+        )
+        if state == 'running':
+            markup.add(
+                types.InlineKeyboardButton(f"⏸️ إيقاف #{broadcast_id}", callback_data=f"admin_broadcast_pause_{broadcast_id}"),
+                types.InlineKeyboardButton(f"⛔ إلغاء #{broadcast_id}", callback_data=f"admin_broadcast_stop_{broadcast_id}")
+            )
+        elif state == 'paused':
+            markup.add(
+                types.InlineKeyboardButton(f"▶️ استكمال #{broadcast_id}", callback_data=f"admin_broadcast_resume_{broadcast_id}"),
+                types.InlineKeyboardButton(f"⛔ إلغاء #{broadcast_id}", callback_data=f"admin_broadcast_stop_{broadcast_id}")
+            )
+
+    markup.add(
+        types.InlineKeyboardButton("🔄 تحديث", callback_data="admin_broadcast_status"),
+        types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_broadcast_menu")
+    )
+    return status_text, markup
+
 def get_admin_notifications_markup():
     """إنشاء أزرار صفحة إدارة الإشعارات"""
     markup = types.InlineKeyboardMarkup(row_width=2)
@@ -507,6 +574,14 @@ def get_admin_auto_processing_markup():
             callback_data="admin_tag_footer")
     )
     
+    markup.add(
+        types.InlineKeyboardButton(f"🔀 مسارات القنوات ({len(channel_pipelines.get_pipelines())})", 
+            callback_data="admin_pipelines")
+    )
+    markup.add(
+        types.InlineKeyboardButton("📥 معالجة المنشورات السابقة", 
+            callback_data="admin_backfill")
+    )
     markup.add(
         types.InlineKeyboardButton("⚙️ إعدادات متقدمة", 
             callback_data="admin_auto_proc_settings")
@@ -516,6 +591,81 @@ def get_admin_auto_processing_markup():
             callback_data="admin_panel")
     )
     return markup
+
+def get_auto_processing_message():
+    """إنشاء رسالة صفحة التعديل التلقائي مع نسبة الملفات التي تم تخطي تنزيلها"""
+    message = "🤖 *التعديل التلقائي للقنوات*\n\n"
+    
+    checked = admin_panel.admin_data['statistics'].get('precheck_checked', 0)
+    skipped = admin_panel.admin_data['statistics'].get('precheck_skipped', 0)
+    if checked:
+        message += f"⏭️ ملفات لم تحتج إلى تنزيل: {skipped} من {checked} ({skipped * 100 / checked:.1f}%)\n\n"
+    
+    message += "اختر إحدى الوظائف التالية:"
+    return message
+
+def get_admin_pipelines_markup():
+    """إنشاء أزرار صفحة مسارات القنوات"""
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    for pipeline in channel_pipelines.get_pipelines().values():
+        if pipeline['id'] == channel_pipelines.DEFAULT_PIPELINE_ID:
+            # المسار الافتراضي يدار من إعدادات قناة المصدر والهدف
+            continue
+        enabled = pipeline.get('enabled', True)
+        markup.add(
+            types.InlineKeyboardButton(f"{'⏸️' if enabled else '▶️'} {pipeline.get('name', pipeline['id'])}",
+                callback_data=f"admin_pipeline_toggle_{pipeline['id']}"),
+            types.InlineKeyboardButton("🗑️ حذف", callback_data=f"admin_pipeline_remove_{pipeline['id']}")
+        )
+    markup.add(types.InlineKeyboardButton("➕ إضافة مسار", callback_data="admin_pipeline_add"))
+    markup.add(types.InlineKeyboardButton("🔄 تحديث", callback_data="admin_pipelines"))
+    markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_auto_processing"))
+    return markup
+
+def get_pipelines_message():
+    """إنشاء رسالة حالة مسارات القنوات"""
+    pipelines = channel_pipelines.get_pipeline_stats()
+    message = "🔀 *مسارات القنوات*\n\n"
+    if not pipelines:
+        return message + "لا توجد مسارات حالياً. أضف مساراً أو عيّن قناة المصدر."
+    
+    for pipeline in pipelines:
+        status = "✅" if pipeline['enabled'] else "⏸️"
+        targets = ", ".join(pipeline['target_channels']) or "لا يوجد"
+        message += f"{status} *{pipeline['name']}* (`{pipeline['id']}`)\n"
+        message += f"   📡 المصدر: `{pipeline['source_channel']}`\n"
+        message += f"   🎯 الهدف: {targets}\n"
+        message += f"   👷 العمال: {pipeline['workers']} | ⏳ قيد المعالجة: {pipeline['inflight']}\n\n"
+    return message
+
+def get_admin_backfill_markup():
+    """إنشاء أزرار صفحة المعالجة الرجعية لمنشورات القناة"""
+    job = backfill.get_current_job()
+    running = job is not None and job.is_running()
+    
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    if running:
+        markup.add(types.InlineKeyboardButton("⏸️ إيقاف المعالجة", callback_data="admin_backfill_stop"))
+    else:
+        if job is not None and (job.status in ('running', 'stopped') or job.failed_ids):
+            markup.add(types.InlineKeyboardButton("▶️ استكمال المعالجة", callback_data="admin_backfill_resume"))
+        markup.add(types.InlineKeyboardButton("🆕 بدء معالجة نطاق جديد", callback_data="admin_backfill_start"))
+    markup.add(types.InlineKeyboardButton("🔄 تحديث", callback_data="admin_backfill"))
+    markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_auto_processing"))
+    return markup
+
+def get_backfill_pipelines():
+    """الحصول على مسارات القنوات التي لها قناة مصدر (يمكن معالجة منشوراتها السابقة)"""
+    return [pipeline for pipeline in channel_pipelines.get_pipelines().values() if pipeline.get('source_channel')]
+
+def get_admin_backfill_pipelines_markup(pipelines):
+    """إنشاء أزرار اختيار مسار المعالجة الرجعية"""
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    for pipeline in pipelines:
+        label = f"🔀 {pipeline.get('name') or pipeline['id']} ({pipeline['source_channel']})"
+        markup.add(types.InlineKeyboardButton(label, callback_data=f"admin_backfill_pipeline_{pipeline['id']}"))
+    markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_backfill"))
+    return markup
     
 def get_admin_smart_rules_markup():
     """إنشاء أزرار صفحة القواعد الذكية"""
@@ -554,6 +704,12 @@ def get_admin_smart_rules_markup():
             callback_data="admin_smart_rules_stats")
     )
     
+    # نشاط القواعد (العدادات)
+    markup.add(
+        types.InlineKeyboardButton("🔥 نشاط القواعد", 
+            callback_data="admin_smart_rules_activity")
+    )
+    
     # تجربة القواعد
     markup.add(
         types.InlineKeyboardButton("🧪 تجربة القواعد الذكية على نص", 
@@ -568,6 +724,42 @@ def get_admin_smart_rules_markup():
     
     return markup
 
+def get_smart_rules_activity_message(limit: int = 5) -> str:
+    """إنشاء رسالة نشاط القواعد الذكية (الأكثر تطبيقاً، التي لم تتحقق أبداً، والأعلى تكلفة)"""
+    stats = smart_rules.get_rule_activity()
+    if not stats:
+        return "🔥 *نشاط القواعد الذكية*\n\nلا توجد قواعد ذكية."
+    
+    def rule_label(rule):
+        name = ''.join(ch for ch in rule['name'] if ch not in '*_`[')
+        return f"#{rule['id']} {name}"
+    
+    text = "🔥 *نشاط القواعد الذكية*\n\n"
+    
+    hot_rules = sorted((rule for rule in stats if rule['matches']), key=lambda rule: -rule['matches'])[:limit]
+    text += "*الأكثر تطبيقاً:*\n"
+    if hot_rules:
+        for rule in hot_rules:
+            text += (f"• {rule_label(rule)}: {rule['matches']} مطابقة، "
+                     f"{rule['actions_applied']} تعديل من {rule['evaluations']} تقييم\n")
+    else:
+        text += "• لا توجد مطابقات بعد\n"
+    
+    dead_rules = [rule for rule in stats if rule['is_active'] and not rule['matches']]
+    text += f"\n*قواعد نشطة لم تتحقق أبداً ({len(dead_rules)}):*\n"
+    for rule in dead_rules[:limit]:
+        text += f"• {rule_label(rule)} ({rule['evaluations']} تقييم)\n"
+    if len(dead_rules) > limit:
+        text += f"• ... و{len(dead_rules) - limit} قاعدة أخرى\n"
+    
+    costly_rules = sorted((rule for rule in stats if rule['evaluations']), key=lambda rule: -rule['total_ms'])[:limit]
+    if costly_rules:
+        text += "\n*الأعلى تكلفة:*\n"
+        for rule in costly_rules:
+            text += f"• {rule_label(rule)}: {rule['total_ms']} مللي ثانية (متوسط {rule['mean_us']} ميكرو ثانية)\n"
+    
+    return text
+
 def get_admin_image_watermark_markup():
     """إنشاء أزرار صفحة العلامة المائية للصور"""
     watermark_enabled = admin_panel.get_setting("image_watermark.enabled", False)
@@ -822,6 +1014,7 @@ def get_admin_auto_proc_settings_markup():
     keep_caption = admin_panel.get_setting("auto_processing.keep_caption", True)
     auto_publish = admin_panel.get_setting("auto_processing.auto_publish", True)
     remove_links = admin_panel.get_setting("auto_processing.remove_links", False)
+    edit_in_place = admin_panel.get_setting("auto_processing.edit_in_place", False)
     
     markup = types.InlineKeyboardMarkup(row_width=1)
     markup.add(
@@ -836,6 +1029,10 @@ def get_admin_auto_proc_settings_markup():
         types.InlineKeyboardButton(f"{'✅' if remove_links else '❌'} حذف الروابط من الوسوم تلقائياً", 
             callback_data="admin_toggle_remove_links")
     )
+    markup.add(
+        types.InlineKeyboardButton(f"{'✅' if edit_in_place else '❌'} تعديل الملف داخل المنشور الأصلي", 
+            callback_data="admin_toggle_edit_in_place")
+    )
     
     # إدارة الوسوم المفعلة
     markup.add(types.InlineKeyboardButton("🏷️ إدارة الوسوم المفعلة", callback_data="admin_enabled_tags"))
@@ -926,6 +1123,9 @@ def get_admin_broadcast_menu_markup():
     markup.add(
         types.InlineKeyboardButton(f"📅 الرسائل المجدولة ({pending_count})", callback_data="admin_view_scheduled")
     )
+    markup.add(
+        types.InlineKeyboardButton("📊 حالة البث", callback_data="admin_broadcast_status")
+    )
     markup.add(
         types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_panel")
     )
@@ -982,6 +1182,9 @@ def get_admin_tools_markup():
         types.InlineKeyboardButton("📊 تشخيص الأداء", callback_data="admin_performance"),
         types.InlineKeyboardButton("🧪 اختبار الوظائف", callback_data="admin_test_features")
     )
+    markup.add(
+        types.InlineKeyboardButton("⏰ المهام المجدولة", callback_data="admin_scheduler")
+    )
     markup.add(
         types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_panel")
     )
@@ -1042,9 +1245,17 @@ def get_stats_message():
     message += f"• الملفات المعالجة: {stats['total_files_processed']}\n"
     message += f"• التعديلات الناجحة: {stats['successful_edits']}\n"
     message += f"• العمليات الفاشلة: {stats['failed_operations']}\n"
-    message += f"• عدد المستخدمين: {len(admin_panel.admin_data['users'])}\n"
+    message += f"• عدد المستخدمين: {admin_panel.count_users()}\n"
     message += f"• المستخدمين المحظورين: {len(admin_panel.admin_data['blocked_users'])}\n\n"
     
+    # الإنتاجية خلال الفترات الأخيرة
+    message += "*📉 الإنتاجية:*\n"
+    for title, resolution, count in (("آخر ساعة", 'minute', 60), ("آخر 24 ساعة", 'hour', 24), ("آخر 7 أيام", 'day', 7)):
+        summary = stats_timeseries.get_summary(resolution, count)
+        message += (f"• {title}: {summary['files']} ملف، {summary['bytes'] / (1024 * 1024):.1f} ميجا، "
+                    f"{summary['failures']} فشل، متوسط {summary['avg_latency']:.1f} ث\n")
+    message += "\n"
+    
     # معلومات النظام
     message += "*💻 معلومات النظام:*\n"
     message += f"• استخدام المعالج: {system_info['cpu_percent']}%\n"
@@ -1059,6 +1270,68 @@ def get_stats_message():
     
     return message
 
+def get_daily_report_message(day_offset=1):
+    """
+    إنشاء رسالة التقرير اليومي من السلاسل الزمنية للإحصائيات
+    
+    Args:
+        day_offset: 0 لليوم الحالي، 1 لليوم السابق
+    """
+    report = stats_timeseries.get_daily_report(day_offset)
+    day = datetime.utcfromtimestamp(report['day_start']).strftime('%Y-%m-%d')
+    
+    message = f"📅 *التقرير اليومي ({day})*\n\n"
+    message += f"• الملفات المعالجة: {report['files']}\n"
+    message += f"• حجم البيانات: {report['bytes'] / (1024 * 1024):.1f} ميجا\n"
+    message += f"• العمليات الفاشلة: {report['failures']}\n"
+    message += f"• متوسط زمن المعالجة: {report['avg_latency']:.1f} ثانية\n"
+    if report['peak_hour'] is not None:
+        peak_hour = datetime.utcfromtimestamp(report['peak_hour']).strftime('%H:00')
+        message += f"• ساعة الذروة (UTC): {peak_hour} ({report['peak_hour_files']} ملف)\n"
+    message += f"• المستخدمين النشطين (يوم): {admin_panel.count_active_users(1)}\n"
+    return message
+
+SCHEDULER_STATUS_LABELS = {
+    'success': "✅",
+    'failed': "❌",
+    None: "⏳"
+}
+
+def get_scheduler_message():
+    """
+    إنشاء رسالة المهام المجدولة مع أزرار التشغيل الفوري
+
+    Returns:
+        tuple: (نص الرسالة، الأزرار)
+    """
+    jobs = scheduler.get_jobs()
+    markup = types.InlineKeyboardMarkup(row_width=1)
+    message = "⏰ *المهام المجدولة*\n\n"
+    if not scheduler.is_running():
+        message += "⚠️ خيط الجدولة غير قيد التشغيل.\n\n"
+    if not jobs:
+        message += "لا توجد مهام مجدولة."
+
+    for job in jobs:
+        message += f"{SCHEDULER_STATUS_LABELS.get(job['last_status'], '⏳')} *{job['description'] or job['name']}*\n"
+        message += f"   • التشغيل القادم: {format_timestamp(job['next_run'])}\n"
+        if job['last_run']:
+            message += f"   • آخر تشغيل: {format_timestamp(job['last_run'])} ({job['last_duration']:.1f} ثانية)\n"
+        message += f"   • مرات التشغيل: {job['runs']} | الفائتة: {job['missed']}\n"
+        if job['last_error']:
+            message += f"   • آخر خطأ: `{job['last_error'][:100]}`\n"
+        message += "\n"
+        markup.add(types.InlineKeyboardButton(
+            f"▶️ تشغيل الآن: {job['description'] or job['name']}",
+            callback_data=f"admin_scheduler_run_{job['name']}"
+        ))
+
+    markup.add(
+        types.InlineKeyboardButton("🔄 تحديث", callback_data="admin_scheduler"),
+        types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_tools")
+    )
+    return message, markup
+
 def get_user_list_message(users, title):
     """إنشاء رسالة قائمة المستخدمين"""
     message = f"👥 *{title}*\n\n"
@@ -1116,6 +1389,79 @@ def get_logs_message(logs, title):
     
     return message
 
+# عناوين صفحات السجلات وعدد السجلات في كل صفحة
+LOGS_VIEWS = {
+    'recent': "آخر السجلات",
+    'errors': "سجلات الأخطاء",
+    'admins': "سجلات المشرفين"
+}
+LOGS_PAGE_SIZE = 5
+
+def get_logs_page(view, cursor=None):
+    """
+    إنشاء صفحة من سجل العمليات مع زر الانتقال إلى السجلات الأقدم
+    
+    Args:
+        view: نوع الصفحة (recent أو errors أو admins)
+        cursor: مؤشر الصفحة من الصفحة السابقة (None للصفحة الأولى)
+    
+    Returns:
+        tuple: (نص الرسالة، الأزرار)
+    """
+    if view == 'errors':
+        logs, next_cursor = admin_panel.get_logs_page(cursor, LOGS_PAGE_SIZE, status='failed')
+    elif view == 'admins':
+        admin_ids = list(admin_panel.admin_data['admins'])
+        logs, next_cursor = admin_panel.get_logs_page(cursor, LOGS_PAGE_SIZE, user_id=admin_ids) if admin_ids else ([], None)
+    else:
+        logs, next_cursor = admin_panel.get_logs_page(cursor, LOGS_PAGE_SIZE)
+    
+    logs_text = get_logs_message(logs, LOGS_VIEWS.get(view, LOGS_VIEWS['recent']))
+    
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    if cursor:
+        buttons.append(types.InlineKeyboardButton("⏮️ الأحدث", callback_data=f"admin_logs_page_{view}_"))
+    if next_cursor:
+        buttons.append(types.InlineKeyboardButton("⬅️ الأقدم", callback_data=f"admin_logs_page_{view}_{next_cursor}"))
+    if buttons:
+        markup.add(*buttons)
+    markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_logs"))
+    return logs_text, markup
+
+def get_backfill_message():
+    """إنشاء رسالة حالة المعالجة الرجعية"""
+    job = backfill.get_current_job()
+    if job is None:
+        return ("📥 *معالجة المنشورات السابقة*\n\n"
+                "لا توجد مهمة حالياً.\n"
+                "يتم تطبيق الاستبدالات والتذييل والقوالب الذكية على نطاق من رسائل قناة المصدر.")
+    
+    status = job.get_status()
+    status_names = {
+        'pending': '⏳ في الانتظار',
+        'running': '▶️ قيد التشغيل',
+        'stopped': '⏸️ متوقفة',
+        'completed': '✅ مكتملة'
+    }
+    stats = status['stats']
+    
+    message = "📥 *معالجة المنشورات السابقة*\n\n"
+    message += f"🔹 *الحالة:* {status_names.get(status['status'], status['status'])}\n"
+    message += f"🔹 *القناة:* `{status['source_chat']}`\n"
+    if status['pipeline_id']:
+        message += f"🔹 *المسار:* `{status['pipeline_id']}`\n"
+    message += f"🔹 *النطاق:* {status['start_id']} - {status['end_id']}\n"
+    message += f"🔹 *التقدم:* {status['done']}/{status['total']} ({status['percent']}%)\n"
+    message += f"🔹 *تمت معالجتها:* {stats['processed']} | *تم تخطيها:* {stats['skipped']} | *فشلت:* {stats['failed']}\n"
+    message += f"🔹 *معدل الإنجاز:* {status['throughput_per_minute']} رسالة/دقيقة\n"
+    if status['eta_seconds'] is not None:
+        message += f"🔹 *الوقت المتبقي:* {format_duration(status['eta_seconds'])}\n"
+    message += f"🔹 *المدة:* {format_duration(status['elapsed_seconds'])}\n"
+    if status['last_error']:
+        message += f"\n⚠️ *آخر خطأ:* `{status['last_error'][:200]}`\n"
+    return message
+
 def get_system_status_message():
     """إنشاء رسالة حالة النظام"""
     system_info = admin_panel.get_system_info()
@@ -1158,6 +1504,16 @@ def get_system_status_message():
     except Exception as e:
         logger.error(f"خطأ في الحصول على معلومات القواعد الذكية: {e}")
     
+    # زمن مراحل المعالجة
+    stages = stage_metrics.get_snapshot(('pipeline', 'stage'))
+    if stages:
+        pipeline_names = {'channel': 'القنوات', 'edit': 'تعديل المستخدمين'}
+        message += "\n*⏱ زمن مراحل المعالجة (ميلي ثانية):*\n"
+        for entry in stages:
+            message += (f"• {pipeline_names.get(entry['pipeline'], entry['pipeline'])} / `{entry['stage']}`: "
+                        f"p50 {entry['p50_ms']:.0f} | p95 {entry['p95_ms']:.0f} | p99 {entry['p99_ms']:.0f} "
+                        f"({entry['count']})\n")
+    
     return message
 
 # دالة للتعامل مع جميع أزرار لوحة الإدارة
@@ -1209,6 +1565,17 @@ def handle_admin_callback(bot, call):
                 parse_mode="Markdown"
             )
             
+        elif call.data == "admin_daily_report":
+            # عرض تقرير اليوم السابق
+            markup = types.InlineKeyboardMarkup()
+            markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_stats"))
+            bot.edit_message_text(
+                get_daily_report_message(),
+                chat_id, message_id,
+                reply_markup=markup,
+                parse_mode="Markdown"
+            )
+            
         elif call.data == "admin_reset_stats":
             # إعادة تعيين الإحصائيات
             admin_panel.reset_statistics()
@@ -1232,12 +1599,9 @@ def handle_admin_callback(bot, call):
             
         elif call.data == "admin_users":
             # عرض صفحة إدارة المستخدمين
-            active_users = admin_panel.get_active_users(7)
-            top_users = admin_panel.get_top_users(10)
-            
             text = "*👥 إدارة المستخدمين*\n\n"
-            text += f"🔹 *إجمالي المستخدمين:* {len(admin_panel.admin_data['users'])}\n"
-            text += f"🔹 *المستخدمين النشطين (7 أيام):* {len(active_users)}\n"
+            text += f"🔹 *إجمالي المستخدمين:* {admin_panel.count_users()}\n"
+            text += f"🔹 *المستخدمين النشطين (7 أيام):* {admin_panel.count_active_users(7)}\n"
             text += f"🔹 *المستخدمين المحظورين:* {len(admin_panel.admin_data['blocked_users'])}\n\n"
             text += "*اختر إحدى الخيارات التالية:*"
             
@@ -1261,11 +1625,107 @@ def handle_admin_callback(bot, call):
             # معالجة زر التعديل التلقائي للقنوات
             if call.data == "admin_auto_processing":
                 bot.edit_message_text(
-                    "🤖 *التعديل التلقائي للقنوات*\n\nاختر إحدى الوظائف التالية:",
+                    get_auto_processing_message(),
                     chat_id, message_id,
                     reply_markup=get_admin_auto_processing_markup(),
                     parse_mode="Markdown"
                 )
+            # معالجة أزرار المعالجة الرجعية لمنشورات القناة
+            elif call.data == "admin_backfill":
+                bot.edit_message_text(
+                    get_backfill_message(),
+                    chat_id, message_id,
+                    reply_markup=get_admin_backfill_markup(),
+                    parse_mode="Markdown"
+                )
+            elif call.data == "admin_backfill_start" or call.data.startswith("admin_backfill_pipeline_"):
+                pipelines = get_backfill_pipelines()
+                if call.data.startswith("admin_backfill_pipeline_"):
+                    pipeline_id = call.data[len("admin_backfill_pipeline_"):]
+                    pipelines = [pipeline for pipeline in pipelines if pipeline['id'] == pipeline_id]
+                if not pipelines:
+                    bot.send_message(chat_id, "❌ يجب تعيين قناة المصدر أولاً.")
+                elif len(pipelines) > 1:
+                    bot.edit_message_text(
+                        "📥 *معالجة المنشورات السابقة*\n\nاختر مسار القناة المراد معالجة منشوراتها:",
+                        chat_id, message_id,
+                        reply_markup=get_admin_backfill_pipelines_markup(pipelines),
+                        parse_mode="Markdown"
+                    )
+                else:
+                    pipeline = pipelines[0]
+                    msg = bot.send_message(
+                        chat_id,
+                        "📥 *معالجة المنشورات السابقة*\n\n"
+                        f"📡 القناة: `{pipeline['source_channel']}`\n\n"
+                        "أرسل نطاق أرقام الرسائل بالتنسيق التالي:\n"
+                        "`من-إلى` مثل `1-25000`\n\n"
+                        "🔄 أو أرسل `الغاء` للإلغاء.",
+                        parse_mode="Markdown"
+                    )
+                    from bot import set_user_state
+                    set_user_state(user_id, "admin_waiting_backfill_range",
+                                   {"message_id": msg.message_id, "pipeline_id": pipeline['id']})
+            # معالجة أزرار مسارات القنوات
+            elif call.data == "admin_pipelines":
+                bot.edit_message_text(
+                    get_pipelines_message(),
+                    chat_id, message_id,
+                    reply_markup=get_admin_pipelines_markup(),
+                    parse_mode="Markdown"
+                )
+            elif call.data == "admin_pipeline_add":
+                msg = bot.send_message(
+                    chat_id,
+                    "🔀 *إضافة مسار قناة*\n\n"
+                    "أرسل تعريف المسار بالتنسيق التالي:\n"
+                    "`المعرف | قناة المصدر | قنوات الهدف | عدد العمال`\n"
+                    "مثل `news | @source | @target1, @target2 | 2`\n\n"
+                    "يستخدم المسار الإعدادات العامة للاستبدالات والتذييل والقوالب ما لم يتم تحديد إعدادات خاصة به.\n\n"
+                    "🔄 أو أرسل `الغاء` للإلغاء.",
+                    parse_mode="Markdown"
+                )
+                from bot import set_user_state
+                set_user_state(user_id, "admin_waiting_pipeline", {"message_id": msg.message_id})
+            elif call.data.startswith("admin_pipeline_toggle_"):
+                pipeline_id = call.data[len("admin_pipeline_toggle_"):]
+                pipeline = channel_pipelines.get_pipeline(pipeline_id)
+                if pipeline:
+                    definition = channel_pipelines.get_pipeline_overrides(pipeline)
+                    definition['enabled'] = not pipeline.get('enabled', True)
+                    channel_pipelines.save_pipeline(pipeline_id, definition)
+                bot.edit_message_text(
+                    get_pipelines_message(),
+                    chat_id, message_id,
+                    reply_markup=get_admin_pipelines_markup(),
+                    parse_mode="Markdown"
+                )
+            elif call.data.startswith("admin_pipeline_remove_"):
+                pipeline_id = call.data[len("admin_pipeline_remove_"):]
+                if channel_pipelines.remove_pipeline(pipeline_id):
+                    admin_panel.log_action(user_id, "pipeline_remove", "success", pipeline_id)
+                bot.edit_message_text(
+                    get_pipelines_message(),
+                    chat_id, message_id,
+                    reply_markup=get_admin_pipelines_markup(),
+                    parse_mode="Markdown"
+                )
+            elif call.data == "admin_backfill_resume":
+                backfill.resume_backfill(bot)
+                bot.edit_message_text(
+                    get_backfill_message(),
+                    chat_id, message_id,
+                    reply_markup=get_admin_backfill_markup(),
+                    parse_mode="Markdown"
+                )
+            elif call.data == "admin_backfill_stop":
+                backfill.stop_backfill()
+                bot.edit_message_text(
+                    get_backfill_message(),
+                    chat_id, message_id,
+                    reply_markup=get_admin_backfill_markup(),
+                    parse_mode="Markdown"
+                )
             # معالجة زر إدارة البث الجماعي
             elif call.data == "admin_broadcast_menu":
                 bot.edit_message_text(
@@ -1422,7 +1882,7 @@ def handle_admin_callback(bot, call):
                 
                 # تحديث واجهة التعديل التلقائي
                 bot.edit_message_text(
-                    "🤖 *التعديل التلقائي للقنوات*\n\nاختر إحدى الوظائف التالية:",
+                    get_auto_processing_message(),
                     chat_id, message_id,
                     reply_markup=get_admin_auto_processing_markup(),
                     parse_mode="Markdown"
@@ -1829,6 +2289,20 @@ def handle_admin_callback(bot, call):
                     parse_mode="Markdown"
                 )
                 
+            elif call.data == "admin_toggle_edit_in_place":
+                # تبديل خيار استبدال الملف داخل المنشور الأصلي بدلاً من حذفه وإعادة نشره
+                current_state = admin_panel.get_setting("auto_processing.edit_in_place", False)
+                admin_panel.update_setting("auto_processing.edit_in_place", not current_state)
+                
+                # تحديث واجهة الإعدادات المتقدمة
+                bot.edit_message_text(
+                    "⚙️ *إعدادات التعديل التلقائي المتقدمة*\n\n"
+                    "اضبط خيارات التعديل التلقائي للقنوات.",
+                    chat_id, message_id,
+                    reply_markup=get_admin_auto_proc_settings_markup(),
+                    parse_mode="Markdown"
+                )
+                
             elif call.data == "admin_toggle_replacements":
                 # تبديل حالة تفعيل الاستبدالات
                 current_state = admin_panel.get_setting("auto_processing.replacements_enabled", True)
@@ -2262,8 +2736,8 @@ def handle_admin_callback(bot, call):
                 
                 stats_text = "📊 *إحصائيات مفصلة للبوت*\n\n"
                 stats_text += "*◉ إحصائيات المستخدمين:*\n"
-                stats_text += f"• إجمالي المستخدمين: {len(admin_panel.get_setting('users', {}))}\n"
-                stats_text += f"• المستخدمين النشطين (7 أيام): {len(admin_panel.get_active_users(7))}\n"
+                stats_text += f"• إجمالي المستخدمين: {admin_panel.count_users()}\n"
+                stats_text += f"• المستخدمين النشطين (7 أيام): {admin_panel.count_active_users(7)}\n"
                 stats_text += f"• المستخدمين المحظورين: {len(admin_panel.get_setting('blocked_users', []))}\n"
                 stats_text += f"• المشرفين: {len(admin_panel.get_setting('admins', []))}\n\n"
                 
@@ -2299,8 +2773,8 @@ def handle_admin_callback(bot, call):
                 
             # معالجة أزرار صفحة إدارة المستخدمين
             elif call.data == "admin_active_users":
-                # عرض المستخدمين النشطين
-                active_users = admin_panel.get_active_users(7)
+                # عرض المستخدمين النشطين (تعرض القائمة أول 10 فقط)
+                active_users = admin_panel.get_active_users(7, limit=11)
                 users_text = get_user_list_message(active_users, "المستخدمين النشطين في آخر 7 أيام")
                 
                 markup = types.InlineKeyboardMarkup()
@@ -2332,11 +2806,10 @@ def handle_admin_callback(bot, call):
                 # عرض المستخدمين المحظورين
                 blocked_ids = admin_panel.get_setting("blocked_users", [])
                 blocked_users = []
-                users_data = admin_panel.get_setting("users", {})
                 
                 for user_id in blocked_ids:
                     user_id = int(user_id)
-                    user_data = users_data.get(str(user_id), {})
+                    user_data = admin_panel.get_user_data(user_id) or {}
                     blocked_users.append({
                         "id": user_id,
                         "username": user_data.get("username", "غير معروف"),
@@ -2361,11 +2834,10 @@ def handle_admin_callback(bot, call):
                 # عرض المشرفين
                 admin_ids = admin_panel.get_setting("admins", [])
                 admins = []
-                users_data = admin_panel.get_setting("users", {})
                 
                 for user_id in admin_ids:
                     user_id = int(user_id)
-                    user_data = users_data.get(str(user_id), {})
+                    user_data = admin_panel.get_user_data(user_id) or {}
                     admins.append({
                         "id": user_id,
                         "username": user_data.get("username", "غير معروف"),
@@ -2559,43 +3031,14 @@ def handle_admin_callback(bot, call):
                 set_user_state(user_id, "admin_waiting_for_templates_file", {"message_id": msg.message_id})
                 
             # معالجة أزرار صفحة السجلات
-            elif call.data == "admin_recent_logs":
-                # عرض آخر السجلات
-                recent_logs = admin_panel.get_recent_logs(20)
-                logs_text = get_logs_message(recent_logs, "آخر السجلات")
-                
-                markup = types.InlineKeyboardMarkup()
-                markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_logs"))
-                
-                bot.edit_message_text(
-                    logs_text, 
-                    chat_id, message_id,
-                    reply_markup=markup, 
-                    parse_mode="Markdown"
-                )
-                
-            elif call.data == "admin_error_logs":
-                # عرض سجلات الأخطاء
-                error_logs = admin_panel.get_error_logs(20)
-                logs_text = get_logs_message(error_logs, "سجلات الأخطاء")
-                
-                markup = types.InlineKeyboardMarkup()
-                markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_logs"))
-                
-                bot.edit_message_text(
-                    logs_text, 
-                    chat_id, message_id,
-                    reply_markup=markup, 
-                    parse_mode="Markdown"
-                )
-                
-            elif call.data == "admin_admin_logs":
-                # عرض سجلات المشرفين
-                admin_logs = [log for log in admin_panel.get_recent_logs(50) if log.get('user_id') in admin_panel.get_setting('admins', [])]
-                logs_text = get_logs_message(admin_logs, "سجلات المشرفين")
-                
-                markup = types.InlineKeyboardMarkup()
-                markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_logs"))
+            elif call.data in ("admin_recent_logs", "admin_error_logs", "admin_admin_logs") or call.data.startswith("admin_logs_page_"):
+                # عرض صفحة من السجلات (آخر العمليات، الأخطاء، المشرفين) مع التصفح إلى السجلات الأقدم
+                if call.data.startswith("admin_logs_page_"):
+                    view, cursor = call.data[len("admin_logs_page_"):].split("_", 1)
+                else:
+                    view = {"admin_error_logs": "errors", "admin_admin_logs": "admins"}.get(call.data, "recent")
+                    cursor = None
+                logs_text, markup = get_logs_page(view, cursor or None)
                 
                 bot.edit_message_text(
                     logs_text, 
@@ -2624,14 +3067,15 @@ def handle_admin_callback(bot, call):
                     markup = types.InlineKeyboardMarkup(row_width=1)
                     
                     for idx, broadcast in enumerate(scheduled):
-                        broadcast_time = datetime.fromtimestamp(broadcast.get("timestamp", 0))
+                        broadcast_time = datetime.fromtimestamp(broadcast.get("time", 0))
                         time_str = broadcast_time.strftime("%Y-%m-%d %H:%M:%S")
-                        message_preview = broadcast.get("message_text", "")[:50] + "..." if len(broadcast.get("message_text", "")) > 50 else broadcast.get("message_text", "")
+                        message_preview = broadcast.get("message", "")[:50] + "..." if len(broadcast.get("message", "")) > 50 else broadcast.get("message", "")
+                        status = "✅ تم الإرسال" if broadcast.get("sent") else "⏳ في الانتظار"
                         
-                        broadcasts_text += f"{idx+1}. {time_str}\n{message_preview}\n\n"
+                        broadcasts_text += f"{idx+1}. {time_str} ({status})\n{message_preview}\n\n"
                         markup.add(types.InlineKeyboardButton(
                             f"❌ إلغاء البث {idx+1}",
-                            callback_data=f"admin_cancel_broadcast_{broadcast.get('id')}"
+                            callback_data=f"admin_cancel_broadcast_{broadcast.get('scheduled_id')}"
                         ))
                     
                     markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_broadcast_menu"))
@@ -2643,6 +3087,65 @@ def handle_admin_callback(bot, call):
                         parse_mode="Markdown"
                     )
                     
+            elif call.data == "admin_confirm_broadcast":
+                # تأكيد إرسال الرسالة الجماعية المدخلة من المشرف
+                broadcast_text = getattr(bot, 'user_broadcast_data', {}).pop(user_id, None)
+                markup = types.InlineKeyboardMarkup()
+                markup.add(types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_broadcast_menu"))
+                if not broadcast_text:
+                    bot.edit_message_text("⚠️ لم يتم العثور على نص الرسالة. أعد المحاولة.", chat_id, message_id,
+                                          reply_markup=markup)
+                    return
+                broadcast_id = admin_panel.send_broadcast(bot, broadcast_text, created_by=user_id)
+                if broadcast_id is None:
+                    bot.edit_message_text("⚠️ فشل في بدء الرسالة الجماعية.", chat_id, message_id, reply_markup=markup)
+                    return
+                status_text, markup = get_broadcast_status_message()
+                bot.edit_message_text(
+                    f"✅ بدأ إرسال الرسالة الجماعية #{broadcast_id} في الخلفية.\n\n" + status_text,
+                    chat_id, message_id,
+                    reply_markup=markup,
+                    parse_mode="Markdown"
+                )
+
+            elif call.data == "admin_cancel_broadcast":
+                # إلغاء الرسالة الجماعية قبل إرسالها
+                getattr(bot, 'user_broadcast_data', {}).pop(user_id, None)
+                bot.edit_message_text(
+                    "❌ تم إلغاء الرسالة الجماعية.",
+                    chat_id, message_id,
+                    reply_markup=get_admin_broadcast_menu_markup()
+                )
+
+            elif call.data == "admin_broadcast_status" or call.data.startswith((
+                    "admin_broadcast_pause_", "admin_broadcast_resume_", "admin_broadcast_stop_")):
+                # حالة البث الجماعي والتحكم به
+                result_text = ""
+                requested_states = {}
+                if call.data != "admin_broadcast_status":
+                    action, broadcast_id = call.data[len("admin_broadcast_"):].split("_", 1)
+                    broadcast_id = int(broadcast_id)
+                    if action == "pause":
+                        result = broadcaster.pause_broadcast(broadcast_id)
+                        state = 'paused'
+                    elif action == "resume":
+                        result = broadcaster.resume_broadcast(bot, broadcast_id)
+                        state = 'running'
+                    else:
+                        result = broadcaster.cancel_broadcast(broadcast_id)
+                        state = 'cancelled'
+                    admin_panel.log_action(user_id, f"broadcast_{action}", "success" if result else "failed",
+                                           f"البث {broadcast_id}")
+                    result_text = "✅ تم تنفيذ العملية.\n\n" if result else "❌ تعذر تنفيذ العملية.\n\n"
+                    if result:
+                        requested_states[broadcast_id] = state
+                status_text, markup = get_broadcast_status_message(requested_states)
+                try:
+                    bot.edit_message_text(result_text + status_text, chat_id, message_id, reply_markup=markup, parse_mode="Markdown")
+                except Exception as e:
+                    # لم تتغير الرسالة عند التحديث
+                    logger.debug(f"لم يتم تحديث رسالة حالة البث: {e}")
+
             elif call.data.startswith("admin_cancel_broadcast_"):
                 # إلغاء بث مجدول
                 broadcast_id = int(call.data.split("_")[-1])
@@ -2707,6 +3210,22 @@ def handle_admin_callback(bot, call):
                 from bot import set_user_state
                 set_user_state(user_id, "admin_waiting_for_backup_file", {"message_id": msg.message_id})
                 
+            elif call.data == "admin_scheduler" or call.data.startswith("admin_scheduler_run_"):
+                # عرض المهام المجدولة وتشغيل مهمة فوراً
+                result_text = ""
+                if call.data.startswith("admin_scheduler_run_"):
+                    job_name = call.data[len("admin_scheduler_run_"):]
+                    result = scheduler.run_now(job_name)
+                    admin_panel.log_action(user_id, "scheduler_run_now", "success" if result else "failed", job_name)
+                    result_text = "✅ تمت جدولة المهمة للتشغيل الآن.\n\n" if result else "❌ المهمة غير موجودة.\n\n"
+                message_text, markup = get_scheduler_message()
+                try:
+                    bot.edit_message_text(result_text + message_text, chat_id, message_id,
+                                          reply_markup=markup, parse_mode="Markdown")
+                except Exception as e:
+                    # لم تتغير الرسالة عند التحديث
+                    logger.debug(f"لم يتم تحديث رسالة المهام المجدولة: {e}")
+
             elif call.data == "admin_clean_temp":
                 # تنظيف الملفات المؤقتة
                 result = admin_panel.clean_temp_files()
@@ -2918,6 +3437,21 @@ def handle_admin_callback(bot, call):
                 except Exception as e:
                     logger.error(f"خطأ في عرض إحصائيات القواعد الذكية: {e}")
                     
+            elif call.data == "admin_smart_rules_activity":
+                # عرض نشاط القواعد الذكية من العدادات
+                try:
+                    bot.edit_message_text(
+                        get_smart_rules_activity_message(),
+                        chat_id, message_id,
+                        parse_mode="Markdown",
+                        reply_markup=types.InlineKeyboardMarkup().add(
+                            types.InlineKeyboardButton("🔄 تحديث", callback_data="admin_smart_rules_activity"),
+                            types.InlineKeyboardButton("🔙 رجوع", callback_data="admin_smart_rules")
+                        )
+                    )
+                except Exception as e:
+                    logger.error(f"خطأ في عرض نشاط القواعد الذكية: {e}")
+                    
             elif call.data.startswith("admin_rule_"):
                 # عرض تفاصيل قاعدة ذكية محددة
                 try:
@@ -2948,6 +3482,8 @@ def handle_admin_callback(bot, call):
                     
                     rule_text += f"*الأولوية:* {rule.priority}\n"
                     rule_text += f"*الحالة:* {'نشطة ✅' if rule.is_active else 'معطلة ❌'}\n"
+                    scope_names = {s["id"]: s["name"] for s in smart_rules.get_available_scopes()}
+                    rule_text += f"*النطاق:* {scope_names.get(rule.scope, rule.scope)}\n"
                     rule_text += f"*تاريخ الإنشاء:* {rule.created_at.strftime('%Y-%m-%d')}\n"
                     rule_text += f"*آخر تحديث:* {rule.updated_at.strftime('%Y-%m-%d')}\n"
                     
@@ -3393,32 +3929,16 @@ def handle_admin_callback(bot, call):
                 
                 try:
                     # عدد المستخدمين الإجمالي
-                    user_count = len(admin_panel.admin_data.get("users", {}))
+                    user_count = admin_panel.count_users()
                     
                     # المستخدمين النشطين اليوم
-                    active_today = admin_panel.get_active_users(1)
-                    active_users_today = len(active_today)
+                    active_users_today = admin_panel.count_active_users(1)
                     
                     # المستخدمين النشطين هذا الأسبوع
-                    active_week = admin_panel.get_active_users(7)
-                    active_users_week = len(active_week)
+                    active_users_week = admin_panel.count_active_users(7)
                     
                     # الملفات المعالجة
-                    for user_data in admin_panel.admin_data.get("users", {}).values():
-                        if "files_processed" in user_data:
-                            total_files_processed += user_data["files_processed"]
-                        
-                        # التحقق من آخر نشاط
-                        if "last_activity" in user_data:
-                            last_activity = user_data["last_activity"]
-                            now = time.time()
-                            # النشاط اليوم
-                            if now - last_activity < 24 * 60 * 60:
-                                files_processed_today += user_data.get("files_processed_today", 0)
-                            
-                            # النشاط هذا الأسبوع
-                            if now - last_activity < 7 * 24 * 60 * 60:
-                                files_processed_week += user_data.get("files_processed_week", 0)
+                    total_files_processed = admin_panel.get_total_files_processed()
                 except Exception as e:
                     logger.error(f"خطأ في الحصول على إحصائيات المستخدمين: {e}")
                 
@@ -4004,8 +4524,12 @@ def broadcast_command(bot, message):
         return
     
     try:
-        admin_panel.send_broadcast(bot, broadcast_text)
-        bot.reply_to(message, "✅ تم إرسال الرسالة الجماعية بنجاح.")
+        broadcast_id = admin_panel.send_broadcast(bot, broadcast_text, created_by=user_id)
+        if broadcast_id is None:
+            bot.reply_to(message, "⚠️ فشل في بدء الرسالة الجماعية.")
+            return
+        bot.reply_to(message, f"✅ بدأ إرسال الرسالة الجماعية #{broadcast_id} في الخلفية.\n"
+                              "يمكنك متابعة التقدم من لوحة الإدارة: البث الجماعي ← 📊 حالة البث.")
     except Exception as e:
         logger.error(f"خطأ في إرسال رسالة جماعية: {e}")
         bot.reply_to(message, f"⚠️ حدث خطأ في إرسال الرسالة الجماعية: {str(e)}")
@@ -1,13 +1,21 @@
 import os
+import copy
 import json
 import time
+import atexit
 import logging
+import functools
+import threading
 import psutil
 from datetime import datetime
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from telebot import types
 from typing import Dict, List, Set, Optional, Union, Any, Tuple
 
+from config import Config
+import oplog
+
 # إعداد التسجيل
 logger = logging.getLogger('admin_panel')
 logger.setLevel(logging.INFO)
@@ -25,9 +33,11 @@ admin_data = {
         'bot_start_time': time.time(),  # وقت بدء تشغيل البوت
         'last_reset_time': time.time(),  # وقت آخر إعادة تعيين للإحصائيات
         'daily_stats_reset': time.time(),  # وقت آخر إعادة تعيين للإحصائيات اليومية
+        'precheck_checked': 0,  # عدد ملفات القنوات التي تم فحص بياناتها قبل التنزيل
+        'precheck_skipped': 0,  # عدد ملفات القنوات التي تم تخطي تنزيلها لعدم الحاجة إلى تعديل
     },
     'users': {},  # معلومات المستخدمين: {user_id: {'username': '', 'first_name': '', 'last_seen': timestamp, 'files_processed': 0, 'daily_usage': 0, 'daily_reset': timestamp}}
-    'logs': [],  # سجل العمليات: [{'time': timestamp, 'user_id': user_id, 'action': '', 'status': 'success|failed', 'details': ''}]
+    'logs': [],  # سجل العمليات القديم (يتم نقله إلى oplog عند التحميل)
     'scheduled_broadcasts': [],  # البث المجدول: [{'time': timestamp, 'message': '', 'type': 'text|photo|video|document', 'file_id': '', 'sent': False}]
     'global_templates': {},  # القوالب العامة: {template_name: {tag1: value1, tag2: value2, ...}}
     'settings': {
@@ -66,6 +76,7 @@ admin_data = {
             'source_channel': "",  # معرف قناة المصدر
             'keep_caption': True,  # الحفاظ على الكابشن الأصلي
             'auto_publish': True,  # نشر الرسالة تلقائياً بعد التعديل
+            'edit_in_place': False,  # استبدال الملف داخل المنشور الأصلي بدلاً من الحذف وإعادة النشر
             'tag_replacements': {},  # استبدالات الوسوم: {"من": "إلى"}
             'enabled_tags': {  # الوسوم المفعلة للاستبدال
                 'artist': True,
@@ -91,13 +102,87 @@ admin_data = {
 # المسار للملف الذي يخزن بيانات المشرفين والإحصائيات
 ADMIN_DATA_FILE = 'admin_data.json'
 
+# حالة الحفظ المؤجل: التعديلات تضاف إلى سجل تعديلات (journal) بجانب الملف،
+# وتدمج دورياً في نسخة كاملة من الملف تكتب في ملف مؤقت ثم تستبدل الملف الرئيسي
+# _persist_lock يحمي البيانات في الذاكرة فقط (يُمسك لنسخها)، و_write_lock يرتب الكتابة إلى القرص
+# (الترتيب دائماً: _write_lock ثم _persist_lock)
+_persist_lock = threading.RLock()
+_write_lock = threading.Lock()
+_pending_ops = []  # التعديلات التي لم تكتب بعد: [{'op': 'set|append', 'path': [...], 'value': ...}]
+_snapshot_requested = False  # طلب كتابة نسخة كاملة (للتعديلات التي لا تسجل كعملية محددة)
+_journal_seq = 0  # الرقم التسلسلي لآخر تعديل مسجل
+_journal_entries = 0  # عدد التعديلات في ملف السجل منذ آخر دمج
+_last_snapshot_time = time.time()
+_flusher = None
+
+def _with_persist_lock(func):
+    """تنفيذ دالة تعدل admin_data مع قفل الحفظ حتى لا يتزامن التعديل مع كتابة النسخة الكاملة"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _persist_lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+def _journal_path() -> str:
+    """مسار ملف سجل التعديلات"""
+    return ADMIN_DATA_FILE + '.journal'
+
+def _apply_op(data: Dict, entry: Dict):
+    """تطبيق تعديل مسجل على البيانات (عند الاستعادة من سجل التعديلات)"""
+    path = entry['path']
+    current = data
+    for part in path[:-1]:
+        if not isinstance(current.get(part), dict):
+            current[part] = {}
+        current = current[part]
+    if entry['op'] == 'set':
+        current[path[-1]] = entry['value']
+    elif entry['op'] == 'append':
+        items = current.setdefault(path[-1], [])
+        items.append(entry['value'])
+        limit = entry.get('limit')
+        if limit and len(items) > limit:
+            current[path[-1]] = items[-limit:]
+
+def _replay_journal(snapshot_seq: int) -> int:
+    """
+    إعادة تطبيق التعديلات المسجلة بعد آخر نسخة كاملة (استعادة البيانات بعد توقف مفاجئ)
+    
+    Returns:
+        int: عدد التعديلات التي تمت إعادة تطبيقها
+    """
+    global _journal_seq, _journal_entries
+    journal_path = _journal_path()
+    _journal_seq = snapshot_seq
+    if not os.path.exists(journal_path):
+        return 0
+    replayed = 0
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # سطر غير مكتمل بسبب توقف أثناء الكتابة
+                logger.warning("تم تجاهل سطر غير مكتمل في سجل تعديلات بيانات الإدارة")
+                continue
+            if entry.get('seq', 0) <= snapshot_seq:
+                continue
+            _apply_op(admin_data, entry)
+            _journal_seq = max(_journal_seq, entry['seq'])
+            replayed += 1
+    _journal_entries = replayed
+    return replayed
+
 def load_admin_data():
-    """تحميل بيانات المشرفين والإحصائيات من الملف"""
+    """تحميل بيانات المشرفين والإحصائيات من الملف ثم إعادة تطبيق سجل التعديلات"""
     global admin_data
     try:
+        snapshot_seq = 0
         if os.path.exists(ADMIN_DATA_FILE):
             with open(ADMIN_DATA_FILE, 'r', encoding='utf-8') as f:
                 file_data = json.load(f)
+            with _persist_lock:
+                snapshot_seq = file_data.get('journal_seq', 0)
                 # تحويل المعرّفات من سلاسل نصية إلى أرقام صحيحة وتحويل القوائم إلى مجموعات
                 if 'admins' in file_data:
                     admin_data['admins'] = set(int(admin_id) for admin_id in file_data['admins'])
@@ -105,7 +190,8 @@ def load_admin_data():
                     admin_data['blocked_users'] = set(int(user_id) for user_id in file_data['blocked_users'])
                 # نسخ بقية البيانات
                 if 'statistics' in file_data:
-                    admin_data['statistics'] = file_data['statistics']
+                    # دمج الإحصائيات المحفوظة مع القيم الافتراضية حتى تبقى الإحصائيات الجديدة متاحة
+                    admin_data['statistics'].update(file_data['statistics'])
                 if 'users' in file_data:
                     admin_data['users'] = file_data['users']
                 if 'logs' in file_data:
@@ -113,22 +199,150 @@ def load_admin_data():
                 if 'settings' in file_data:
                     admin_data['settings'] = file_data['settings']
                 logger.info("تم تحميل بيانات المشرفين والإحصائيات بنجاح")
+        
+        with _write_lock:
+            with _persist_lock:
+                replayed = _replay_journal(snapshot_seq)
+                if replayed:
+                    logger.info(f"تمت استعادة {replayed} تعديل من سجل تعديلات بيانات الإدارة")
+                # نقل سجل العمليات القديم إلى السجل المقسم
+                migrated_logs = bool(admin_data['logs']) and oplog.import_entries(admin_data['logs']) is not None
+                if migrated_logs:
+                    admin_data['logs'] = []
+                snapshot = _copy_state() if replayed or migrated_logs else None
+            if snapshot is not None:
+                _write_snapshot(snapshot)
     except Exception as e:
         logger.error(f"خطأ في تحميل بيانات المشرفين والإحصائيات: {e}")
 
-def save_admin_data():
-    """حفظ بيانات المشرفين والإحصائيات في الملف"""
-    try:
-        # تحويل المجموعات إلى قوائم للتمكن من تحويلها إلى JSON
-        data_to_save = admin_data.copy()
-        data_to_save['admins'] = list(admin_data['admins'])
-        data_to_save['blocked_users'] = list(admin_data['blocked_users'])
+def _copy_state() -> Dict:
+    """نسخة مستقلة من البيانات قابلة للتحويل إلى JSON (يستدعى مع _persist_lock)"""
+    data_to_save = copy.deepcopy({key: value for key, value in admin_data.items()
+                                  if key not in ('admins', 'blocked_users')})
+    # تحويل المجموعات إلى قوائم للتمكن من تحويلها إلى JSON
+    data_to_save['admins'] = list(admin_data['admins'])
+    data_to_save['blocked_users'] = list(admin_data['blocked_users'])
+    data_to_save['journal_seq'] = _journal_seq
+    return data_to_save
+
+def _write_snapshot(data_to_save: Dict):
+    """كتابة نسخة كاملة من البيانات بشكل ذري (ملف مؤقت ثم استبدال) وتفريغ سجل التعديلات (يستدعى مع _write_lock)"""
+    global _journal_entries, _last_snapshot_time
+    payload = json.dumps(data_to_save, ensure_ascii=False, indent=2)
+    
+    temp_path = ADMIN_DATA_FILE + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, ADMIN_DATA_FILE)
+    
+    # النسخة تتضمن جميع التعديلات حتى journal_seq، والتعديلات اللاحقة لم تكتب في السجل بعد، لذا يمكن تفريغه
+    with open(_journal_path(), 'w', encoding='utf-8'):
+        pass
+    _journal_entries = 0
+    _last_snapshot_time = time.time()
+
+def _coalesce(ops: List[Dict]) -> List[Dict]:
+    """دمج التعديلات: عند تعيين نفس المسار أكثر من مرة يبقى آخر تعيين فقط"""
+    last_set = {}
+    for index, entry in enumerate(ops):
+        if entry['op'] == 'set':
+            last_set[tuple(entry['path'])] = index
+    return [entry for index, entry in enumerate(ops)
+            if entry['op'] != 'set' or last_set[tuple(entry['path'])] == index]
+
+def flush_admin_data():
+    """
+    كتابة التعديلات المؤجلة: إضافتها إلى سجل التعديلات، أو كتابة نسخة كاملة
+    عند طلبها أو عند امتلاء السجل أو مرور فترة الدمج
+    
+    يتم نسخ البيانات أو التعديلات المؤجلة مع _persist_lock فقط، أما التحويل إلى JSON والكتابة
+    وfsync فتتم خارجه حتى لا تنتظر المعدلات عمليات القرص.
+    """
+    global _pending_ops, _snapshot_requested, _journal_seq, _journal_entries
+    with _write_lock:
+        with _persist_lock:
+            ops, _pending_ops = _pending_ops, []
+            snapshot_requested, _snapshot_requested = _snapshot_requested, False
+            compact_due = _journal_entries and time.time() - _last_snapshot_time >= Config.ADMIN_DATA_COMPACT_SECONDS
+            snapshot = None
+            entries = []
+            try:
+                if snapshot_requested or compact_due or _journal_entries + len(ops) > Config.ADMIN_DATA_JOURNAL_MAX_ENTRIES:
+                    # النسخة الكاملة تتضمن نتيجة جميع التعديلات الموجودة في الذاكرة
+                    snapshot = _copy_state()
+                else:
+                    for entry in _coalesce(ops):
+                        _journal_seq += 1
+                        entries.append(dict(copy.deepcopy(entry), seq=_journal_seq))
+            except Exception as e:
+                logger.error(f"خطأ في نسخ بيانات المشرفين والإحصائيات للحفظ: {e}")
+                _snapshot_requested = True
+                return
         
-        with open(ADMIN_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, ensure_ascii=False, indent=2)
-        logger.info("تم حفظ بيانات المشرفين والإحصائيات بنجاح")
-    except Exception as e:
-        logger.error(f"خطأ في حفظ بيانات المشرفين والإحصائيات: {e}")
+        try:
+            if snapshot is not None:
+                _write_snapshot(snapshot)
+                return
+            if not entries:
+                return
+            lines = [json.dumps(entry, ensure_ascii=False) for entry in entries]
+            with open(_journal_path(), 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            _journal_entries += len(lines)
+        except Exception as e:
+            logger.error(f"خطأ في حفظ بيانات المشرفين والإحصائيات: {e}")
+            # إعادة المحاولة بنسخة كاملة في الدورة القادمة
+            with _persist_lock:
+                _snapshot_requested = True
+
+def _flush_loop():
+    """خيط الحفظ في الخلفية: دمج التعديلات المتتالية وكتابتها كل ADMIN_DATA_FLUSH_SECONDS"""
+    while True:
+        time.sleep(Config.ADMIN_DATA_FLUSH_SECONDS)
+        flush_admin_data()
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        with _persist_lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name="admin-data-flusher", daemon=True)
+                _flusher.start()
+
+def _journal(op: str, path: List[str], value: Any, limit: Optional[int] = None):
+    """
+    تسجيل تعديل محدد على البيانات (بعد تطبيقه في الذاكرة) ليكتب في الخلفية
+    
+    Args:
+        op: نوع التعديل (set للتعيين، append للإضافة إلى قائمة)
+        path: مسار القيمة داخل admin_data
+        value: القيمة
+        limit: الحد الأقصى لطول القائمة (لتعديلات append)
+    """
+    entry = {'op': op, 'path': path, 'value': value}
+    if limit:
+        entry['limit'] = limit
+    with _persist_lock:
+        _pending_ops.append(entry)
+    _ensure_flusher()
+
+def save_admin_data():
+    """
+    طلب حفظ نسخة كاملة من بيانات المشرفين والإحصائيات
+    
+    الحفظ مؤجل: تدمج الطلبات المتتالية في كتابة واحدة بواسطة خيط الحفظ في الخلفية.
+    """
+    global _snapshot_requested
+    with _persist_lock:
+        _snapshot_requested = True
+    _ensure_flusher()
+
+# كتابة التعديلات المتبقية عند إيقاف البوت
+atexit.register(flush_admin_data)
 
 def is_admin(user_id: int) -> bool:
     """التحقق مما إذا كان المستخدم مشرفًا"""
@@ -136,12 +350,14 @@ def is_admin(user_id: int) -> bool:
     developer_ids = [1174919068, 6556918772, 6602517122]
     
     if user_id in developer_ids and user_id not in admin_data['admins']:
-        admin_data['admins'].add(user_id)
+        with _persist_lock:
+            admin_data['admins'].add(user_id)
         save_admin_data()
         logger.info(f"تمت إضافة المستخدم {user_id} كمشرف (مطور البوت)")
     
     return user_id in admin_data['admins'] or user_id in developer_ids
 
+@_with_persist_lock
 def add_admin(user_id: int) -> bool:
     """إضافة مستخدم كمشرف"""
     if user_id not in admin_data['admins']:
@@ -151,6 +367,7 @@ def add_admin(user_id: int) -> bool:
         return True
     return False
 
+@_with_persist_lock
 def remove_admin(user_id: int) -> bool:
     """إزالة مستخدم من المشرفين"""
     if user_id in admin_data['admins']:
@@ -160,6 +377,7 @@ def remove_admin(user_id: int) -> bool:
         return True
     return False
 
+@_with_persist_lock
 def block_user(user_id: int) -> bool:
     """حظر مستخدم"""
     if user_id not in admin_data['blocked_users']:
@@ -169,6 +387,7 @@ def block_user(user_id: int) -> bool:
         return True
     return False
 
+@_with_persist_lock
 def unblock_user(user_id: int) -> bool:
     """إلغاء حظر مستخدم"""
     if user_id in admin_data['blocked_users']:
@@ -184,34 +403,25 @@ def is_blocked(user_id: int) -> bool:
 
 def log_action(user_id: int, action: str, status: str = 'success', details: str = ''):
     """تسجيل عملية في سجل العمليات"""
-    log_entry = {
-        'time': time.time(),
-        'user_id': user_id,
-        'action': action,
-        'status': status,
-        'details': details
-    }
-    admin_data['logs'].append(log_entry)
-    # الاحتفاظ بآخر 1000 عملية فقط
-    if len(admin_data['logs']) > 1000:
-        admin_data['logs'] = admin_data['logs'][-1000:]
-    save_admin_data()
+    oplog.append(user_id, action, status, details)
+
+def _migrate_legacy_users():
+    """نقل المستخدمين المحفوظين سابقاً في admin_data.json إلى قاعدة البيانات (مرة واحدة)"""
+    if not admin_data.get('users'):
+        return
+    import user_store
+    if user_store.import_users(admin_data['users']) is not None:
+        with _persist_lock:
+            admin_data['users'] = {}
+        save_admin_data()
 
 def update_user_data(user_id: int, username: str = None, first_name: str = None, files_processed: int = 0, file_size_mb: float = 0):
-    """تحديث بيانات المستخدم"""
-    user_id_str = str(user_id)
-    now = time.time()
+    """تحديث بيانات المستخدم (تحديث تدريجي لسجل المستخدم في قاعدة البيانات)"""
+    import user_store
+    _migrate_legacy_users()
+    user_data, created = user_store.touch_user(user_id, username, first_name, files_processed, file_size_mb)
     
-    if user_id_str not in admin_data['users']:
-        admin_data['users'][user_id_str] = {
-            'username': username if username else "",
-            'first_name': first_name if first_name else "",
-            'last_seen': now,
-            'files_processed': 0,
-            'first_seen': now,
-            'daily_usage': 0,
-            'daily_reset': now  # توقيت آخر إعادة تعيين للاستخدام اليومي
-        }
+    if created:
         # إذا كانت ميزة إشعارات المستخدمين الجدد مفعّلة، سجّل ذلك للإشعار
         if admin_data['settings']['notifications']['new_users']:
             for admin_id in admin_data['admins']:
@@ -225,42 +435,47 @@ def update_user_data(user_id: int, username: str = None, first_name: str = None,
                 except:
                     pass
     
-    # تحديث بيانات المستخدم
-    user_data = admin_data['users'][user_id_str]
-    if username:
-        user_data['username'] = username
-    if first_name:
-        user_data['first_name'] = first_name
-    user_data['last_seen'] = now
-    user_data['files_processed'] += files_processed
-    
-    # تحديث الاستخدام اليومي
-    # إعادة تعيين العداد اليومي إذا مر أكثر من 24 ساعة
-    daily_reset_time = user_data.get('daily_reset', 0)
-    if now - daily_reset_time > 86400:  # 24 ساعة
-        user_data['daily_usage'] = 0
-        user_data['daily_reset'] = now
-    
-    # زيادة الاستخدام اليومي
-    if 'daily_usage' not in user_data:
-        user_data['daily_usage'] = 0
-    user_data['daily_usage'] += file_size_mb
-    
-    save_admin_data()
-    
     return user_data
 
+def get_user_data(user_id: int) -> Optional[Dict]:
+    """الحصول على بيانات مستخدم (None إذا لم يستخدم البوت من قبل)"""
+    import user_store
+    _migrate_legacy_users()
+    return user_store.get_user(user_id)
+
+def count_users() -> int:
+    """عدد المستخدمين المسجلين"""
+    import user_store
+    _migrate_legacy_users()
+    return user_store.count_users()
+
+def count_active_users(days: int = 7) -> int:
+    """عدد المستخدمين النشطين في الأيام الأخيرة"""
+    import user_store
+    _migrate_legacy_users()
+    return user_store.count_active_users(days)
+
+def get_total_files_processed() -> int:
+    """إجمالي الملفات المعالجة لجميع المستخدمين"""
+    import user_store
+    _migrate_legacy_users()
+    return user_store.sum_files_processed()
+
+@_with_persist_lock
 def increment_statistic(stat_name: str, value: int = 1):
     """زيادة قيمة إحصائية"""
     if stat_name in admin_data['statistics']:
         admin_data['statistics'][stat_name] += value
-        save_admin_data()
+        _journal('set', ['statistics', stat_name], admin_data['statistics'][stat_name])
 
+@_with_persist_lock
 def reset_statistics():
     """إعادة تعيين الإحصائيات"""
     admin_data['statistics']['total_files_processed'] = 0
     admin_data['statistics']['successful_edits'] = 0
     admin_data['statistics']['failed_operations'] = 0
+    admin_data['statistics']['precheck_checked'] = 0
+    admin_data['statistics']['precheck_skipped'] = 0
     admin_data['statistics']['last_reset_time'] = time.time()
     save_admin_data()
 
@@ -273,50 +488,47 @@ def get_system_info() -> Dict:
         'uptime': time.time() - admin_data['statistics']['bot_start_time']
     }
 
-def get_active_users(days: int = 7) -> List[Dict]:
-    """الحصول على المستخدمين النشطين في الأيام الأخيرة"""
-    active_users = []
-    now = time.time()
-    days_seconds = days * 24 * 60 * 60
-    
-    for user_id, user_data in admin_data['users'].items():
-        if now - user_data.get('last_seen', 0) <= days_seconds:
-            user_info = user_data.copy()
-            user_info['user_id'] = user_id
-            if 'daily_usage' not in user_info:
-                user_info['daily_usage'] = 0
-            active_users.append(user_info)
-    
-    # ترتيب المستخدمين حسب آخر ظهور
-    active_users.sort(key=lambda x: x['last_seen'], reverse=True)
-    return active_users
+def get_active_users(days: int = 7, limit: Optional[int] = None) -> List[Dict]:
+    """الحصول على المستخدمين النشطين في الأيام الأخيرة مرتبين حسب آخر ظهور"""
+    import user_store
+    _migrate_legacy_users()
+    return user_store.get_active_users(days, limit)
 
 def get_top_users(limit: int = 10) -> List[Dict]:
     """الحصول على أكثر المستخدمين نشاطًا"""
-    users = []
-    for user_id, user_data in admin_data['users'].items():
-        user_info = user_data.copy()
-        user_info['user_id'] = user_id
-        users.append(user_info)
-    
-    # ترتيب المستخدمين حسب عدد الملفات المعالجة
-    users.sort(key=lambda x: x['files_processed'], reverse=True)
-    return users[:limit]
+    import user_store
+    _migrate_legacy_users()
+    return user_store.get_top_users(limit)
 
 def get_recent_logs(limit: int = 20) -> List[Dict]:
-    """الحصول على آخر سجلات العمليات"""
-    return admin_data['logs'][-limit:]
+    """الحصول على آخر سجلات العمليات (من الأحدث إلى الأقدم)"""
+    return oplog.query(limit=limit)[0]
 
 def get_logs_by_user(user_id: int, limit: int = 20) -> List[Dict]:
-    """الحصول على سجلات عمليات مستخدم معين"""
-    user_logs = [log for log in admin_data['logs'] if log['user_id'] == user_id]
-    return user_logs[-limit:]
+    """الحصول على آخر سجلات عمليات مستخدم معين (من الأحدث إلى الأقدم)"""
+    return oplog.query(user_id=user_id, limit=limit)[0]
 
 def get_error_logs(limit: int = 20) -> List[Dict]:
-    """الحصول على سجلات الأخطاء"""
-    error_logs = [log for log in admin_data['logs'] if log['status'] == 'failed']
-    return error_logs[-limit:]
+    """الحصول على آخر سجلات الأخطاء (من الأحدث إلى الأقدم)"""
+    return oplog.query(status='failed', limit=limit)[0]
+
+def get_logs_page(cursor: str = None, limit: int = 5, user_id=None, action=None, status=None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    الحصول على صفحة من سجل العمليات (من الأحدث إلى الأقدم)
+    
+    Args:
+        cursor: مؤشر الصفحة من الاستعلام السابق (None للصفحة الأولى)
+        limit: عدد السجلات في الصفحة
+        user_id: معرف المستخدم أو قائمة معرفات (اختياري)
+        action: اسم العملية (اختياري)
+        status: حالة العملية (اختياري)
+    
+    Returns:
+        tuple: (السجلات، مؤشر الصفحة التالية أو None)
+    """
+    return oplog.query(user_id=user_id, action=action, status=status, limit=limit, cursor=cursor)
 
+@_with_persist_lock
 def update_setting(setting_path: str, value: Any) -> bool:
     """تحديث إعداد معين"""
     try:
@@ -337,12 +549,18 @@ def update_setting(setting_path: str, value: Any) -> bool:
             
         # تعيين القيمة
         current[path_parts[-1]] = value
-        save_admin_data()
+        _journal('set', ['settings'] + path_parts, value)
+        _settings_changed(setting_path)
         return True
     except Exception as e:
         logger.error(f"خطأ في تحديث الإعداد {setting_path}: {e}")
         return False
 
+def _settings_changed(setting_path: Optional[str] = None):
+    """إبطال الفهارس المبنية من الإعدادات بعد تعديلها (None عند استبدال جميع الإعدادات)"""
+    import channel_pipelines
+    channel_pipelines.invalidate_index(setting_path)
+
 def get_setting(setting_path: str, default: Any = None) -> Any:
     """الحصول على قيمة إعداد معين"""
     try:
@@ -369,35 +587,36 @@ def notify_admin(admin_id: int, message: str) -> bool:
     # سيتم استدعاؤها من خارج هذا الملف
     return True
 
-def send_broadcast(bot, message: str, user_ids: List[int] = None):
-    """إرسال رسالة جماعية للمستخدمين"""
+def send_broadcast(bot, message: str, user_ids: List[int] = None, created_by: int = None):
+    """
+    بدء إرسال رسالة جماعية للمستخدمين في الخلفية
+
+    Returns:
+        int: معرف البث لمتابعة حالته، أو None عند الفشل
+    """
+    import broadcaster
     if user_ids is None:
-        # إرسال لجميع المستخدمين
-        user_ids = [int(user_id) for user_id in admin_data['users'].keys()]
-    
-    success_count = 0
-    fail_count = 0
-    
-    for user_id in user_ids:
-        try:
-            if not is_blocked(user_id):
-                bot.send_message(user_id, message)
-                success_count += 1
-        except Exception as e:
-            logger.error(f"خطأ في إرسال رسالة جماعية للمستخدم {user_id}: {e}")
-            fail_count += 1
-    
-    return success_count, fail_count
+        _migrate_legacy_users()
+    return broadcaster.start_broadcast(bot, message, created_by=created_by, user_ids=user_ids)
+
+def clean_temp_files(max_age_seconds: float = None):
+    """
+    تنظيف الملفات المؤقتة
 
-def clean_temp_files():
-    """تنظيف الملفات المؤقتة"""
+    Args:
+        max_age_seconds: حذف الملفات الأقدم من هذه المدة فقط (None لحذف جميع الملفات)
+    """
     temp_dir = "temp_audio_files"
     try:
         if os.path.exists(temp_dir):
             files_removed = 0
+            cutoff = time.time() - max_age_seconds if max_age_seconds is not None else None
             for filename in os.listdir(temp_dir):
                 file_path = os.path.join(temp_dir, filename)
                 if os.path.isfile(file_path):
+                    # عدم حذف ملفات المعالجات الجارية
+                    if cutoff is not None and os.path.getmtime(file_path) > cutoff:
+                        continue
                     os.remove(file_path)
                     files_removed += 1
             logger.info(f"تم تنظيف {files_removed} ملف مؤقت")
@@ -410,6 +629,8 @@ def clean_temp_files():
 def export_data(data_type: str = 'all') -> str:
     """تصدير البيانات إلى ملف"""
     try:
+        import user_store
+        _migrate_legacy_users()
         export_filename = f"export_{data_type}_{int(time.time())}.json"
         data_to_export = {}
         
@@ -417,10 +638,12 @@ def export_data(data_type: str = 'all') -> str:
             data_to_export = admin_data.copy()
             data_to_export['admins'] = list(admin_data['admins'])
             data_to_export['blocked_users'] = list(admin_data['blocked_users'])
+            data_to_export['users'] = user_store.export_users()
+            data_to_export['logs'] = list(oplog.iter_entries())
         elif data_type == 'users':
-            data_to_export = admin_data['users']
+            data_to_export = user_store.export_users()
         elif data_type == 'logs':
-            data_to_export = admin_data['logs']
+            data_to_export = list(oplog.iter_entries())
         elif data_type == 'statistics':
             data_to_export = admin_data['statistics']
         elif data_type == 'settings':
@@ -451,6 +674,7 @@ def export_data(data_type: str = 'all') -> str:
         logger.error(f"خطأ في تصدير البيانات: {e}")
         return None
 
+@_with_persist_lock
 def import_data(filename: str, data_type: str = 'all') -> bool:
     """استيراد البيانات من ملف"""
     try:
@@ -460,19 +684,22 @@ def import_data(filename: str, data_type: str = 'all') -> bool:
         with open(filename, 'r', encoding='utf-8') as f:
             imported_data = json.load(f)
         
+        import user_store
         if data_type == 'all':
             # تحديث كل البيانات باستثناء المشرفين المحظورين (للأمان)
             admin_data['statistics'] = imported_data.get('statistics', admin_data['statistics'])
-            admin_data['users'] = imported_data.get('users', admin_data['users'])
-            admin_data['logs'] = imported_data.get('logs', admin_data['logs'])
+            if 'users' in imported_data:
+                user_store.import_users(imported_data['users'])
+            if 'logs' in imported_data:
+                oplog.import_entries(imported_data['logs'])
             admin_data['settings'] = imported_data.get('settings', admin_data['settings'])
             # استيراد القوالب إذا كانت موجودة
             if 'templates' in imported_data:
                 import_templates(imported_data['templates'])
         elif data_type == 'users':
-            admin_data['users'] = imported_data
+            user_store.import_users(imported_data)
         elif data_type == 'logs':
-            admin_data['logs'] = imported_data
+            oplog.import_entries(imported_data)
         elif data_type == 'statistics':
             admin_data['statistics'] = imported_data
         elif data_type == 'settings':
@@ -486,6 +713,8 @@ def import_data(filename: str, data_type: str = 'all') -> bool:
                 import_templates(imported_data)
         
         save_admin_data()
+        if data_type in ('all', 'settings'):
+            _settings_changed()
         return True
     except Exception as e:
         logger.error(f"خطأ في استيراد البيانات: {e}")
@@ -524,25 +753,23 @@ def import_templates(templates_data):
 def reset_user_limit(user_id: int = None) -> bool:
     """إعادة تعيين الحد اليومي لمستخدم معين أو لكل المستخدمين"""
     try:
+        import quota
+        import user_store
+        _migrate_legacy_users()
+        quota.reset(user_id)
         if user_id:
             # إعادة تعيين الحد لمستخدم محدد
-            user_id_str = str(user_id)
-            if user_id_str in admin_data['users']:
-                admin_data['users'][user_id_str]['daily_usage'] = 0
-                admin_data['users'][user_id_str]['daily_reset'] = time.time()
-                save_admin_data()
-                return True
-            return False
+            return user_store.reset_daily_usage(user_id)
         else:
             # إعادة تعيين الحد لكل المستخدمين
-            for user_id_str in admin_data['users']:
-                admin_data['users'][user_id_str]['daily_usage'] = 0
-                admin_data['users'][user_id_str]['daily_reset'] = time.time()
+            if not user_store.reset_daily_usage():
+                return False
             
             # إعادة تعيين الإحصائيات اليومية
-            admin_data['statistics']['daily_files_processed'] = 0
-            admin_data['statistics']['daily_data_usage'] = 0
-            admin_data['statistics']['daily_stats_reset'] = time.time()
+            with _persist_lock:
+                admin_data['statistics']['daily_files_processed'] = 0
+                admin_data['statistics']['daily_data_usage'] = 0
+                admin_data['statistics']['daily_stats_reset'] = time.time()
             
             save_admin_data()
             return True
@@ -575,8 +802,13 @@ def schedule_broadcast(message_text: str, timestamp: float = None, message_type:
             'scheduled_id': int(time.time() * 1000)  # معرف فريد للبث المجدول
         }
         
-        admin_data['scheduled_broadcasts'].append(broadcast_data)
+        with _persist_lock:
+            admin_data['scheduled_broadcasts'].append(broadcast_data)
         save_admin_data()
+
+        import scheduler
+        if scheduler.is_running():
+            scheduler.schedule_broadcast_job(broadcast_data)
         return True
     except Exception as e:
         logger.error(f"خطأ في جدولة البث الجماعي: {e}")
@@ -591,6 +823,7 @@ def get_pending_broadcasts() -> List[Dict]:
     now = time.time()
     return [b for b in admin_data['scheduled_broadcasts'] if not b.get('sent', False) and b.get('time', 0) <= now]
 
+@_with_persist_lock
 def mark_broadcast_sent(scheduled_id: int) -> bool:
     """تحديد بث مجدول كمرسل
     
@@ -629,16 +862,23 @@ def remove_scheduled_broadcast(scheduled_id: int) -> bool:
         bool: نتيجة العملية
     """
     try:
-        for i, broadcast in enumerate(admin_data['scheduled_broadcasts']):
-            if broadcast.get('scheduled_id') == scheduled_id:
-                admin_data['scheduled_broadcasts'].pop(i)
-                save_admin_data()
-                return True
-        return False
+        with _persist_lock:
+            broadcasts = admin_data['scheduled_broadcasts']
+            index = next((i for i, broadcast in enumerate(broadcasts) if broadcast.get('scheduled_id') == scheduled_id), None)
+            if index is not None:
+                broadcasts.pop(index)
+        if index is None:
+            return False
+        save_admin_data()
+
+        import scheduler
+        scheduler.cancel_broadcast_job(scheduled_id)
+        return True
     except Exception as e:
         logger.error(f"خطأ في إزالة البث المجدول: {e}")
         return False
 
+@_with_persist_lock
 def update_bot_description(description: str) -> bool:
     """تحديث وصف البوت
     
@@ -656,6 +896,7 @@ def update_bot_description(description: str) -> bool:
         logger.error(f"خطأ في تحديث وصف البوت: {e}")
         return False
 
+@_with_persist_lock
 def update_usage_notes(notes: str) -> bool:
     """تحديث ملاحظات استخدام البوت
     
@@ -673,6 +914,7 @@ def update_usage_notes(notes: str) -> bool:
         logger.error(f"خطأ في تحديث ملاحظات استخدام البوت: {e}")
         return False
 
+@_with_persist_lock
 def add_tag_replacement(old_text: str, new_text: str) -> bool:
     """إضافة استبدال نصي للتعديل التلقائي
     
@@ -700,6 +942,7 @@ def add_tag_replacement(old_text: str, new_text: str) -> bool:
         logger.error(f"خطأ في إضافة استبدال نصي: {e}")
         return False
         
+@_with_persist_lock
 def remove_tag_replacement(old_text: str) -> bool:
     """إزالة استبدال نصي للتعديل التلقائي
     
@@ -723,6 +966,7 @@ def remove_tag_replacement(old_text: str) -> bool:
         logger.error(f"خطأ في إزالة استبدال نصي: {e}")
         return False
 
+@_with_persist_lock
 def add_smart_template(artist_name: str, template_id: str) -> bool:
     """إضافة قالب ذكي للتعديل التلقائي حسب اسم الفنان
     
@@ -750,6 +994,7 @@ def add_smart_template(artist_name: str, template_id: str) -> bool:
         logger.error(f"خطأ في إضافة قالب ذكي: {e}")
         return False
         
+@_with_persist_lock
 def remove_smart_template(artist_name: str) -> bool:
     """إزالة قالب ذكي للتعديل التلقائي
     
@@ -773,6 +1018,7 @@ def remove_smart_template(artist_name: str) -> bool:
         logger.error(f"خطأ في إزالة قالب ذكي: {e}")
         return False
         
+@_with_persist_lock
 def set_source_channel(channel_id: str) -> bool:
     """تعيين قناة المصدر للمعالجة التلقائية
     
@@ -788,12 +1034,14 @@ def set_source_channel(channel_id: str) -> bool:
         
         admin_data['settings']['auto_processing']['source_channel'] = channel_id
         save_admin_data()
+        _settings_changed("auto_processing.source_channel")
         logger.info(f"تم تعيين قناة المصدر: {channel_id}")
         return True
     except Exception as e:
         logger.error(f"خطأ في تعيين قناة المصدر: {e}")
         return False
         
+@_with_persist_lock
 def set_target_channel(channel_id: str) -> bool:
     """تعيين قناة الهدف للنشر التلقائي
     
@@ -815,6 +1063,7 @@ def set_target_channel(channel_id: str) -> bool:
         logger.error(f"خطأ في تعيين قناة الهدف: {e}")
         return False
         
+@_with_persist_lock
 def set_forward_to_target(enabled: bool = True) -> bool:
     """تفعيل/تعطيل النشر التلقائي للقناة الهدف
     
@@ -837,6 +1086,7 @@ def set_forward_to_target(enabled: bool = True) -> bool:
         logger.error(f"خطأ في تعيين حالة النشر التلقائي للقناة الهدف: {e}")
         return False
 
+@_with_persist_lock
 def set_tag_footer(footer_text: str) -> bool:
     """تعيين نص التذييل للوسوم
     
@@ -858,6 +1108,7 @@ def set_tag_footer(footer_text: str) -> bool:
         logger.error(f"خطأ في تعيين نص التذييل: {e}")
         return False
 
+@_with_persist_lock
 def set_tag_footer_enabled(enabled: bool = True) -> bool:
     """تفعيل/تعطيل إضافة التذييل للوسوم
     
@@ -880,6 +1131,7 @@ def set_tag_footer_enabled(enabled: bool = True) -> bool:
         logger.error(f"خطأ في تعيين حالة إضافة التذييل للوسوم: {e}")
         return False
 
+@_with_persist_lock
 def update_footer_tag_settings(tag_settings: dict) -> bool:
     """تحديث إعدادات الوسوم التي يضاف إليها التذييل
     
@@ -901,6 +1153,7 @@ def update_footer_tag_settings(tag_settings: dict) -> bool:
         logger.error(f"خطأ في تحديث إعدادات الوسوم التي يضاف إليها التذييل: {e}")
         return False
 
+@_with_persist_lock
 def update_auto_tags(auto_tags: Dict) -> bool:
     """تحديث الوسوم التلقائية
     
@@ -918,6 +1171,7 @@ def update_auto_tags(auto_tags: Dict) -> bool:
         logger.error(f"خطأ في تحديث الوسوم التلقائية: {e}")
         return False
 
+@_with_persist_lock
 def set_audio_watermark(file_path: str, position: str = 'start', volume: float = 0.5) -> bool:
     """تعيين ملف العلامة المائية الصوتية
     
@@ -939,6 +1193,7 @@ def set_audio_watermark(file_path: str, position: str = 'start', volume: float =
         logger.error(f"خطأ في تعيين العلامة المائية الصوتية: {e}")
         return False
 
+@_with_persist_lock
 def enable_audio_watermark(enabled: bool = True) -> bool:
     """تفعيل/تعطيل العلامة المائية الصوتية
     
@@ -956,6 +1211,7 @@ def enable_audio_watermark(enabled: bool = True) -> bool:
         logger.error(f"خطأ في تفعيل/تعطيل العلامة المائية الصوتية: {e}")
         return False
 
+@_with_persist_lock
 def enable_image_watermark(enabled: bool = True) -> bool:
     """تفعيل/تعطيل العلامة المائية للصور
     
@@ -976,6 +1232,7 @@ def enable_image_watermark(enabled: bool = True) -> bool:
         logger.error(f"خطأ في تفعيل/تعطيل العلامة المائية للصور: {e}")
         return False
     
+@_with_persist_lock
 def set_image_watermark(file_path: str) -> bool:
     """تعيين ملف العلامة المائية للصور
     
@@ -1002,6 +1259,7 @@ def set_image_watermark(file_path: str) -> bool:
         logger.error(f"خطأ في تعيين ملف العلامة المائية للصور: {e}")
         return False
         
+@_with_persist_lock
 def set_image_watermark_position(position: str) -> bool:
     """تعيين موضع العلامة المائية للصور
     
@@ -1028,6 +1286,7 @@ def set_image_watermark_position(position: str) -> bool:
         logger.error(f"خطأ في تعيين موضع العلامة المائية للصور: {e}")
         return False
     
+@_with_persist_lock
 def set_image_watermark_size(size_percent: int) -> bool:
     """تعيين حجم العلامة المائية للصور
     
@@ -1054,6 +1313,7 @@ def set_image_watermark_size(size_percent: int) -> bool:
         logger.error(f"خطأ في تعيين حجم العلامة المائية للصور: {e}")
         return False
     
+@_with_persist_lock
 def set_image_watermark_opacity(opacity: float) -> bool:
     """تعيين شفافية العلامة المائية للصور
     
@@ -1080,6 +1340,7 @@ def set_image_watermark_opacity(opacity: float) -> bool:
         logger.error(f"خطأ في تعيين شفافية العلامة المائية للصور: {e}")
         return False
     
+@_with_persist_lock
 def set_image_watermark_padding(padding: int) -> bool:
     """تعيين التباعد من الحافة للعلامة المائية
     
@@ -1124,38 +1385,97 @@ def send_to_log_channel(message: str, bot=None):
         return False
 
 # دالة للتحقق من اشتراك المستخدم في القنوات المطلوبة
+# ذاكرة مؤقتة لنتائج التحقق من الاشتراك: {(معرف المستخدم، معرف القناة): (مشترك، وقت الانتهاء)}
+_subscription_cache: Dict[Tuple[int, str], Tuple[bool, float]] = {}
+_subscription_cache_lock = threading.Lock()
+_subscription_executor = None
+
+# عند تجاوز هذا العدد من النتائج يتم حذف المنتهية منها
+SUBSCRIPTION_CACHE_MAX_ENTRIES = 10000
+
+def _is_channel_member(bot, channel_id: str, user_id: int) -> Optional[bool]:
+    """
+    التحقق من عضوية المستخدم في قناة عبر تيليجرام
+
+    Returns:
+        bool: هل المستخدم مشترك، أو None عند فشل التحقق
+    """
+    try:
+        member = bot.get_chat_member(channel_id, user_id)
+        return member.status in ['member', 'administrator', 'creator']
+    except Exception as e:
+        logger.error(f"خطأ في التحقق من اشتراك المستخدم {user_id} في القناة {channel_id}: {e}")
+        return None
+
+def _cache_subscription(user_id: int, channel_id: str, is_member: bool):
+    """حفظ نتيجة التحقق: مدة أطول للمشتركين ومدة أقصر لغير المشتركين حتى يظهر اشتراكهم بسرعة"""
+    ttl = Config.SUBSCRIPTION_CACHE_POSITIVE_SECONDS if is_member else Config.SUBSCRIPTION_CACHE_NEGATIVE_SECONDS
+    now = time.time()
+    with _subscription_cache_lock:
+        if len(_subscription_cache) >= SUBSCRIPTION_CACHE_MAX_ENTRIES:
+            for key in [key for key, (_, expires_at) in _subscription_cache.items() if expires_at <= now]:
+                del _subscription_cache[key]
+        _subscription_cache[(user_id, channel_id)] = (is_member, now + ttl)
+
+def invalidate_subscription_cache(user_id: int = None):
+    """حذف نتائج التحقق المحفوظة لمستخدم محدد (عند ضغط زر "اشتركت") أو لجميع المستخدمين"""
+    with _subscription_cache_lock:
+        if user_id is None:
+            _subscription_cache.clear()
+            return
+        for key in [key for key in _subscription_cache if key[0] == user_id]:
+            del _subscription_cache[key]
+
 def check_subscription(user_id: int, bot) -> Tuple[bool, List[Dict]]:
     """التحقق من اشتراك المستخدم في القنوات المطلوبة
     
+    تستخدم النتائج المحفوظة إن لم تنته صلاحيتها، ويتم التحقق من بقية القنوات بالتوازي.
+    
     Returns:
         Tuple[bool, List[Dict]]: الاشتراك بنجاح، قائمة القنوات غير المشترك بها
     """
+    global _subscription_executor
+    
     # التحقق مما إذا كانت ميزة الاشتراك الإجباري مفعّلة
     if not admin_data['settings']['features_enabled'].get('required_subscription', False):
         return True, []
     
     # الحصول على قائمة القنوات المطلوبة
-    required_channels = admin_data['settings'].get('required_channels', [])
+    required_channels = [channel for channel in admin_data['settings'].get('required_channels', [])
+                         if channel.get('channel_id')]
     if not required_channels:
         return True, []
     
-    not_subscribed = []
-    for channel in required_channels:
-        channel_id = channel.get('channel_id', '')
-        if not channel_id:
-            continue
-        
-        try:
-            member = bot.get_chat_member(channel_id, user_id)
-            if member.status not in ['member', 'administrator', 'creator']:
-                not_subscribed.append(channel)
-        except Exception as e:
-            logger.error(f"خطأ في التحقق من اشتراك المستخدم {user_id} في القناة {channel_id}: {e}")
-            not_subscribed.append(channel)
-    
+    now = time.time()
+    results = {}
+    with _subscription_cache_lock:
+        for channel in required_channels:
+            cached = _subscription_cache.get((user_id, channel['channel_id']))
+            if cached is not None and cached[1] > now:
+                results[channel['channel_id']] = cached[0]
+    
+    missing = [channel['channel_id'] for channel in required_channels if channel['channel_id'] not in results]
+    if len(missing) == 1:
+        results[missing[0]] = _is_channel_member(bot, missing[0], user_id)
+    elif missing:
+        if _subscription_executor is None:
+            with _subscription_cache_lock:
+                if _subscription_executor is None:
+                    _subscription_executor = ThreadPoolExecutor(max_workers=Config.SUBSCRIPTION_CHECK_WORKERS,
+                                                                thread_name_prefix="subscription-check")
+        checks = _subscription_executor.map(lambda channel_id: _is_channel_member(bot, channel_id, user_id), missing)
+        results.update(zip(missing, checks))
+    
+    for channel_id in missing:
+        # عدم حفظ نتيجة الأخطاء حتى يعاد التحقق في الرسالة التالية
+        if results[channel_id] is not None:
+            _cache_subscription(user_id, channel_id, results[channel_id])
+    
+    not_subscribed = [channel for channel in required_channels if not results[channel['channel_id']]]
     return len(not_subscribed) == 0, not_subscribed
 
 # دالة تحديث رسالة الترحيب
+@_with_persist_lock
 def update_welcome_message(message: str) -> bool:
     """تحديث رسالة الترحيب"""
     try:
@@ -1167,6 +1487,7 @@ def update_welcome_message(message: str) -> bool:
         return False
 
 # دالة إضافة قناة اشتراك إجباري
+@_with_persist_lock
 def add_required_channel(channel_id: str, title: str) -> bool:
     """إضافة قناة اشتراك إجباري"""
     try:
@@ -1199,6 +1520,7 @@ def add_required_channel(channel_id: str, title: str) -> bool:
         return False
 
 # دالة إزالة قناة اشتراك إجباري
+@_with_persist_lock
 def remove_required_channel(channel_id: str) -> bool:
     """إزالة قناة اشتراك إجباري"""
     try:
@@ -1220,6 +1542,7 @@ def remove_required_channel(channel_id: str) -> bool:
         return False
 
 # دالة تعيين قناة السجل
+@_with_persist_lock
 def set_log_channel(channel_id: str) -> bool:
     """تعيين قناة السجل"""
     try:
@@ -1235,6 +1558,7 @@ def set_log_channel(channel_id: str) -> bool:
         return False
 
 # دالة تعيين وقت التأخير بين تعديل كل ملف
+@_with_persist_lock
 def set_processing_delay(delay_seconds: int) -> bool:
     """تعيين وقت التأخير بين تعديل كل ملف"""
     try:
@@ -1246,6 +1570,7 @@ def set_processing_delay(delay_seconds: int) -> bool:
         return False
 
 # دالة تعيين حد البيانات اليومي لكل مستخدم
+@_with_persist_lock
 def set_daily_user_limit(limit_mb: int) -> bool:
     """تعيين حد البيانات اليومي لكل مستخدم بالميجابايت"""
     try:
@@ -1267,26 +1592,12 @@ def check_user_limit(user_id: int, file_size_mb: float) -> bool:
     if user_limit <= 0:
         return True  # عدم وجود حد
     
-    user_id_str = str(user_id)
-    if user_id_str not in admin_data['users']:
-        return True  # مستخدم جديد
-    
-    user_data = admin_data['users'][user_id_str]
-    daily_usage = user_data.get('daily_usage', 0)
-    
-    # التحقق من إعادة تعيين العداد اليومي
-    now = time.time()
-    daily_reset_time = user_data.get('daily_reset', 0)
-    if now - daily_reset_time > 86400:  # 24 ساعة
-        user_data['daily_usage'] = 0
-        user_data['daily_reset'] = now
-        daily_usage = 0
-        save_admin_data()
-    
-    # التحقق من الحد
-    return daily_usage + file_size_mb <= user_limit
+    # الاستخدام اليومي مع الحجوزات الجارية (يبدأ عداد جديد مع كل يوم)
+    import quota
+    return quota.check(user_id, file_size_mb)
 
 # دوال العلامة المائية للصور
+@_with_persist_lock
 def enable_image_watermark(enable=True):
     """تفعيل أو تعطيل العلامة المائية للصور"""
     try:
@@ -1299,6 +1610,7 @@ def enable_image_watermark(enable=True):
         logger.error(f"خطأ أثناء تفعيل/تعطيل العلامة المائية: {e}")
         return False
 
+@_with_persist_lock
 def set_image_watermark_position(position):
     """تعيين موضع العلامة المائية"""
     try:
@@ -1311,6 +1623,7 @@ def set_image_watermark_position(position):
         logger.error(f"خطأ أثناء تعيين موضع العلامة المائية: {e}")
         return False
         
+@_with_persist_lock
 def set_image_watermark_size(size):
     """تعيين حجم العلامة المائية (1-100)"""
     try:
@@ -1327,6 +1640,7 @@ def set_image_watermark_size(size):
         logger.error(f"خطأ أثناء تعيين حجم العلامة المائية: {e}")
         return False
         
+@_with_persist_lock
 def set_image_watermark_opacity(opacity):
     """تعيين شفافية العلامة المائية (1-100)"""
     try:
@@ -1343,6 +1657,7 @@ def set_image_watermark_opacity(opacity):
         logger.error(f"خطأ أثناء تعيين شفافية العلامة المائية: {e}")
         return False
         
+@_with_persist_lock
 def set_image_watermark_padding(padding):
     """تعيين تباعد العلامة المائية من الحافة (1-100)"""
     try:
@@ -1359,6 +1674,7 @@ def set_image_watermark_padding(padding):
         logger.error(f"خطأ أثناء تعيين تباعد العلامة المائية: {e}")
         return False
         
+@_with_persist_lock
 def save_image_watermark(image_path):
     """حفظ صورة العلامة المائية"""
     try:
@@ -1395,6 +1711,7 @@ if not admin_data['admins']:
     admin_data['admins'].add(1174919068)  # هذا مجرد مثال، يمكن تغييره
 
 # وظائف إدارة القوالب العامة
+@_with_persist_lock
 def add_global_template(template_name: str, template_data: dict) -> bool:
     """
     إضافة قالب عام جديد أو تحديث قالب موجود
@@ -1423,6 +1740,7 @@ def add_global_template(template_name: str, template_data: dict) -> bool:
         logger.error(f"حدث خطأ أثناء إضافة القالب العام '{template_name}': {str(e)}")
         return False
 
+@_with_persist_lock
 def delete_global_template(template_name: str) -> bool:
     """
     حذف قالب عام موجود
@@ -12,10 +12,19 @@ import logging
 import telebot
 import tempfile
 import shutil
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tag_handler import get_audio_tags, set_audio_tags
-from thumbnail_helper import extract_album_art_as_bytes
-from template_handler import get_template
+from thumbnail_helper import extract_album_art_as_bytes, get_telegram_thumbnail, submit_thumbnail_task
+from template_handler import get_template, get_template_path
 import admin_panel
+import result_cache
+import job_queue
+import channel_pipelines
+import text_normalizer
+import stats_timeseries
+from stage_metrics import stage_timer, get_file_format, record_overlap
 from config import Config
 from logger_setup import log_auto_processing, log_error
 
@@ -79,41 +88,45 @@ def get_target_channel():
     """الحصول على معرف قناة الهدف للنشر التلقائي"""
     return admin_panel.get_setting("auto_processing.target_channel", "")
 
-def should_keep_caption():
+def should_keep_caption(pipeline=None):
     """التحقق مما إذا كان يجب الحفاظ على الكابشن الأصلي"""
-    return admin_panel.get_setting("auto_processing.keep_caption", True)
+    return channel_pipelines.get_pipeline_setting(pipeline, "keep_caption", True)
 
-def should_auto_publish():
+def should_auto_publish(pipeline=None):
     """التحقق مما إذا كان يجب النشر التلقائي بعد التعديل"""
-    return admin_panel.get_setting("auto_processing.auto_publish", True)
+    return channel_pipelines.get_pipeline_setting(pipeline, "auto_publish", True)
     
-def should_forward_to_target():
+def should_edit_in_place(pipeline=None):
+    """التحقق مما إذا كان يجب استبدال الملف داخل المنشور الأصلي بدلاً من حذفه وإعادة نشره"""
+    return channel_pipelines.get_pipeline_setting(pipeline, "edit_in_place", False)
+
+def should_forward_to_target(pipeline=None):
     """التحقق مما إذا كان يجب نشر الملف المعدل لقناة الهدف"""
-    return admin_panel.get_setting("auto_processing.forward_to_target", False)
+    return channel_pipelines.get_pipeline_setting(pipeline, "forward_to_target", False)
     
-def should_remove_links():
+def should_remove_links(pipeline=None):
     """التحقق مما إذا كان يجب حذف الروابط تلقائيًا من الوسوم"""
-    return admin_panel.get_setting("auto_processing.remove_links", False)
+    return channel_pipelines.get_pipeline_setting(pipeline, "remove_links", False)
     
-def should_add_footer():
+def should_add_footer(pipeline=None):
     """التحقق مما إذا كان يجب إضافة التذييل للوسوم"""
-    return admin_panel.get_setting("auto_processing.footer_enabled", False)
+    return channel_pipelines.get_pipeline_setting(pipeline, "footer_enabled", False)
 
-def get_tag_footer():
+def get_tag_footer(pipeline=None):
     """الحصول على نص التذييل للوسوم"""
-    return admin_panel.get_setting("auto_processing.tag_footer", "")
+    return channel_pipelines.get_pipeline_setting(pipeline, "tag_footer", "")
 
-def get_footer_tag_settings():
+def get_footer_tag_settings(pipeline=None):
     """الحصول على إعدادات الوسوم التي يضاف إليها التذييل"""
-    return admin_panel.get_setting("auto_processing.footer_tag_settings", {})
+    return channel_pipelines.get_pipeline_setting(pipeline, "footer_tag_settings", {})
 
-def get_tag_replacements():
+def get_tag_replacements(pipeline=None):
     """الحصول على استبدالات النصوص للوسوم"""
-    return admin_panel.get_setting("auto_processing.tag_replacements", {})
+    return channel_pipelines.get_pipeline_setting(pipeline, "tag_replacements", {})
 
-def get_enabled_tags():
+def get_enabled_tags(pipeline=None):
     """الحصول على الوسوم المفعلة للمعالجة"""
-    return admin_panel.get_setting("auto_processing.enabled_tags", {
+    return channel_pipelines.get_pipeline_setting(pipeline, "enabled_tags", {
         'artist': True,
         'album_artist': True,
         'album': True,
@@ -125,9 +138,166 @@ def get_enabled_tags():
         'lyrics': True  # إضافة دعم كلمات الأغاني للاستبدال
     })
 
-def get_smart_templates():
+def get_target_channels(pipeline=None):
+    """الحصول على قنوات الهدف للمسار (قناة الهدف العامة إذا لم يحدد المسار قنوات خاصة)"""
+    return channel_pipelines.get_target_channels(pipeline)
+
+def get_smart_templates(pipeline=None):
     """الحصول على القوالب الذكية حسب اسم الفنان"""
-    return admin_panel.get_setting("auto_processing.smart_templates", {})
+    return channel_pipelines.get_pipeline_setting(pipeline, "smart_templates", {})
+
+def get_transform_fingerprint(pipeline=None):
+    """
+    حساب بصمة التعديل التلقائي الحالي (الاستبدالات والوسوم المفعلة والقوالب وحذف الروابط والتذييل)
+
+    Args:
+        pipeline: مسار المعالجة (إعداداته تتجاوز الإعدادات العامة)
+
+    Returns:
+        str: بصمة تتغير عند تغيير أي إعداد يؤثر على الملف الناتج
+    """
+    smart_templates = get_smart_templates(pipeline)
+
+    # تضمين وقت آخر تعديل لملفات القوالب المستخدمة حتى يتم تجاهل النتائج القديمة عند تعديل القالب
+    template_versions = {}
+    for template_id in set(smart_templates.values()):
+        template_path = get_template_path(template_id)
+        template_versions[template_id] = os.path.getmtime(template_path) if os.path.exists(template_path) else None
+
+    # الإعدادات التي تغير الملف الناتج فقط (إعدادات النشر والقنوات لا تلغي النتائج المخزنة)
+    add_footer_enabled = should_add_footer(pipeline)
+    return result_cache.compute_fingerprint(
+        get_tag_replacements(pipeline),
+        should_remove_links(pipeline),
+        add_footer_enabled,
+        get_tag_footer(pipeline) if add_footer_enabled else "",
+        get_footer_tag_settings(pipeline) if add_footer_enabled else {},
+        get_enabled_tags(pipeline),
+        smart_templates,
+        template_versions
+    )
+
+def build_transform_context(pipeline=None):
+    """
+    قراءة جميع إعدادات التعديل التلقائي مرة واحدة (تستخدم لمعالجة دفعة من الملفات بنفس الإعدادات)
+    
+    Args:
+        pipeline: مسار المعالجة (إعداداته تتجاوز الإعدادات العامة)
+    
+    Returns:
+        dict: الاستبدالات والوسوم المفعلة والقوالب الذكية المحملة وإعدادات الروابط والتذييل وبصمة التعديل
+    """
+    smart_templates = get_smart_templates(pipeline)
+    add_footer_enabled = should_add_footer(pipeline)
+    
+    return {
+        'replacements': get_tag_replacements(pipeline),
+        'enabled_tags': get_enabled_tags(pipeline),
+        'smart_templates': smart_templates,
+        # تحميل ملفات القوالب المستخدمة مرة واحدة فقط
+        'templates': {template_id: get_template(template_id) for template_id in set(smart_templates.values())},
+        'remove_links': should_remove_links(pipeline),
+        'keep_caption': should_keep_caption(pipeline),
+        'footer_enabled': add_footer_enabled,
+        'footer_text': get_tag_footer(pipeline) if add_footer_enabled else "",
+        'footer_tag_settings': get_footer_tag_settings(pipeline) if add_footer_enabled else {},
+        'fingerprint': get_transform_fingerprint(pipeline)
+    }
+
+# الوسوم التي يرسلها تيليجرام مع الملف الصوتي (title وperformer) والوسوم التي لا تظهر إلا بعد تنزيل الملف
+METADATA_TAGS = {'title': 'title', 'artist': 'performer'}
+FILE_ONLY_TAGS = ('album_artist', 'album', 'year', 'genre', 'composer', 'comment', 'track', 'length', 'lyrics')
+# الوسوم الرقمية لا تحتوي على روابط، ولا يغيرها إلا استبدال نصه من الأرقام والفواصل فقط
+NUMERIC_TAGS = ('year', 'track', 'length')
+NUMERIC_CHARS = set('0123456789/-:. ')
+
+def get_file_only_targets(enabled_tags, replacements, remove_links_enabled):
+    """
+    الوسوم غير الظاهرة في بيانات تيليجرام التي يمكن أن تغيرها الاستبدالات أو حذف الروابط
+
+    يحتسب الوسم فقط إذا كان مفعلاً صراحة في إعدادات الوسوم المفعلة.
+
+    Args:
+        enabled_tags: قاموس الوسوم المفعلة {اسم الوسم: True/False}
+        replacements: قاموس الاستبدالات {من: إلى}
+        remove_links_enabled: هل حذف الروابط مفعل
+
+    Returns:
+        list: أسماء الوسوم المستهدفة
+    """
+    numeric_replacements = any(old and set(old) <= NUMERIC_CHARS for old in replacements)
+    targets = []
+    for tag_name in FILE_ONLY_TAGS:
+        if not enabled_tags.get(tag_name, False):
+            continue
+        if tag_name in NUMERIC_TAGS:
+            if not numeric_replacements:
+                continue
+        elif not (replacements or remove_links_enabled):
+            continue
+        targets.append(tag_name)
+    return targets
+
+def get_change_reason(audio, original_caption, context):
+    """
+    فحص سريع لبيانات الملف التي يرسلها تيليجرام لمعرفة ما إذا كان التعديل قد يغير الملف
+
+    يتم تنزيل الملف وقراءة وسومه فقط إذا كان التغيير ممكناً أو إذا كانت القواعد تستهدف وسوماً
+    لا تظهر في بيانات تيليجرام (مثل الكلمات والتعليق والألبوم).
+
+    Args:
+        audio: كائن الملف الصوتي من الرسالة
+        original_caption: الكابشن الأصلي للرسالة
+        context: إعدادات التعديل من build_transform_context
+
+    Returns:
+        str: سبب الحاجة إلى المعالجة، أو None إذا كان الملف لن يتغير
+    """
+    # حذف الكابشن الأصلي يتطلب إعادة النشر
+    if original_caption and not context['keep_caption']:
+        return 'caption'
+
+    # التذييل يضاف إلى كل وسم غير فارغ، ولا يمكن معرفة الوسوم الفارغة دون قراءة الملف
+    if context['footer_enabled'] and context['footer_text']:
+        return 'footer'
+
+    performer = getattr(audio, 'performer', None)
+    if context['smart_templates']:
+        if not performer:
+            return 'unknown_artist'
+        if apply_smart_template({'artist': performer}, context['smart_templates'], context['templates']) != {'artist': performer}:
+            return 'smart_template'
+
+    replacements = context['replacements']
+    if not replacements and not context['remove_links']:
+        return None
+
+    enabled_tags = context['enabled_tags']
+    if not enabled_tags:
+        return None
+    if get_file_only_targets(enabled_tags, replacements, context['remove_links']):
+        return 'file_only_tags'
+
+    for tag_name, attribute in METADATA_TAGS.items():
+        if not enabled_tags.get(tag_name, True):
+            continue
+        value = getattr(audio, attribute, None)
+        if not value:
+            # القيمة غير متوفرة في بيانات تيليجرام (قد تكون موجودة في الملف)
+            return 'missing_metadata'
+        processed_value = remove_links(value) if context['remove_links'] else value
+        if replacements:
+            processed_value = apply_replacements(processed_value, replacements)
+        if processed_value != value:
+            return tag_name
+
+    return None
+
+def record_precheck(checked, skipped):
+    """تسجيل عدد الملفات المفحوصة والملفات التي تم تخطي تنزيلها في إحصائيات لوحة الإدارة"""
+    admin_panel.increment_statistic('precheck_checked', checked)
+    if skipped:
+        admin_panel.increment_statistic('precheck_skipped', skipped)
 
 def apply_replacements(text, replacements):
     """
@@ -150,7 +320,7 @@ def apply_replacements(text, replacements):
     
     return result
 
-def apply_tag_replacements(tags, replacements, enabled_tags):
+def apply_tag_replacements(tags, replacements, enabled_tags, context=None):
     """
     تطبيق استبدالات النصوص على الوسوم وحذف الروابط إذا كانت الميزة مفعلة
     
@@ -158,15 +328,22 @@ def apply_tag_replacements(tags, replacements, enabled_tags):
         tags: الوسوم الأصلية
         replacements: قاموس الاستبدالات {من: إلى}
         enabled_tags: قاموس الوسوم المفعلة {اسم الوسم: True/False}
+        context: إعدادات التعديل المقروءة مسبقاً من build_transform_context (اختياري)
     
     Returns:
         dict: الوسوم بعد الاستبدالات
     """
     # التحقق من وجود استبدالات أو تفعيل حذف الروابط
-    remove_links_enabled = should_remove_links()
-    add_footer_enabled = should_add_footer()
-    footer_text = get_tag_footer() if add_footer_enabled else ""
-    footer_tag_settings = get_footer_tag_settings() if add_footer_enabled else {}
+    if context is not None:
+        remove_links_enabled = context['remove_links']
+        add_footer_enabled = context['footer_enabled']
+        footer_text = context['footer_text']
+        footer_tag_settings = context['footer_tag_settings']
+    else:
+        remove_links_enabled = should_remove_links()
+        add_footer_enabled = should_add_footer()
+        footer_text = get_tag_footer() if add_footer_enabled else ""
+        footer_tag_settings = get_footer_tag_settings() if add_footer_enabled else {}
     
     if not replacements and not remove_links_enabled and not add_footer_enabled:
         return tags
@@ -272,13 +449,14 @@ def apply_tag_replacements(tags, replacements, enabled_tags):
     
     return result
 
-def apply_smart_template(tags, smart_templates):
+def apply_smart_template(tags, smart_templates, templates=None):
     """
     تطبيق القالب الذكي المناسب حسب اسم الفنان
     
     Args:
         tags: الوسوم الأصلية
         smart_templates: قاموس القوالب الذكية {اسم الفنان: معرف القالب}
+        templates: القوالب المحملة مسبقاً {معرف القالب: بيانات القالب} (اختياري)
     
     Returns:
         dict: الوسوم بعد تطبيق القالب (إن وجد)
@@ -290,9 +468,9 @@ def apply_smart_template(tags, smart_templates):
     
     # البحث عن القالب المناسب حسب اسم الفنان
     for template_artist, template_id in smart_templates.items():
-        if template_artist.lower() in artist_name.lower() or artist_name.lower() in template_artist.lower():
+        if text_normalizer.matches_any_direction(template_artist, artist_name):
             # الحصول على القالب
-            template = get_template(template_id)
+            template = templates[template_id] if templates is not None and template_id in templates else get_template(template_id)
             if template and 'tags' in template:
                 # دمج الوسوم مع الحفاظ على العنوان والفنان والألبوم الأصليين
                 merged_tags = tags.copy()
@@ -315,19 +493,445 @@ def apply_smart_template(tags, smart_templates):
     
     return tags
 
-def process_audio_file(bot, message, temp_dir='temp_audio_files'):
+def download_audio(bot, file_id, file_path):
     """
-    معالجة ملف صوتي من رسالة في القناة
+    تنزيل ملف صوتي من تيليجرام إلى مسار محلي
+    
+    Args:
+        bot: كائن البوت
+        file_id: معرف الملف في تيليجرام
+        file_path: مسار الحفظ
+        
+    Returns:
+        str: مسار الملف المنزل
+    """
+    with stage_timer('download', file_path):
+        file_info = bot.get_file(file_id)
+        downloaded_file = bot.download_file(file_info.file_path)
+        with open(file_path, 'wb') as new_file:
+            new_file.write(downloaded_file)
+    logger.info(f"تم تنزيل الملف الصوتي: {file_path}")
+    return file_path
+
+def rewrite_audio_tags(file_path, edited_file_path, context):
+    """
+    إنشاء نسخة معدلة من الملف مع تطبيق القالب الذكي والاستبدالات
+    
+    Args:
+        file_path: مسار الملف الأصلي
+        edited_file_path: مسار النسخة المعدلة
+        context: إعدادات التعديل من build_transform_context
+        
+    Returns:
+        dict: الوسوم الجديدة
+    """
+    shutil.copy2(file_path, edited_file_path)
+    with stage_timer('parse', edited_file_path):
+        tags = get_audio_tags(edited_file_path)
+    
+    # تطبيق القالب الذكي أولاً ثم استبدالات النصوص
+    with stage_timer('smart_template', edited_file_path):
+        tags = apply_smart_template(tags, context['smart_templates'], context['templates'])
+    with stage_timer('replace', edited_file_path):
+        tags = apply_tag_replacements(tags, context['replacements'], context['enabled_tags'], context)
+    
+    with stage_timer('tag_write', edited_file_path):
+        set_audio_tags(edited_file_path, tags)
+    logger.info(f"تم تعديل الملف الصوتي: {edited_file_path}")
+    return tags
+
+def prepare_thumbnail(file_path):
+    """
+    استخراج صورة الألبوم وتجهيز الصورة المصغرة (تعمل في الخلفية بالتوازي مع كتابة الوسوم)
+    
+    Args:
+        file_path: مسار الملف الذي يحتوي على صورة الألبوم
+        
+    Returns:
+        tuple: (بيانات الصورة المصغرة أو None، زمن التجهيز بالثواني)
+    """
+    timer = stage_timer('thumbnail', file_path)
+    try:
+        cover = extract_album_art_as_bytes(file_path)
+        return (get_telegram_thumbnail(cover) if cover else None), timer.stop()
+    except Exception as e:
+        logger.error(f"خطأ في استخراج الصورة المصغرة: {e}")
+        return None, timer.stop()
+
+def wait_for_thumbnail(future, file_path, pipeline='channel'):
+    """
+    انتظار انتهاء تجهيز الصورة المصغرة وتسجيل مقدار التداخل المحقق
+    
+    Args:
+        future: مهمة التجهيز من submit_thumbnail_task
+        file_path: مسار الملف (للقياسات)
+        pipeline: مسار المعالجة
+        
+    Returns:
+        نتيجة التجهيز (بيانات الصورة المصغرة أو مسارها) أو None
+    """
+    if future is None:
+        return None
+    wait_started = time.perf_counter()
+    try:
+        thumbnail_data, task_seconds = future.result()
+    except Exception as e:
+        logger.error(f"خطأ في تجهيز الصورة المصغرة: {e}")
+        return None
+    record_overlap(task_seconds, time.perf_counter() - wait_started, file_path, pipeline=pipeline)
+    return thumbnail_data
+
+def upload_audio(bot, chat_id, edited_file_path, tags, caption, title=None, performer=None, duration=None,
+                 thumbnail_data=None):
+    """
+    إرسال الملف المعدل مع صورة الألبوم كصورة مصغرة
+    
+    Args:
+        bot: كائن البوت
+        chat_id: معرف المحادثة
+        edited_file_path: مسار الملف المعدل
+        tags: الوسوم الجديدة
+        caption: الكابشن
+        title: العنوان الأصلي (يستخدم إذا لم يوجد في الوسوم)
+        performer: الفنان الأصلي (يستخدم إذا لم يوجد في الوسوم)
+        duration: مدة الملف
+        thumbnail_data: الصورة المصغرة الجاهزة (إن لم تمرر يتم استخراجها من الملف المعدل)
+        
+    Returns:
+        Message: الرسالة المرسلة
+    """
+    if thumbnail_data is None:
+        thumbnail_data, _ = prepare_thumbnail(edited_file_path)
+    
+    with open(edited_file_path, 'rb') as audio_file:
+        # استخدام صورة الألبوم كصورة مصغرة إن وجدت
+        thumbnail = None
+        thumbnail_path = None
+        try:
+            if thumbnail_data:
+                thumbnail_path = f"{os.path.splitext(edited_file_path)[0]}_thumb.jpg"
+                with open(thumbnail_path, 'wb') as thumb_file:
+                    thumb_file.write(thumbnail_data)
+                thumbnail = open(thumbnail_path, 'rb')
+        except Exception as thumb_error:
+            logger.error(f"خطأ في حفظ الصورة المصغرة: {thumb_error}")
+            thumbnail = None
+        
+        upload_timer = stage_timer('upload', edited_file_path)
+        try:
+            sent_message = bot.send_audio(
+                chat_id=chat_id,
+                audio=audio_file,
+                caption=caption,
+                title=tags.get('title', title),
+                performer=tags.get('artist', performer),
+                thumb=thumbnail,
+                duration=duration,
+                parse_mode='Markdown'  # لدعم التنسيق في التسمية التوضيحية
+            )
+        except Exception as send_error:
+            logger.error(f"خطأ في إرسال الملف المعدل: {send_error}")
+            # محاولة إرسال الملف بدون خيارات متقدمة
+            audio_file.seek(0)
+            sent_message = bot.send_audio(
+                chat_id=chat_id,
+                audio=audio_file,
+                caption=caption
+            )
+            logger.info(f"تم إرسال الملف المعدل بالطريقة البسيطة برقم {sent_message.message_id}")
+        finally:
+            upload_timer.stop()
+            # إغلاق وحذف ملف الصورة المصغرة المؤقت إن وجد
+            if thumbnail:
+                thumbnail.close()
+            if thumbnail_path and os.path.exists(thumbnail_path):
+                os.remove(thumbnail_path)
+    
+    logger.info(f"تم إرسال الملف المعدل برسالة جديدة برقم {sent_message.message_id}")
+    return sent_message
+
+# أخطاء تيليجرام التي تعني أن تعديل المنشور غير مسموح (يتم الرجوع عندها للحذف وإعادة النشر)
+EDIT_NOT_PERMITTED_ERRORS = (
+    "message can't be edited",
+    "not enough rights",
+    "message to edit not found",
+    "message_id_invalid",
+    "chat_admin_required",
+    "have no rights",
+)
+
+def edit_audio_in_place(bot, job, audio, thumbnail_data=None, tags=None):
+    """
+    استبدال الملف الصوتي داخل المنشور الأصلي باستخدام editMessageMedia
+    
+    Args:
+        bot: كائن البوت
+        job: بيانات المهمة
+        audio: الملف المعدل (كائن ملف مفتوح) أو معرف ملف مرفوع مسبقاً
+        thumbnail_data: الصورة المصغرة الجاهزة
+        tags: الوسوم الجديدة
+        
+    Returns:
+        Message: المنشور بعد التعديل، أو None إذا كان التعديل غير مسموح
+    """
+    tags = tags or {}
+    media = telebot.types.InputMediaAudio(
+        media=audio,
+        thumbnail=thumbnail_data if thumbnail_data and not isinstance(audio, str) else None,
+        caption=job['caption'],
+        parse_mode='Markdown',
+        duration=job['duration'],
+        performer=tags.get('artist', job['audio_performer']),
+        title=tags.get('title', job['audio_title'])
+    )
+    try:
+        with stage_timer('edit_media', file_format=get_file_format(job['file_name']), size_bytes=job['file_size']):
+            edited = bot.edit_message_media(media=media, chat_id=job['chat_id'], message_id=job['message_id'])
+        logger.info(f"تم استبدال الملف داخل المنشور الأصلي برقم {job['message_id']}")
+        return edited
+    except telebot.apihelper.ApiTelegramException as e:
+        description = str(getattr(e, 'description', e)).lower()
+        if any(error in description for error in EDIT_NOT_PERMITTED_ERRORS):
+            logger.warning(f"تعديل المنشور {job['message_id']} غير مسموح، سيتم استخدام الحذف وإعادة النشر: {e}")
+            return None
+        raise
+
+class InPlaceEditError(Exception):
+    """تعذر تعديل المنشور في مكانه لمهمة لا يسمح لها بالحذف وإعادة النشر"""
+    pass
+
+def _remove_temp_files(*paths):
+    """حذف الملفات المؤقتة إن وجدت"""
+    for path in paths:
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            logger.error(f"خطأ في حذف الملفات المؤقتة: {e}")
+
+def run_processing_job(bot, job_id, temp_dir='temp_audio_files'):
+    """
+    تنفيذ مهمة معالجة من الطابور الدائم بدءاً من آخر مرحلة مسجلة
+    
+    كل مرحلة تسجل في قاعدة البيانات فور انتهائها، لذلك يمكن استكمال المهمة بعد انهيار البوت
+    دون إعادة المراحل المكتملة (مثل حذف الرسالة الأصلية أو إرسال الملف المعدل).
+    
+    Args:
+        bot: كائن البوت
+        job_id: معرف المهمة
+        temp_dir: مسار المجلد المؤقت
+        
+    Returns:
+        bool: True إذا اكتملت المهمة
+    """
+    job = job_queue.claim_job(job_id)
+    if not job:
+        # المهمة مكتملة أو يعالجها عامل آخر
+        existing = job_queue.get_job(job_id)
+        return bool(existing and existing['state'] == 'done')
+    
+    if job['attempts'] > Config.JOB_MAX_ATTEMPTS:
+        logger.error(f"تجاوزت المهمة {job_id} الحد الأقصى للمحاولات")
+        job_queue.release_job(job, job.get('last_error'), failed=True)
+        return False
+    
+    os.makedirs(temp_dir, exist_ok=True)
+    # إعدادات المسار الذي استلم الرسالة (أو الإعدادات العامة للمهام القديمة)
+    pipeline = channel_pipelines.get_pipeline(job.get('pipeline_id'))
+    context = None
+    # الصورة المصغرة المجهزة أثناء مرحلة التعديل (عند الاستكمال بعد انهيار يتم استخراجها من جديد)
+    thumbnail_data = None
+    # استبدال الملف داخل المنشور الأصلي (للقنوات فقط، وإجبارياً لمهام المعالجة الرجعية)
+    in_place_only = bool(job.get('in_place_only'))
+    in_place = in_place_only or (should_edit_in_place(pipeline) and job['chat_type'] == 'channel')
+    
+    try:
+        while job['state'] not in job_queue.TERMINAL_STATES:
+            state = job['state']
+            
+            if state == 'pending':
+                # إعادة إرسال النتيجة السابقة إذا تمت معالجة نفس الملف بنفس الإعدادات من قبل
+                cached = result_cache.get_cached_result(job['file_unique_id'], job['fingerprint'])
+                edited = None
+                if cached and in_place:
+                    # تعديل المنشور مباشرة بالملف المخزن دون أي رفع
+                    edited = edit_audio_in_place(bot, job, cached['file_id'])
+                if edited:
+                    job = job_queue.advance_job(job, 'published',
+                                                sent_message_id=job['message_id'],
+                                                sent_file_id=cached['file_id'])
+                elif cached and in_place_only:
+                    raise InPlaceEditError(f"تعديل المنشور {job['message_id']} غير مسموح")
+                elif cached:
+                    with stage_timer('upload_cached', file_format=get_file_format(job['file_name']), size_bytes=job['file_size']):
+                        sent_message = bot.send_audio(
+                            chat_id=job['chat_id'],
+                            audio=cached['file_id'],
+                            caption=job['caption'],
+                            parse_mode='Markdown'
+                        )
+                    logger.info(f"تم إعادة إرسال نتيجة مخزنة للملف {job['file_unique_id']} برقم {sent_message.message_id}")
+                    job = job_queue.advance_job(job, 'uploaded',
+                                                sent_message_id=sent_message.message_id,
+                                                sent_file_id=cached['file_id'])
+                else:
+                    file_path = os.path.join(temp_dir, f"ch_{job['message_id']}_{job['file_name']}")
+                    download_audio(bot, job['file_id'], file_path)
+                    job = job_queue.advance_job(job, 'downloaded', original_path=file_path)
+            
+            elif state == 'downloaded':
+                # إعادة التنزيل إذا فقد الملف المؤقت (مثلاً بعد إعادة النشر)
+                if not job['original_path'] or not os.path.exists(job['original_path']):
+                    job = job_queue.advance_job(job, 'pending')
+                    continue
+                if context is None:
+                    context = build_transform_context(pipeline)
+                edited_file_path = os.path.join(temp_dir, f"edited_{job['message_id']}_{job['file_name']}")
+                # الغلاف لا يتغير بالتعديل، لذلك يتم تجهيز الصورة المصغرة من الملف الأصلي بالتوازي مع كتابة الوسوم
+                thumb_future = submit_thumbnail_task(prepare_thumbnail, job['original_path'])
+                tags = rewrite_audio_tags(job['original_path'], edited_file_path, context)
+                thumbnail_data = wait_for_thumbnail(thumb_future, edited_file_path)
+                job = job_queue.advance_job(job, 'tagged', edited_path=edited_file_path, tags=tags)
+            
+            elif state == 'tagged':
+                if not job['edited_path'] or not os.path.exists(job['edited_path']):
+                    job = job_queue.advance_job(job, 'downloaded')
+                    continue
+                tags = job['tags'] or {}
+                edited = None
+                if in_place:
+                    if thumbnail_data is None:
+                        thumbnail_data, _ = prepare_thumbnail(job['edited_path'])
+                    with open(job['edited_path'], 'rb') as audio_file:
+                        edited = edit_audio_in_place(bot, job, audio_file, thumbnail_data, tags)
+                
+                if edited:
+                    # المنشور الأصلي أصبح يحتوي على الملف المعدل: لا حاجة للحذف أو النشر من جديد
+                    sent_file_id = edited.audio.file_id if getattr(edited, 'audio', None) else None
+                    job = job_queue.advance_job(job, 'published',
+                                                sent_message_id=job['message_id'],
+                                                sent_file_id=sent_file_id)
+                elif in_place_only:
+                    # المنشورات القديمة لا تحذف ولا يعاد نشرها في نهاية القناة
+                    raise InPlaceEditError(f"تعديل المنشور {job['message_id']} غير مسموح")
+                else:
+                    sent_message = upload_audio(
+                        bot, job['chat_id'], job['edited_path'], tags, job['caption'],
+                        title=job['audio_title'], performer=job['audio_performer'], duration=job['duration'],
+                        thumbnail_data=thumbnail_data
+                    )
+                    sent_file_id = sent_message.audio.file_id if getattr(sent_message, 'audio', None) else None
+                    job = job_queue.advance_job(job, 'uploaded',
+                                                sent_message_id=sent_message.message_id,
+                                                sent_file_id=sent_file_id)
+                
+                # تخزين الملف الناتج لإعادة استخدامه عند تكرار نشر نفس الملف
+                if sent_file_id:
+                    result_cache.store_result(
+                        job['file_unique_id'],
+                        job['fingerprint'],
+                        sent_file_id,
+                        title=tags.get('title', ''),
+                        performer=tags.get('artist', '')
+                    )
+            
+            elif state == 'uploaded':
+                # حذف الرسالة الأصلية
+                try:
+                    with stage_timer('delete_original', file_format=get_file_format(job['file_name']), size_bytes=job['file_size']):
+                        bot.delete_message(chat_id=job['chat_id'], message_id=job['message_id'])
+                    logger.info(f"تم حذف الرسالة الأصلية برقم {job['message_id']}")
+                except Exception as e:
+                    logger.error(f"خطأ في حذف الرسالة الأصلية: {e}")
+                job = job_queue.advance_job(job, 'original_deleted')
+            
+            elif state == 'original_deleted':
+                # نشر الرسالة الجديدة تلقائياً إذا كانت الخاصية مفعلة
+                if should_auto_publish(pipeline) and job['chat_type'] == 'channel':
+                    try:
+                        with stage_timer('publish', file_format=get_file_format(job['file_name']), size_bytes=job['file_size']):
+                            bot.copy_message(
+                                chat_id=job['chat_id'],
+                                from_chat_id=job['chat_id'],
+                                message_id=job['sent_message_id']
+                            )
+                        logger.info(f"تم نشر الرسالة الجديدة تلقائياً")
+                    except Exception as e:
+                        logger.error(f"خطأ في نشر الرسالة الجديدة: {e}")
+                job = job_queue.advance_job(job, 'published')
+            
+            elif state == 'published':
+                # إرسال الملف المعدل إلى قنوات الهدف إذا كانت الميزة مفعلة
+                if should_forward_to_target(pipeline):
+                    for target_channel in get_target_channels(pipeline):
+                        try:
+                            logger.info(f"جاري إرسال الملف المعدل إلى قناة الهدف: {target_channel}")
+                            with stage_timer('forward', file_format=get_file_format(job['file_name']), size_bytes=job['file_size']):
+                                bot.copy_message(
+                                    chat_id=target_channel,
+                                    from_chat_id=job['chat_id'],
+                                    message_id=job['sent_message_id'],
+                                    caption=job['caption'] if should_keep_caption(pipeline) else None
+                                )
+                            logger.info(f"تم إرسال الملف المعدل إلى قناة الهدف بنجاح")
+                        except Exception as e:
+                            logger.error(f"خطأ في إرسال الملف المعدل إلى قناة الهدف {target_channel}: {e}")
+                job = job_queue.advance_job(job, 'forwarded')
+            
+            elif state == 'forwarded':
+                # تنظيف الملفات المؤقتة وتسجيل العملية
+                _remove_temp_files(job['original_path'], job['edited_path'])
+                job = job_queue.advance_job(job, 'done')
+                admin_panel.log_action(
+                    None,
+                    "auto_process_channel_file",
+                    "success",
+                    f"معالجة ملف صوتي من القناة: {job['chat_title'] or job['chat_id']}"
+                )
+            
+            else:
+                raise ValueError(f"حالة مهمة غير معروفة: {state}")
+        
+        return job['state'] == 'done'
+    
+    except job_queue.LeaseLostError as e:
+        logger.warning(f"{e}، سيتم ترك المهمة للعامل الآخر")
+        return False
+    
+    except InPlaceEditError as e:
+        # إعادة المحاولة لن تمنح البوت صلاحية التعديل
+        logger.error(f"{e}، لن تتم إعادة نشر المنشور (المهمة {job_id})")
+        job_queue.release_job(job, str(e), failed=True)
+        return False
+    
+    except Exception as e:
+        logger.error(f"خطأ في معالجة الملف الصوتي التلقائية (المهمة {job_id}، المرحلة {job['state']}): {e}")
+        admin_panel.log_action(
+            None, 
+            "auto_process_channel_file", 
+            "failed", 
+            f"خطأ: {str(e)}"
+        )
+        job_queue.release_job(job, str(e), failed=job['attempts'] >= Config.JOB_MAX_ATTEMPTS)
+        return False
+
+def process_audio_file(bot, message, temp_dir='temp_audio_files', check_enabled=True, pipeline=None,
+                       in_place_only=False):
+    """
+    معالجة ملف صوتي من رسالة في القناة (عبر طابور المهام الدائم)
     
     Args:
         bot: كائن البوت
         message: كائن الرسالة
         temp_dir: مسار المجلد المؤقت
+        check_enabled: التحقق من تفعيل المعالجة التلقائية (تعطيله للمعالجة الرجعية التي يطلبها المشرف)
+        pipeline: مسار المعالجة (إذا لم يمرر يتم البحث عنه حسب القناة)
+        in_place_only: تعديل الملف داخل المنشور فقط دون حذفه وإعادة نشره (للمعالجة الرجعية)
         
     Returns:
         bool: نتيجة العملية
     """
-    if not is_enabled():
+    if check_enabled and not is_enabled():
         logger.info("المعالجة التلقائية غير مفعلة")
         return False
     
@@ -335,194 +939,501 @@ def process_audio_file(bot, message, temp_dir='temp_audio_files'):
         logger.info("الرسالة لا تحتوي على ملف صوتي")
         return False
     
-    # التأكد من وجود المجلد المؤقت
-    os.makedirs(temp_dir, exist_ok=True)
-    
     try:
-        file_info = bot.get_file(message.audio.file_id)
-        file_path = os.path.join(temp_dir, f"ch_{message.message_id}_{message.audio.file_name}")
-        downloaded_file = bot.download_file(file_info.file_path)
-        
-        # حفظ الملف في المجلد المؤقت
-        with open(file_path, 'wb') as new_file:
-            new_file.write(downloaded_file)
-        
-        logger.info(f"تم تنزيل الملف الصوتي: {file_path}")
+        if pipeline is None:
+            pipeline = channel_pipelines.find_pipeline(message.chat)
+        context = build_transform_context(pipeline)
+        caption = message.caption if context['keep_caption'] and message.caption else ""
+        # فحص بيانات تيليجرام قبل التنزيل: الملف الذي لن يتغير ينتقل مباشرة إلى مرحلة النشر
+        reason = get_change_reason(message.audio, message.caption, context)
+        record_precheck(1, 0 if reason else 1)
+        if reason:
+            logger.debug(f"الملف {message.message_id} يحتاج إلى معالجة (السبب: {reason})")
+        else:
+            logger.info(f"تخطي تنزيل الملف {message.message_id} لأن بياناته لا تحتاج إلى تعديل")
+        job_id = job_queue.enqueue_message(message, context['fingerprint'], caption, unchanged=reason is None,
+                                           pipeline_id=pipeline['id'] if pipeline else None,
+                                           in_place_only=in_place_only)
+        if job_id is None:
+            return False
+        started = time.perf_counter()
+        with stage_timer('total', getattr(message.audio, 'file_name', None), size_bytes=getattr(message.audio, 'file_size', None)):
+            result = run_processing_job(bot, job_id, temp_dir)
+        stats_timeseries.record(result, getattr(message.audio, 'file_size', 0) or 0, time.perf_counter() - started)
+        return result
+    
+    except Exception as e:
+        logger.error(f"خطأ في معالجة الملف الصوتي التلقائية: {e}")
+        stats_timeseries.record(False, getattr(getattr(message, 'audio', None), 'file_size', 0) or 0)
+        admin_panel.log_action(
+            None, 
+            "auto_process_channel_file", 
+            "failed", 
+            f"خطأ: {str(e)}"
+        )
+        return False
+
+def recover_processing_jobs(bot, temp_dir='temp_audio_files'):
+    """
+    استكمال مهام المعالجة غير المكتملة (بعد إعادة التشغيل أو انتهاء حجز عامل متوقف)
+    
+    Args:
+        bot: كائن البوت
+        temp_dir: مسار المجلد المؤقت
         
-        # إنشاء نسخة من الملف للتعديل
-        edited_file_path = os.path.join(temp_dir, f"edited_{message.message_id}_{message.audio.file_name}")
-        shutil.copy2(file_path, edited_file_path)
+    Returns:
+        int: عدد المهام التي تم استكمالها
+    """
+    job_ids = job_queue.get_recoverable_jobs()
+    if job_ids:
+        logger.info(f"استكمال {len(job_ids)} مهمة معالجة غير مكتملة")
+    completed = 0
+    recovered_groups = set()
+    for job_id in job_ids:
+        job = job_queue.get_job(job_id)
+        if job and job.get('media_group_id'):
+            # مهام الألبوم تستكمل معاً مرة واحدة لكل ألبوم
+            group_key = (job['chat_id'], job['media_group_id'])
+            if group_key in recovered_groups:
+                continue
+            recovered_groups.add(group_key)
+            group_job_ids = job_queue.get_group_job_ids(*group_key)
+            if run_group_jobs(bot, group_job_ids, temp_dir):
+                completed += len(group_job_ids)
+            continue
+        if run_processing_job(bot, job_id, temp_dir):
+            completed += 1
+    return completed
+
+def start_job_recovery(bot, temp_dir='temp_audio_files'):
+    """
+    تشغيل خيط في الخلفية يستكمل المهام غير المكتملة عند بدء التشغيل ثم بشكل دوري
+    
+    Args:
+        bot: كائن البوت
+        temp_dir: مسار المجلد المؤقت
+    """
+    def recovery_loop():
+        while True:
+            try:
+                recover_processing_jobs(bot, temp_dir)
+            except Exception as e:
+                logger.error(f"خطأ في استكمال مهام المعالجة: {e}")
+            # المهام المحجوزة من عامل متوقف تصبح متاحة بعد انتهاء الحجز
+            time.sleep(max(Config.JOB_LEASE_SECONDS / 2, 5))
+    
+    thread = threading.Thread(target=recovery_loop, name="job-recovery", daemon=True)
+    thread.start()
+    return thread
+
+# الرسائل المنتظرة لكل ألبوم في القنوات: {(معرف المحادثة, معرف المجموعة): {'messages': [], 'timer': Timer, 'pipeline': dict}}
+_media_groups = {}
+_media_groups_lock = threading.Lock()
+
+def queue_media_group_message(bot, message, temp_dir='temp_audio_files', pipeline=None):
+    """
+    إضافة رسالة من ألبوم (media group) إلى قائمة الانتظار ومعالجة الألبوم كاملاً بعد انتهاء فترة التجميع
+    
+    Args:
+        bot: كائن البوت
+        message: كائن الرسالة
+        temp_dir: مسار المجلد المؤقت
+        pipeline: مسار المعالجة الذي استلم الرسالة
+    """
+    key = (message.chat.id, message.media_group_id)
+    with _media_groups_lock:
+        group = _media_groups.get(key)
+        if group is None:
+            group = {'messages': [], 'timer': None, 'pipeline': pipeline}
+            _media_groups[key] = group
+        elif group['timer']:
+            group['timer'].cancel()
+        group['messages'].append(message)
         
-        # الحصول على الوسوم الحالية
-        tags = get_audio_tags(edited_file_path)
+        # إعادة ضبط المؤقت مع كل رسالة جديدة حتى تصل جميع رسائل الألبوم
+        timer = threading.Timer(Config.MEDIA_GROUP_WINDOW_SECONDS, _flush_media_group, args=(bot, key, temp_dir))
+        timer.daemon = True
+        group['timer'] = timer
+        timer.start()
+
+def _flush_media_group(bot, key, temp_dir):
+    """معالجة رسائل الألبوم المجمعة بعد انتهاء فترة التجميع"""
+    with _media_groups_lock:
+        group = _media_groups.pop(key, None)
+    if not group:
+        return
+    
+    messages = sorted(group['messages'], key=lambda m: m.message_id)
+    logger.info(f"معالجة ألبوم {key[1]} يحتوي على {len(messages)} ملف صوتي")
+    if group['pipeline']:
+        # تنفيذ الألبوم ضمن عمال المسار الخاص به
+        channel_pipelines.submit(group['pipeline'], process_media_group, bot, messages, temp_dir, group['pipeline'])
+    else:
+        process_media_group(bot, messages, temp_dir)
+
+def _prepare_group_job(bot, job, context, temp_dir, in_place):
+    """
+    تنفيذ مراحل ما قبل الرفع لمهمة من ألبوم (التنزيل وتعديل الوسوم، أو تعديل المنشور مباشرة)
+    
+    Args:
+        bot: كائن البوت
+        job: بيانات المهمة المحجوزة
+        context: إعدادات المعالجة المشتركة للألبوم
+        temp_dir: مسار المجلد المؤقت
+        in_place: استبدال الملف داخل المنشور الأصلي
         
-        # تطبيق التعديلات
-        replacements = get_tag_replacements()
-        enabled_tags = get_enabled_tags()
-        smart_templates = get_smart_templates()
+    Returns:
+        tuple: (بيانات المهمة في مرحلة 'tagged' أو 'published'، الصورة المصغرة أو None)
+    """
+    thumbnail_data = None
+    while True:
+        state = job['state']
         
-        # تطبيق القالب الذكي أولاً
-        tags = apply_smart_template(tags, smart_templates)
+        if state == 'pending':
+            cached = result_cache.get_cached_result(job['file_unique_id'], job['fingerprint'])
+            if cached:
+                edited = edit_audio_in_place(bot, job, cached['file_id']) if in_place else None
+                if edited:
+                    return job_queue.advance_job(job, 'published',
+                                                 sent_message_id=job['message_id'],
+                                                 sent_file_id=cached['file_id']), None
+                # الملف المخزن يرفع ضمن الألبوم دون تنزيل أو تعديل
+                return job_queue.advance_job(job, 'tagged', edited_path=None, sent_file_id=cached['file_id']), None
+            file_path = os.path.join(temp_dir, f"ch_{job['message_id']}_{job['file_name']}")
+            download_audio(bot, job['file_id'], file_path)
+            job = job_queue.advance_job(job, 'downloaded', original_path=file_path)
         
-        # ثم تطبيق استبدالات النصوص
-        tags = apply_tag_replacements(tags, replacements, enabled_tags)
+        elif state == 'downloaded':
+            if not job['original_path'] or not os.path.exists(job['original_path']):
+                job = job_queue.advance_job(job, 'pending')
+                continue
+            edited_file_path = os.path.join(temp_dir, f"edited_{job['message_id']}_{job['file_name']}")
+            thumb_future = submit_thumbnail_task(prepare_thumbnail, job['original_path'])
+            tags = rewrite_audio_tags(job['original_path'], edited_file_path, context)
+            thumbnail_data = wait_for_thumbnail(thumb_future, edited_file_path)
+            job = job_queue.advance_job(job, 'tagged', edited_path=edited_file_path, tags=tags)
         
-        # حفظ التغييرات
-        set_audio_tags(edited_file_path, tags)
+        elif state == 'tagged':
+            if job['edited_path'] and not os.path.exists(job['edited_path']):
+                job = job_queue.advance_job(job, 'downloaded')
+                continue
+            if in_place and job['edited_path']:
+                tags = job['tags'] or {}
+                if thumbnail_data is None:
+                    thumbnail_data, _ = prepare_thumbnail(job['edited_path'])
+                with open(job['edited_path'], 'rb') as audio_file:
+                    edited = edit_audio_in_place(bot, job, audio_file, thumbnail_data, tags)
+                if edited:
+                    sent_file_id = edited.audio.file_id if getattr(edited, 'audio', None) else None
+                    job = job_queue.advance_job(job, 'published',
+                                                sent_message_id=job['message_id'],
+                                                sent_file_id=sent_file_id)
+                    if sent_file_id:
+                        result_cache.store_result(
+                            job['file_unique_id'],
+                            job['fingerprint'],
+                            sent_file_id,
+                            title=tags.get('title', ''),
+                            performer=tags.get('artist', '')
+                        )
+            return job, thumbnail_data
         
-        logger.info(f"تم تعديل الملف الصوتي: {edited_file_path}")
+        else:
+            return job, thumbnail_data
+
+def upload_channel_group(bot, jobs, thumbnails=None):
+    """
+    إرسال الألبوم المعدل بنفس ترتيب الرسائل الأصلية وتسجيل رسائله الجديدة في مهام الألبوم
+    
+    Args:
+        bot: كائن البوت
+        jobs: مهام الألبوم المحجوزة مرتبة
+        thumbnails: الصور المصغرة المجهزة {معرف المهمة: بيانات الصورة}
         
-        # حذف الرسالة الأصلية وإرسال الملف المعدل
-        caption = message.caption if should_keep_caption() and message.caption else ""
+    Returns:
+        list: مهام الألبوم في مرحلة 'uploaded'
+    """
+    thumbnails = thumbnails or {}
+    media = []
+    open_files = []
+    edited_jobs = [job for job in jobs if job['state'] == 'tagged' and job['edited_path']]
+    edited_ids = {job['id'] for job in edited_jobs}
+    try:
+        for job in jobs:
+            if job['id'] in edited_ids:
+                tags = job['tags'] or {}
+                thumbnail_data = thumbnails.get(job['id'])
+                if thumbnail_data is None:
+                    thumbnail_data, _ = prepare_thumbnail(job['edited_path'])
+                audio_file = open(job['edited_path'], 'rb')
+                open_files.append(audio_file)
+                media.append(telebot.types.InputMediaAudio(
+                    media=audio_file,
+                    thumbnail=thumbnail_data,
+                    caption=job['caption'],
+                    parse_mode='Markdown',
+                    duration=job['duration'],
+                    performer=tags.get('artist', job['audio_performer']),
+                    title=tags.get('title', job['audio_title'])
+                ))
+            else:
+                # الملف المخزن أو المعدل داخل منشوره، وإلا الملف الأصلي حتى لا يتغير ترتيب الألبوم
+                media.append(telebot.types.InputMediaAudio(
+                    media=job['sent_file_id'] or job['file_id'],
+                    caption=job['caption'],
+                    parse_mode='Markdown'
+                ))
         
-        # إرسال الملف المعدل كرسالة جديدة مع تحسين العرض
-        with open(edited_file_path, 'rb') as audio_file:
-            # استخراج صورة الألبوم لاستخدامها كصورة مصغرة إن وجدت
-            thumbnail = None
-            thumbnail_path = None
-            try:
-                # محاولة استخراج صورة الألبوم من الملف المعدل
-                thumbnail_data = extract_album_art_as_bytes(edited_file_path)
-                
-                if thumbnail_data:
-                    # تحسين جودة الصورة المصغرة قبل استخدامها
-                    from io import BytesIO
-                    from PIL import Image
-                    
-                    try:
-                        # تحويل بيانات الصورة إلى كائن PIL
-                        image_stream = BytesIO(thumbnail_data)
-                        img = Image.open(image_stream)
-                        
-                        # تعديل حجم الصورة لتيليغرام 
-                        # Telegram يفضل صور مربعة بأبعاد محددة للصور المصغرة
-                        size = 512  # حجم مثالي لتيليغرام (يجب أن يكون أكبر من 320px على الأقل)
-                        width, height = img.size
-                        
-                        # الحصول على مربع من وسط الصورة للحفاظ على التناسب
-                        min_dim = min(width, height)
-                        left = (width - min_dim) // 2
-                        top = (height - min_dim) // 2
-                        right = left + min_dim
-                        bottom = top + min_dim
-                        img = img.crop((left, top, right, bottom))
-                        
-                        # تغيير الحجم إلى 512×512 للحصول على أفضل نتيجة في تيليغرام
-                        img = img.resize((size, size), Image.Resampling.LANCZOS)
-                        
-                        # حفظ بجودة 100% لضمان أفضل جودة ممكنة
-                        thumbnail_path = f"{os.path.splitext(edited_file_path)[0]}_thumb.jpg"
-                        img.save(thumbnail_path, format='JPEG', quality=100, optimize=True)
-                        
-                        # فتح الصورة المحسنة للإرسال
-                        thumbnail = open(thumbnail_path, 'rb')
-                        logger.info(f"تم تحسين الصورة المصغرة بأبعاد {size}×{size} بكسل")
-                    except Exception as img_err:
-                        logger.error(f"خطأ في معالجة الصورة المصغرة: {img_err}")
-                        # استخدام الصورة الأصلية بدون معالجة في حالة حدوث خطأ
-                        thumbnail_path = f"{os.path.splitext(edited_file_path)[0]}_thumb.jpg"
-                        with open(thumbnail_path, 'wb') as thumb_file:
-                            thumb_file.write(thumbnail_data)
-                        thumbnail = open(thumbnail_path, 'rb')
-                        logger.info(f"تم استخدام الصورة الأصلية كمصغرة بحجم {len(thumbnail_data)} بايت")
-            except Exception as thumb_error:
-                logger.error(f"خطأ في استخراج الصورة المصغرة: {thumb_error}")
-                thumbnail = None
-            
-            # إرسال الملف المعدل مع تحسين العرض
-            try:
-                sent_message = bot.send_audio(
-                    chat_id=message.chat.id,
-                    audio=audio_file,
-                    caption=caption,
-                    title=tags.get('title', message.audio.title),
-                    performer=tags.get('artist', message.audio.performer),
-                    thumb=thumbnail,
-                    duration=message.audio.duration if hasattr(message.audio, 'duration') else None,
-                    parse_mode='Markdown'  # لدعم التنسيق في التسمية التوضيحية
-                )
-                
-                # تسجيل العملية
-                logger.info(f"تم إرسال الملف المعدل برسالة جديدة برقم {sent_message.message_id}")
-                
-                # إغلاق وحذف ملف الصورة المصغرة المؤقت إن وجد
-                if thumbnail:
-                    thumbnail.close()
-                    if thumbnail_path and os.path.exists(thumbnail_path):
-                        os.remove(thumbnail_path)
-                
-            except Exception as send_error:
-                logger.error(f"خطأ في إرسال الملف المعدل: {send_error}")
-                # محاولة إرسال الملف بدون خيارات متقدمة
-                sent_message = bot.send_audio(
-                    chat_id=message.chat.id,
-                    audio=audio_file,
-                    caption=caption
-                )
-                logger.info(f"تم إرسال الملف المعدل بالطريقة البسيطة برقم {sent_message.message_id}")
-                
-            # تسجيل العملية
-            logger.info(f"تم إرسال الملف المعدل برسالة جديدة برقم {sent_message.message_id}")
+        with stage_timer('upload_album', file_format='album'):
+            sent_messages = bot.send_media_group(chat_id=jobs[0]['chat_id'], media=media)
+        logger.info(f"تم إرسال الألبوم المعدل ({len(sent_messages)} ملف)")
+    finally:
+        for audio_file in open_files:
+            audio_file.close()
+    
+    fields = {}
+    for job, sent_message in zip(jobs, sent_messages):
+        fields[job['id']] = {
+            'sent_message_id': sent_message.message_id,
+            'sent_file_id': sent_message.audio.file_id if getattr(sent_message, 'audio', None) else None
+        }
+    uploaded = job_queue.advance_group(jobs, 'uploaded', fields)
+    
+    # تخزين الملفات الناتجة لإعادة استخدامها
+    for job in edited_jobs:
+        sent_file_id = fields.get(job['id'], {}).get('sent_file_id')
+        if sent_file_id:
+            tags = job['tags'] or {}
+            result_cache.store_result(
+                job['file_unique_id'],
+                job['fingerprint'],
+                sent_file_id,
+                title=tags.get('title', ''),
+                performer=tags.get('artist', '')
+            )
+    return uploaded
+
+def finalize_channel_group(bot, jobs, pipeline=None):
+    """
+    إكمال نشر الألبوم حسب مرحلة مهامه: حذف الرسائل الأصلية والنشر التلقائي والإرسال لقناة الهدف مع الحفاظ على تجميع الألبوم
+    
+    كل مرحلة تسجل لجميع مهام الألبوم معاً، لذلك لا تتكرر المراحل المكتملة عند الاستكمال بعد الانهيار.
+    
+    Args:
+        bot: كائن البوت
+        jobs: مهام الألبوم المحجوزة مرتبة
+        pipeline: مسار المعالجة
         
-        # حذف الرسالة الأصلية
+    Returns:
+        list: مهام الألبوم بعد اكتمالها
+    """
+    chat_id = jobs[0]['chat_id']
+    is_channel = jobs[0]['chat_type'] == 'channel'
+    
+    if jobs[0]['state'] == 'uploaded':
+        # حذف الرسائل الأصلية
+        original_ids = [job['message_id'] for job in jobs]
         try:
-            bot.delete_message(chat_id=message.chat.id, message_id=message.message_id)
-            logger.info(f"تم حذف الرسالة الأصلية برقم {message.message_id}")
+            bot.delete_messages(chat_id=chat_id, message_ids=original_ids)
+            logger.info(f"تم حذف رسائل الألبوم الأصلية: {original_ids}")
         except Exception as e:
-            logger.error(f"خطأ في حذف الرسالة الأصلية: {e}")
-        
-        # نشر الرسالة الجديدة تلقائياً إذا كانت الخاصية مفعلة
-        if should_auto_publish() and hasattr(message.chat, 'type') and message.chat.type == 'channel':
+            logger.error(f"خطأ في حذف رسائل الألبوم الأصلية: {e}")
+        jobs = job_queue.advance_group(jobs, 'original_deleted')
+    
+    sent_ids = [job['sent_message_id'] for job in jobs]
+    
+    if jobs[0]['state'] == 'original_deleted':
+        # نشر الألبوم الجديد تلقائياً إذا كانت الخاصية مفعلة
+        if should_auto_publish(pipeline) and is_channel:
             try:
-                # استخدام دالة النشر المباشرة للقنوات بدلاً من إعادة التوجيه
-                bot.copy_message(
-                    chat_id=message.chat.id,
-                    from_chat_id=message.chat.id,
-                    message_id=sent_message.message_id
-                )
-                logger.info(f"تم نشر الرسالة الجديدة تلقائياً")
+                bot.copy_messages(chat_id=chat_id, from_chat_id=chat_id, message_ids=sent_ids)
+                logger.info(f"تم نشر الألبوم الجديد تلقائياً")
             except Exception as e:
-                logger.error(f"خطأ في نشر الرسالة الجديدة: {e}")
-        
-        # إرسال الملف المعدل إلى قناة الهدف إذا كانت الميزة مفعلة
-        if should_forward_to_target():
-            target_channel = get_target_channel()
-            if target_channel:
+                logger.error(f"خطأ في نشر الألبوم الجديد: {e}")
+        jobs = job_queue.advance_group(jobs, 'published')
+    
+    if jobs[0]['state'] == 'published':
+        # إرسال الألبوم المعدل إلى قنوات الهدف إذا كانت الميزة مفعلة
+        if should_forward_to_target(pipeline):
+            for target_channel in get_target_channels(pipeline):
                 try:
-                    logger.info(f"جاري إرسال الملف المعدل إلى قناة الهدف: {target_channel}")
-                    forwarded_msg = bot.copy_message(
+                    logger.info(f"جاري إرسال الألبوم المعدل إلى قناة الهدف: {target_channel}")
+                    bot.copy_messages(
                         chat_id=target_channel,
-                        from_chat_id=message.chat.id,
-                        message_id=sent_message.message_id,
-                        caption=caption if should_keep_caption() else None
+                        from_chat_id=chat_id,
+                        message_ids=sent_ids,
+                        remove_caption=not should_keep_caption(pipeline) or not any(job['caption'] for job in jobs)
                     )
-                    logger.info(f"تم إرسال الملف المعدل إلى قناة الهدف بنجاح")
+                    logger.info(f"تم إرسال الألبوم المعدل إلى قناة الهدف بنجاح")
                 except Exception as e:
-                    logger.error(f"خطأ في إرسال الملف المعدل إلى قناة الهدف: {e}")
-        
+                    logger.error(f"خطأ في إرسال الألبوم المعدل إلى قناة الهدف {target_channel}: {e}")
+        jobs = job_queue.advance_group(jobs, 'forwarded')
+    
+    if jobs[0]['state'] == 'forwarded':
         # تنظيف الملفات المؤقتة
-        try:
-            os.remove(file_path)
-            os.remove(edited_file_path)
-        except Exception as e:
-            logger.error(f"خطأ في حذف الملفات المؤقتة: {e}")
+        for job in jobs:
+            _remove_temp_files(job['original_path'], job['edited_path'])
+        jobs = job_queue.advance_group(jobs, 'done')
+    
+    return jobs
+
+def run_group_jobs(bot, job_ids, temp_dir='temp_audio_files'):
+    """
+    تنفيذ مهام ألبوم من الطابور الدائم معاً بدءاً من آخر مرحلة مسجلة
+    
+    التنزيل وتعديل الوسوم (أو تعديل المنشور مباشرة) يتم لكل ملف بالتوازي، ثم يرفع الألبوم
+    وتكمل مراحله التالية كدفعة واحدة حتى يبقى الألبوم مجمعاً.
+    
+    Args:
+        bot: كائن البوت
+        job_ids: معرفات مهام الألبوم
+        temp_dir: مسار المجلد المؤقت
+        
+    Returns:
+        bool: True إذا اكتملت مهام الألبوم
+    """
+    jobs = []
+    for job_id in job_ids:
+        job = job_queue.claim_job(job_id)
+        if job:
+            jobs.append(job)
+            continue
+        existing = job_queue.get_job(job_id)
+        if existing and existing['state'] not in job_queue.TERMINAL_STATES:
+            # جزء من الألبوم يعالجه عامل آخر: ترك الألبوم كاملاً له
+            for claimed in jobs:
+                job_queue.release_job(claimed)
+            return False
+    if not jobs:
+        return all((job_queue.get_job(job_id) or {}).get('state') == 'done' for job_id in job_ids)
+    
+    if any(job['attempts'] > Config.JOB_MAX_ATTEMPTS for job in jobs):
+        logger.error(f"تجاوز الألبوم {jobs[0]['media_group_id']} الحد الأقصى للمحاولات")
+        for job in jobs:
+            job_queue.release_job(job, job.get('last_error'), failed=True)
+        return False
+    
+    jobs.sort(key=lambda job: job['message_id'])
+    os.makedirs(temp_dir, exist_ok=True)
+    pipeline = channel_pipelines.get_pipeline(jobs[0].get('pipeline_id'))
+    in_place = should_edit_in_place(pipeline) and jobs[0]['chat_type'] == 'channel'
+    thumbnails = {}
+    
+    try:
+        # تنزيل وتعديل الملفات بالتوازي
+        to_prepare = [i for i, job in enumerate(jobs) if job['state'] in ('pending', 'downloaded', 'tagged')]
+        if to_prepare:
+            context = build_transform_context(pipeline)
+            workers = max(1, min(len(to_prepare), Config.MEDIA_GROUP_WORKERS))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {i: executor.submit(_prepare_group_job, bot, jobs[i], context, temp_dir, in_place) for i in to_prepare}
+                for i, future in futures.items():
+                    try:
+                        jobs[i], thumbnails[jobs[i]['id']] = future.result()
+                    except job_queue.LeaseLostError:
+                        raise
+                    except Exception as e:
+                        logger.error(f"خطأ في معالجة الملف {jobs[i]['message_id']} من الألبوم، سيتم نشره دون تعديل: {e}")
+                        jobs[i] = dict(jobs[i], state='pending', sent_file_id=None)
+        
+        if any(job['state'] == 'tagged' for job in jobs):
+            jobs = upload_channel_group(bot, jobs, thumbnails)
+        elif any(job['state'] in ('pending', 'downloaded') for job in jobs):
+            # لا يوجد ما يرفع: الملفات التي تعذر تعديلها تبقى في منشوراتها الأصلية
+            jobs = job_queue.advance_group(jobs, 'published', {
+                job['id']: {'sent_message_id': job['message_id']}
+                for job in jobs if job['state'] in ('pending', 'downloaded')
+            })
         
-        # تسجيل العملية
+        jobs = finalize_channel_group(bot, jobs, pipeline)
         admin_panel.log_action(
-            None, 
-            "auto_process_channel_file", 
-            "success", 
-            f"معالجة ملف صوتي من القناة: {message.chat.title if hasattr(message.chat, 'title') else message.chat.id}"
+            None,
+            "auto_process_channel_album",
+            "success",
+            f"معالجة ألبوم من {len(jobs)} ملف من القناة: {jobs[0]['chat_title'] or jobs[0]['chat_id']}"
         )
-        
         return True
     
+    except job_queue.LeaseLostError as e:
+        logger.warning(f"{e}، سيتم ترك الألبوم للعامل الآخر")
+        for job in jobs:
+            job_queue.release_job(job)
+        return False
+    
     except Exception as e:
-        logger.error(f"خطأ في معالجة الملف الصوتي التلقائية: {e}")
+        logger.error(f"خطأ في معالجة الألبوم {jobs[0]['media_group_id']} (المرحلة {jobs[0]['state']}): {e}")
         admin_panel.log_action(
-            None, 
-            "auto_process_channel_file", 
-            "failed", 
+            None,
+            "auto_process_channel_album",
+            "failed",
+            f"خطأ: {str(e)}"
+        )
+        for job in jobs:
+            job_queue.release_job(job, str(e), failed=job['attempts'] >= Config.JOB_MAX_ATTEMPTS)
+        return False
+
+def process_media_group(bot, messages, temp_dir='temp_audio_files', pipeline=None):
+    """
+    معالجة ألبوم كامل من القناة كدفعة واحدة (عبر طابور المهام الدائم) وإعادة نشره كألبوم بنفس الترتيب
+    
+    Args:
+        bot: كائن البوت
+        messages: رسائل الألبوم مرتبة حسب ترتيب النشر
+        temp_dir: مسار المجلد المؤقت
+        pipeline: مسار المعالجة
+        
+    Returns:
+        bool: نتيجة العملية
+    """
+    if not is_enabled():
+        logger.info("المعالجة التلقائية غير مفعلة")
+        return False
+    
+    messages = [m for m in messages if m.audio]
+    if not messages:
+        return False
+    
+    started = time.perf_counter()
+    try:
+        # قراءة الإعدادات وتحميل القوالب مرة واحدة للألبوم كاملاً
+        context = build_transform_context(pipeline)
+        keep_caption = context['keep_caption']
+        
+        # فحص بيانات تيليجرام قبل التنزيل: الملفات التي لن تتغير تبقى كما هي
+        unchanged = [get_change_reason(m.audio, m.caption, context) is None for m in messages]
+        record_precheck(len(messages), sum(unchanged))
+        if all(unchanged):
+            logger.info(f"تخطي تنزيل الألبوم لأن بيانات جميع ملفاته لا تحتاج إلى تعديل")
+        
+        job_ids = []
+        for i, message in enumerate(messages):
+            job_id = job_queue.enqueue_message(
+                message, context['fingerprint'],
+                message.caption if keep_caption and message.caption else "",
+                unchanged=unchanged[i],
+                pipeline_id=pipeline['id'] if pipeline else None,
+                media_group_id=str(message.media_group_id)
+            )
+            if job_id is not None:
+                job_ids.append(job_id)
+        if not job_ids:
+            return False
+        
+        with stage_timer('total', file_format='album'):
+            result = run_group_jobs(bot, job_ids, temp_dir)
+        elapsed = (time.perf_counter() - started) / len(messages)
+        for message in messages:
+            stats_timeseries.record(result, getattr(message.audio, 'file_size', 0) or 0, elapsed)
+        return result
+    
+    except Exception as e:
+        logger.error(f"خطأ في معالجة الألبوم: {e}")
+        for message in messages:
+            stats_timeseries.record(False, getattr(message.audio, 'file_size', 0) or 0)
+        admin_panel.log_action(
+            None,
+            "auto_process_channel_album",
+            "failed",
             f"خطأ: {str(e)}"
         )
         return False
@@ -540,12 +1451,15 @@ def setup_channel_handlers(bot):
         if not is_enabled():
             return
         
-        source_channel = get_source_channel()
+        # توجيه الرسالة إلى المسار المسؤول عن هذه القناة عبر فهرس القنوات
+        pipeline = channel_pipelines.find_pipeline(message.chat)
+        if pipeline is None or not pipeline.get('enabled', True):
+            return
         
-        # التحقق من أن الرسالة من القناة المحددة
-        if source_channel and hasattr(message.chat, 'username'):
-            if message.chat.username == source_channel.replace('@', '') or (
-                hasattr(message.chat, 'id') and str(message.chat.id) == source_channel.replace('@', '')
-            ):
-                logger.info(f"استلام ملف صوتي من القناة: {message.chat.title if hasattr(message.chat, 'title') else message.chat.id}")
-                process_audio_file(bot, message)
\ No newline at end of file
+        logger.info(f"استلام ملف صوتي من القناة: {message.chat.title if hasattr(message.chat, 'title') else message.chat.id} (المسار: {pipeline['id']})")
+        # تجميع ملفات الألبوم ومعالجتها كدفعة واحدة
+        if getattr(message, 'media_group_id', None):
+            queue_media_group_message(bot, message, pipeline=pipeline)
+        else:
+            # كل مسار يعالج رسائله بعماله الخاصين حتى لا تؤخر قناة مزدحمة بقية القنوات
+            channel_pipelines.submit(pipeline, process_audio_file, bot, message, pipeline=pipeline)
@@ -0,0 +1,563 @@
+"""
+وحدة المعالجة الرجعية لمنشورات القنوات (Backfill)
+- المرور على نطاق من أرقام الرسائل في قناة المصدر ومعالجتها بنفس مسار المعالجة التلقائية
+- عدة عمال متوازيين مع تحديد معدل الطلبات لتجنب حدود تيليجرام والالتزام بـ retry_after عند الخطأ 429
+- إعادة محاولة الرسائل الفاشلة لاحقاً بدلاً من اعتبارها منجزة، وتخطي الرسائل غير الموجودة فقط
+- تعديل المنشورات في مكانها فقط (لا يتم حذف المنشورات القديمة وإعادة نشرها)
+- حفظ نقطة التقدم بشكل دائم لاستكمال العمل بعد إعادة التشغيل
+- حساب معدل الإنجاز والوقت المتبقي للعرض في لوحة الإدارة
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from functools import partial
+from typing import Callable, Dict, Optional
+
+from config import Config
+
+# إعداد التسجيل
+logger = logging.getLogger('backfill')
+
+# مسار ملف نقطة التقدم
+BACKFILL_CHECKPOINT_FILE = 'backfill_checkpoint.json'
+
+# عدد العناصر المنجزة بين كل حفظ لنقطة التقدم
+CHECKPOINT_EVERY = 10
+
+# أخطاء تيليجرام التي تعني أن الرسالة غير موجودة (محذوفة أو رقم غير مستخدم)
+NOT_FOUND_ERRORS = ('message to forward not found', 'message not found', 'message_id_invalid')
+
+
+class TokenBucket:
+    """محدد معدل بسيط بأسلوب دلو الرموز (Token Bucket)"""
+
+    def __init__(self, rate_per_second: float, capacity: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.rate = max(rate_per_second, 0.001)
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """
+        انتظار توفر رمز واحد
+
+        Returns:
+            bool: True عند الحصول على الرمز، False إذا تم طلب الإيقاف أثناء الانتظار
+        """
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+def get_retry_after(error) -> Optional[float]:
+    """مدة الانتظار المطلوبة من تيليجرام عند الخطأ 429 (None لغير ذلك من الأخطاء)"""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    try:
+        return float(error.result_json['parameters']['retry_after'])
+    except Exception:
+        return 1.0
+
+
+def _is_not_found_error(error) -> bool:
+    """هل يعني الخطأ أن الرسالة غير موجودة في قناة المصدر"""
+    if getattr(error, 'error_code', None) != 400:
+        return False
+    description = str(getattr(error, 'description', '') or error).lower()
+    return any(reason in description for reason in NOT_FOUND_ERRORS)
+
+
+def _default_processor(bot, message, pipeline_id: Optional[str] = None) -> bool:
+    """
+    معالجة الرسالة بنفس مسار المعالجة التلقائية للقنوات
+
+    يتم تعديل الملف داخل المنشور الأصلي فقط، وإذا لم يكن ذلك ممكناً تفشل المعالجة
+    بدلاً من حذف المنشور القديم وإعادة نشره في نهاية القناة.
+    """
+    import auto_processor
+    import channel_pipelines
+    pipeline = channel_pipelines.get_pipeline(pipeline_id)
+    return auto_processor.process_audio_file(bot, message, Config.TEMP_DIR, check_enabled=False,
+                                             pipeline=pipeline, in_place_only=True)
+
+
+class BackfillJob:
+    """
+    مهمة معالجة رجعية لنطاق من رسائل قناة المصدر
+
+    يتم جلب كل رسالة قديمة عبر إعادة توجيهها إلى محادثة مؤقتة (لا توفر واجهة البوت قراءة سجل القناة)،
+    ثم تمريرها إلى دالة المعالجة بعد ربطها بالقناة ورقم الرسالة الأصليين.
+    """
+
+    def __init__(self, bot, source_chat, start_id: int, end_id: int,
+                 scratch_chat=None, workers: Optional[int] = None,
+                 rate_per_minute: Optional[float] = None,
+                 processor: Optional[Callable] = None,
+                 checkpoint_file: str = BACKFILL_CHECKPOINT_FILE,
+                 pipeline_id: Optional[str] = None,
+                 max_attempts: Optional[int] = None,
+                 retry_seconds: Optional[float] = None):
+        self.bot = bot
+        self.source_chat = source_chat
+        self.start_id = int(start_id)
+        self.end_id = int(end_id)
+        self.scratch_chat = scratch_chat or Config.BACKFILL_SCRATCH_CHAT
+        self.workers = max(1, workers or Config.BACKFILL_WORKERS)
+        self.rate_per_minute = rate_per_minute or Config.BACKFILL_RATE_PER_MINUTE
+        self.pipeline_id = pipeline_id
+        self.processor = processor or partial(_default_processor, pipeline_id=pipeline_id)
+        self.checkpoint_file = checkpoint_file
+        self.max_attempts = max(1, max_attempts or Config.BACKFILL_MAX_ATTEMPTS)
+        self.retry_seconds = Config.BACKFILL_RETRY_SECONDS if retry_seconds is None else retry_seconds
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.rate_limiter = TokenBucket(self.rate_per_minute / 60.0)
+        self.threads = []
+        self.chat = None
+        # إيقاف جميع العمال مؤقتاً عند طلب تيليجرام (retry_after)
+        self.paused_until = 0.0
+
+        # حالة التقدم: كل الرسائل الأصغر من watermark منجزة أو فاشلة، وdone_ids للرسائل المنجزة بعده
+        self.watermark = self.start_id
+        self.next_id = self.start_id
+        self.done_ids = set()
+        # الرسائل الفاشلة بانتظار إعادة المحاولة: {رقم الرسالة: عدد المحاولات}
+        self.failed_ids = {}
+        self.retry_at = {}
+        self.in_flight = set()
+        self.stats = {'processed': 0, 'skipped': 0, 'failed': 0}
+        self.status = 'pending'
+        self.last_error = None
+        self.elapsed_before = 0.0
+        self.run_started = None
+        self.run_done = 0
+        self._since_checkpoint = 0
+
+    # ------------------------------------------------------------------
+    # نقطة التقدم
+    # ------------------------------------------------------------------
+
+    def to_dict(self) -> Dict:
+        """تحويل حالة المهمة إلى قاموس قابل للحفظ"""
+        with self.lock:
+            return {
+                'source_chat': self.source_chat,
+                'start_id': self.start_id,
+                'end_id': self.end_id,
+                'scratch_chat': self.scratch_chat,
+                'pipeline_id': self.pipeline_id,
+                'watermark': self.watermark,
+                'done_ids': sorted(self.done_ids),
+                'failed_ids': {str(message_id): attempts for message_id, attempts in sorted(self.failed_ids.items())},
+                'stats': dict(self.stats),
+                'status': self.status,
+                'last_error': self.last_error,
+                'elapsed': self._elapsed(),
+                'saved_at': time.time()
+            }
+
+    def save_checkpoint(self):
+        """حفظ نقطة التقدم (كتابة ذرية عبر ملف مؤقت)"""
+        try:
+            data = self.to_dict()
+            tmp_path = f"{self.checkpoint_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.checkpoint_file)
+        except Exception as e:
+            logger.error(f"خطأ في حفظ نقطة تقدم المعالجة الرجعية: {e}")
+
+    @classmethod
+    def from_checkpoint(cls, bot, checkpoint_file: str = BACKFILL_CHECKPOINT_FILE, **kwargs) -> Optional['BackfillJob']:
+        """
+        استعادة مهمة من ملف نقطة التقدم
+
+        Returns:
+            BackfillJob: المهمة المستعادة أو None إذا لم يوجد ملف صالح
+        """
+        try:
+            if not os.path.exists(checkpoint_file):
+                return None
+            with open(checkpoint_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"خطأ في قراءة نقطة تقدم المعالجة الرجعية: {e}")
+            return None
+
+        kwargs.setdefault('pipeline_id', data.get('pipeline_id'))
+        job = cls(bot, data['source_chat'], data['start_id'], data['end_id'],
+                  scratch_chat=data.get('scratch_chat'), checkpoint_file=checkpoint_file, **kwargs)
+        job.watermark = data.get('watermark', job.start_id)
+        job.next_id = job.watermark
+        job.done_ids = set(data.get('done_ids', []))
+        job.failed_ids = {int(message_id): attempts for message_id, attempts in data.get('failed_ids', {}).items()}
+        job.stats.update(data.get('stats', {}))
+        job.status = data.get('status', 'stopped')
+        job.last_error = data.get('last_error')
+        job.elapsed_before = data.get('elapsed', 0.0)
+        return job
+
+    # ------------------------------------------------------------------
+    # التشغيل والإيقاف
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """بدء العمال في الخلفية"""
+        if self.is_running():
+            return
+        self.stop_event.clear()
+        with self.lock:
+            self.status = 'running'
+            self.run_started = time.time()
+            self.run_done = 0
+            self.next_id = self.watermark
+            # كل استكمال يمنح الرسائل الفاشلة محاولات جديدة
+            self.failed_ids = {message_id: 0 for message_id in self.failed_ids}
+            self.retry_at = {}
+            self.in_flight = set()
+        self.save_checkpoint()
+
+        self.threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"backfill-{i}", daemon=True)
+            self.threads.append(thread)
+            thread.start()
+        threading.Thread(target=self._wait_for_workers, name="backfill-monitor", daemon=True).start()
+        logger.info(f"بدء المعالجة الرجعية للقناة {self.source_chat} من {self.watermark} إلى {self.end_id} بعدد {self.workers} عمال")
+
+    def stop(self):
+        """طلب إيقاف المهمة (يمكن استكمالها لاحقاً من نقطة التقدم)"""
+        self.stop_event.set()
+        with self.lock:
+            if self.status == 'running':
+                self.status = 'stopped'
+        self.save_checkpoint()
+
+    def join(self, timeout: Optional[float] = None):
+        """انتظار انتهاء العمال"""
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def is_running(self) -> bool:
+        return any(thread.is_alive() for thread in self.threads)
+
+    def _wait_for_workers(self):
+        self.join()
+        with self.lock:
+            if self.status == 'running':
+                self.status = 'completed'
+            self.elapsed_before = self._elapsed()
+            self.run_started = None
+        self.save_checkpoint()
+        logger.info(f"انتهت المعالجة الرجعية بالحالة {self.status}: {self.stats}")
+
+    # ------------------------------------------------------------------
+    # العمال
+    # ------------------------------------------------------------------
+
+    def _claim_next(self) -> Optional[tuple]:
+        """
+        حجز الرسالة التالية: الرسائل الجديدة أولاً ثم الرسائل الفاشلة التي لم تستنفد محاولاتها
+
+        Returns:
+            tuple: (رقم الرسالة، مدة الانتظار قبل إعادة المحاولة بالثواني) أو None عند انتهاء العمل
+        """
+        with self.lock:
+            while self.next_id <= self.end_id and (self.next_id in self.done_ids or self.next_id in self.failed_ids):
+                self.next_id += 1
+            if self.next_id <= self.end_id:
+                message_id = self.next_id
+                self.next_id += 1
+                self.in_flight.add(message_id)
+                return message_id, 0.0
+
+            retryable = [(self.retry_at.get(message_id, 0.0), message_id)
+                         for message_id, attempts in self.failed_ids.items()
+                         if attempts < self.max_attempts and message_id not in self.in_flight]
+            if not retryable:
+                return None
+            due, message_id = min(retryable)
+            self.in_flight.add(message_id)
+            return message_id, max(due - time.monotonic(), 0.0)
+
+    def _advance_watermark(self):
+        """تقديم watermark فوق الرسائل المنجزة والفاشلة (تبقى الفاشلة في failed_ids لإعادة المحاولة)"""
+        while self.watermark in self.done_ids or self.watermark in self.failed_ids:
+            self.done_ids.discard(self.watermark)
+            self.watermark += 1
+
+    def _record(self, message_id: int, outcome: str, error: Optional[str] = None):
+        """تسجيل نتيجة رسالة (processed/skipped/failed) وحفظ نقطة التقدم كل CHECKPOINT_EVERY نتيجة"""
+        with self.lock:
+            self.in_flight.discard(message_id)
+            if outcome == 'failed':
+                attempts = self.failed_ids.get(message_id, 0) + 1
+                self.failed_ids[message_id] = attempts
+                self.retry_at[message_id] = time.monotonic() + self.retry_seconds * attempts
+                self.last_error = f"{message_id}: {error}"
+            else:
+                self.stats[outcome] += 1
+                self.failed_ids.pop(message_id, None)
+                self.retry_at.pop(message_id, None)
+                if message_id >= self.watermark:
+                    self.done_ids.add(message_id)
+            self.stats['failed'] = len(self.failed_ids)
+            self._advance_watermark()
+            self.run_done += 1
+            self._since_checkpoint += 1
+            should_save = self._since_checkpoint >= CHECKPOINT_EVERY
+            if should_save:
+                self._since_checkpoint = 0
+        if should_save:
+            self.save_checkpoint()
+
+    def _release(self, message_id: int):
+        """إعادة رسالة محجوزة دون نتيجة (عند الإيقاف)"""
+        with self.lock:
+            self.in_flight.discard(message_id)
+
+    def _pause(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _wait_turn(self) -> bool:
+        """
+        انتظار انتهاء الإيقاف المؤقت ثم الحصول على إذن من محدد المعدل
+
+        Returns:
+            bool: False إذا تم طلب الإيقاف أثناء الانتظار
+        """
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            if self.stop_event.wait(delay):
+                return False
+        return self.rate_limiter.acquire(self.stop_event)
+
+    def _get_chat(self):
+        if self.chat is None:
+            self.chat = self.bot.get_chat(self.source_chat)
+        return self.chat
+
+    def _fetch_message(self, message_id: int):
+        """
+        جلب رسالة قديمة من قناة المصدر عبر إعادة توجيهها إلى المحادثة المؤقتة
+
+        Returns:
+            Message: الرسالة مرتبطة بالقناة ورقم الرسالة الأصليين، أو None إذا لم تكن موجودة
+
+        Raises:
+            Exception: أخطاء تيليجرام الأخرى (بما فيها 429) ليتم إعادة المحاولة لاحقاً
+        """
+        try:
+            forwarded = self.bot.forward_message(
+                chat_id=self.scratch_chat,
+                from_chat_id=self.source_chat,
+                message_id=message_id,
+                disable_notification=True
+            )
+        except Exception as e:
+            if not _is_not_found_error(e):
+                raise
+            # الرسائل المحذوفة أو أرقام الرسائل غير المستخدمة
+            logger.debug(f"الرسالة {message_id} غير موجودة: {e}")
+            return None
+
+        try:
+            self.bot.delete_message(chat_id=self.scratch_chat, message_id=forwarded.message_id)
+        except Exception as e:
+            logger.debug(f"تعذر حذف الرسالة المؤقتة {forwarded.message_id}: {e}")
+
+        forwarded.chat = self._get_chat()
+        forwarded.message_id = message_id
+        return forwarded
+
+    def _handle(self, message_id: int) -> Optional[str]:
+        """
+        جلب رسالة ومعالجتها
+
+        Returns:
+            str: processed أو skipped، أو None إذا تم طلب الإيقاف
+
+        Raises:
+            Exception: عند فشل الجلب أو المعالجة (تتم إعادة المحاولة لاحقاً)
+        """
+        while True:
+            if not self._wait_turn():
+                return None
+            try:
+                message = self._fetch_message(message_id)
+                break
+            except Exception as e:
+                retry_after = get_retry_after(e)
+                if retry_after is None:
+                    raise
+                # تجاوز حد الطلبات لا يحتسب محاولة فاشلة
+                logger.warning(f"تجاوز حد الطلبات أثناء جلب الرسالة {message_id}، الانتظار {retry_after} ثانية")
+                self._pause(retry_after)
+
+        if message is None or not getattr(message, 'audio', None):
+            return 'skipped'
+        if not self.processor(self.bot, message):
+            raise RuntimeError("فشلت معالجة الملف الصوتي")
+        return 'processed'
+
+    def _worker(self):
+        while not self.stop_event.is_set():
+            claimed = self._claim_next()
+            if claimed is None:
+                return
+            message_id, delay = claimed
+            if delay > 0 and self.stop_event.wait(delay):
+                self._release(message_id)
+                return
+
+            try:
+                outcome = self._handle(message_id)
+            except Exception as e:
+                logger.error(f"خطأ في المعالجة الرجعية للرسالة {message_id}: {e}")
+                self._record(message_id, 'failed', str(e))
+                continue
+            if outcome is None:
+                self._release(message_id)
+                return
+            self._record(message_id, outcome)
+
+    # ------------------------------------------------------------------
+    # الحالة
+    # ------------------------------------------------------------------
+
+    def _elapsed(self) -> float:
+        if self.run_started is None:
+            return self.elapsed_before
+        return self.elapsed_before + (time.time() - self.run_started)
+
+    def get_status(self) -> Dict:
+        """
+        الحصول على حالة المهمة مع معدل الإنجاز والوقت المتبقي
+
+        Returns:
+            dict: التقدم والإحصائيات ومعدل الإنجاز (رسالة/دقيقة) والوقت المتبقي بالثواني
+        """
+        with self.lock:
+            total = self.end_id - self.start_id + 1
+            # الرسائل الفاشلة خلف watermark غير محتسبة ضمن المنجز
+            failed_behind = sum(1 for message_id in self.failed_ids if message_id < self.watermark)
+            done = (self.watermark - self.start_id) + len(self.done_ids) - failed_behind
+            remaining = max(total - done, 0)
+            run_elapsed = time.time() - self.run_started if self.run_started else 0
+            throughput = self.run_done / run_elapsed if run_elapsed > 0 else 0.0
+            return {
+                'status': self.status,
+                'source_chat': self.source_chat,
+                'pipeline_id': self.pipeline_id,
+                'start_id': self.start_id,
+                'end_id': self.end_id,
+                'watermark': self.watermark,
+                'total': total,
+                'done': done,
+                'remaining': remaining,
+                'percent': round(done * 100.0 / total, 1) if total else 100.0,
+                'stats': dict(self.stats),
+                'throughput_per_minute': round(throughput * 60, 2),
+                'eta_seconds': int(remaining / throughput) if throughput > 0 else None,
+                'elapsed_seconds': int(self._elapsed()),
+                'last_error': self.last_error
+            }
+
+
+# المهمة الحالية (مهمة واحدة فقط في نفس الوقت)
+_current_job = None
+_jobs_lock = threading.Lock()
+
+
+def get_current_job() -> Optional[BackfillJob]:
+    """الحصول على المهمة الحالية أو آخر مهمة محفوظة"""
+    global _current_job
+    with _jobs_lock:
+        if _current_job is None:
+            _current_job = BackfillJob.from_checkpoint(None)
+        return _current_job
+
+
+def start_backfill(bot, source_chat, start_id: int, end_id: int, **kwargs) -> Optional[BackfillJob]:
+    """
+    بدء مهمة معالجة رجعية جديدة
+
+    Args:
+        bot: كائن البوت
+        source_chat: معرف قناة المصدر
+        start_id: رقم أول رسالة
+        end_id: رقم آخر رسالة
+        **kwargs: إعدادات إضافية لـ BackfillJob (عدد العمال، المعدل، دالة المعالجة...)
+
+    Returns:
+        BackfillJob: المهمة الجديدة أو None إذا كانت هناك مهمة قيد التشغيل
+    """
+    global _current_job
+    if start_id > end_id:
+        start_id, end_id = end_id, start_id
+    with _jobs_lock:
+        if _current_job is not None and _current_job.is_running():
+            logger.warning("توجد مهمة معالجة رجعية قيد التشغيل بالفعل")
+            return None
+        _current_job = BackfillJob(bot, source_chat, start_id, end_id, **kwargs)
+    _current_job.start()
+    return _current_job
+
+
+def resume_backfill(bot, only_if_running: bool = False) -> Optional[BackfillJob]:
+    """
+    استكمال المهمة المحفوظة من نقطة التقدم
+
+    Args:
+        bot: كائن البوت
+        only_if_running: الاستكمال فقط إذا كانت المهمة قيد التشغيل قبل إعادة تشغيل البوت
+
+    Returns:
+        BackfillJob: المهمة المستكملة أو None
+    """
+    global _current_job
+    with _jobs_lock:
+        if _current_job is not None and _current_job.is_running():
+            return _current_job
+        job = BackfillJob.from_checkpoint(bot)
+        # المهمة المكتملة تستكمل فقط لإعادة محاولة رسائلها الفاشلة
+        if job is None or (job.status == 'completed' and not job.failed_ids):
+            return None
+        if only_if_running and job.status != 'running':
+            return None
+        _current_job = job
+    logger.info(f"استكمال المعالجة الرجعية من الرسالة {job.watermark}")
+    job.start()
+    return job
+
+
+def stop_backfill() -> bool:
+    """إيقاف المهمة الحالية"""
+    job = get_current_job()
+    if job is None or not job.is_running():
+        return False
+    job.stop()
+    return True
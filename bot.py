@@ -1,4 +1,5 @@
 import os
+import time
 import logging
 import telebot
 import tempfile
@@ -18,6 +19,12 @@ from template_handler import (
 
 from utils import sanitize_filename, ensure_temp_dir
 import auto_processor  # استيراد وحدة المعالجة التلقائية
+import result_cache  # التخزين المؤقت لنتائج المعالجة
+from stage_metrics import stage_timer  # قياس زمن مراحل المعالجة
+from thumbnail_helper import submit_thumbnail_task  # تجهيز الصور المصغرة في الخلفية
+import quota  # حصص الاستخدام اليومي
+import stats_timeseries  # السلاسل الزمنية لإحصائيات المعالجة
+import rule_engine  # نسخة القواعد الذكية لبصمة التخزين المؤقت
 
 # استيراد النماذج من ملف models.py
 from models import db, User, UserTemplate, UserLog, SmartRule
@@ -112,6 +119,49 @@ def get_user_state(user_id):
         return user_states[user_id]
     return None
 
+def prepare_edit_thumbnail(new_picture, source_path, user_id):
+    """
+    تجهيز الصورة المصغرة للملف المعدل (تعمل في الخلفية أثناء كتابة الوسوم)
+    
+    Args:
+        new_picture: صورة الألبوم الجديدة التي اختارها المستخدم (إن وجدت)
+        source_path: مسار الملف الأصلي لاستخراج صورة الألبوم الحالية
+        user_id: معرف المستخدم (لتسمية الملف المؤقت)
+        
+    Returns:
+        tuple: (مسار الصورة المصغرة أو None، زمن التجهيز بالثواني)
+    """
+    timer = stage_timer('thumbnail', source_path, pipeline='edit')
+    album_art_path = None
+    img_data = new_picture
+    try:
+        if not img_data:
+            img_data, _ = extract_album_art(source_path)
+        if img_data:
+            logger.info(f"Preparing thumbnail from album art, size: {len(img_data)} bytes")
+            from PIL import Image
+            import io
+            
+            # إنشاء نسخة مصغرة (90x90) لعرضها كصورة مصغرة في تيليجرام
+            img = Image.open(io.BytesIO(img_data))
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.thumbnail((90, 90))
+            album_art_path = os.path.join('temp_audio_files', f"{user_id}_thumbnail.jpg")
+            img.save(album_art_path, format='JPEG', quality=95)
+            logger.info(f"Saved thumbnail version to: {album_art_path}")
+        else:
+            logger.info("No album art found for thumbnail")
+    except Exception as e:
+        logger.error(f"Error processing album art: {e}")
+        # في حالة فشل معالجة الصورة، نستخدم الصورة كما هي
+        if img_data:
+            album_art_path = os.path.join('temp_audio_files', f"{user_id}_final_albumart.jpg")
+            with open(album_art_path, 'wb') as img_file:
+                img_file.write(img_data)
+            logger.info(f"Fallback: Saved album art directly to: {album_art_path}")
+    return album_art_path, timer.stop()
+
 # تسجيل عمليات المستخدم وأخطاء البوت أصبحت مستوردة من logger_setup
 
 # Define state class for conversation management
@@ -179,6 +229,21 @@ def start_bot():
     # إعداد معالجات القنوات للمعالجة التلقائية
     auto_processor.setup_channel_handlers(bot)
     
+    # استكمال مهام المعالجة التلقائية التي توقفت في منتصفها
+    auto_processor.start_job_recovery(bot, Config.TEMP_DIR)
+    
+    # استكمال المعالجة الرجعية إذا توقفت بسبب إعادة التشغيل
+    import backfill
+    backfill.resume_backfill(bot, only_if_running=True)
+    
+    # استكمال البث الجماعي الذي كان قيد الإرسال قبل إعادة التشغيل
+    import broadcaster
+    broadcaster.resume_running_broadcasts(bot)
+    
+    # بدء جدولة المهام الموقوتة (البث المجدول، الحصص اليومية، تنظيف الملفات المؤقتة، التقرير اليومي)
+    import scheduler
+    scheduler.start(bot)
+    
     # Define handlers
     # Command for getting bot status
     @bot.message_handler(commands=['status'])
@@ -304,6 +369,37 @@ def start_bot():
             logger.warning(f"Unauthorized access attempt to admin panel by user {user_id}")
             admin_panel.log_action(user_id, "admin_access_attempt", "failed", "غير مصرح له")
     
+    def get_subscription_markup(not_subscribed):
+        """أزرار القنوات المطلوبة مع زر إعادة التحقق"""
+        markup = types.InlineKeyboardMarkup(row_width=1)
+        for channel in not_subscribed:
+            channel_id = str(channel.get('channel_id', ''))
+            if channel_id.startswith('@'):
+                markup.add(types.InlineKeyboardButton(
+                    f"📢 {channel.get('title') or channel_id}", url=f"https://t.me/{channel_id[1:]}"))
+        markup.add(types.InlineKeyboardButton("✅ اشتركت", callback_data="check_subscription"))
+        return markup
+    
+    def get_subscription_text(not_subscribed):
+        titles = "\n".join(f"• {channel.get('title') or channel.get('channel_id')}" for channel in not_subscribed)
+        return f"🔒 للاستفادة من البوت يجب الاشتراك في القنوات التالية:\n\n{titles}\n\nبعد الاشتراك اضغط \"✅ اشتركت\"."
+    
+    def ensure_subscribed(message):
+        """
+        التحقق من الاشتراك الإجباري وإرسال القنوات المطلوبة إذا لم يكن المستخدم مشتركاً
+        
+        Returns:
+            bool: True إذا كان المستخدم مشتركاً أو مشرفاً
+        """
+        user_id = message.from_user.id
+        if admin_panel.is_admin(user_id):
+            return True
+        subscribed, not_subscribed = admin_panel.check_subscription(user_id, bot)
+        if not subscribed:
+            bot.send_message(message.chat.id, get_subscription_text(not_subscribed),
+                             reply_markup=get_subscription_markup(not_subscribed))
+        return subscribed
+    
     @bot.message_handler(commands=['start'])
     def start_command(message):
         """Start the conversation."""
@@ -329,6 +425,10 @@ def start_bot():
         # Add user to active users
         bot_status["active_users"].add(user_id)
         
+        # التحقق من الاشتراك الإجباري
+        if not ensure_subscribed(message):
+            return
+        
         # Send welcome message with improved, attractive buttons
         markup = types.InlineKeyboardMarkup(row_width=2)
         markup.add(
@@ -439,6 +539,19 @@ def start_bot():
             bot.send_message(message.chat.id, "لم أتمكن من اكتشاف ملف صوتي. الرجاء إرسال ملف صوتي.")
             return
         
+        # التحقق من الاشتراك الإجباري
+        if not ensure_subscribed(message):
+            return
+        
+        # حجز حجم الملف من الحصة اليومية قبل التنزيل (يُرجع الحجز إذا فشل التنزيل)
+        file_size_mb = (getattr(audio_file, 'file_size', 0) or 0) / (1024 * 1024)
+        reservation = quota.reserve(user_id, file_size_mb)
+        if reservation is None:
+            daily_limit = admin_panel.get_setting('daily_user_limit_mb', 0)
+            bot.send_message(message.chat.id, f"⚠️ لقد وصلت إلى حد الاستخدام اليومي ({daily_limit} ميجابايت). الرجاء المحاولة غداً.")
+            admin_panel.log_action(user_id, "daily_limit_exceeded", "failed", f"حجم الملف: {file_size_mb:.2f} ميجابايت")
+            return
+        
         # Download the file
         bot.send_message(message.chat.id, "جاري تنزيل الملف الصوتي...")
         
@@ -449,6 +562,7 @@ def start_bot():
             
             if not file_info.file_path:
                 logger.error("file_info.file_path is None or empty")
+                quota.refund(reservation)
                 bot.send_message(message.chat.id, "تعذر الحصول على مسار الملف. الرجاء المحاولة مرة أخرى.")
                 return
                 
@@ -457,9 +571,16 @@ def start_bot():
             logger.info(f"Downloaded file of size: {len(downloaded_file)} bytes")
         except Exception as e:
             logger.error(f"Error downloading file: {e}")
+            quota.refund(reservation)
             bot.send_message(message.chat.id, f"حدث خطأ في تنزيل الملف: {e}. الرجاء المحاولة مرة أخرى.")
             return
         
+        # تأكيد الحجز بالحجم الفعلي وتسجيل الحجم المنزل (يحتسب الملف كمعالج عند نجاح الحفظ فقط)
+        downloaded_mb = len(downloaded_file) / (1024 * 1024)
+        quota.commit(reservation, downloaded_mb)
+        admin_panel.update_user_data(user_id, message.from_user.username, message.from_user.first_name,
+                                     file_size_mb=downloaded_mb)
+        
         safe_file_name = sanitize_filename(file_name)
         file_path = os.path.join(TEMP_DIR, f"{user_id}_{safe_file_name}")
         
@@ -469,6 +590,7 @@ def start_bot():
         # Store the file path
         user_data[user_id]['file_path'] = file_path
         user_data[user_id]['original_file_name'] = file_name
+        user_data[user_id]['file_unique_id'] = getattr(audio_file, 'file_unique_id', None)
         
         # Get the current tags
         try:
@@ -630,7 +752,27 @@ def start_bot():
             # Always answer callback query first to prevent timeout errors
             bot.answer_callback_query(call.id)
             
-            if call.data == 'open_admin_panel':
+            if call.data == 'check_subscription':
+                # إعادة التحقق من الاشتراك بعد ضغط زر "اشتركت" (تجاهل النتائج المحفوظة)
+                admin_panel.invalidate_subscription_cache(user_id)
+                subscribed, not_subscribed = admin_panel.check_subscription(user_id, bot)
+                if subscribed:
+                    bot.edit_message_text(
+                        "✅ شكراً لاشتراكك! يمكنك الآن إرسال ملف صوتي لتعديل وسومه.",
+                        call.message.chat.id, call.message.message_id
+                    )
+                else:
+                    try:
+                        bot.edit_message_text(
+                            "⚠️ لم يتم العثور على اشتراكك بعد.\n\n" + get_subscription_text(not_subscribed),
+                            call.message.chat.id, call.message.message_id,
+                            reply_markup=get_subscription_markup(not_subscribed)
+                        )
+                    except Exception as e:
+                        # لم تتغير الرسالة عند الضغط مرة أخرى
+                        logger.debug(f"لم يتم تحديث رسالة الاشتراك الإجباري: {e}")
+            
+            elif call.data == 'open_admin_panel':
                 # فتح لوحة الإدارة للمشرف أو المطور
                 # التحقق من أن المستخدم مطور أو مشرف
                 developer_ids = [1174919068, 6556918772, 6602517122]
@@ -2718,6 +2860,8 @@ lyrics:
             bot: Telebot instance
             override_user_id: Optional user ID to use instead of extracting from message
         """
+        save_started = time.perf_counter()
+        
         # Get user ID from message object
         # We handle different scenarios:
         # 1. If override_user_id is provided, use it directly
@@ -2780,6 +2924,42 @@ lyrics:
             logger.info(f"File path: {file_path}, Tags to save: {new_tags}")
             original_file_name = user_data[user_id]['original_file_name']
             
+            # إعادة إرسال النتيجة السابقة إذا تم تطبيق نفس التعديل على نفس الملف من قبل
+            file_unique_id = user_data[user_id].get('file_unique_id')
+            # الملف الناتج يتضمن القواعد الذكية المطبقة، لذلك تدخل نسخة القواعد وقسم المستخدم في البصمة
+            try:
+                rules_key = rule_engine.get_cache_key(user_id)
+            except Exception as e:
+                logger.error(f"خطأ في قراءة إصدار القواعد الذكية، لن يستخدم التخزين المؤقت: {e}")
+                rules_key = None
+            edit_fingerprint = result_cache.compute_fingerprint(new_tags, user_data[user_id].get('full_lyrics'), rules_key)
+            cached_result = result_cache.get_cached_result(file_unique_id, edit_fingerprint) if rules_key else None
+            if cached_result:
+                try:
+                    save_started = time.perf_counter()
+                    if cached_result.get('applied_rules'):
+                        bot.send_message(
+                            message.chat.id,
+                            f"✨ تم تطبيق القواعد الذكية التالية تلقائياً:\n• " + "\n• ".join(cached_result['applied_rules'])
+                        )
+                    bot.send_audio(
+                        message.chat.id,
+                        cached_result['file_id'],
+                        caption=cached_result.get('caption')
+                    )
+                    stats_timeseries.record(True, cached_result.get('size_bytes', 0), time.perf_counter() - save_started)
+                    admin_panel.update_user_data(user_id, files_processed=1)
+                    logger.info(f"Re-sent cached result for file {file_unique_id} to user {user_id}")
+                    
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                    user_data.pop(user_id, None)
+                    bot.delete_state(user_id, message.chat.id)
+                    bot.send_message(message.chat.id, "✅ تم حفظ الوسوم وإرسال الملف بنجاح!\n\nيمكنك إرسال ملف صوتي آخر في أي وقت.")
+                    return
+                except Exception as e:
+                    logger.error(f"Error re-sending cached result, processing the file again: {e}")
+            
             bot.send_message(message.chat.id, "جاري حفظ الوسوم الجديدة...")
             
             # Create a copy of the file for modification
@@ -2804,7 +2984,8 @@ lyrics:
                 logger.info(f"New tags for saving: {new_tags}")
                 
                 # قراءة الوسوم الحالية من الملف الأصلي
-                current_tags = get_audio_tags(file_path)
+                with stage_timer('parse', file_path, pipeline='edit'):
+                    current_tags = get_audio_tags(file_path)
                 logger.info(f"Current tags from file: {current_tags}")
                 
                 # دمج الوسوم الحالية مع الجديدة
@@ -2813,9 +2994,11 @@ lyrics:
                     merged_tags[key] = value
                     
                 # تطبيق القواعد الذكية على الوسوم المدمجة
+                applied_rules = []
                 try:
                     with app.app_context():
-                        modified_tags, applied_rules = smart_rules.apply_smart_rules(merged_tags)
+                        with stage_timer('smart_rules', file_path, pipeline='edit'):
+                            modified_tags, applied_rules = smart_rules.apply_smart_rules(merged_tags, user_id)
                         if applied_rules:
                             merged_tags = modified_tags
                             logger.info(f"Applied smart rules to tags: {applied_rules}")
@@ -2860,8 +3043,12 @@ lyrics:
                 
                 logger.info(f"Merged tags after special handling: {merged_tags}")
                 
+                # تجهيز الصورة المصغرة بالتوازي مع كتابة الوسوم (الغلاف معروف مسبقاً: الصورة الجديدة أو صورة الملف الأصلي)
+                thumb_future = submit_thumbnail_task(prepare_edit_thumbnail, new_tags.get('picture'), file_path, user_id)
+                
                 # حفظ الوسوم المدمجة في الملف المعدل
-                set_audio_tags(modified_file_path, merged_tags)
+                with stage_timer('tag_write', modified_file_path, pipeline='edit'):
+                    set_audio_tags(modified_file_path, merged_tags)
                 
                 # التحقق من أن الوسوم تم حفظها بنجاح باستخراجها من الملف
                 saved_tags = get_audio_tags(modified_file_path)
@@ -2881,71 +3068,8 @@ lyrics:
                     logger.info(f"Modified file opened successfully: {modified_file_path}")
                     # Send audio file with specific parameters to maximize Telegram thumbnail compatibility
                     # First, check if we have an album art thumbnail we can use directly
-                    album_art_path = None
-                    try:
-                        # استخراج صورة الألبوم وتحسينها للعرض في تيليجرام
-                        # هذا يساعد تيليجرام على التعرف عليها بشكل أفضل ويحسن من العرض المصغر
-                        img_data = None
-                        mime = None
-                        
-                        # محاولة استخراج الصورة من الملف المعدل
-                        try:
-                            img_data, mime = extract_album_art(modified_file_path)
-                            if img_data:
-                                logger.info(f"Extracted album art from modified file, size: {len(img_data)} bytes")
-                            else:
-                                logger.info("No album art found in modified file")
-                                
-                                # إذا لم نتمكن من استخراج الصورة، نحاول استخدام الصورة من الوسوم الجديدة
-                                if 'picture' in new_tags and new_tags['picture']:
-                                    img_data = new_tags['picture']
-                                    logger.info(f"Using picture from new_tags, size: {len(img_data)} bytes")
-                            
-                            # إذا حصلنا على بيانات الصورة، نقوم بمعالجتها
-                            if img_data:
-                                # استخدام PIL لمعالجة الصورة
-                                from PIL import Image
-                                import io
-                                
-                                # تحويل الصورة إلى كائن Image
-                                img_io = io.BytesIO(img_data)
-                                img = Image.open(img_io)
-                                
-                                # حفظ الصورة الأصلية ذات الدقة العالية للملف النهائي
-                                album_art_high_res = os.path.join('temp_audio_files', f"{user_id}_high_res_albumart.jpg")
-                                img.save(album_art_high_res, format='JPEG', quality=95)
-                                logger.info(f"Saved high-quality album art to: {album_art_high_res}")
-                                
-                                # إنشاء نسخة مصغرة (90x90) لعرضها كصورة مصغرة في تيليجرام
-                                thumb_size = (90, 90)
-                                thumb_img = img.copy()
-                                thumb_img.thumbnail(thumb_size)
-                                
-                                # حفظ الصورة المصغرة
-                                album_art_path = os.path.join('temp_audio_files', f"{user_id}_thumbnail.jpg")
-                                thumb_img.save(album_art_path, format='JPEG', quality=95)
-                                logger.info(f"Saved thumbnail version to: {album_art_path}")
-                                
-                                # حفظ نسخة متوسطة ذات حجم مناسب لتيليجرام (320x320)
-                                medium_size = (320, 320)
-                                medium_img = img.copy()
-                                medium_img.thumbnail(medium_size)
-                                
-                                # حفظ النسخة المتوسطة كنسخة احتياطية
-                                medium_path = os.path.join('temp_audio_files', f"{user_id}_medium_albumart.jpg")
-                                medium_img.save(medium_path, format='JPEG', quality=95)
-                                logger.info(f"Saved medium-size album art to: {medium_path}")
-                        except Exception as e:
-                            logger.error(f"Error processing album art: {e}")
-                            
-                            # في حالة فشل معالجة الصورة، نستخدم الطريقة التقليدية
-                            if img_data:
-                                album_art_path = os.path.join('temp_audio_files', f"{user_id}_final_albumart.jpg")
-                                with open(album_art_path, 'wb') as img_file:
-                                    img_file.write(img_data)
-                                logger.info(f"Fallback: Saved album art directly to: {album_art_path}")
-                    except Exception as e:
-                        logger.error(f"Error preparing thumbnail: {e}")
+                    # انتظار الصورة المصغرة التي تم تجهيزها بالتوازي مع كتابة الوسوم
+                    album_art_path = auto_processor.wait_for_thumbnail(thumb_future, modified_file_path, pipeline='edit')
                     
                     # الحد الأقصى للوصف في تيليجرام هو 1024 حرف - لذلك نختصر اسم الملف إذا كان طويلاً
                     # Create a safe caption that won't exceed Telegram's limit
@@ -2974,6 +3098,8 @@ lyrics:
                         safe_caption = f"ملف صوتي معدل: {short_filename}\nالألبوم: {album}"
                     
                     logger.info(f"Sending final file with performer={performer}, title={title}")
+                    sent_audio = None
+                    upload_timer = stage_timer('upload', modified_file_path, pipeline='edit')
                     
                     # استخدام الصورة المصغرة المحسنة إذا كانت متوفرة
                     if album_art_path and os.path.exists(album_art_path):
@@ -2995,7 +3121,7 @@ lyrics:
                                 logger.error(f"Error sending audio with custom thumbnail: {e}")
                                 # محاولة الإرسال بدون الصورة المصغرة المخصصة في حالة فشل الإرسال
                                 bot.send_message(message.chat.id, "⚠️ حدث خطأ أثناء إرفاق الصورة المصغرة، جاري إعادة المحاولة...")
-                                bot.send_audio(
+                                sent_audio = bot.send_audio(
                                     message.chat.id,
                                     audio_file,
                                     caption=safe_caption,
@@ -3027,7 +3153,7 @@ lyrics:
                         logger.info("No custom thumbnail available, letting Telegram extract thumbnail automatically")
                         
                         try:
-                            bot.send_audio(
+                            sent_audio = bot.send_audio(
                                 message.chat.id,
                                 audio_file,
                                 caption=safe_caption,
@@ -3041,9 +3167,26 @@ lyrics:
                                 message.chat.id,
                                 f"⚠️ حدث خطأ أثناء إرسال الملف: {str(e)}"
                             )
+                    upload_timer.stop()
+                    stats_timeseries.record(sent_audio is not None, os.path.getsize(modified_file_path),
+                                            time.perf_counter() - save_started)
+                    if sent_audio is not None:
+                        admin_panel.update_user_data(user_id, files_processed=1)
                     logger.info(f"Modified file sent successfully to user {user_id}")
+                    
+                    # تخزين الملف الناتج لإعادة استخدامه عند تكرار نفس التعديل
+                    if rules_key and sent_audio is not None and getattr(sent_audio, 'audio', None):
+                        result_cache.store_result(
+                            file_unique_id,
+                            edit_fingerprint,
+                            sent_audio.audio.file_id,
+                            caption=safe_caption,
+                            applied_rules=applied_rules,
+                            size_bytes=os.path.getsize(modified_file_path)
+                        )
             except Exception as e:
                 logger.error(f"Error processing or sending modified file: {e}")
+                stats_timeseries.record(False, seconds=time.perf_counter() - save_started)
                 bot.send_message(message.chat.id, f"حدث خطأ أثناء معالجة أو إرسال الملف المعدل: {str(e)}")
             
             # Clean up both files
@@ -3556,6 +3699,81 @@ lyrics:
                         "❌ حدث خطأ أثناء تعيين قناة المصدر. الرجاء المحاولة مرة أخرى."
                     )
                     
+        elif current_state == "admin_waiting_backfill_range":
+            # المشرف ينتظر إدخال نطاق الرسائل للمعالجة الرجعية
+            logger.info(f"Admin {user_id} is in admin_waiting_backfill_range state, processing range: {message.text}")
+            
+            if message.text.lower() == "الغاء":
+                user_states.pop(user_id, None)
+                bot.send_message(message.chat.id, "تم إلغاء عملية المعالجة الرجعية.")
+                from admin_handlers import open_admin_panel
+                open_admin_panel(bot, message)
+            else:
+                try:
+                    start_id, end_id = [int(part.strip()) for part in message.text.split('-', 1)]
+                except ValueError:
+                    bot.send_message(
+                        message.chat.id,
+                        "❌ تنسيق غير صحيح. أرسل النطاق مثل `1-25000` أو `الغاء` للإلغاء.",
+                        parse_mode="Markdown"
+                    )
+                else:
+                    state_data = user_states.pop(user_id, {}).get('data', {})
+                    import backfill
+                    import channel_pipelines
+                    pipeline = channel_pipelines.get_pipeline(state_data.get('pipeline_id'))
+                    source_chat = pipeline['source_channel'] if pipeline else auto_processor.get_source_channel()
+                    job = backfill.start_backfill(bot, source_chat, start_id, end_id,
+                                                  pipeline_id=pipeline['id'] if pipeline else None)
+                    if job:
+                        bot.send_message(
+                            message.chat.id,
+                            f"✅ بدأت معالجة الرسائل من {job.start_id} إلى {job.end_id}.\n"
+                            "يمكنك متابعة التقدم من لوحة الإدارة ← التعديل التلقائي ← معالجة المنشورات السابقة."
+                        )
+                        admin_panel.log_action(user_id, "backfill_start", "success", f"{job.source_chat}: {job.start_id}-{job.end_id}")
+                    else:
+                        bot.send_message(message.chat.id, "❌ توجد مهمة معالجة رجعية قيد التشغيل بالفعل.")
+                    
+        elif current_state == "admin_waiting_pipeline":
+            # المشرف ينتظر إدخال تعريف مسار قناة جديد
+            logger.info(f"Admin {user_id} is in admin_waiting_pipeline state, processing pipeline: {message.text}")
+            
+            if message.text.lower() == "الغاء":
+                user_states.pop(user_id, None)
+                bot.send_message(message.chat.id, "تم إلغاء عملية إضافة المسار.")
+                from admin_handlers import open_admin_panel
+                open_admin_panel(bot, message)
+            else:
+                parts = [part.strip() for part in message.text.split('|')]
+                try:
+                    pipeline_id, source_channel = parts[0], parts[1]
+                    targets = [target.strip() for target in parts[2].split(',') if target.strip()] if len(parts) > 2 else []
+                    workers = int(parts[3]) if len(parts) > 3 and parts[3] else Config.PIPELINE_WORKERS
+                    if not pipeline_id or not source_channel:
+                        raise ValueError
+                except (IndexError, ValueError):
+                    bot.send_message(
+                        message.chat.id,
+                        "❌ تنسيق غير صحيح. أرسل التعريف مثل `news | @source | @target1, @target2 | 2` أو `الغاء` للإلغاء.",
+                        parse_mode="Markdown"
+                    )
+                else:
+                    user_states.pop(user_id, None)
+                    import channel_pipelines
+                    definition = {
+                        'name': pipeline_id,
+                        'source_channel': source_channel,
+                        'target_channels': targets,
+                        'forward_to_target': bool(targets),
+                        'workers': workers
+                    }
+                    if channel_pipelines.save_pipeline(pipeline_id, definition):
+                        bot.send_message(message.chat.id, f"✅ تم حفظ المسار {pipeline_id}: {source_channel} ← {', '.join(targets) or 'بدون قناة هدف'}")
+                        admin_panel.log_action(user_id, "pipeline_add", "success", f"{pipeline_id}: {source_channel}")
+                    else:
+                        bot.send_message(message.chat.id, "❌ حدث خطأ أثناء حفظ المسار. الرجاء المحاولة مرة أخرى.")
+                    
         elif current_state == "admin_waiting_old_text":
             # المشرف ينتظر إدخال النص الأصلي للاستبدال
             logger.info(f"Admin {user_id} is in admin_waiting_old_text state, processing old text: {message.text}")
@@ -3864,7 +4082,7 @@ lyrics:
                     field_name = next((field['name'] for field in smart_rules.get_available_fields() if field['id'] == field_id), field_id)
                     
                     # تجربة القواعد الذكية
-                    modified_text, applied_rules, active_rules_count = smart_rules.test_smart_rules_on_text(original_text, field_id)
+                    modified_text, applied_rules, active_rules_count = smart_rules.test_smart_rules_on_text(original_text, field_id, user_id)
                     
                     # تحضير رسالة النتيجة
                     result_message = f"🧪 *نتيجة تجربة القواعد الذكية*\n\n"
@@ -4808,7 +5026,7 @@ lyrics:
             admin_panel.log_action(user_id, "add_admin", "success", f"إضافة مشرف جديد: {new_admin_id}")
             
             # إرسال إشعار للمشرف الجديد إذا كان موجودًا في قاعدة البيانات
-            user_data = admin_panel.admin_data['users'].get(str(new_admin_id))
+            user_data = admin_panel.get_user_data(new_admin_id)
             if user_data:
                 try:
                     bot.send_message(
@@ -0,0 +1,427 @@
+"""
+وحدة البث الجماعي في الخلفية
+- مهمة البث تعمل في خيط منفصل حتى لا تتوقف جلسة المشرف أثناء الإرسال
+- عدة عمال متوازيين بعدد محدود مع تحديد المعدل العام لتيليجرام والالتزام بـ retry_after عند الخطأ 429
+- حفظ التقدم (آخر معرف مستخدم) ونتيجة كل مستلم في قاعدة البيانات لاستكمال البث بعد إعادة التشغيل
+- استبعاد المستخدمين الذين حظروا البوت من البث القادم
+- إيقاف مؤقت واستكمال وإلغاء البث من لوحة الإدارة
+"""
+
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from models import db, Broadcast, BroadcastRecipient
+from main import app
+from backfill import TokenBucket, get_retry_after
+from config import Config
+import user_store
+
+# إعداد التسجيل
+logger = logging.getLogger('broadcaster')
+
+# عدد محاولات الإرسال لكل مستلم عند تجاوز حد الطلبات (429)
+MAX_RETRIES = 3
+
+# أخطاء تيليجرام التي تعني أن المستخدم لم يعد متاحاً للمراسلة
+BLOCKED_ERRORS = ('bot was blocked', 'user is deactivated', 'bot was kicked', 'chat not found')
+
+
+class _RateGate:
+    """محدد المعدل العام للإرسال مع إيقاف جميع العمال مؤقتاً عند طلب تيليجرام (retry_after)"""
+
+    def __init__(self, rate_per_second: float):
+        self.bucket = TokenBucket(rate_per_second, capacity=max(1.0, rate_per_second))
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+
+    def backoff(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def wait(self, stop_event: threading.Event) -> bool:
+        """
+        انتظار الإذن بالإرسال
+
+        Returns:
+            bool: False إذا تم طلب الإيقاف أثناء الانتظار
+        """
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            if stop_event.wait(delay):
+                return False
+        return self.bucket.acquire(stop_event)
+
+
+def _is_blocked_error(error) -> bool:
+    """هل يعني الخطأ أن المستخدم حظر البوت أو حذف حسابه"""
+    if getattr(error, 'error_code', None) not in (400, 403):
+        return False
+    description = str(getattr(error, 'description', '') or error).lower()
+    return any(reason in description for reason in BLOCKED_ERRORS)
+
+
+def _send(bot, broadcast: Dict, user_id: int):
+    """إرسال رسالة البث لمستخدم واحد حسب نوعها"""
+    message_type = broadcast['message_type']
+    text = broadcast['text'] or None
+    if message_type == 'photo':
+        bot.send_photo(user_id, broadcast['file_id'], caption=text)
+    elif message_type == 'video':
+        bot.send_video(user_id, broadcast['file_id'], caption=text)
+    elif message_type == 'document':
+        bot.send_document(user_id, broadcast['file_id'], caption=text)
+    elif message_type == 'audio':
+        bot.send_audio(user_id, broadcast['file_id'], caption=text)
+    else:
+        bot.send_message(user_id, text)
+
+
+class BroadcastRunner:
+    """تشغيل بث واحد في الخلفية على دفعات من المستلمين"""
+
+    def __init__(self, bot, broadcast_id: int, workers: int = None, rate_per_second: float = None,
+                 batch_size: int = None):
+        self.bot = bot
+        self.broadcast_id = broadcast_id
+        self.workers = max(1, workers or Config.BROADCAST_WORKERS)
+        self.batch_size = max(1, batch_size or Config.BROADCAST_BATCH_SIZE)
+        self.gate = _RateGate(rate_per_second or Config.BROADCAST_RATE_PER_SECOND)
+        self.stop_event = threading.Event()
+        self.stop_state = None  # الحالة المطلوبة عند الإيقاف (paused أو cancelled)
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f"broadcast-{self.broadcast_id}", daemon=True)
+        self.thread.start()
+
+    def stop(self, state: str):
+        self.stop_state = state
+        self.stop_event.set()
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    # ------------------------------------------------------------------
+    # المستلمون
+    # ------------------------------------------------------------------
+
+    def _next_batch(self, broadcast: Dict, targets: Optional[List[int]]) -> Tuple[List[int], Optional[int]]:
+        """
+        الدفعة التالية بعد آخر معرف تمت معالجته، مع استبعاد من تم تسجيل نتيجتهم مسبقاً
+        (دفعة توقفت في منتصفها عند الإيقاف المؤقت)
+
+        Returns:
+            tuple: (المستلمون، آخر معرف في الدفعة) أو ([], None) عند انتهاء المستلمين
+        """
+        cursor = broadcast['cursor_user_id']
+        while True:
+            if targets is not None:
+                batch = [user_id for user_id in targets if cursor is None or user_id > cursor][:self.batch_size]
+            else:
+                batch = user_store.get_user_ids_after(cursor, self.batch_size)
+            if not batch:
+                return [], None
+            with app.app_context():
+                done = {user_id for (user_id,) in db.session.query(BroadcastRecipient.user_id).filter(
+                    BroadcastRecipient.broadcast_id == self.broadcast_id,
+                    BroadcastRecipient.user_id.in_(batch)).all()}
+            pending = [user_id for user_id in batch if user_id not in done]
+            if pending:
+                return pending, batch[-1]
+            cursor = batch[-1]
+
+    def _deliver(self, broadcast: Dict, user_id: int) -> Optional[tuple]:
+        """
+        إرسال البث لمستلم واحد
+
+        Returns:
+            tuple: (الحالة، الخطأ) أو None إذا تم الإيقاف قبل الإرسال
+        """
+        for attempt in range(MAX_RETRIES):
+            if not self.gate.wait(self.stop_event):
+                return None
+            try:
+                _send(self.bot, broadcast, user_id)
+                return 'sent', None
+            except Exception as e:
+                retry_after = get_retry_after(e)
+                if retry_after is not None:
+                    logger.warning(f"تجاوز حد الطلبات أثناء البث {self.broadcast_id}، الانتظار {retry_after} ثانية")
+                    self.gate.backoff(retry_after)
+                    continue
+                if _is_blocked_error(e):
+                    return 'blocked', str(e)[:255]
+                return 'failed', str(e)[:255]
+        return 'failed', 'retry_after'
+
+    # ------------------------------------------------------------------
+    # التشغيل
+    # ------------------------------------------------------------------
+
+    def _load(self) -> Optional[Dict]:
+        with app.app_context():
+            broadcast = Broadcast.query.get(self.broadcast_id)
+            if broadcast is None:
+                return None
+            data = broadcast.to_dict()
+            data['targets'] = broadcast.get_target_user_ids()
+            return data
+
+    def _save_progress(self, cursor: Optional[int], outcomes: List[tuple], counts: Dict[str, int],
+                       state: str = None, last_error: str = None):
+        """حفظ نتائج الدفعة وآخر معرف وحالة البث في معاملة واحدة"""
+        with app.app_context():
+            try:
+                if outcomes:
+                    db.session.bulk_insert_mappings(BroadcastRecipient, [
+                        {'broadcast_id': self.broadcast_id, 'user_id': user_id, 'status': status, 'error': error}
+                        for user_id, status, error in outcomes
+                    ])
+                broadcast = Broadcast.query.get(self.broadcast_id)
+                if cursor is not None:
+                    broadcast.cursor_user_id = cursor
+                broadcast.sent_count = (broadcast.sent_count or 0) + counts.get('sent', 0)
+                broadcast.failed_count = (broadcast.failed_count or 0) + counts.get('failed', 0)
+                broadcast.blocked_count = (broadcast.blocked_count or 0) + counts.get('blocked', 0)
+                broadcast.skipped_count = (broadcast.skipped_count or 0) + counts.get('skipped', 0)
+                if last_error:
+                    broadcast.last_error = last_error
+                if state:
+                    broadcast.state = state
+                    if state in ('completed', 'cancelled'):
+                        broadcast.finished_at = datetime.utcnow()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _run(self):
+        import admin_panel
+        try:
+            broadcast = self._load()
+            if broadcast is None:
+                return
+            targets = broadcast['targets']
+            with app.app_context():
+                Broadcast.query.filter(Broadcast.id == self.broadcast_id, Broadcast.started_at.is_(None)).update(
+                    {'started_at': datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"broadcast-{self.broadcast_id}") as executor:
+                while not self.stop_event.is_set():
+                    batch, last_id = self._next_batch(broadcast, targets)
+                    if not batch:
+                        self._save_progress(None, [], {}, state='completed')
+                        logger.info(f"اكتمل البث الجماعي {self.broadcast_id}")
+                        admin_panel.log_action(broadcast['created_by'], "broadcast", "success",
+                                               f"اكتمل البث {self.broadcast_id}")
+                        return
+
+                    # المستخدمون المحظورون من الإدارة (قراءة المجموعة مرة واحدة لكل دفعة)
+                    blocked_by_admin = set(admin_panel.admin_data['blocked_users'])
+                    recipients = [user_id for user_id in batch if user_id not in blocked_by_admin]
+                    outcomes = [(user_id, 'skipped', None) for user_id in batch if user_id in blocked_by_admin]
+
+                    results = executor.map(lambda user_id: self._deliver(broadcast, user_id), recipients)
+                    cursor = broadcast['cursor_user_id']
+                    stopped = False
+                    for user_id, result in zip(recipients, results):
+                        if result is None:
+                            stopped = True
+                            continue
+                        outcomes.append((user_id,) + result)
+                    if not stopped:
+                        cursor = last_id
+
+                    counts = {}
+                    for _, status, _ in outcomes:
+                        counts[status] = counts.get(status, 0) + 1
+                    last_error = next((error for _, status, error in reversed(outcomes) if status == 'failed'), None)
+                    self._save_progress(cursor, outcomes, counts, last_error=last_error)
+                    broadcast['cursor_user_id'] = cursor
+
+                    # استبعاد من حظر البوت من البث القادم
+                    user_store.mark_bot_blocked([user_id for user_id, status, _ in outcomes if status == 'blocked'])
+
+            if self.stop_state:
+                self._save_progress(None, [], {}, state=self.stop_state)
+                logger.info(f"تم {'إلغاء' if self.stop_state == 'cancelled' else 'إيقاف'} البث الجماعي {self.broadcast_id}")
+        except Exception as e:
+            logger.error(f"خطأ في تشغيل البث الجماعي {self.broadcast_id}: {e}")
+            try:
+                self._save_progress(None, [], {}, state='paused', last_error=str(e))
+            except Exception:
+                pass
+        finally:
+            with _runners_lock:
+                if _runners.get(self.broadcast_id) is self:
+                    del _runners[self.broadcast_id]
+
+
+# البث قيد التشغيل في هذه العملية: {معرف البث: BroadcastRunner}
+_runners: Dict[int, BroadcastRunner] = {}
+_runners_lock = threading.Lock()
+
+
+def _start_runner(bot, broadcast_id: int) -> bool:
+    with _runners_lock:
+        runner = _runners.get(broadcast_id)
+        if runner is not None and runner.is_running():
+            return False
+        runner = _runners[broadcast_id] = BroadcastRunner(bot, broadcast_id)
+    runner.start()
+    return True
+
+
+def start_broadcast(bot, text: str, created_by: int = None, message_type: str = 'text',
+                    file_id: str = None, user_ids: List[int] = None) -> Optional[int]:
+    """
+    إنشاء بث جماعي وبدء إرساله في الخلفية
+
+    Args:
+        bot: كائن البوت
+        text: نص الرسالة أو الكابشن
+        created_by: معرف المشرف
+        message_type: نوع الرسالة ('text', 'photo', 'video', 'document', 'audio')
+        file_id: معرف الملف للوسائط
+        user_ids: قائمة مستلمين محددة (None لجميع المستخدمين)
+
+    Returns:
+        int: معرف البث، أو None عند الفشل
+    """
+    try:
+        targets = sorted(set(int(user_id) for user_id in user_ids)) if user_ids is not None else None
+        with app.app_context():
+            broadcast = Broadcast(
+                message_type=message_type,
+                text=text,
+                file_id=file_id,
+                target_user_ids=json.dumps(targets) if targets is not None else None,
+                created_by=created_by,
+                state='running',
+                total=len(targets) if targets is not None else user_store.count_reachable_users()
+            )
+            db.session.add(broadcast)
+            db.session.commit()
+            broadcast_id = broadcast.id
+        logger.info(f"بدء البث الجماعي {broadcast_id} إلى {broadcast.total} مستخدم")
+        _start_runner(bot, broadcast_id)
+        return broadcast_id
+    except Exception as e:
+        logger.error(f"خطأ في إنشاء البث الجماعي: {e}")
+        return None
+
+
+def pause_broadcast(broadcast_id: int) -> bool:
+    """إيقاف البث مؤقتاً (يكمل العمال الرسائل الجارية فقط)"""
+    return _stop(broadcast_id, 'paused')
+
+
+def cancel_broadcast(broadcast_id: int) -> bool:
+    """إلغاء البث نهائياً"""
+    return _stop(broadcast_id, 'cancelled')
+
+
+def _stop(broadcast_id: int, state: str) -> bool:
+    with _runners_lock:
+        runner = _runners.get(broadcast_id)
+    if runner is not None and runner.is_running():
+        runner.stop(state)
+        return True
+    # البث غير قيد التشغيل في هذه العملية: تحديث الحالة مباشرة
+    try:
+        with app.app_context():
+            broadcast = Broadcast.query.get(broadcast_id)
+            if broadcast is None or broadcast.state in ('completed', 'cancelled'):
+                return False
+            broadcast.state = state
+            if state == 'cancelled':
+                broadcast.finished_at = datetime.utcnow()
+            db.session.commit()
+            return True
+    except Exception as e:
+        logger.error(f"خطأ في تغيير حالة البث الجماعي {broadcast_id}: {e}")
+        return False
+
+
+def resume_broadcast(bot, broadcast_id: int) -> bool:
+    """استكمال بث متوقف مؤقتاً من آخر نقطة تقدم"""
+    try:
+        with app.app_context():
+            broadcast = Broadcast.query.get(broadcast_id)
+            if broadcast is None or broadcast.state in ('completed', 'cancelled'):
+                return False
+            broadcast.state = 'running'
+            db.session.commit()
+        return _start_runner(bot, broadcast_id)
+    except Exception as e:
+        logger.error(f"خطأ في استكمال البث الجماعي {broadcast_id}: {e}")
+        return False
+
+
+def resume_running_broadcasts(bot) -> int:
+    """
+    استكمال البث الذي كان قيد التشغيل قبل إعادة تشغيل البوت
+
+    Returns:
+        int: عدد البث المستكمل
+    """
+    try:
+        with app.app_context():
+            broadcast_ids = [broadcast_id for (broadcast_id,) in
+                             db.session.query(Broadcast.id).filter_by(state='running').all()]
+        resumed = sum(1 for broadcast_id in broadcast_ids if _start_runner(bot, broadcast_id))
+        if resumed:
+            logger.info(f"تم استكمال {resumed} بث جماعي بعد إعادة التشغيل")
+        return resumed
+    except Exception as e:
+        logger.error(f"خطأ في استكمال البث الجماعي: {e}")
+        return 0
+
+
+def get_broadcast_status(broadcast_id: int) -> Optional[Dict]:
+    """
+    حالة البث مع نسبة التقدم ومعدل الإرسال
+
+    Returns:
+        dict: بيانات البث، أو None إذا لم يكن موجوداً
+    """
+    try:
+        with app.app_context():
+            broadcast = Broadcast.query.get(broadcast_id)
+            if broadcast is None:
+                return None
+            status = broadcast.to_dict()
+        done = status['sent_count'] + status['failed_count'] + status['blocked_count'] + status['skipped_count']
+        status['done'] = done
+        status['percent'] = round(done * 100.0 / status['total'], 1) if status['total'] else 100.0
+        elapsed = ((status['finished_at'] or datetime.utcnow()) - status['started_at']).total_seconds() \
+            if status['started_at'] else 0
+        status['rate_per_second'] = round(status['sent_count'] / elapsed, 2) if elapsed > 0 else 0.0
+        with _runners_lock:
+            runner = _runners.get(broadcast_id)
+        status['active'] = runner is not None and runner.is_running()
+        return status
+    except Exception as e:
+        logger.error(f"خطأ في الحصول على حالة البث الجماعي {broadcast_id}: {e}")
+        return None
+
+
+def list_broadcasts(limit: int = 5) -> List[Dict]:
+    """آخر البث الجماعي من الأحدث إلى الأقدم"""
+    try:
+        with app.app_context():
+            broadcast_ids = [broadcast_id for (broadcast_id,) in
+                             db.session.query(Broadcast.id).order_by(Broadcast.id.desc()).limit(limit).all()]
+        return [status for status in (get_broadcast_status(broadcast_id) for broadcast_id in broadcast_ids) if status]
+    except Exception as e:
+        logger.error(f"خطأ في الحصول على قائمة البث الجماعي: {e}")
+        return []
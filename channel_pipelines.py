@@ -0,0 +1,303 @@
+"""
+وحدة مسارات المعالجة التلقائية للقنوات (مصدر ← أهداف)
+- تعريف عدة مسارات، لكل مسار قناة مصدر وقنوات هدف واستبدالات وتذييل وقوالب خاصة به
+- فهرس يربط معرف القناة أو اسم المستخدم بالمسار المناسب (بحث O(1))
+- مجموعة عمال منفصلة لكل مسار حتى لا تؤخر قناة مزدحمة بقية القنوات
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import admin_panel
+from config import Config
+
+# إعداد التسجيل
+logger = logging.getLogger('channel_pipelines')
+
+# معرف المسار الافتراضي المبني من إعدادات المعالجة التلقائية العامة (قناة المصدر والهدف الحاليتان)
+DEFAULT_PIPELINE_ID = 'default'
+
+# الإعدادات التي يمكن لكل مسار تجاوزها، وما لم يحدد منها يؤخذ من إعدادات auto_processing العامة
+PIPELINE_KEYS = (
+    'name', 'enabled', 'source_channel', 'target_channels', 'workers',
+    'tag_replacements', 'enabled_tags', 'smart_templates', 'remove_links',
+    'footer_enabled', 'tag_footer', 'footer_tag_settings',
+    'keep_caption', 'auto_publish', 'edit_in_place', 'forward_to_target'
+)
+
+# إعدادات auto_processing التي يبنى منها فهرس القنوات (أي كتابة عليها تبطل الفهرس)
+INDEX_SETTINGS = ('auto_processing.pipelines', 'auto_processing.source_channel')
+
+# فهرس القنوات: {مفتاح القناة: المسار}
+_index = {}
+_index_key = None
+_definitions_version = 0
+_index_lock = threading.Lock()
+
+# مجموعات العمال: {معرف المسار: (عدد العمال، ThreadPoolExecutor)}
+_executors = {}
+_inflight = {}
+_executors_lock = threading.Lock()
+
+
+def normalize_chat_key(chat_ref) -> str:
+    """
+    توحيد مرجع القناة (معرف رقمي أو اسم مستخدم مع أو بدون @) لاستخدامه كمفتاح في الفهرس
+
+    Args:
+        chat_ref: معرف القناة أو اسم المستخدم
+
+    Returns:
+        str: المفتاح الموحد
+    """
+    return str(chat_ref).strip().lstrip('@').lower()
+
+
+def _get_pipeline_definitions() -> Dict[str, Dict]:
+    """الحصول على تعريفات المسارات المحفوظة"""
+    return admin_panel.get_setting("auto_processing.pipelines", {}) or {}
+
+
+def get_pipelines() -> Dict[str, Dict]:
+    """
+    الحصول على جميع المسارات، بما فيها المسار الافتراضي المبني من قناة المصدر العامة
+
+    Returns:
+        dict: {معرف المسار: تعريف المسار}
+    """
+    pipelines = {}
+    legacy_source = admin_panel.get_setting("auto_processing.source_channel", "")
+    if legacy_source:
+        pipelines[DEFAULT_PIPELINE_ID] = {
+            'id': DEFAULT_PIPELINE_ID,
+            'name': 'المسار الافتراضي',
+            'source_channel': legacy_source
+        }
+    for pipeline_id, definition in _get_pipeline_definitions().items():
+        pipeline = dict(definition)
+        pipeline['id'] = pipeline_id
+        pipelines[pipeline_id] = pipeline
+    return pipelines
+
+
+def get_pipeline(pipeline_id: Optional[str]) -> Optional[Dict]:
+    """
+    الحصول على مسار حسب معرفه
+
+    Returns:
+        dict: تعريف المسار، أو None إذا لم يكن موجوداً
+    """
+    if not pipeline_id:
+        return None
+    return get_pipelines().get(pipeline_id)
+
+
+def invalidate_index(setting_path: Optional[str] = None):
+    """
+    إبطال فهرس القنوات بعد تعديل تعريفات المسارات أو قناة المصدر العامة
+
+    Args:
+        setting_path: مسار الإعداد المعدل (None للإبطال دون شرط)
+    """
+    global _definitions_version
+    if setting_path is not None and not any(
+            path == setting_path or path.startswith(setting_path + '.') or setting_path.startswith(path + '.')
+            for path in INDEX_SETTINGS):
+        return
+    with _index_lock:
+        _definitions_version += 1
+
+
+def _rebuild_index():
+    """إعادة بناء فهرس القنوات عند تغيير تعريفات المسارات"""
+    global _index, _index_key
+    # يتغير الإصدار مع كل كتابة على تعريفات المسارات أو قناة المصدر العامة
+    key = _definitions_version
+    if key == _index_key:
+        return
+
+    index = {}
+    for pipeline in get_pipelines().values():
+        source = pipeline.get('source_channel')
+        if not source:
+            continue
+        chat_key = normalize_chat_key(source)
+        if chat_key in index:
+            logger.warning(f"القناة {source} مستخدمة في أكثر من مسار، سيتم استخدام المسار {index[chat_key]['id']}")
+            continue
+        index[chat_key] = pipeline
+    _index = index
+    _index_key = key
+    logger.info(f"تم بناء فهرس مسارات القنوات ({len(index)} قناة)")
+
+
+def find_pipeline(chat) -> Optional[Dict]:
+    """
+    البحث عن المسار المسؤول عن قناة (حسب المعرف الرقمي أو اسم المستخدم)
+
+    Args:
+        chat: كائن المحادثة من الرسالة
+
+    Returns:
+        dict: تعريف المسار، أو None إذا لم تكن القناة مصدراً لأي مسار
+    """
+    with _index_lock:
+        _rebuild_index()
+        index = _index
+    pipeline = index.get(normalize_chat_key(chat.id))
+    if pipeline is None and getattr(chat, 'username', None):
+        pipeline = index.get(normalize_chat_key(chat.username))
+    return pipeline
+
+
+def get_pipeline_setting(pipeline: Optional[Dict], key: str, default: Any = None) -> Any:
+    """
+    الحصول على إعداد من المسار، أو من إعدادات المعالجة التلقائية العامة إذا لم يحدده المسار
+
+    Args:
+        pipeline: تعريف المسار (أو None للإعدادات العامة)
+        key: اسم الإعداد داخل auto_processing
+        default: القيمة الافتراضية
+    """
+    if pipeline and key in pipeline:
+        return pipeline[key]
+    return admin_panel.get_setting(f"auto_processing.{key}", default)
+
+
+def get_target_channels(pipeline: Optional[Dict]) -> List[str]:
+    """
+    الحصول على قنوات الهدف للمسار
+
+    Returns:
+        list: معرفات قنوات الهدف (قناة الهدف العامة للمسار الافتراضي)
+    """
+    if pipeline and pipeline.get('target_channels') is not None:
+        return [channel for channel in pipeline['target_channels'] if channel]
+    target_channel = admin_panel.get_setting("auto_processing.target_channel", "")
+    return [target_channel] if target_channel else []
+
+
+def get_pipeline_overrides(pipeline: Optional[Dict]) -> Dict:
+    """الحصول على الإعدادات التي يتجاوزها المسار (تستخدم في بصمة التعديل)"""
+    if not pipeline:
+        return {}
+    return {key: pipeline[key] for key in PIPELINE_KEYS if key in pipeline}
+
+
+def save_pipeline(pipeline_id: str, definition: Dict) -> bool:
+    """
+    إضافة أو تحديث مسار
+
+    Args:
+        pipeline_id: معرف المسار
+        definition: إعدادات المسار (المفاتيح من PIPELINE_KEYS)
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    try:
+        if pipeline_id == DEFAULT_PIPELINE_ID:
+            logger.error("لا يمكن استخدام معرف المسار الافتراضي لمسار جديد")
+            return False
+        unknown = set(definition) - set(PIPELINE_KEYS)
+        if unknown:
+            logger.error(f"إعدادات غير معروفة للمسار {pipeline_id}: {unknown}")
+            return False
+        definitions = dict(_get_pipeline_definitions())
+        definitions[pipeline_id] = dict(definition)
+        return admin_panel.update_setting("auto_processing.pipelines", definitions)
+    except Exception as e:
+        logger.error(f"خطأ في حفظ المسار {pipeline_id}: {e}")
+        return False
+
+
+def remove_pipeline(pipeline_id: str) -> bool:
+    """
+    حذف مسار وإيقاف مجموعة العمال الخاصة به
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    try:
+        definitions = dict(_get_pipeline_definitions())
+        if pipeline_id not in definitions:
+            return False
+        del definitions[pipeline_id]
+        result = admin_panel.update_setting("auto_processing.pipelines", definitions)
+        with _executors_lock:
+            entry = _executors.pop(pipeline_id, None)
+        if entry:
+            entry[1].shutdown(wait=False)
+        return result
+    except Exception as e:
+        logger.error(f"خطأ في حذف المسار {pipeline_id}: {e}")
+        return False
+
+
+def _get_executor(pipeline: Dict) -> ThreadPoolExecutor:
+    """الحصول على مجموعة العمال الخاصة بالمسار (يعاد إنشاؤها عند تغيير عدد العمال)"""
+    workers = max(1, int(pipeline.get('workers') or Config.PIPELINE_WORKERS))
+    with _executors_lock:
+        entry = _executors.get(pipeline['id'])
+        if entry and entry[0] == workers:
+            return entry[1]
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"pipeline-{pipeline['id']}")
+        _executors[pipeline['id']] = (workers, executor)
+    if entry:
+        # المهام الجارية في المجموعة القديمة تكتمل بشكل طبيعي
+        entry[1].shutdown(wait=False)
+    return executor
+
+
+def submit(pipeline: Dict, fn, *args, **kwargs):
+    """
+    تنفيذ مهمة ضمن مجموعة العمال الخاصة بالمسار
+
+    Args:
+        pipeline: تعريف المسار
+        fn: الدالة المراد تنفيذها
+        *args, **kwargs: معاملات الدالة
+
+    Returns:
+        Future: المهمة المرسلة
+    """
+    pipeline_id = pipeline['id']
+    with _executors_lock:
+        _inflight[pipeline_id] = _inflight.get(pipeline_id, 0) + 1
+
+    def run():
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"خطأ في تنفيذ مهمة المسار {pipeline_id}: {e}")
+            return None
+        finally:
+            with _executors_lock:
+                _inflight[pipeline_id] = max(_inflight.get(pipeline_id, 1) - 1, 0)
+
+    return _get_executor(pipeline).submit(run)
+
+
+def get_pipeline_stats() -> List[Dict]:
+    """
+    الحصول على ملخص المسارات لعرضه في لوحة الإدارة
+
+    Returns:
+        list: لكل مسار: المعرف والاسم والمصدر والأهداف وعدد العمال والمهام الجارية أو المنتظرة
+    """
+    stats = []
+    for pipeline in get_pipelines().values():
+        with _executors_lock:
+            inflight = _inflight.get(pipeline['id'], 0)
+        stats.append({
+            'id': pipeline['id'],
+            'name': pipeline.get('name', pipeline['id']),
+            'enabled': pipeline.get('enabled', True),
+            'source_channel': pipeline.get('source_channel', ''),
+            'target_channels': get_target_channels(pipeline),
+            'workers': max(1, int(pipeline.get('workers') or Config.PIPELINE_WORKERS)),
+            'inflight': inflight
+        })
+    return stats
@@ -39,7 +39,84 @@ class Config:
     SOURCE_CHANNEL = os.getenv('SOURCE_CHANNEL', '')
     KEEP_CAPTION = os.getenv('KEEP_CAPTION', 'true').lower() == 'true'
     AUTO_PUBLISH = os.getenv('AUTO_PUBLISH', 'true').lower() == 'true'
-    
+
+    # إعدادات التخزين المؤقت لنتائج المعالجة
+    RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '5000'))
+    RESULT_CACHE_TTL_DAYS = int(os.getenv('RESULT_CACHE_TTL_DAYS', '30'))
+    RESULT_CACHE_FLUSH_SECONDS = float(os.getenv('RESULT_CACHE_FLUSH_SECONDS', '10'))
+
+    # إعدادات معالجة ألبومات القنوات (media groups)
+    MEDIA_GROUP_WINDOW_SECONDS = float(os.getenv('MEDIA_GROUP_WINDOW_SECONDS', '1.5'))
+    MEDIA_GROUP_WORKERS = int(os.getenv('MEDIA_GROUP_WORKERS', str(os.cpu_count() or 2)))
+
+    # الفترة بين كل تحقق من رقم إصدار القواعد الذكية المشترك بين العمليات (بالثواني)
+    SMART_RULES_VERSION_CHECK_SECONDS = float(os.getenv('SMART_RULES_VERSION_CHECK_SECONDS', '5'))
+    # الفترة بين كل حفظ لعدادات القواعد الذكية في قاعدة البيانات (بالثواني)
+    SMART_RULES_STATS_FLUSH_SECONDS = float(os.getenv('SMART_RULES_STATS_FLUSH_SECONDS', '60'))
+    # عدد مجموعات قواعد المستخدمين المترجمة المحفوظة في الذاكرة (يحذف الأقدم استخداماً)
+    SMART_RULES_USER_PARTITIONS = int(os.getenv('SMART_RULES_USER_PARTITIONS', '256'))
+
+    # حدود التعبيرات النمطية في القواعد الذكية (طول النمط وطول النص المطابق)
+    SMART_RULES_REGEX_MAX_LENGTH = int(os.getenv('SMART_RULES_REGEX_MAX_LENGTH', '256'))
+    SMART_RULES_REGEX_MAX_INPUT = int(os.getenv('SMART_RULES_REGEX_MAX_INPUT', '256'))
+
+    # عدد العمال الافتراضي لكل مسار معالجة (قناة مصدر)
+    PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', '2'))
+
+    # إعدادات المعالجة الرجعية لمنشورات القنوات
+    BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', '3'))
+    BACKFILL_RATE_PER_MINUTE = float(os.getenv('BACKFILL_RATE_PER_MINUTE', '20'))
+    BACKFILL_SCRATCH_CHAT = os.getenv('BACKFILL_SCRATCH_CHAT', '') or str(DEVELOPER_ID)
+    BACKFILL_MAX_ATTEMPTS = int(os.getenv('BACKFILL_MAX_ATTEMPTS', '3'))
+    BACKFILL_RETRY_SECONDS = float(os.getenv('BACKFILL_RETRY_SECONDS', '30'))
+
+    # إعدادات طابور مهام المعالجة التلقائية
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+    # عدد آخر القياسات المحفوظة لكل مرحلة لحساب النسب المئوية لزمن المعالجة
+    STAGE_METRICS_WINDOW = int(os.getenv('STAGE_METRICS_WINDOW', '1000'))
+
+    # عدد مفاتيح المطابقة الموحدة المحفوظة في الذاكرة (text_normalizer)
+    TEXT_NORMALIZER_CACHE_SIZE = int(os.getenv('TEXT_NORMALIZER_CACHE_SIZE', '20000'))
+
+    # الحفظ المؤجل لبيانات الإدارة (admin_data.json): فترة كتابة التعديلات، وحد سجل التعديلات وفترة دمجه في الملف
+    ADMIN_DATA_FLUSH_SECONDS = float(os.getenv('ADMIN_DATA_FLUSH_SECONDS', '1'))
+    ADMIN_DATA_JOURNAL_MAX_ENTRIES = int(os.getenv('ADMIN_DATA_JOURNAL_MAX_ENTRIES', '5000'))
+    ADMIN_DATA_COMPACT_SECONDS = float(os.getenv('ADMIN_DATA_COMPACT_SECONDS', '300'))
+
+    # سجل العمليات المقسم (oplog): مدة كل مقطع بالثواني، ومدة الاحتفاظ بالمقاطع بالأيام
+    OPLOG_SEGMENT_SECONDS = int(os.getenv('OPLOG_SEGMENT_SECONDS', '86400'))
+    OPLOG_RETENTION_DAYS = int(os.getenv('OPLOG_RETENTION_DAYS', '90'))
+
+    # حصص الاستخدام اليومي: عدد أجزاء العدادات (لكل جزء قفل)، وفترة حفظ العدادات المعدلة بالثواني
+    QUOTA_SHARDS = int(os.getenv('QUOTA_SHARDS', '16'))
+    QUOTA_FLUSH_SECONDS = float(os.getenv('QUOTA_FLUSH_SECONDS', '5'))
+
+    # فترة حفظ السلاسل الزمنية لإحصائيات المعالجة بالثواني
+    STATS_TIMESERIES_FLUSH_SECONDS = float(os.getenv('STATS_TIMESERIES_FLUSH_SECONDS', '60'))
+
+    # البث الجماعي: عدد عمال الإرسال المتوازيين، والحد العام للرسائل في الثانية، وعدد المستلمين في كل دفعة
+    BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '8'))
+    BROADCAST_RATE_PER_SECOND = float(os.getenv('BROADCAST_RATE_PER_SECOND', '25'))
+    BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '100'))
+
+    # جدولة المهام: فترة تنظيف الملفات المؤقتة بالثواني، وأقل عمر للملف المؤقت قبل حذفه،
+    # وساعة إرسال التقرير اليومي للمشرفين (UTC)
+    SCHEDULER_JANITOR_SECONDS = int(os.getenv('SCHEDULER_JANITOR_SECONDS', '3600'))
+    TEMP_FILE_MAX_AGE_SECONDS = int(os.getenv('TEMP_FILE_MAX_AGE_SECONDS', '3600'))
+    DAILY_REPORT_HOUR_UTC = int(os.getenv('DAILY_REPORT_HOUR_UTC', '8'))
+
+    # الاشتراك الإجباري: مدة حفظ نتيجة التحقق للمشتركين ولغير المشتركين بالثواني،
+    # وعدد العمال للتحقق من عدة قنوات بالتوازي
+    SUBSCRIPTION_CACHE_POSITIVE_SECONDS = int(os.getenv('SUBSCRIPTION_CACHE_POSITIVE_SECONDS', '300'))
+    SUBSCRIPTION_CACHE_NEGATIVE_SECONDS = int(os.getenv('SUBSCRIPTION_CACHE_NEGATIVE_SECONDS', '30'))
+    SUBSCRIPTION_CHECK_WORKERS = int(os.getenv('SUBSCRIPTION_CHECK_WORKERS', '8'))
+
+    # عدد العمال لتجهيز الصور المصغرة بالتوازي مع كتابة الوسوم
+    THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+
     # المجلدات
     TEMP_DIR = os.getenv('TEMP_DIR', 'temp_audio_files')
     TEMPLATES_DIR = os.getenv('TEMPLATES_DIR', 'templates')
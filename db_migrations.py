@@ -0,0 +1,123 @@
+"""
+وحدة ترحيل مخطط قاعدة البيانات
+- db.create_all() ينشئ الجداول الجديدة فقط ولا يضيف الأعمدة الجديدة إلى الجداول الموجودة
+- إضافة الأعمدة الناقصة باستخدام ALTER TABLE مع قيمة افتراضية مناسبة للبيانات الحالية
+- توسيع أعمدة معرفات تيليجرام إلى BIGINT في الجداول الموجودة
+- إنشاء الفهارس المعرفة في النماذج والناقصة في الجداول الموجودة
+"""
+
+import logging
+from typing import Dict, List, Tuple
+
+from sqlalchemy import inspect, text
+
+from models import db
+
+# إعداد التسجيل
+logger = logging.getLogger('db_migrations')
+
+# الأعمدة المضافة بعد إنشاء الجداول: {اسم الجدول: [(اسم العمود، تعريف العمود)]}
+ADDED_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    # القواعد الموجودة قبل إضافة النطاق كانت تطبق على جميع المستخدمين
+    'smart_rule': [('scope', "VARCHAR(10) NOT NULL DEFAULT 'global'")],
+    'processing_job': [('pipeline_id', "VARCHAR(64)"), ('media_group_id', "VARCHAR(64)"),
+                       ('in_place_only', "BOOLEAN NOT NULL DEFAULT FALSE")],
+    'user': [('daily_reset_at', "TIMESTAMP"), ('bot_blocked_at', "TIMESTAMP")],
+    # يملأ للقوالب الموجودة عبر user_template_handler.backfill_artist_keys
+    'user_template': [('artist_key', "VARCHAR(255)")],
+}
+
+
+# الأعمدة التي أنشئت INTEGER ويجب توسيعها إلى BIGINT (معرفات مستخدمي تيليجرام تتجاوز 2^31)
+WIDENED_COLUMNS: Dict[str, List[str]] = {
+    'user': ['id'],
+    'user_template': ['user_id'],
+    'user_log': ['user_id'],
+    'smart_rule': ['creator_id'],
+}
+
+
+def ensure_column_types() -> int:
+    """
+    توسيع أعمدة المعرفات من INTEGER إلى BIGINT في الجداول الموجودة (يجب استدعاؤها داخل app.app_context())
+
+    أعمدة INTEGER في SQLite تخزن 64 بت أصلاً، لذلك يتم التوسيع في PostgreSQL فقط.
+
+    Returns:
+        int: عدد الأعمدة التي تم توسيعها
+    """
+    widened = 0
+    if db.engine.dialect.name != 'postgresql':
+        return widened
+    try:
+        inspector = inspect(db.engine)
+        tables = set(inspector.get_table_names())
+        for table, columns in WIDENED_COLUMNS.items():
+            if table not in tables:
+                continue
+            types = {column['name']: str(column['type']).upper() for column in inspector.get_columns(table)}
+            for column in columns:
+                if types.get(column) != 'INTEGER':
+                    continue
+                db.session.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN {column} TYPE BIGINT'))
+                db.session.commit()
+                widened += 1
+                logger.info(f"تم توسيع العمود {column} في الجدول {table} إلى BIGINT")
+    except Exception as e:
+        logger.error(f"خطأ في توسيع أعمدة المعرفات: {e}")
+        db.session.rollback()
+    return widened
+
+
+def ensure_columns() -> int:
+    """
+    إضافة الأعمدة الناقصة إلى الجداول الموجودة (يجب استدعاؤها داخل app.app_context())
+
+    Returns:
+        int: عدد الأعمدة التي تمت إضافتها
+    """
+    added = 0
+    try:
+        inspector = inspect(db.engine)
+        tables = set(inspector.get_table_names())
+        for table, columns in ADDED_COLUMNS.items():
+            if table not in tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table)}
+            for column, definition in columns:
+                if column in existing:
+                    continue
+                db.session.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {definition}'))
+                db.session.commit()
+                added += 1
+                logger.info(f"تمت إضافة العمود {column} إلى الجدول {table}")
+    except Exception as e:
+        logger.error(f"خطأ في ترحيل مخطط قاعدة البيانات: {e}")
+        db.session.rollback()
+    return added
+
+
+def ensure_indexes() -> int:
+    """
+    إنشاء فهارس النماذج الناقصة في الجداول الموجودة (يجب استدعاؤها داخل app.app_context())
+
+    Returns:
+        int: عدد الفهارس التي تم إنشاؤها
+    """
+    created = 0
+    try:
+        inspector = inspect(db.engine)
+        tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                index.create(bind=db.engine)
+                created += 1
+                logger.info(f"تم إنشاء الفهرس {index.name} على الجدول {table.name}")
+    except Exception as e:
+        logger.error(f"خطأ في إنشاء فهارس قاعدة البيانات: {e}")
+    return created
@@ -0,0 +1,357 @@
+"""
+وحدة الطابور الدائم لمهام المعالجة التلقائية
+- حفظ كل مهمة في قاعدة البيانات مع حالتها الحالية قبل بدء المعالجة
+- حجز المهام بعقود إيجار (leases) عبر تحديث شرطي حتى لا يعالج عاملان نفس المهمة
+- تسجيل انتقال المهمة بين المراحل لاستكمالها بعد الانهيار بدلاً من تكرارها أو فقدانها
+"""
+
+import os
+import json
+import uuid
+import socket
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_
+
+from models import db, ProcessingJob
+from main import app
+from config import Config
+
+# إعداد التسجيل
+logger = logging.getLogger('job_queue')
+
+# مراحل المهمة بالترتيب
+JOB_STATES = [
+    'pending',           # تم استلام الرسالة
+    'downloaded',        # تم تنزيل الملف الأصلي
+    'tagged',            # تم تعديل الوسوم
+    'uploaded',          # تم إرسال الملف المعدل
+    'original_deleted',  # تم حذف الرسالة الأصلية
+    'published',         # تم النشر التلقائي في القناة
+    'forwarded',         # تم الإرسال إلى قناة الهدف
+    'done'               # اكتملت المهمة
+]
+
+# الحالات النهائية التي لا تحتاج إلى استكمال
+TERMINAL_STATES = ('done', 'failed')
+
+# معرف هذه العملية (يستخدم كجزء من معرف الحجز)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseLostError(Exception):
+    """خطأ فقدان حجز المهمة (انتهى الحجز وحجزها عامل آخر)"""
+    pass
+
+
+def enqueue_message(message, fingerprint: str = None, caption: str = "", unchanged: bool = False,
+                    pipeline_id: str = None, media_group_id: str = None,
+                    in_place_only: bool = False) -> Optional[int]:
+    """
+    إضافة رسالة قناة إلى طابور المعالجة (لا يتم إنشاء مهمة مكررة لنفس الرسالة)
+
+    Args:
+        message: رسالة القناة التي تحتوي على الملف الصوتي
+        fingerprint: بصمة التعديل الحالية
+        caption: الكابشن الذي سيستخدم مع الملف المعدل
+        unchanged: الملف لا يحتاج إلى تعديل (تبدأ المهمة من مرحلة النشر باستخدام الرسالة الأصلية)
+        pipeline_id: معرف مسار المعالجة الذي استلم الرسالة
+        media_group_id: معرف الألبوم إذا كانت الرسالة جزءاً من ألبوم
+        in_place_only: تعديل الملف داخل المنشور فقط (تفشل المهمة بدلاً من حذف المنشور وإعادة نشره)
+
+    Returns:
+        int: معرف المهمة، أو None في حالة الخطأ
+    """
+    try:
+        with app.app_context():
+            job = ProcessingJob.query.filter_by(chat_id=message.chat.id, message_id=message.message_id).first()
+            if job:
+                # إعادة فتح المهمة الفاشلة عند استلام نفس الرسالة مرة أخرى
+                if job.state == 'failed':
+                    job.state = 'published' if unchanged else 'pending'
+                    job.sent_message_id = message.message_id if unchanged else job.sent_message_id
+                    job.attempts = 0
+                    job.last_error = None
+                    job.fingerprint = fingerprint
+                    job.pipeline_id = pipeline_id
+                    job.media_group_id = media_group_id
+                    job.in_place_only = in_place_only
+                    db.session.commit()
+                return job.id
+
+            audio = message.audio
+            job = ProcessingJob(
+                chat_id=message.chat.id,
+                chat_type=getattr(message.chat, 'type', None),
+                chat_title=getattr(message.chat, 'title', None),
+                message_id=message.message_id,
+                file_id=audio.file_id,
+                file_unique_id=getattr(audio, 'file_unique_id', None),
+                file_name=getattr(audio, 'file_name', None),
+                file_size=getattr(audio, 'file_size', None),
+                caption=caption,
+                audio_title=getattr(audio, 'title', None),
+                audio_performer=getattr(audio, 'performer', None),
+                duration=getattr(audio, 'duration', None),
+                fingerprint=fingerprint,
+                pipeline_id=pipeline_id,
+                media_group_id=media_group_id,
+                in_place_only=in_place_only,
+                state='published' if unchanged else 'pending',
+                sent_message_id=message.message_id if unchanged else None
+            )
+            db.session.add(job)
+            db.session.commit()
+            logger.info(f"تمت إضافة مهمة معالجة {job.id} للرسالة {message.message_id}")
+            return job.id
+    except Exception as e:
+        logger.error(f"خطأ في إضافة مهمة المعالجة إلى الطابور: {e}")
+        try:
+            with app.app_context():
+                db.session.rollback()
+        except Exception:
+            pass
+        return None
+
+
+def get_job(job_id: int) -> Optional[Dict]:
+    """الحصول على بيانات مهمة"""
+    try:
+        with app.app_context():
+            job = ProcessingJob.query.get(job_id)
+            return job.to_dict() if job else None
+    except Exception as e:
+        logger.error(f"خطأ في قراءة مهمة المعالجة {job_id}: {e}")
+        return None
+
+
+def claim_job(job_id: int) -> Optional[Dict]:
+    """
+    حجز مهمة للتنفيذ عبر تحديث شرطي (ينجح فقط إذا لم تكن محجوزة أو انتهى حجزها)
+
+    Args:
+        job_id: معرف المهمة
+
+    Returns:
+        dict: بيانات المهمة مع 'lease_owner' الخاص بهذا الحجز، أو None إذا تعذر الحجز
+    """
+    token = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+    now = datetime.utcnow()
+    try:
+        with app.app_context():
+            result = db.session.execute(
+                db.update(ProcessingJob)
+                .where(
+                    ProcessingJob.id == job_id,
+                    ProcessingJob.state.notin_(TERMINAL_STATES),
+                    or_(ProcessingJob.lease_owner.is_(None), ProcessingJob.lease_expires_at < now)
+                )
+                .values(
+                    lease_owner=token,
+                    lease_expires_at=now + timedelta(seconds=Config.JOB_LEASE_SECONDS),
+                    attempts=ProcessingJob.attempts + 1,
+                    updated_at=now
+                )
+            )
+            db.session.commit()
+            if result.rowcount != 1:
+                return None
+            job = ProcessingJob.query.get(job_id)
+            return job.to_dict() if job else None
+    except Exception as e:
+        logger.error(f"خطأ في حجز مهمة المعالجة {job_id}: {e}")
+        return None
+
+
+def advance_job(job: Dict, state: str, **fields) -> Dict:
+    """
+    تسجيل انتقال المهمة إلى مرحلة جديدة وتجديد الحجز
+
+    Args:
+        job: بيانات المهمة المحجوزة (من claim_job)
+        state: المرحلة الجديدة
+        **fields: نتائج المرحلة (المسارات، معرف الرسالة المرسلة...)
+
+    Returns:
+        dict: بيانات المهمة بعد التحديث
+
+    Raises:
+        LeaseLostError: إذا لم تعد المهمة محجوزة لهذا العامل
+    """
+    now = datetime.utcnow()
+    values = dict(fields)
+    if 'tags' in values and not isinstance(values['tags'], str):
+        values['tags'] = json.dumps(values['tags'], ensure_ascii=False)
+    values.update(state=state, updated_at=now)
+    if state in TERMINAL_STATES:
+        # تحرير الحجز عند اكتمال المهمة
+        values.update(lease_owner=None, lease_expires_at=None)
+    else:
+        values['lease_expires_at'] = now + timedelta(seconds=Config.JOB_LEASE_SECONDS)
+
+    with app.app_context():
+        result = db.session.execute(
+            db.update(ProcessingJob)
+            .where(ProcessingJob.id == job['id'], ProcessingJob.lease_owner == job['lease_owner'])
+            .values(**values)
+        )
+        db.session.commit()
+    if result.rowcount != 1:
+        raise LeaseLostError(f"فقدان حجز المهمة {job['id']}")
+
+    updated = dict(job)
+    updated.update(fields)
+    updated['state'] = state
+    return updated
+
+
+def advance_group(jobs: List[Dict], state: str, fields: Dict[int, Dict] = None) -> List[Dict]:
+    """
+    نقل جميع مهام الألبوم إلى مرحلة جديدة في معاملة واحدة (حتى لا تختلف مراحلها بعد الانهيار)
+
+    Args:
+        jobs: مهام الألبوم المحجوزة
+        state: المرحلة الجديدة
+        fields: نتائج المرحلة لكل مهمة {معرف المهمة: الحقول}
+
+    Returns:
+        list: بيانات المهام بعد التحديث
+
+    Raises:
+        LeaseLostError: إذا لم تعد إحدى المهام محجوزة لهذا العامل (لا يتم تطبيق أي تغيير)
+    """
+    fields = fields or {}
+    now = datetime.utcnow()
+    updated_jobs = []
+    with app.app_context():
+        try:
+            for job in jobs:
+                values = dict(fields.get(job['id'], {}))
+                values.update(state=state, updated_at=now)
+                if state in TERMINAL_STATES:
+                    values.update(lease_owner=None, lease_expires_at=None)
+                else:
+                    values['lease_expires_at'] = now + timedelta(seconds=Config.JOB_LEASE_SECONDS)
+                result = db.session.execute(
+                    db.update(ProcessingJob)
+                    .where(ProcessingJob.id == job['id'], ProcessingJob.lease_owner == job['lease_owner'])
+                    .values(**values)
+                )
+                if result.rowcount != 1:
+                    raise LeaseLostError(f"فقدان حجز المهمة {job['id']}")
+                updated = dict(job)
+                updated.update(fields.get(job['id'], {}))
+                updated['state'] = state
+                updated_jobs.append(updated)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return updated_jobs
+
+
+def get_group_job_ids(chat_id: int, media_group_id: str) -> List[int]:
+    """
+    الحصول على معرفات مهام ألبوم مرتبة حسب ترتيب رسائله
+
+    Args:
+        chat_id: معرف القناة
+        media_group_id: معرف الألبوم
+
+    Returns:
+        list: معرفات المهام
+    """
+    try:
+        with app.app_context():
+            jobs = (ProcessingJob.query
+                    .filter_by(chat_id=chat_id, media_group_id=media_group_id)
+                    .order_by(ProcessingJob.message_id)
+                    .all())
+            return [job.id for job in jobs]
+    except Exception as e:
+        logger.error(f"خطأ في قراءة مهام الألبوم {media_group_id}: {e}")
+        return []
+
+
+def release_job(job: Dict, error: str = None, failed: bool = False) -> bool:
+    """
+    تحرير حجز المهمة (بعد خطأ) مع إمكانية وسمها كفاشلة نهائياً
+
+    Args:
+        job: بيانات المهمة المحجوزة
+        error: نص الخطأ
+        failed: وسم المهمة كفاشلة بدلاً من إعادتها للطابور
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    values = {'lease_owner': None, 'lease_expires_at': None, 'last_error': error, 'updated_at': datetime.utcnow()}
+    if failed:
+        values['state'] = 'failed'
+    try:
+        with app.app_context():
+            db.session.execute(
+                db.update(ProcessingJob)
+                .where(ProcessingJob.id == job['id'], ProcessingJob.lease_owner == job['lease_owner'])
+                .values(**values)
+            )
+            db.session.commit()
+        return True
+    except Exception as e:
+        logger.error(f"خطأ في تحرير مهمة المعالجة {job['id']}: {e}")
+        return False
+
+
+def get_recoverable_jobs(limit: int = 100) -> List[int]:
+    """
+    الحصول على المهام غير المكتملة التي لا يحجزها أي عامل (أو انتهى حجزها)
+
+    Returns:
+        list: معرفات المهام مرتبة من الأقدم
+    """
+    now = datetime.utcnow()
+    try:
+        with app.app_context():
+            jobs = (ProcessingJob.query
+                    .filter(ProcessingJob.state.notin_(TERMINAL_STATES))
+                    .filter(or_(ProcessingJob.lease_owner.is_(None), ProcessingJob.lease_expires_at < now))
+                    .order_by(ProcessingJob.id)
+                    .limit(limit)
+                    .all())
+            return [job.id for job in jobs]
+    except Exception as e:
+        logger.error(f"خطأ في البحث عن المهام غير المكتملة: {e}")
+        return []
+
+
+def get_queue_stats() -> Dict:
+    """الحصول على عدد المهام في كل حالة"""
+    try:
+        with app.app_context():
+            rows = db.session.query(ProcessingJob.state, db.func.count(ProcessingJob.id)).group_by(ProcessingJob.state).all()
+            return {state: count for state, count in rows}
+    except Exception as e:
+        logger.error(f"خطأ في قراءة إحصائيات طابور المعالجة: {e}")
+        return {}
+
+
+def purge_finished_jobs(days: int = 7) -> int:
+    """
+    حذف المهام المكتملة الأقدم من عدد أيام محدد
+
+    Returns:
+        int: عدد المهام المحذوفة
+    """
+    try:
+        with app.app_context():
+            cutoff = datetime.utcnow() - timedelta(days=days)
+            count = (ProcessingJob.query
+                     .filter(ProcessingJob.state == 'done', ProcessingJob.updated_at < cutoff)
+                     .delete(synchronize_session=False))
+            db.session.commit()
+            return count
+    except Exception as e:
+        logger.error(f"خطأ في حذف المهام المكتملة: {e}")
+        return 0
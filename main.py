@@ -24,7 +24,7 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 
 # تهيئة قاعدة البيانات
-from models import db, User, UserTemplate, UserLog, SmartRule
+from models import db, User, UserTemplate, UserLog, SmartRule, SmartRuleStat, ProcessingJob, CacheVersion, Broadcast, BroadcastRecipient
 db.init_app(app)
 
 # Flag to track if the bot is already running
@@ -89,6 +89,29 @@ def view_logs():
     </html>
     """
 
+@app.route('/metrics/stages')
+def stage_metrics_endpoint():
+    """قياسات زمن مراحل المعالجة بتنسيق JSON"""
+    import stage_metrics
+    group_by = flask.request.args.get('group_by')
+    if group_by:
+        fields = tuple(field for field in group_by.split(',') if field in ('pipeline', 'stage', 'format', 'size_bucket'))
+        return flask.jsonify(stage_metrics.get_snapshot(fields or ('pipeline', 'stage')))
+    return flask.jsonify(stage_metrics.get_metrics_report())
+
+@app.route('/metrics/timeseries')
+def stats_timeseries_endpoint():
+    """السلاسل الزمنية لإحصائيات المعالجة بتنسيق JSON (resolution: minute/hour/day، count: عدد الخانات)"""
+    import stats_timeseries
+    resolution = flask.request.args.get('resolution', 'minute')
+    if resolution not in stats_timeseries.RESOLUTIONS:
+        return flask.jsonify({'error': f"unknown resolution: {resolution}"}), 400
+    count = flask.request.args.get('count', type=int) or 60
+    return flask.jsonify({
+        'summary': stats_timeseries.get_summary(resolution, count),
+        'series': stats_timeseries.get_series(resolution, count)
+    })
+
 def run_bot():
     try:
         from bot import start_bot
@@ -108,6 +131,13 @@ setup_exception_handler()
 with app.app_context():
     try:
         db.create_all()
+        # إضافة الأعمدة الجديدة إلى الجداول الموجودة مسبقاً
+        import db_migrations
+        db_migrations.ensure_columns()
+        db_migrations.ensure_column_types()
+        db_migrations.ensure_indexes()
+        import user_template_handler
+        user_template_handler.backfill_artist_keys()
         logger.info("تم إنشاء/التحقق من جداول قاعدة البيانات بنجاح")
     except Exception as e:
         log_error(e, "إنشاء جداول قاعدة البيانات")
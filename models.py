@@ -1,25 +1,30 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from datetime import datetime
 import json
 
+from text_normalizer import normalize
+
 db = SQLAlchemy()
 
 class User(db.Model):
     """نموذج بيانات المستخدم"""
-    id = db.Column(db.Integer, primary_key=True)  # معرف تيليجرام للمستخدم
+    id = db.Column(db.BigInteger, primary_key=True)  # معرف تيليجرام للمستخدم (يتجاوز 2^31)
     username = db.Column(db.String(128), nullable=True)  # اسم المستخدم في تيليجرام
     first_name = db.Column(db.String(128), nullable=True)  # الاسم الأول
     last_name = db.Column(db.String(128), nullable=True)  # الاسم الأخير
     is_admin = db.Column(db.Boolean, default=False)  # هل المستخدم مشرف؟
     is_blocked = db.Column(db.Boolean, default=False)  # هل المستخدم محظور؟
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # وقت إنشاء الحساب
-    last_activity = db.Column(db.DateTime, default=datetime.utcnow)  # آخر نشاط
+    last_activity = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # آخر نشاط
     
     # إحصائيات المستخدم
-    files_processed = db.Column(db.Integer, default=0)  # عدد الملفات المعالجة
+    files_processed = db.Column(db.Integer, default=0, index=True)  # عدد الملفات المعالجة
     total_file_size_mb = db.Column(db.Float, default=0.0)  # إجمالي حجم الملفات بالميجابايت
     daily_usage_mb = db.Column(db.Float, default=0.0)  # الاستخدام اليومي بالميجابايت
     daily_reset_date = db.Column(db.Date, nullable=True)  # تاريخ إعادة تعيين الاستخدام اليومي
+    daily_reset_at = db.Column(db.DateTime, nullable=True)  # بداية اليوم (UTC) الذي يخصه الاستخدام اليومي المحفوظ
+    bot_blocked_at = db.Column(db.DateTime, nullable=True)  # وقت اكتشاف حظر المستخدم للبوت (يستبعد من البث الجماعي)
     
     # بيانات إضافية (json)
     settings = db.Column(db.Text, default='{}')  # إعدادات المستخدم المخصصة
@@ -68,9 +73,10 @@ class User(db.Model):
 class UserTemplate(db.Model):
     """نموذج قوالب المستخدم الخاصة"""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.BigInteger, db.ForeignKey('user.id'), nullable=False)
     template_name = db.Column(db.String(128), nullable=False)  # اسم القالب
     artist_name = db.Column(db.String(128), nullable=False)  # اسم الفنان
+    artist_key = db.Column(db.String(255), nullable=True)  # اسم الفنان الموحد للبحث (text_normalizer)
     is_public = db.Column(db.Boolean, default=False)  # هل القالب عام؟
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # وقت إنشاء القالب
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # وقت آخر تحديث
@@ -90,11 +96,17 @@ class UserTemplate(db.Model):
     def set_tags(self, tags_dict):
         """تعيين الوسوم من قاموس"""
         self.tags = json.dumps(tags_dict, ensure_ascii=False)
+    
+    @validates('artist_name')
+    def _update_artist_key(self, key, artist_name):
+        """تحديث اسم الفنان الموحد مع كل تعيين لاسم الفنان"""
+        self.artist_key = normalize(artist_name or '')
+        return artist_name
 
 class UserLog(db.Model):
     """نموذج سجلات عمليات المستخدم"""
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.BigInteger, db.ForeignKey('user.id'), nullable=False)
     action = db.Column(db.String(128), nullable=False)  # نوع العملية
     status = db.Column(db.String(50), default='success')  # حالة العملية
     details = db.Column(db.Text, nullable=True)  # تفاصيل العملية
@@ -120,14 +132,15 @@ class SmartRule(db.Model):
     
     priority = db.Column(db.Integer, default=10)  # أولوية التنفيذ
     is_active = db.Column(db.Boolean, default=True)  # هل القاعدة نشطة
+    scope = db.Column(db.String(10), nullable=False, default='global', server_default='global')  # نطاق القاعدة (global لجميع المستخدمين، user لمنشئها فقط)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # المستخدم الذي أنشأ القاعدة
+    creator_id = db.Column(db.BigInteger, db.ForeignKey('user.id'), nullable=False)  # المستخدم الذي أنشأ القاعدة
     creator = db.relationship('User', backref='smart_rules')
     
     def apply_rule(self, tags):
-        """تطبيق القاعدة على مجموعة من الوسوم"""
+        """تطبيق القاعدة على مجموعة من الوسوم (بنفس منطق محرك القواعد المترجمة)"""
         if not self.is_active:
             return tags, False
             
@@ -135,52 +148,130 @@ class SmartRule(db.Model):
         field_value = tags.get(self.condition_field, "")
         if not field_value:
             return tags, False
-            
-        rule_applied = False
         
-        # تطبيق الشرط
-        if self.condition_operator == 'contains' and self.condition_value.lower() in str(field_value).lower():
-            rule_applied = True
-        elif self.condition_operator == 'equals' and str(field_value).lower() == self.condition_value.lower():
-            rule_applied = True
-        elif self.condition_operator == 'starts_with' and str(field_value).lower().startswith(self.condition_value.lower()):
-            rule_applied = True
-        elif self.condition_operator == 'ends_with' and str(field_value).lower().endswith(self.condition_value.lower()):
-            rule_applied = True
-            
+        # المطابقة على مفاتيح النص الموحدة (أحرف صغيرة وأحرف عربية موحدة دون تشكيل)
+        from rule_engine import compile_rule
+        compiled_rule = compile_rule(self)
+        if not compiled_rule.matches(normalize(str(field_value))):
+            return tags, False
+        
         # تنفيذ الإجراء إذا تحقق الشرط
-        if rule_applied:
-            if self.action_type == 'add':
-                # إضافة إلى الحقل الحالي إذا كان موجودًا
-                current_value = tags.get(self.action_field, "")
-                if current_value:
-                    tags[self.action_field] = f"{current_value}, {self.action_value}"
-                else:
-                    tags[self.action_field] = self.action_value
-            elif self.action_type == 'set':
-                # تعيين قيمة الحقل بغض النظر عن قيمته الحالية
-                tags[self.action_field] = self.action_value
-            elif self.action_type == 'replace':
-                # استبدال في جميع الحقول
-                if self.action_field == '*':
-                    for key in tags:
-                        if isinstance(tags[key], str):
-                            tags[key] = tags[key].replace(self.condition_value, self.action_value)
-                # استبدال في حقل محدد
-                elif self.action_field in tags and isinstance(tags[self.action_field], str):
-                    tags[self.action_field] = tags[self.action_field].replace(self.condition_value, self.action_value)
-            
-        return tags, rule_applied
+        compiled_rule.apply_action(tags)
+        return tags, True
+
+
+class SmartRuleStat(db.Model):
+    """عدادات تنفيذ القواعد الذكية (تحفظ دورياً من الذاكرة)"""
+    rule_id = db.Column(db.Integer, db.ForeignKey('smart_rule.id', ondelete='CASCADE'), primary_key=True)
+    evaluations = db.Column(db.BigInteger, nullable=False, default=0)  # مرات تقييم شرط القاعدة
+    matches = db.Column(db.BigInteger, nullable=False, default=0)  # مرات تحقق الشرط
+    actions_applied = db.Column(db.BigInteger, nullable=False, default=0)  # مرات تغيير الوسوم فعلياً
+    total_seconds = db.Column(db.Float, nullable=False, default=0.0)  # الزمن التراكمي للتقييم والتطبيق
+    last_matched_at = db.Column(db.DateTime, nullable=True)  # وقت آخر مطابقة
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # وقت آخر حفظ
+
+class CacheVersion(db.Model):
+    """أرقام إصدار مشتركة بين العمليات لإلغاء البيانات المخزنة في الذاكرة (مثل القواعد الذكية المترجمة)"""
+    name = db.Column(db.String(64), primary_key=True)  # اسم البيانات المخزنة
+    version = db.Column(db.Integer, nullable=False, default=0)  # رقم الإصدار الحالي
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # وقت آخر تغيير
+
+class ProcessingJob(db.Model):
+    """نموذج مهام المعالجة التلقائية لملفات القنوات (طابور دائم قابل للاستكمال بعد الانهيار)"""
+    __table_args__ = (
+        db.UniqueConstraint('chat_id', 'message_id', name='uq_processing_job_message'),
+    )
     
-    @staticmethod
-    def apply_all_rules(tags):
-        """تطبيق جميع القواعد النشطة على مجموعة من الوسوم"""
-        rules = SmartRule.query.filter_by(is_active=True).order_by(SmartRule.priority).all()
-        applied_rules = []
-        
-        for rule in rules:
-            tags, applied = rule.apply_rule(tags)
-            if applied:
-                applied_rules.append(rule.name)
-                
-        return tags, applied_rules
\ No newline at end of file
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # الرسالة الأصلية
+    chat_id = db.Column(db.BigInteger, nullable=False)  # معرف القناة
+    chat_type = db.Column(db.String(32), nullable=True)  # نوع المحادثة
+    chat_title = db.Column(db.String(255), nullable=True)  # اسم القناة
+    message_id = db.Column(db.BigInteger, nullable=False)  # رقم الرسالة الأصلية
+    file_id = db.Column(db.String(255), nullable=False)  # معرف الملف الأصلي
+    file_unique_id = db.Column(db.String(128), nullable=True)  # المعرف الفريد للملف الأصلي
+    file_name = db.Column(db.String(255), nullable=True)  # اسم الملف
+    file_size = db.Column(db.BigInteger, nullable=True)  # حجم الملف بالبايت
+    caption = db.Column(db.Text, nullable=True)  # الكابشن المستخدم
+    audio_title = db.Column(db.String(255), nullable=True)  # العنوان الأصلي
+    audio_performer = db.Column(db.String(255), nullable=True)  # الفنان الأصلي
+    duration = db.Column(db.Integer, nullable=True)  # مدة الملف
+    fingerprint = db.Column(db.String(64), nullable=True)  # بصمة التعديل وقت إنشاء المهمة
+    pipeline_id = db.Column(db.String(64), nullable=True)  # مسار المعالجة (قناة المصدر وإعداداتها)
+    media_group_id = db.Column(db.String(64), nullable=True, index=True)  # معرف الألبوم (مهام الألبوم تتقدم معاً)
+    in_place_only = db.Column(db.Boolean, nullable=False, default=False)  # التعديل داخل المنشور فقط دون حذف وإعادة نشر (المعالجة الرجعية)
+    
+    # حالة المهمة
+    state = db.Column(db.String(32), nullable=False, default='pending', index=True)
+    attempts = db.Column(db.Integer, default=0)  # عدد محاولات التنفيذ
+    lease_owner = db.Column(db.String(128), nullable=True)  # العامل الذي يحجز المهمة
+    lease_expires_at = db.Column(db.DateTime, nullable=True, index=True)  # انتهاء الحجز
+    last_error = db.Column(db.Text, nullable=True)  # آخر خطأ
+    
+    # نتائج المراحل
+    original_path = db.Column(db.String(512), nullable=True)  # مسار الملف المنزل
+    edited_path = db.Column(db.String(512), nullable=True)  # مسار الملف المعدل
+    tags = db.Column(db.Text, nullable=True)  # الوسوم الجديدة بتنسيق JSON
+    sent_message_id = db.Column(db.BigInteger, nullable=True)  # رقم رسالة الملف المعدل
+    sent_file_id = db.Column(db.String(255), nullable=True)  # معرف الملف المعدل
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def get_tags(self):
+        """استرجاع الوسوم كقاموس"""
+        try:
+            return json.loads(self.tags) if self.tags else {}
+        except:
+            return {}
+    
+    def to_dict(self):
+        """تحويل المهمة إلى قاموس (لاستخدامه خارج جلسة قاعدة البيانات)"""
+        data = {column.name: getattr(self, column.name) for column in self.__table__.columns}
+        data['tags'] = self.get_tags()
+        return data
+
+class Broadcast(db.Model):
+    """نموذج مهام البث الجماعي (تعمل في الخلفية وتستكمل بعد إعادة التشغيل)"""
+    id = db.Column(db.Integer, primary_key=True)
+    
+    # الرسالة
+    message_type = db.Column(db.String(16), nullable=False, default='text')  # text, photo, video, document, audio
+    text = db.Column(db.Text, nullable=True)  # نص الرسالة أو الكابشن
+    file_id = db.Column(db.String(255), nullable=True)  # معرف الملف للوسائط
+    target_user_ids = db.Column(db.Text, nullable=True)  # قائمة المستلمين بتنسيق JSON (None لجميع المستخدمين)
+    created_by = db.Column(db.BigInteger, nullable=True)  # المشرف الذي أنشأ البث
+    
+    # الحالة والتقدم
+    state = db.Column(db.String(16), nullable=False, default='running', index=True)  # running, paused, completed, cancelled
+    cursor_user_id = db.Column(db.BigInteger, nullable=True)  # آخر معرف مستخدم تمت معالجة جميع من قبله
+    total = db.Column(db.Integer, default=0)  # عدد المستلمين المتوقع عند البدء
+    sent_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    blocked_count = db.Column(db.Integer, default=0)  # المستخدمون الذين حظروا البوت
+    skipped_count = db.Column(db.Integer, default=0)  # المستخدمون المحظورون من الإدارة
+    last_error = db.Column(db.Text, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)  # بداية آخر تشغيل
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def get_target_user_ids(self):
+        """استرجاع قائمة المستلمين المحددين (None لجميع المستخدمين)"""
+        try:
+            return json.loads(self.target_user_ids) if self.target_user_ids else None
+        except:
+            return None
+    
+    def to_dict(self):
+        """تحويل البث إلى قاموس (لاستخدامه خارج جلسة قاعدة البيانات)"""
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
+
+class BroadcastRecipient(db.Model):
+    """نتيجة إرسال البث الجماعي لكل مستلم"""
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcast.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.BigInteger, primary_key=True)
+    status = db.Column(db.String(16), nullable=False)  # sent, failed, blocked, skipped
+    error = db.Column(db.String(255), nullable=True)  # سبب الفشل
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
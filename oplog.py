@@ -0,0 +1,419 @@
+"""
+وحدة سجل العمليات المقسم (بديل قائمة admin_data['logs'] في الذاكرة)
+- ملفات إضافة فقط (JSON Lines) مقسمة حسب الوقت: مقطع لكل فترة OPLOG_SEGMENT_SECONDS
+- حذف المقاطع الأقدم من مدة الاحتفاظ OPLOG_RETENTION_DAYS
+- فهارس ثانوية في الذاكرة لكل مقطع حسب المستخدم والعملية والحالة (مواقع الأسطر فقط وليس السجلات)
+- استعلامات مرتبة من الأحدث إلى الأقدم مع مؤشر للتصفح بين الصفحات
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import Config
+
+# إعداد التسجيل
+logger = logging.getLogger('oplog')
+
+# مجلد مقاطع سجل العمليات
+OPLOG_DIR = os.path.join('logs', 'oplog')
+SEGMENT_PREFIX = 'oplog-'
+SEGMENT_SUFFIX = '.jsonl'
+
+# الحقول المفهرسة
+INDEXED_FIELDS = ('user_id', 'action', 'status')
+
+
+class _Segment:
+    """مقطع واحد من السجل: ملف إضافة فقط مع مواقع الأسطر والفهارس الثانوية"""
+
+    __slots__ = ('start', 'path', 'offsets', 'indexes', 'size')
+
+    def __init__(self, start: int, path: str):
+        self.start = start
+        self.path = path
+        self.offsets = array('q')  # موقع بداية كل سجل داخل الملف
+        self.indexes = {field: {} for field in INDEXED_FIELDS}  # {الحقل: {القيمة: مواقع السجلات}}
+        self.size = 0
+
+    def add(self, entry: Dict, offset: int, length: int):
+        """إضافة سجل إلى الفهارس"""
+        position = len(self.offsets)
+        self.offsets.append(offset)
+        for field in INDEXED_FIELDS:
+            postings = self.indexes[field].get(entry.get(field))
+            if postings is None:
+                postings = self.indexes[field][entry.get(field)] = array('l')
+            postings.append(position)
+        self.size = offset + length
+
+    def load(self):
+        """بناء الفهارس من الملف وحذف السطر الأخير غير المكتمل (توقف أثناء الكتابة)"""
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    self.add(json.loads(line), offset, len(line))
+                except ValueError:
+                    self.size = offset + len(line)
+                offset += len(line)
+        if os.path.getsize(self.path) > self.size:
+            logger.warning(f"تم حذف سطر غير مكتمل من نهاية مقطع السجل {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.size)
+
+    def positions(self, filters: Dict[str, List], before: int) -> Iterator[int]:
+        """
+        مواقع السجلات المطابقة للمرشحات من الأحدث إلى الأقدم (قبل الموقع before)
+
+        يتم المرور على أقصر قائمة مواقع، والتحقق من بقية المرشحات بالبحث الثنائي.
+        """
+        if not filters:
+            yield from range(before - 1, -1, -1)
+            return
+
+        candidates = []
+        for field, values in filters.items():
+            postings = [self.indexes[field][value] for value in values if value in self.indexes[field]]
+            if not postings:
+                return
+            candidates.append((sum(len(p) for p in postings), field, postings))
+        candidates.sort(key=lambda item: item[0])
+        _, _, driver = candidates[0]
+        checks = [postings for _, _, postings in candidates[1:]]
+
+        driver = driver[0] if len(driver) == 1 else array('l', merge(*driver))
+        for index in range(bisect_left(driver, before) - 1, -1, -1):
+            position = driver[index]
+            if all(any(_contains(p, position) for p in postings) for postings in checks):
+                yield position
+
+
+def _contains(postings: array, position: int) -> bool:
+    """التحقق من وجود موقع في قائمة مواقع مرتبة (بحث ثنائي)"""
+    index = bisect_left(postings, position)
+    return index < len(postings) and postings[index] == position
+
+
+# المقاطع مرتبة حسب وقت البداية
+_segments: List[_Segment] = []
+_segment_starts: List[int] = []
+_writer = None
+_lock = threading.RLock()
+_loaded = False
+
+
+def _segment_start(timestamp: float) -> int:
+    """وقت بداية المقطع الذي ينتمي إليه الوقت المحدد"""
+    period = max(1, int(Config.OPLOG_SEGMENT_SECONDS))
+    return int(timestamp) // period * period
+
+
+def _segment_path(start: int) -> str:
+    return os.path.join(OPLOG_DIR, f"{SEGMENT_PREFIX}{start}{SEGMENT_SUFFIX}")
+
+
+def _ensure_loaded():
+    """تحميل المقاطع الموجودة وبناء فهارسها (مرة واحدة، يستدعى مع القفل)"""
+    global _loaded
+    if _loaded:
+        return
+    os.makedirs(OPLOG_DIR, exist_ok=True)
+    for filename in os.listdir(OPLOG_DIR):
+        if not (filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX)):
+            continue
+        try:
+            start = int(filename[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+        except ValueError:
+            continue
+        segment = _Segment(start, os.path.join(OPLOG_DIR, filename))
+        try:
+            segment.load()
+        except Exception as e:
+            logger.error(f"خطأ في تحميل مقطع السجل {filename}: {e}")
+            continue
+        _insert_segment(segment)
+    _loaded = True
+    _apply_retention()
+
+
+def _insert_segment(segment: _Segment):
+    index = bisect_left(_segment_starts, segment.start)
+    _segment_starts.insert(index, segment.start)
+    _segments.insert(index, segment)
+
+
+def _get_segment(start: int, create: bool = True) -> Optional[_Segment]:
+    """الحصول على مقطع حسب وقت بدايته (وإنشاؤه إذا لم يكن موجوداً)"""
+    index = bisect_left(_segment_starts, start)
+    if index < len(_segments) and _segments[index].start == start:
+        return _segments[index]
+    if not create:
+        return None
+    segment = _Segment(start, _segment_path(start))
+    open(segment.path, 'ab').close()
+    _insert_segment(segment)
+    return segment
+
+
+def _close_writer():
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+def _apply_retention():
+    """حذف المقاطع التي انتهت مدة الاحتفاظ بها (يستدعى مع القفل)"""
+    cutoff = time.time() - Config.OPLOG_RETENTION_DAYS * 86400
+    period = max(1, int(Config.OPLOG_SEGMENT_SECONDS))
+    while _segments and _segments[0].start + period <= cutoff:
+        segment = _segments.pop(0)
+        _segment_starts.pop(0)
+        if _writer is not None and _writer.name == segment.path:
+            _close_writer()
+        try:
+            os.remove(segment.path)
+            logger.info(f"تم حذف مقطع السجل القديم {os.path.basename(segment.path)}")
+        except OSError as e:
+            logger.error(f"خطأ في حذف مقطع السجل {segment.path}: {e}")
+
+
+def _encode(entry: Dict) -> bytes:
+    return (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def append(user_id: int, action: str, status: str = 'success', details: str = '',
+           timestamp: float = None) -> bool:
+    """
+    إضافة عملية إلى السجل
+
+    يتم إنشاء مقطع جديد عند بداية كل فترة، ويضاف السجل إلى نهاية المقطع الحالي.
+
+    Args:
+        user_id: معرف المستخدم
+        action: اسم العملية
+        status: حالة العملية (success أو failed)
+        details: تفاصيل إضافية
+        timestamp: وقت العملية (الوقت الحالي افتراضياً)
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    global _writer
+    entry = {
+        'time': timestamp if timestamp is not None else time.time(),
+        'user_id': user_id,
+        'action': action,
+        'status': status,
+        'details': details
+    }
+    try:
+        data = _encode(entry)
+        with _lock:
+            _ensure_loaded()
+            start = _segment_start(entry['time'])
+            active = _segments[-1] if _segments else None
+            if active is None or start > active.start:
+                # تدوير المقطع: بداية فترة جديدة
+                _close_writer()
+                active = _get_segment(start)
+                _apply_retention()
+                if not _segments or _segments[-1] is not active:
+                    # السجل أقدم من مدة الاحتفاظ وتم حذف مقطعه مباشرة
+                    logger.debug(f"تم تجاهل سجل أقدم من مدة الاحتفاظ: {action}")
+                    return False
+            if _writer is None or _writer.name != active.path:
+                _close_writer()
+                _writer = open(active.path, 'ab')
+            _writer.write(data)
+            _writer.flush()
+            active.add(entry, active.size, len(data))
+        return True
+    except Exception as e:
+        logger.error(f"خطأ في إضافة عملية إلى السجل: {e}")
+        return False
+
+
+def _as_filter(value) -> Optional[List]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [value]
+
+
+def _parse_cursor(cursor: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    if not cursor:
+        return None, None
+    start, position = cursor.split(':', 1)
+    return int(start), int(position)
+
+
+def query(user_id=None, action=None, status=None, limit: int = 20,
+          cursor: str = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    البحث في السجل من الأحدث إلى الأقدم باستخدام الفهارس
+
+    Args:
+        user_id: معرف المستخدم أو قائمة معرفات (اختياري)
+        action: اسم العملية أو قائمة أسماء (اختياري)
+        status: حالة العملية أو قائمة حالات (اختياري)
+        limit: عدد السجلات في الصفحة
+        cursor: مؤشر الصفحة التالية من استعلام سابق (None للصفحة الأولى)
+
+    Returns:
+        tuple: (السجلات، مؤشر الصفحة التالية أو None إذا لم تعد هناك سجلات أقدم)
+    """
+    filters = {}
+    for field, value in (('user_id', user_id), ('action', action), ('status', status)):
+        values = _as_filter(value)
+        if values is not None:
+            filters[field] = values
+
+    try:
+        cursor_start, cursor_position = _parse_cursor(cursor)
+        matches = []
+        with _lock:
+            _ensure_loaded()
+            for segment in reversed(_segments):
+                if cursor_start is not None and segment.start > cursor_start:
+                    continue
+                before = cursor_position if segment.start == cursor_start else len(segment.offsets)
+                for position in segment.positions(filters, before):
+                    matches.append((segment, position))
+                    # سجل إضافي لمعرفة وجود صفحة تالية
+                    if len(matches) > limit:
+                        break
+                if len(matches) > limit:
+                    break
+            next_cursor = None
+            if len(matches) > limit:
+                matches = matches[:limit]
+                last_segment, last_position = matches[-1]
+                next_cursor = f"{last_segment.start}:{last_position}"
+            return _read_entries(matches), next_cursor
+    except Exception as e:
+        logger.error(f"خطأ في البحث في سجل العمليات: {e}")
+        return [], None
+
+
+def _read_entries(matches: List[Tuple[_Segment, int]]) -> List[Dict]:
+    """قراءة السجلات من الملفات حسب مواقعها (يستدعى مع القفل)"""
+    entries = []
+    handles = {}
+    try:
+        for segment, position in matches:
+            handle = handles.get(segment.path)
+            if handle is None:
+                handle = handles[segment.path] = open(segment.path, 'rb')
+            handle.seek(segment.offsets[position])
+            entries.append(json.loads(handle.readline()))
+    finally:
+        for handle in handles.values():
+            handle.close()
+    return entries
+
+
+def iter_entries() -> Iterator[Dict]:
+    """المرور على جميع السجلات من الأقدم إلى الأحدث (للتصدير)"""
+    with _lock:
+        _ensure_loaded()
+        paths = [segment.path for segment in _segments]
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    if line.endswith(b'\n'):
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+        except FileNotFoundError:
+            # تم حذف المقطع بسبب انتهاء مدة الاحتفاظ
+            continue
+
+
+def import_entries(entries: Iterable[Dict]) -> int:
+    """
+    استيراد سجلات (نقل السجل القديم من admin_data أو استيراد نسخة احتياطية)
+
+    يتم دمج السجلات مع المقاطع الموجودة وإعادة كتابة كل مقطع متأثر مرتباً حسب الوقت،
+    مع تجاهل السجلات المكررة.
+
+    Returns:
+        int: عدد السجلات الجديدة التي تمت إضافتها، أو None عند الفشل
+    """
+    try:
+        groups = {}
+        for entry in entries:
+            if not isinstance(entry, dict) or 'time' not in entry:
+                continue
+            groups.setdefault(_segment_start(entry['time']), []).append(entry)
+
+        added = 0
+        with _lock:
+            _ensure_loaded()
+            for start, group in sorted(groups.items()):
+                segment = _get_segment(start)
+                existing = []
+                with open(segment.path, 'rb') as f:
+                    for line in f:
+                        try:
+                            existing.append(json.loads(line))
+                        except ValueError:
+                            continue
+                seen = {_encode(entry) for entry in existing}
+                merged = list(existing)
+                for entry in group:
+                    data = _encode(entry)
+                    if data not in seen:
+                        seen.add(data)
+                        merged.append(entry)
+                        added += 1
+                if len(merged) == len(existing):
+                    continue
+                merged.sort(key=lambda entry: entry['time'])
+
+                if _writer is not None and _writer.name == segment.path:
+                    _close_writer()
+                temp_path = segment.path + '.tmp'
+                with open(temp_path, 'wb') as f:
+                    for entry in merged:
+                        f.write(_encode(entry))
+                os.replace(temp_path, segment.path)
+
+                rebuilt = _Segment(start, segment.path)
+                rebuilt.load()
+                _segments[bisect_left(_segment_starts, start)] = rebuilt
+            _apply_retention()
+        logger.info(f"تم استيراد {added} سجل إلى سجل العمليات")
+        return added
+    except Exception as e:
+        logger.error(f"خطأ في استيراد سجل العمليات: {e}")
+        return None
+
+
+def get_stats() -> Dict:
+    """
+    إحصائيات السجل
+
+    Returns:
+        dict: عدد المقاطع والسجلات، والحجم على القرص، ووقت بداية أقدم مقطع
+    """
+    with _lock:
+        _ensure_loaded()
+        return {
+            'segments': len(_segments),
+            'entries': sum(len(segment.offsets) for segment in _segments),
+            'size_bytes': sum(segment.size for segment in _segments),
+            'oldest': _segments[0].start if _segments else None
+        }
@@ -0,0 +1,308 @@
+"""
+وحدة حصص الاستخدام اليومي للمستخدمين
+- حجز الحصة قبل تنزيل الملف ثم تأكيدها بعد النجاح أو إرجاعها عند الفشل (عمليات ذرية)
+- عدادات حسب اليوم (UTC): يبدأ يوم جديد بعداد فارغ دون إعادة تعيين صريحة
+- تقسيم العدادات على أجزاء لكل منها قفل خاص لتقليل التنافس بين خيوط المعالجة
+- حفظ العدادات المعدلة في قاعدة البيانات على دفعات بواسطة خيط في الخلفية
+"""
+
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from config import Config
+
+# إعداد التسجيل
+logger = logging.getLogger('quota')
+
+DAY_SECONDS = 86400
+
+
+def _today() -> int:
+    """رقم اليوم الحالي (UTC)"""
+    return int(time.time() // DAY_SECONDS)
+
+
+def _day_start(day: int) -> datetime:
+    """بداية اليوم كوقت UTC للتخزين"""
+    return datetime.utcfromtimestamp(day * DAY_SECONDS)
+
+
+class Reservation:
+    """حجز من حصة المستخدم اليومية، يجب تأكيده أو إرجاعه مرة واحدة"""
+
+    __slots__ = ('user_id', 'size_mb', 'day', 'settled')
+
+    def __init__(self, user_id: int, size_mb: float, day: int):
+        self.user_id = user_id
+        self.size_mb = size_mb
+        self.day = day
+        self.settled = False
+
+
+class _Shard:
+    """جزء من العدادات: {معرف المستخدم: [اليوم، المستخدم، المحجوز]} مع قفل خاص"""
+
+    __slots__ = ('lock', 'counters', 'dirty')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[int, list] = {}
+        self.dirty = set()
+
+
+_shards = [_Shard() for _ in range(max(1, Config.QUOTA_SHARDS))]
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _shard(user_id: int) -> _Shard:
+    return _shards[hash(user_id) % len(_shards)]
+
+
+def _daily_limit() -> float:
+    """حد البيانات اليومي لكل مستخدم من إعدادات الإدارة (0 = غير محدود)"""
+    import admin_panel
+    return admin_panel.get_setting('daily_user_limit_mb', 0) or 0
+
+
+def _load_usage(user_id: int, day: int) -> float:
+    """قراءة استخدام اليوم المحفوظ في قاعدة البيانات (عند أول استخدام للمستخدم بعد التشغيل)"""
+    import user_store
+    return user_store.get_daily_usage(user_id, _day_start(day)) or 0
+
+
+def _counter(shard: _Shard, user_id: int, day: int, loaded: Optional[float]) -> Optional[list]:
+    """
+    الحصول على عداد المستخدم لليوم الحالي (يستدعى مع قفل الجزء)
+
+    Returns:
+        list: العداد، أو None إذا كان يجب تحميل الاستخدام المحفوظ أولاً
+    """
+    counter = shard.counters.get(user_id)
+    if counter is None:
+        if loaded is None:
+            return None
+        counter = shard.counters[user_id] = [day, loaded, 0.0]
+    elif counter[0] != day:
+        # بداية يوم جديد: عداد فارغ، والحجوزات السابقة لم تعد محسوبة
+        counter[0], counter[1], counter[2] = day, 0.0, 0.0
+    return counter
+
+
+def _with_counter(user_id: int, update):
+    """تنفيذ تعديل ذري على عداد المستخدم بعد تحميله من قاعدة البيانات إذا لزم"""
+    shard = _shard(user_id)
+    day = _today()
+    loaded = None
+    while True:
+        with shard.lock:
+            counter = _counter(shard, user_id, day, loaded)
+            if counter is not None:
+                return update(shard, counter)
+        # التحميل خارج القفل حتى لا تنتظر بقية المستخدمين في نفس الجزء
+        loaded = _load_usage(user_id, day)
+
+
+def reserve(user_id: int, size_mb: float) -> Optional[Reservation]:
+    """
+    حجز حجم ملف من حصة المستخدم اليومية قبل تنزيله
+
+    يتم احتساب الحجوزات غير المؤكدة مع الاستخدام، لذا لا يمكن لعدة ملفات متزامنة تجاوز الحد.
+
+    Args:
+        user_id: معرف المستخدم
+        size_mb: حجم الملف بالميجابايت
+
+    Returns:
+        Reservation: الحجز، أو None إذا كان الحجم يتجاوز الحد اليومي
+    """
+    limit = _daily_limit()
+    size_mb = max(0.0, size_mb or 0.0)
+
+    def update(shard, counter):
+        if limit > 0 and counter[1] + counter[2] + size_mb > limit:
+            return None
+        counter[2] += size_mb
+        return Reservation(user_id, size_mb, counter[0])
+
+    try:
+        return _with_counter(user_id, update)
+    except Exception as e:
+        logger.error(f"خطأ في حجز حصة المستخدم {user_id}: {e}")
+        # عدم منع المستخدم بسبب خطأ داخلي
+        return Reservation(user_id, 0.0, _today())
+
+
+def commit(reservation: Optional[Reservation], actual_mb: float = None) -> bool:
+    """
+    تأكيد الحجز بعد نجاح التنزيل وإضافة الحجم الفعلي إلى استخدام اليوم
+
+    Args:
+        reservation: الحجز
+        actual_mb: الحجم الفعلي بالميجابايت (حجم الحجز افتراضياً)
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    if reservation is None or reservation.settled:
+        return False
+    reservation.settled = True
+    used_mb = reservation.size_mb if actual_mb is None else max(0.0, actual_mb)
+
+    def update(shard, counter):
+        if counter[0] == reservation.day:
+            counter[2] = max(0.0, counter[2] - reservation.size_mb)
+        counter[1] += used_mb
+        shard.dirty.add(reservation.user_id)
+        return True
+
+    try:
+        result = _with_counter(reservation.user_id, update)
+        _ensure_flusher()
+        return result
+    except Exception as e:
+        logger.error(f"خطأ في تأكيد حصة المستخدم {reservation.user_id}: {e}")
+        return False
+
+
+def refund(reservation: Optional[Reservation]) -> bool:
+    """
+    إرجاع الحجز إلى حصة المستخدم (عند فشل التنزيل أو المعالجة)
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    if reservation is None or reservation.settled:
+        return False
+    reservation.settled = True
+    shard = _shard(reservation.user_id)
+    with shard.lock:
+        counter = shard.counters.get(reservation.user_id)
+        if counter is not None and counter[0] == reservation.day:
+            counter[2] = max(0.0, counter[2] - reservation.size_mb)
+    return True
+
+
+def add_usage(user_id: int, size_mb: float) -> bool:
+    """إضافة استخدام مباشرة دون حجز (لعمليات لا تحتاج التحقق من الحد)"""
+    return commit(Reservation(user_id, 0.0, _today()), size_mb)
+
+
+def check(user_id: int, size_mb: float) -> bool:
+    """
+    التحقق من إمكانية استخدام الحجم دون حجزه
+
+    Returns:
+        bool: True إذا كان المستخدم ضمن الحد المسموح
+    """
+    limit = _daily_limit()
+    if limit <= 0:
+        return True
+    try:
+        return _with_counter(user_id, lambda shard, counter: counter[1] + counter[2] + size_mb <= limit)
+    except Exception as e:
+        logger.error(f"خطأ في التحقق من حصة المستخدم {user_id}: {e}")
+        return True
+
+
+def get_usage(user_id: int) -> Tuple[float, float]:
+    """
+    الحصول على استخدام اليوم للمستخدم
+
+    Returns:
+        tuple: (الاستخدام المؤكد، المحجوز حالياً) بالميجابايت
+    """
+    try:
+        return _with_counter(user_id, lambda shard, counter: (counter[1], counter[2]))
+    except Exception as e:
+        logger.error(f"خطأ في قراءة حصة المستخدم {user_id}: {e}")
+        return 0.0, 0.0
+
+
+def reset(user_id: int = None):
+    """إعادة تعيين الاستخدام اليومي في الذاكرة لمستخدم محدد أو لجميع المستخدمين"""
+    shards = [_shard(user_id)] if user_id else _shards
+    for shard in shards:
+        with shard.lock:
+            if user_id:
+                shard.counters.pop(user_id, None)
+                shard.dirty.discard(user_id)
+            else:
+                shard.counters.clear()
+                shard.dirty.clear()
+
+
+def rollover() -> int:
+    """
+    حذف عدادات الأيام السابقة من الذاكرة (بعد حفظها)
+
+    Returns:
+        int: عدد العدادات المحذوفة
+    """
+    flush()
+    day = _today()
+    removed = 0
+    for shard in _shards:
+        with shard.lock:
+            stale = [user_id for user_id, counter in shard.counters.items()
+                     if counter[0] != day and user_id not in shard.dirty]
+            for user_id in stale:
+                del shard.counters[user_id]
+            removed += len(stale)
+    return removed
+
+
+def flush() -> int:
+    """
+    حفظ العدادات المعدلة في قاعدة البيانات دفعة واحدة
+
+    Returns:
+        int: عدد المستخدمين الذين تم حفظ استخدامهم
+    """
+    usages = {}
+    for shard in _shards:
+        with shard.lock:
+            for user_id in shard.dirty:
+                counter = shard.counters.get(user_id)
+                if counter is not None:
+                    usages[user_id] = (counter[1], _day_start(counter[0]))
+            shard.dirty.clear()
+    if not usages:
+        return 0
+
+    import user_store
+    if not user_store.save_daily_usage(usages):
+        # إعادة المحاولة في الدورة التالية
+        for user_id in usages:
+            shard = _shard(user_id)
+            with shard.lock:
+                shard.dirty.add(user_id)
+        return 0
+    return len(usages)
+
+
+def _flush_loop():
+    """خيط الحفظ في الخلفية: كتابة العدادات المعدلة كل QUOTA_FLUSH_SECONDS"""
+    while True:
+        time.sleep(Config.QUOTA_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"خطأ في حفظ حصص المستخدمين: {e}")
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        with _flusher_lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name="quota-flusher", daemon=True)
+                _flusher.start()
+
+
+# حفظ العدادات المتبقية عند إيقاف البوت
+atexit.register(flush)
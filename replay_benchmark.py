@@ -0,0 +1,302 @@
+"""
+أداة قياس أداء المعالجة التلقائية دون قناة حقيقية
+- تمرير ملفات صوتية من مجلد كرسائل قناة وهمية عبر auto_processor.process_audio_file
+- بوت وهمي يسجل استدعاءات واجهة تيليجرام ويحاكي زمن الاستجابة
+- تقرير JSON بعدد الملفات في الثانية وزمن كل مرحلة وأقصى استهلاك للذاكرة لكل تشغيل
+
+مثال:
+    python replay_benchmark.py samples/ --concurrency 1,4 --replacements 0,100 --latency-ms 50 -o before.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import string
+import shutil
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import psutil
+
+# امتدادات الملفات الصوتية المدعومة
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.ogg', '.m4a', '.wav', '.opus')
+
+
+class ReplayBot:
+    """بوت وهمي يسجل استدعاءات واجهة تيليجرام ويحاكي زمن الاستجابة"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._next_message_id = 1000000
+
+    def _call(self, method: str):
+        with self._lock:
+            self.calls[method] += 1
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def _message(self, chat_id, audio=None):
+        with self._lock:
+            self._next_message_id += 1
+            message_id = self._next_message_id
+        return SimpleNamespace(
+            message_id=message_id,
+            chat=SimpleNamespace(id=chat_id, type='channel'),
+            audio=SimpleNamespace(file_id=f"replay-{message_id}") if audio is not None else None
+        )
+
+    def get_file(self, file_id):
+        self._call('get_file')
+        # معرف الملف في الرسائل الوهمية هو مسار الملف المحلي
+        return SimpleNamespace(file_path=file_id)
+
+    def download_file(self, file_path):
+        self._call('download_file')
+        with open(file_path, 'rb') as f:
+            return f.read()
+
+    def send_audio(self, chat_id, audio, **kwargs):
+        self._call('send_audio')
+        if hasattr(audio, 'read'):
+            audio.read()
+        return self._message(chat_id, audio)
+
+    def send_media_group(self, chat_id, media, **kwargs):
+        self._call('send_media_group')
+        return [self._message(chat_id, item) for item in media]
+
+    def edit_message_media(self, media, chat_id, message_id, **kwargs):
+        self._call('edit_message_media')
+        return self._message(chat_id, media)
+
+    def delete_message(self, chat_id, message_id, **kwargs):
+        self._call('delete_message')
+        return True
+
+    def delete_messages(self, chat_id, message_ids, **kwargs):
+        self._call('delete_messages')
+        return True
+
+    def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self._call('copy_message')
+        return self._message(chat_id)
+
+    def copy_messages(self, chat_id, from_chat_id, message_ids, **kwargs):
+        self._call('copy_messages')
+        return [self._message(chat_id) for _ in message_ids]
+
+
+class PeakRSSSampler:
+    """قياس أقصى استهلاك للذاكرة (RSS) أثناء التشغيل عبر خيط في الخلفية"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = self.process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+        return False
+
+
+def find_samples(samples_dir: str):
+    """البحث عن الملفات الصوتية في المجلد"""
+    samples = []
+    for root, _, files in os.walk(samples_dir):
+        for name in sorted(files):
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                samples.append(os.path.join(root, name))
+    return samples
+
+
+def build_messages(samples, run_id: str, start_id: int = 1):
+    """
+    تغليف الملفات كرسائل قناة وهمية
+
+    يضاف معرف التشغيل إلى المعرف الفريد للملف حتى لا تؤثر نتائج تشغيل سابق على القياس.
+    """
+    from tag_handler import get_audio_tags
+
+    chat = SimpleNamespace(id=-1000000000001, type='channel', title='replay', username='replay_benchmark')
+    messages = []
+    for offset, path in enumerate(samples):
+        tags = get_audio_tags(path) or {}
+        messages.append(SimpleNamespace(
+            message_id=start_id + offset,
+            chat=chat,
+            caption='',
+            media_group_id=None,
+            audio=SimpleNamespace(
+                file_id=path,
+                file_unique_id=f"{run_id}-{offset}",
+                file_name=os.path.basename(path),
+                file_size=os.path.getsize(path),
+                title=tags.get('title'),
+                performer=tags.get('artist'),
+                duration=None
+            )
+        ))
+    return messages
+
+
+def build_replacements(size: int, seed: int = 0):
+    """إنشاء جدول استبدالات عشوائي بالحجم المطلوب"""
+    rng = random.Random(seed)
+    replacements = {}
+    while len(replacements) < size:
+        old_text = ''.join(rng.choices(string.ascii_letters, k=8))
+        replacements[old_text] = ''.join(rng.choices(string.ascii_letters, k=8))
+    return replacements
+
+
+def run_once(auto_processor, messages, concurrency: int, latency_ms: float, jitter_ms: float, temp_dir: str):
+    """
+    تشغيل واحد: معالجة جميع الرسائل بعدد العمال المطلوب
+
+    Returns:
+        dict: نتائج التشغيل
+    """
+    import stage_metrics
+
+    bot = ReplayBot(latency_ms, jitter_ms)
+    stage_metrics.reset()
+    results = []
+
+    with PeakRSSSampler() as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(auto_processor.process_audio_file, bot, message, temp_dir, False)
+                for message in messages
+            ]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+
+    return {
+        'files': len(messages),
+        'succeeded': sum(1 for result in results if result),
+        'failed': sum(1 for result in results if not result),
+        'elapsed_seconds': round(elapsed, 3),
+        'files_per_second': round(len(messages) / elapsed, 3) if elapsed else None,
+        'peak_rss_mb': round(sampler.peak / (1024 * 1024), 1),
+        'api_calls': dict(bot.calls),
+        'stages': stage_metrics.get_snapshot(('pipeline', 'stage'))
+    }
+
+
+def parse_int_list(value: str):
+    """تحويل قائمة أرقام مفصولة بفواصل"""
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="قياس أداء المعالجة التلقائية باستخدام ملفات محلية وبوت وهمي")
+    parser.add_argument('samples', help="مجلد الملفات الصوتية")
+    parser.add_argument('--concurrency', default='1', help="عدد العمال (قائمة مفصولة بفواصل مثل 1,4,8)")
+    parser.add_argument('--replacements', default='0', help="أحجام جدول الاستبدالات (قائمة مفصولة بفواصل)")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="زمن الاستجابة المحاكى لكل استدعاء لواجهة تيليجرام")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="التذبذب العشوائي في زمن الاستجابة")
+    parser.add_argument('--repeat', type=int, default=1, help="عدد مرات تكرار الملفات في كل تشغيل")
+    parser.add_argument('--cache', action='store_true', help="تفعيل التخزين المؤقت للنتائج أثناء القياس")
+    parser.add_argument('-o', '--output', help="مسار ملف JSON للنتائج (الافتراضي: الطباعة)")
+    args = parser.parse_args(argv)
+
+    samples = find_samples(args.samples)
+    if not samples:
+        parser.error(f"لا توجد ملفات صوتية في {args.samples}")
+    samples = samples * max(1, args.repeat)
+
+    work_dir = tempfile.mkdtemp(prefix='replay_benchmark_')
+    # قاعدة بيانات وملفات بيانات مؤقتة حتى لا يتأثر البوت الحقيقي بالقياس
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(work_dir, 'replay.db')}"
+
+    # سجل العمليات والسلاسل الزمنية توجه قبل استيراد admin_panel (الذي يكتب في السجل عند التحميل)
+    import oplog
+    import stats_timeseries
+    oplog.OPLOG_DIR = os.path.join(work_dir, 'oplog')
+    stats_timeseries.TIMESERIES_FILE = os.path.join(work_dir, 'stats_timeseries.json')
+
+    import admin_panel
+    import result_cache
+    from config import Config
+    from main import app
+    from models import db
+    import auto_processor
+
+    admin_panel.ADMIN_DATA_FILE = os.path.join(work_dir, 'admin_data.json')
+    result_cache.RESULT_CACHE_FILE = os.path.join(work_dir, 'result_cache.json')
+    Config.RESULT_CACHE_ENABLED = args.cache
+    with app.app_context():
+        db.create_all()
+
+    report = {
+        'started_at': time.time(),
+        'python': sys.version.split()[0],
+        'cpu_count': os.cpu_count(),
+        'samples': len(samples),
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'cache': args.cache,
+        'runs': []
+    }
+
+    try:
+        message_id = 1
+        for replacements_size in parse_int_list(args.replacements):
+            admin_panel.admin_data['settings'].setdefault('auto_processing', {})
+            admin_panel.admin_data['settings']['auto_processing'].update({
+                'tag_replacements': build_replacements(replacements_size),
+                'pipelines': {}
+            })
+            for concurrency in parse_int_list(args.concurrency):
+                run_id = f"replay-{replacements_size}-{concurrency}-{int(time.time() * 1000)}"
+                messages = build_messages(samples, run_id, message_id)
+                message_id += len(messages)
+                temp_dir = os.path.join(work_dir, run_id)
+                os.makedirs(temp_dir, exist_ok=True)
+
+                result = run_once(auto_processor, messages, concurrency, args.latency_ms, args.jitter_ms, temp_dir)
+                result.update({'concurrency': concurrency, 'replacements': replacements_size})
+                report['runs'].append(result)
+                print(f"concurrency={concurrency} replacements={replacements_size}: "
+                      f"{result['files_per_second']} files/s, peak RSS {result['peak_rss_mb']} MB",
+                      file=sys.stderr)
+    finally:
+        # كتابة البيانات المؤجلة قبل حذف مجلد القياس حتى لا تفشل كتابتها عند الخروج
+        stats_timeseries.flush()
+        result_cache.save_cache()
+        admin_panel.flush_admin_data()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
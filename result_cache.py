@@ -0,0 +1,248 @@
+"""
+وحدة التخزين المؤقت لنتائج المعالجة
+- ربط المعرف الفريد للملف في تيليجرام (file_unique_id) وبصمة التعديل بمعرف الملف الناتج (file_id)
+- إعادة إرسال الملف المعالج سابقاً دون تنزيل أو معالجة
+- تخزين محدود الحجم مع انتهاء صلاحية العناصر (TTL) وحفظ دائم في ملف JSON
+- الحفظ مؤجل: التعديلات تعلم الذاكرة كمعدلة ويكتبها خيط في الخلفية دورياً وعند الإيقاف
+"""
+
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import Config
+
+# إعداد التسجيل
+logger = logging.getLogger('result_cache')
+
+# مسار ملف التخزين الدائم
+RESULT_CACHE_FILE = 'result_cache.json'
+
+# العناصر المخزنة مرتبة من الأقدم استخداماً إلى الأحدث: {مفتاح: {'file_id': '', 'created': timestamp, ...}}
+_cache = OrderedDict()
+_lock = threading.RLock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_dirty = False
+_flusher = None
+# قفل الكتابة في الملف: حتى لا تستبدل لقطة أقدم لقطة أحدث
+_write_lock = threading.Lock()
+
+
+def _json_default(value):
+    """تحويل القيم غير القابلة للتسلسل (مثل بيانات الصور) إلى بصمة نصية"""
+    if isinstance(value, (bytes, bytearray)):
+        return 'bytes:' + hashlib.sha1(value).hexdigest()
+    if isinstance(value, set):
+        return sorted(value)
+    return str(value)
+
+
+def compute_fingerprint(*parts: Any) -> str:
+    """
+    حساب بصمة ثابتة لمجموعة من القيم (إعدادات، استبدالات، وسوم...)
+
+    Args:
+        *parts: القيم التي تحدد نتيجة التعديل
+
+    Returns:
+        str: بصمة SHA1 بصيغة نصية
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=_json_default)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _make_key(file_unique_id: str, fingerprint: str) -> str:
+    return f"{file_unique_id}:{fingerprint}"
+
+
+def _is_expired(entry: Dict, now: float) -> bool:
+    return now - entry.get('created', 0) > Config.RESULT_CACHE_TTL_DAYS * 86400
+
+
+def load_cache():
+    """تحميل النتائج المخزنة من الملف مع تجاهل العناصر المنتهية"""
+    try:
+        if not os.path.exists(RESULT_CACHE_FILE):
+            return
+        with open(RESULT_CACHE_FILE, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        now = time.time()
+        with _lock:
+            _cache.clear()
+            for key, entry in entries:
+                if not _is_expired(entry, now):
+                    _cache[key] = entry
+            _evict_overflow()
+        logger.info(f"تم تحميل {len(_cache)} نتيجة مخزنة من {RESULT_CACHE_FILE}")
+    except Exception as e:
+        logger.error(f"خطأ في تحميل النتائج المخزنة: {e}")
+
+
+def save_cache() -> bool:
+    """
+    حفظ النتائج المخزنة في الملف إذا تغيرت (كتابة ذرية عبر ملف مؤقت خاص بكل عملية حفظ)
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    global _dirty
+    with _write_lock:
+        with _lock:
+            if not _dirty:
+                return True
+            entries = list(_cache.items())
+            _dirty = False
+        tmp_path = None
+        try:
+            directory = os.path.dirname(os.path.abspath(RESULT_CACHE_FILE))
+            fd, tmp_path = tempfile.mkstemp(prefix='.result_cache.', suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, RESULT_CACHE_FILE)
+            return True
+        except Exception as e:
+            logger.error(f"خطأ في حفظ النتائج المخزنة: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            with _lock:
+                _dirty = True
+            return False
+
+
+def _mark_dirty():
+    """تعليم النتائج كمعدلة ليحفظها خيط الحفظ في الخلفية (يستدعى مع القفل)"""
+    global _dirty
+    _dirty = True
+
+
+def _flush_loop():
+    """خيط الحفظ في الخلفية كل RESULT_CACHE_FLUSH_SECONDS"""
+    while True:
+        time.sleep(Config.RESULT_CACHE_FLUSH_SECONDS)
+        save_cache()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name="result-cache-flusher", daemon=True)
+                _flusher.start()
+
+
+def _evict_overflow():
+    """حذف أقدم العناصر استخداماً عند تجاوز الحد الأقصى"""
+    while len(_cache) > Config.RESULT_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+        _stats['evictions'] += 1
+
+
+def get_cached_result(file_unique_id: str, fingerprint: str) -> Optional[Dict]:
+    """
+    البحث عن نتيجة معالجة سابقة لنفس الملف ونفس التعديل
+
+    Args:
+        file_unique_id: المعرف الفريد للملف الأصلي في تيليجرام
+        fingerprint: بصمة التعديل المطبق
+
+    Returns:
+        dict: بيانات النتيجة ('file_id' وغيرها) أو None إذا لم توجد
+    """
+    if not Config.RESULT_CACHE_ENABLED or not file_unique_id:
+        return None
+
+    key = _make_key(file_unique_id, fingerprint)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            _stats['misses'] += 1
+            return None
+        if _is_expired(entry, time.time()):
+            del _cache[key]
+            _stats['misses'] += 1
+            return None
+        _cache.move_to_end(key)
+        _stats['hits'] += 1
+        return dict(entry)
+
+
+def store_result(file_unique_id: str, fingerprint: str, file_id: str, **meta) -> bool:
+    """
+    تخزين معرف الملف الناتج عن المعالجة
+
+    Args:
+        file_unique_id: المعرف الفريد للملف الأصلي
+        fingerprint: بصمة التعديل المطبق
+        file_id: معرف الملف الناتج في تيليجرام
+        **meta: بيانات إضافية (العنوان، الفنان، المدة...)
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    if not Config.RESULT_CACHE_ENABLED or not file_unique_id or not file_id:
+        return False
+
+    entry = {'file_id': file_id, 'created': time.time()}
+    entry.update(meta)
+    with _lock:
+        key = _make_key(file_unique_id, fingerprint)
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        _stats['stores'] += 1
+        _evict_overflow()
+        _mark_dirty()
+    _ensure_flusher()
+    return True
+
+
+def purge_expired() -> int:
+    """حذف العناصر المنتهية الصلاحية
+
+    Returns:
+        int: عدد العناصر المحذوفة
+    """
+    now = time.time()
+    with _lock:
+        expired = [key for key, entry in _cache.items() if _is_expired(entry, now)]
+        for key in expired:
+            del _cache[key]
+        if expired:
+            _mark_dirty()
+    if expired:
+        _ensure_flusher()
+    return len(expired)
+
+
+def clear_cache():
+    """مسح جميع النتائج المخزنة"""
+    with _lock:
+        _cache.clear()
+        _mark_dirty()
+    save_cache()
+
+
+def get_cache_stats() -> Dict:
+    """الحصول على إحصائيات التخزين المؤقت"""
+    with _lock:
+        stats = dict(_stats)
+        stats['size'] = len(_cache)
+    stats['max_entries'] = Config.RESULT_CACHE_MAX_ENTRIES
+    return stats
+
+
+# تحميل النتائج المخزنة عند استيراد الوحدة
+load_cache()
+
+# حفظ التعديلات المتبقية عند إيقاف البوت
+atexit.register(save_cache)
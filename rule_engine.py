@@ -0,0 +1,944 @@
+"""
+وحدة تقييم القواعد الذكية من الذاكرة
+- تحميل القواعد النشطة من قاعدة البيانات مرة واحدة وتحويلها إلى مجموعة قواعد مترجمة
+- المطابقة على مفاتيح النص الموحدة (text_normalizer) بدلاً من lower()
+- فهرسة القواعد حسب الحقل والعملية (جدول تجزئة، شجرة بادئات، شجرة لواحق، ومطابق Aho-Corasick)
+- إلغاء المجموعة عند إنشاء أو تعديل أو حذف أو تبديل حالة قاعدة
+- رقم إصدار مشترك في قاعدة البيانات حتى تلاحظ العمليات الأخرى تغيير القواعد
+- عدادات لكل قاعدة (مرات التقييم والمطابقة والتطبيق والزمن) تحفظ في قاعدة البيانات دورياً
+- عملية التعبير النمطي (regex): تحقق وترجمة عند الحفظ، ورفض الأنماط المعرضة للتراجع الكارثي، وحد لطول النص
+- نطاق القاعدة (عامة أو خاصة بمنشئها): مجموعة مترجمة لكل مستخدم تحمل عند الحاجة وتحذف الأقدم استخداماً (LRU)
+"""
+
+import re
+import time
+import heapq
+import logging
+import threading
+from collections import deque, OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from models import db, SmartRule, SmartRuleStat, CacheVersion
+from main import app
+from config import Config
+import text_normalizer
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# إعداد التسجيل
+logger = logging.getLogger('rule_engine')
+
+# أكبر عدد تكرار محدود يعامل كتكرار عادي عند فحص التكرار المتداخل
+REGEX_BOUNDED_REPEAT_LIMIT = 10
+
+# اسم رقم الإصدار الخاص بالقواعد الذكية في جدول CacheVersion
+RULES_VERSION_KEY = 'smart_rules'
+
+# نطاقات القواعد: العامة تطبق على الجميع، والخاصة تطبق على ملفات منشئها فقط
+SCOPE_GLOBAL = 'global'
+SCOPE_USER = 'user'
+
+# مجموعة القواعد العامة المترجمة الحالية
+_rule_set = None
+_stale = True
+_lock = threading.Lock()
+_watcher = None
+
+# مجموعات المستخدمين (القواعد العامة + قواعد المستخدم) مرتبة حسب آخر استخدام: {معرف المستخدم: CompiledRuleSet}
+_user_sets = OrderedDict()
+
+# عدادات القواعد التي لم تحفظ بعد من مجموعات قواعد سابقة: {معرف القاعدة: {...}}
+_pending_stats = {}
+_last_stats_flush = time.time()
+
+
+def _subpatterns(av):
+    """الأنماط الفرعية داخل معامل عقدة في شجرة التعبير النمطي"""
+    for child in (av if isinstance(av, (list, tuple)) else [av]):
+        if isinstance(child, sre_parse.SubPattern):
+            yield child
+        elif isinstance(child, (list, tuple)):
+            for item in child:
+                if isinstance(item, sre_parse.SubPattern):
+                    yield item
+
+
+def _has_backreference(parsed) -> bool:
+    """التحقق من وجود إحالة خلفية (\\1 أو (?P=name)) في شجرة التعبير"""
+    for op, av in parsed:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return True
+        if any(_has_backreference(sub) for sub in _subpatterns(av)):
+            return True
+    return False
+
+
+def _has_nested_repeat(parsed, inside_repeat: bool = False) -> bool:
+    """التحقق من وجود تكرار غير محدود داخل تكرار آخر (مثل (a+)+) وهو سبب التراجع الكارثي"""
+    for op, av in parsed:
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, high, sub = av
+            repeats = high == sre_parse.MAXREPEAT or high > REGEX_BOUNDED_REPEAT_LIMIT
+            if repeats and inside_repeat:
+                return True
+            if _has_nested_repeat(sub, inside_repeat or repeats):
+                return True
+        elif any(_has_nested_repeat(sub, inside_repeat) for sub in _subpatterns(av)):
+            return True
+    return False
+
+
+def _fold(code: int) -> int:
+    """توحيد حالة الحرف (المطابقة بدون حساسية لحالة الأحرف)"""
+    return ord(chr(code).lower())
+
+
+def _first_chars(items) -> Tuple[List[Tuple[int, int]], bool, bool]:
+    """
+    الأحرف التي يمكن أن تبدأ بها مطابقة سلسلة من عقد التعبير
+
+    Returns:
+        tuple: (نطاقات الأحرف [(من، إلى)]، هل يمكن أن تبدأ بأي حرف، هل يمكن أن تطابق نصاً فارغاً)
+    """
+    ranges = []
+    for op, av in items:
+        if op == sre_parse.LITERAL:
+            return ranges + [(_fold(av), _fold(av))], False, False
+        if op in (sre_parse.NOT_LITERAL, sre_parse.ANY, sre_parse.CATEGORY):
+            return ranges, True, False
+        if op == sre_parse.IN:
+            if any(item_op in (sre_parse.NEGATE, sre_parse.CATEGORY) for item_op, _ in av):
+                return ranges, True, False
+            for item_op, item_av in av:
+                if item_op == sre_parse.LITERAL:
+                    ranges.append((_fold(item_av), _fold(item_av)))
+                elif item_op == sre_parse.RANGE:
+                    ranges.append(item_av)
+                    ranges.append((_fold(item_av[0]), _fold(item_av[1])))
+            return ranges, False, False
+        if op == sre_parse.SUBPATTERN:
+            sub_ranges, universal, nullable = _first_chars(av[-1])
+        elif op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+            sub_ranges, universal, nullable = _first_chars(av)
+        elif op == sre_parse.BRANCH:
+            sub_ranges, universal, nullable = [], False, False
+            for alternative in av[1]:
+                alt_ranges, alt_universal, alt_nullable = _first_chars(alternative)
+                sub_ranges += alt_ranges
+                universal = universal or alt_universal
+                nullable = nullable or alt_nullable
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or op == getattr(sre_parse, 'POSSESSIVE_REPEAT', None):
+            low, high, sub = av
+            sub_ranges, universal, nullable = _first_chars(sub)
+            nullable = nullable or low == 0
+        else:
+            # عقد بدون عرض (مثل ^ و $ و (?=...)) لا تستهلك أحرفاً
+            continue
+        ranges += sub_ranges
+        if universal:
+            return ranges, True, False
+        if not nullable:
+            return ranges, False, False
+    return ranges, False, True
+
+
+def _merge_first(first, follow):
+    """دمج أحرف البداية مع ما يليها إذا كانت المطابقة يمكن أن تكون فارغة"""
+    ranges, universal, nullable = first
+    if not nullable:
+        return first
+    return ranges + follow[0], universal or follow[1], follow[2]
+
+
+def _overlaps(first, other) -> bool:
+    """هل يمكن أن يبدأ فرعان بنفس الحرف"""
+    if (first[1] and (other[0] or other[1] or other[2])) or (other[1] and (first[0] or first[2])):
+        return True
+    if first[2] and other[2]:
+        # فرعان يطابقان نصاً فارغاً في نفس الموضع
+        return True
+    return any(low <= other_high and other_low <= high
+               for low, high in first[0] for other_low, other_high in other[0])
+
+
+def _has_ambiguous_branch(items, inside_repeat: bool = False, follow=([], False, True)) -> bool:
+    """
+    التحقق من وجود تناوب داخل تكرار غير محدود يمكن أن تبدأ فروعه بنفس الحرف (مثل (a|a)* أو (a|aa)+)
+
+    يقسم المحلل البادئة المشتركة للفروع، فيصبح (a|aa) مثلاً a(|a): الفرع الفارغ يقارن بما يليه
+    (بقية الجسم ثم التكرار التالي).
+
+    Args:
+        items: عقد التعبير
+        inside_repeat: هل العقد داخل تكرار غير محدود
+        follow: أحرف البداية لما يلي العقد
+    """
+    for index, (op, av) in enumerate(items):
+        rest = _merge_first(_first_chars(items[index + 1:]), follow)
+        if op == sre_parse.BRANCH:
+            alternatives = [_merge_first(_first_chars(alternative), rest) for alternative in av[1]]
+            if inside_repeat and any(_overlaps(alternatives[i], alternatives[j])
+                                     for i in range(len(alternatives)) for j in range(i + 1, len(alternatives))):
+                return True
+            if any(_has_ambiguous_branch(alternative, inside_repeat, rest) for alternative in av[1]):
+                return True
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, high, sub = av
+            unbounded = high == sre_parse.MAXREPEAT or high > REGEX_BOUNDED_REPEAT_LIMIT
+            sub_follow = rest
+            if unbounded:
+                # بعد الجسم قد يأتي تكرار جديد للجسم أو ما يلي التكرار
+                body = _first_chars(sub)
+                sub_follow = (body[0] + rest[0], body[1] or rest[1], rest[2])
+            if _has_ambiguous_branch(sub, inside_repeat or unbounded, sub_follow):
+                return True
+        elif op == sre_parse.SUBPATTERN:
+            if _has_ambiguous_branch(av[-1], inside_repeat, rest):
+                return True
+        elif any(_has_ambiguous_branch(sub, inside_repeat, rest) for sub in _subpatterns(av)):
+            return True
+    return False
+
+
+def validate_pattern(pattern: str) -> Optional[str]:
+    """
+    التحقق من صلاحية تعبير نمطي لاستخدامه في قاعدة ذكية
+
+    Args:
+        pattern: التعبير النمطي
+
+    Returns:
+        str: سبب الرفض، أو None إذا كان التعبير صالحاً
+    """
+    if not pattern:
+        return "التعبير النمطي فارغ"
+    if len(pattern) > Config.SMART_RULES_REGEX_MAX_LENGTH:
+        return f"التعبير النمطي أطول من {Config.SMART_RULES_REGEX_MAX_LENGTH} حرفاً"
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except re.error as e:
+        return f"تعبير نمطي غير صالح: {e}"
+    if _has_backreference(parsed):
+        return "الإحالات الخلفية غير مدعومة في التعبيرات النمطية"
+    if _has_nested_repeat(parsed):
+        return "التعبير يحتوي على تكرار متداخل (مثل (a+)+) وقد يسبب بطئاً شديداً"
+    if _has_ambiguous_branch(parsed):
+        return "التعبير يحتوي على بدائل متداخلة داخل تكرار (مثل (a|aa)+) وقد يسبب بطئاً شديداً"
+    return None
+
+
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern: str) -> "re.Pattern":
+    """
+    التحقق من التعبير النمطي وترجمته (مع تخزين النتيجة حتى لا تعاد الترجمة عند إعادة تحميل القواعد)
+
+    Raises:
+        ValueError: إذا كان التعبير غير صالح أو معرضاً للتراجع الكارثي
+    """
+    error = validate_pattern(pattern)
+    if error:
+        raise ValueError(error)
+    return re.compile(pattern, re.IGNORECASE)
+
+
+class CompiledRule:
+    """قاعدة ذكية مترجمة (نسخة في الذاكرة لا تحتاج إلى جلسة قاعدة بيانات)"""
+
+    __slots__ = ('id', 'name', 'description', 'condition_field', 'condition_operator', 'condition_value',
+                 'condition_key', 'action_type', 'action_field', 'action_value', 'priority',
+                 'pattern', 'literal')
+
+    def __init__(self, rule):
+        self.id = rule.id
+        self.name = rule.name
+        self.description = rule.description
+        self.condition_field = rule.condition_field
+        self.condition_operator = rule.condition_operator
+        self.condition_value = rule.condition_value
+        self.condition_key = text_normalizer.normalize(rule.condition_value)
+        self.action_type = rule.action_type
+        self.action_field = rule.action_field
+        self.action_value = rule.action_value
+        self.priority = rule.priority if rule.priority is not None else 10
+        self.pattern = None
+        # تعبير يطابق قيمة الشرط ومكافئاتها في النص الأصلي (لاستبدال ما تمت مطابقته على المفاتيح الموحدة)
+        self.literal = None
+        if self.action_type == 'replace' and self.condition_operator != 'regex' and self.condition_key:
+            self.literal = text_normalizer.compile_equivalent(self.condition_value)
+        if self.condition_operator == 'regex':
+            try:
+                self.pattern = compile_pattern(text_normalizer.normalize_chars(self.condition_value))
+            except ValueError as e:
+                logger.error(f"تم تجاهل القاعدة {self.id} بسبب تعبير نمطي غير صالح: {e}")
+
+    def matches(self, value_key: str) -> bool:
+        """التحقق من الشرط على مفتاح المطابقة الموحد لقيمة الحقل (text_normalizer.normalize)"""
+        operator = self.condition_operator
+        if operator == 'contains':
+            return self.condition_key in value_key
+        if operator == 'equals':
+            return value_key == self.condition_key
+        if operator == 'starts_with':
+            return value_key.startswith(self.condition_key)
+        if operator == 'ends_with':
+            return value_key.endswith(self.condition_key)
+        if operator == 'regex':
+            return self._search(value_key)
+        return False
+
+    def _search(self, value: str) -> bool:
+        """
+        مطابقة التعبير النمطي مع حد لطول النص
+
+        لا يمكن إيقاف re أثناء البحث، لذلك تعتمد الحماية من التراجع الكارثي على رفض الأنماط
+        الخطرة عند الترجمة (validate_pattern) وعلى قص النص إلى SMART_RULES_REGEX_MAX_INPUT.
+        """
+        if self.pattern is None:
+            return False
+        return self.pattern.search(value[:Config.SMART_RULES_REGEX_MAX_INPUT]) is not None
+
+    def apply_action(self, tags: Dict) -> List[str]:
+        """
+        تنفيذ إجراء القاعدة على الوسوم
+
+        Returns:
+            list: أسماء الحقول التي تغيرت قيمتها
+        """
+        changed = []
+        if self.action_type == 'add':
+            # إضافة إلى الحقل الحالي إذا كان موجودًا
+            current_value = tags.get(self.action_field, "")
+            tags[self.action_field] = f"{current_value}, {self.action_value}" if current_value else self.action_value
+            changed.append(self.action_field)
+        elif self.action_type == 'set':
+            if tags.get(self.action_field) != self.action_value:
+                tags[self.action_field] = self.action_value
+                changed.append(self.action_field)
+        elif self.action_type == 'replace':
+            # قاعدة التعبير النمطي المرفوضة لا تستبدل نص التعبير كنص حرفي
+            pattern = self.pattern if self.condition_operator == 'regex' else self.literal
+            if pattern is None:
+                return changed
+            fields = list(tags) if self.action_field == '*' else [self.action_field]
+            for key in fields:
+                value = tags.get(key)
+                if isinstance(value, str):
+                    # قيمة الاستبدال نص حرفي (لا تفسر \1 وما شابه)
+                    new_value = pattern.sub(lambda match: self.action_value, value)
+                    if new_value != value:
+                        tags[key] = new_value
+                        changed.append(key)
+        return changed
+
+
+@lru_cache(maxsize=1024)
+def _compile_definition(definition: Tuple) -> CompiledRule:
+    return CompiledRule(SimpleNamespace(**dict(definition)))
+
+
+def compile_rule(rule) -> CompiledRule:
+    """
+    الحصول على النسخة المترجمة لقاعدة واحدة (مخزنة حسب تعريف القاعدة، فلا تعاد الترجمة عند كل استدعاء)
+
+    Args:
+        rule: كائن SmartRule
+
+    Returns:
+        CompiledRule: القاعدة المترجمة
+    """
+    definition = tuple((name, getattr(rule, name)) for name in (
+        'id', 'name', 'description', 'condition_field', 'condition_operator', 'condition_value',
+        'action_type', 'action_field', 'action_value', 'priority'))
+    return _compile_definition(definition)
+
+
+class _Trie:
+    """شجرة بادئات بسيطة: كل عقدة قاموس {حرف: عقدة} والمفتاح None يحمل أرقام القواعد المنتهية عندها"""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key: str, position: int):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(position)
+
+    def match_prefixes(self, text: str, matched: set):
+        """إضافة أرقام جميع القواعد التي قيمتها بادئة للنص"""
+        node = self.root
+        if None in node:
+            matched.update(node[None])
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                return
+            if None in node:
+                matched.update(node[None])
+
+
+class _AhoCorasick:
+    """مطابق متعدد الأنماط: يجد جميع الأنماط الموجودة داخل النص بمرور واحد"""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add(self, pattern: str, position: int):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(position)
+
+    def build(self):
+        """حساب روابط الفشل ودمج مخرجاتها (بعد إضافة جميع الأنماط)"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                candidate = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = candidate if candidate != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def search(self, text: str, matched: set):
+        """إضافة أرقام القواعد التي يظهر نمطها في النص"""
+        state = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                matched.update(output[state])
+
+
+class FieldIndex:
+    """فهرس قواعد حقل واحد حسب نوع العملية"""
+
+    def __init__(self):
+        self.equals = {}
+        self.prefixes = _Trie()
+        self.suffixes = _Trie()
+        self.contains = _AhoCorasick()
+        self.always = []
+        # القواعد التي لا يمكن فهرستها (يتم التحقق منها واحدة تلو الأخرى)
+        self.linear = []
+
+    def add(self, position: int, rule: CompiledRule):
+        value = rule.condition_key
+        operator = rule.condition_operator
+        if operator == 'equals':
+            self.equals.setdefault(value, []).append(position)
+        elif operator == 'starts_with':
+            self.prefixes.insert(value, position)
+        elif operator == 'ends_with':
+            self.suffixes.insert(value[::-1], position)
+        elif operator == 'contains' and value:
+            self.contains.add(value, position)
+        elif operator == 'contains':
+            self.always.append(position)
+        else:
+            self.linear.append((position, rule))
+
+    def build(self):
+        self.contains.build()
+
+    def match(self, value_key: str) -> set:
+        """
+        إيجاد جميع القواعد المطابقة لقيمة الحقل بمرور واحد لكل نوع فهرس
+
+        Returns:
+            set: أرقام القواعد المطابقة (ترتيبها في المجموعة حسب الأولوية)
+        """
+        matched = set(self.always)
+        matched.update(self.equals.get(value_key, ()))
+        self.prefixes.match_prefixes(value_key, matched)
+        self.suffixes.match_prefixes(value_key[::-1], matched)
+        self.contains.search(value_key, matched)
+        for position, rule in self.linear:
+            if rule.matches(value_key):
+                matched.add(position)
+        return matched
+
+
+class CompiledRuleSet:
+    """مجموعة القواعد النشطة المترجمة مرتبة حسب الأولوية ومفهرسة حسب حقل الشرط"""
+
+    def __init__(self, rules: List[CompiledRule], version: int):
+        self.rules = sorted(rules, key=lambda rule: (rule.priority, rule.id))
+        self.version = version
+        self.loaded_at = time.time()
+        self.indexes = {}
+        self.field_rules = {}
+        for position, rule in enumerate(self.rules):
+            self.indexes.setdefault(rule.condition_field, FieldIndex()).add(position, rule)
+            self.field_rules.setdefault(rule.condition_field, []).append(rule.id)
+        for index in self.indexes.values():
+            index.build()
+        
+        # العدادات: {الحقل: [مرات التقييم، الزمن]} و{معرف القاعدة: [المطابقات، الإجراءات المطبقة، الزمن، وقت آخر مطابقة]}
+        self._stats_lock = threading.Lock()
+        self._field_stats = {}
+        self._rule_stats = {}
+
+    def _match_field(self, tags: Dict, field: str, match_cache: Optional[Dict] = None) -> set:
+        value = tags.get(field, "")
+        if not value:
+            return set()
+        value_key = text_normalizer.normalize(str(value))
+        if match_cache is None:
+            return self.indexes[field].match(value_key)
+        key = (field, value_key)
+        matched = match_cache.get(key)
+        if matched is None:
+            matched = frozenset(self.indexes[field].match(value_key))
+            match_cache[key] = matched
+        return matched
+
+    def _timed_match_field(self, tags: Dict, field: str, match_cache: Optional[Dict], field_stats: Optional[Dict]) -> set:
+        if field_stats is None:
+            return self._match_field(tags, field, match_cache)
+        started = time.perf_counter()
+        matched = self._match_field(tags, field, match_cache)
+        if tags.get(field):
+            stats = field_stats.setdefault(field, [0, 0.0])
+            stats[0] += 1
+            stats[1] += time.perf_counter() - started
+        return matched
+
+    def evaluate(self, tags: Dict, match_cache: Optional[Dict] = None,
+                 record_stats: bool = False) -> Tuple[Dict, List[CompiledRule]]:
+        """
+        تطبيق القواعد على الوسوم بالترتيب حسب الأولوية
+
+        يتم إيجاد القواعد المطابقة لكل حقل بمرور واحد على قيمته، ثم تنفيذ الإجراءات حسب الأولوية.
+        إذا غيّر إجراءٌ حقلاً مفهرساً يعاد حساب مطابقات هذا الحقل للقواعد التالية فقط،
+        فتبقى النتيجة مطابقة للتطبيق المتتالي للقواعد.
+
+        Args:
+            tags: قاموس الوسوم (يتم تعديله مباشرة)
+            match_cache: ذاكرة مطابقات مشتركة {(الحقل، القيمة): القواعد المطابقة} لتقييم دفعة من الصفوف
+            record_stats: تسجيل عدادات القواعد (للتقييم الفعلي وليس للتجارب)
+
+        Returns:
+            tuple: (الوسوم بعد التعديل، القواعد المطبقة)
+        """
+        applied = []
+        field_stats = {} if record_stats else None
+        rule_stats = {} if record_stats else None
+        matched = {field: self._timed_match_field(tags, field, match_cache, field_stats) for field in self.indexes}
+        heap = [position for positions in matched.values() for position in positions]
+        heapq.heapify(heap)
+        last = -1
+        while heap:
+            position = heapq.heappop(heap)
+            if position <= last:
+                continue
+            rule = self.rules[position]
+            if position not in matched[rule.condition_field]:
+                # لم تعد القاعدة مطابقة بعد تغيير الحقل بواسطة قاعدة سابقة
+                continue
+            last = position
+            started = time.perf_counter() if record_stats else 0.0
+            changed_fields = rule.apply_action(tags)
+            if record_stats:
+                stats = rule_stats.setdefault(rule.id, [0, 0, 0.0])
+                stats[0] += 1
+                stats[1] += 1 if changed_fields else 0
+                stats[2] += time.perf_counter() - started
+            for changed_field in changed_fields:
+                if changed_field in self.indexes:
+                    matched[changed_field] = self._timed_match_field(tags, changed_field, match_cache, field_stats)
+                    for next_position in matched[changed_field]:
+                        if next_position > position:
+                            heapq.heappush(heap, next_position)
+            applied.append(rule)
+        
+        if record_stats:
+            self._merge_stats(field_stats, rule_stats)
+        return tags, applied
+
+    def _merge_stats(self, field_stats: Dict, rule_stats: Dict):
+        """دمج عدادات تقييم واحد في عدادات المجموعة (قفل واحد لكل تقييم)"""
+        now = time.time()
+        with self._stats_lock:
+            for field, (evaluations, seconds) in field_stats.items():
+                stats = self._field_stats.setdefault(field, [0, 0.0])
+                stats[0] += evaluations
+                stats[1] += seconds
+            for rule_id, (matches, actions, seconds) in rule_stats.items():
+                stats = self._rule_stats.setdefault(rule_id, [0, 0, 0.0, None])
+                stats[0] += matches
+                stats[1] += actions
+                stats[2] += seconds
+                stats[3] = now
+
+    def drain_stats(self) -> Dict:
+        """
+        أخذ العدادات المتراكمة وتصفيرها
+
+        زمن مطابقة الحقل (مرور واحد على الفهرس) يوزع بالتساوي على قواعد هذا الحقل.
+
+        Returns:
+            dict: {معرف القاعدة: {'evaluations', 'matches', 'actions_applied', 'seconds', 'last_matched_at'}}
+        """
+        with self._stats_lock:
+            field_stats, self._field_stats = self._field_stats, {}
+            rule_stats, self._rule_stats = self._rule_stats, {}
+        
+        result = {}
+        for field, (evaluations, seconds) in field_stats.items():
+            rule_ids = self.field_rules.get(field, [])
+            for rule_id in rule_ids:
+                result[rule_id] = {'evaluations': evaluations, 'matches': 0, 'actions_applied': 0,
+                                   'seconds': seconds / len(rule_ids), 'last_matched_at': None}
+        for rule_id, (matches, actions, seconds, last_matched) in rule_stats.items():
+            entry = result.setdefault(rule_id, {'evaluations': 0, 'matches': 0, 'actions_applied': 0,
+                                                'seconds': 0.0, 'last_matched_at': None})
+            entry['matches'] += matches
+            entry['actions_applied'] += actions
+            entry['seconds'] += seconds
+            entry['last_matched_at'] = last_matched
+        return result
+
+    def evaluate_batch(self, rows: List[Dict], record_stats: bool = False) -> Dict:
+        """
+        تطبيق القواعد على قائمة من صفوف الوسوم دفعة واحدة
+
+        نتائج المطابقة تُحفظ لكل قيمة حقل مختلفة، لذلك تتم مطابقة القيم المتكررة
+        (مثل اسم الفنان في مكتبة كاملة) مرة واحدة فقط.
+
+        Args:
+            rows: قائمة قواميس الوسوم (لا يتم تعديلها)
+            record_stats: تسجيل عدادات القواعد
+
+        Returns:
+            dict: {'rows': [{'tags': الوسوم المعدلة، 'applied_rule_ids': [...]}, ...],
+                   'hit_counts': {معرف القاعدة: عدد الصفوف التي طُبقت عليها}}
+        """
+        match_cache = {}
+        hit_counts = {}
+        results = []
+        for row in rows:
+            tags, applied = self.evaluate(dict(row), match_cache, record_stats)
+            rule_ids = [rule.id for rule in applied]
+            for rule_id in rule_ids:
+                hit_counts[rule_id] = hit_counts.get(rule_id, 0) + 1
+            results.append({'tags': tags, 'applied_rule_ids': rule_ids})
+        return {'rows': results, 'hit_counts': hit_counts}
+
+    def with_rule(self, rule: CompiledRule) -> 'CompiledRuleSet':
+        """إنشاء نسخة من المجموعة تتضمن قاعدة إضافية (لتجربة قاعدة قبل تفعيلها)"""
+        rules = [existing for existing in self.rules if existing.id != rule.id]
+        rules.append(rule)
+        return CompiledRuleSet(rules, self.version)
+
+
+def get_version() -> int:
+    """قراءة رقم إصدار القواعد من قاعدة البيانات"""
+    with app.app_context():
+        stamp = CacheVersion.query.get(RULES_VERSION_KEY)
+        return stamp.version if stamp else 0
+
+
+def bump_version() -> int:
+    """
+    زيادة رقم إصدار القواعد في قاعدة البيانات (يستدعى بعد أي تعديل على القواعد)
+
+    Returns:
+        int: رقم الإصدار الجديد
+    """
+    try:
+        with app.app_context():
+            result = db.session.execute(
+                db.update(CacheVersion)
+                .where(CacheVersion.name == RULES_VERSION_KEY)
+                .values(version=CacheVersion.version + 1, updated_at=datetime.utcnow())
+            )
+            if result.rowcount == 0:
+                db.session.add(CacheVersion(name=RULES_VERSION_KEY, version=1))
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"خطأ في تحديث رقم إصدار القواعد الذكية: {e}")
+        try:
+            with app.app_context():
+                db.session.rollback()
+        except Exception:
+            pass
+    invalidate(local_only=True)
+    try:
+        return get_version()
+    except Exception:
+        return 0
+
+
+def invalidate(local_only: bool = False):
+    """
+    إلغاء مجموعة القواعد المترجمة في هذه العملية
+
+    Args:
+        local_only: عدم تحديث رقم الإصدار المشترك (عند ملاحظة تغيير من عملية أخرى)
+    """
+    global _stale
+    if not local_only:
+        bump_version()
+        return
+    with _lock:
+        _stale = True
+
+
+def _load_rule_set() -> CompiledRuleSet:
+    """تحميل القواعد العامة النشطة من قاعدة البيانات وترجمتها"""
+    with app.app_context():
+        version = get_version()
+        query = SmartRule.query.filter_by(is_active=True).filter(
+            db.or_(SmartRule.scope == SCOPE_GLOBAL, SmartRule.scope.is_(None))
+        )
+        rules = [CompiledRule(rule) for rule in query.all()]
+    logger.info(f"تم تحميل {len(rules)} قاعدة ذكية عامة نشطة (الإصدار {version})")
+    return CompiledRuleSet(rules, version)
+
+
+def _load_user_rule_set(global_set: CompiledRuleSet, user_id: int) -> CompiledRuleSet:
+    """
+    بناء مجموعة قواعد المستخدم: القواعد العامة (دون إعادة ترجمتها) مع قواعده الخاصة
+
+    إذا لم تكن للمستخدم قواعد خاصة تستخدم المجموعة العامة نفسها.
+    """
+    with app.app_context():
+        user_rules = [CompiledRule(rule) for rule in SmartRule.query.filter_by(
+            is_active=True, scope=SCOPE_USER, creator_id=user_id
+        ).all()]
+    if not user_rules:
+        return global_set
+    return CompiledRuleSet(global_set.rules + user_rules, global_set.version)
+
+
+def _drain_all_locked():
+    """نقل عدادات جميع المجموعات المحملة إلى العدادات المنتظرة للحفظ (يستدعى مع القفل)"""
+    drained = set()
+    for rule_set in [_rule_set, *_user_sets.values()]:
+        if rule_set is not None and id(rule_set) not in drained:
+            drained.add(id(rule_set))
+            _merge_pending(rule_set.drain_stats())
+
+
+def _merge_pending(stats: Dict):
+    """دمج عدادات في قائمة العدادات المنتظرة للحفظ"""
+    for rule_id, entry in stats.items():
+        pending = _pending_stats.get(rule_id)
+        if pending is None:
+            _pending_stats[rule_id] = dict(entry)
+            continue
+        for key in ('evaluations', 'matches', 'actions_applied', 'seconds'):
+            pending[key] += entry[key]
+        if entry['last_matched_at']:
+            pending['last_matched_at'] = entry['last_matched_at']
+
+
+def flush_stats() -> int:
+    """
+    حفظ عدادات القواعد المتراكمة في قاعدة البيانات (جدول SmartRuleStat)
+
+    Returns:
+        int: عدد القواعد التي تم تحديث عداداتها
+    """
+    global _pending_stats, _last_stats_flush
+    with _lock:
+        _drain_all_locked()
+        pending, _pending_stats = _pending_stats, {}
+        _last_stats_flush = time.time()
+    if not pending:
+        return 0
+    
+    try:
+        with app.app_context():
+            # تجاهل عدادات القواعد المحذوفة
+            existing_ids = {rule_id for (rule_id,) in
+                            db.session.query(SmartRule.id).filter(SmartRule.id.in_(list(pending))).all()}
+            stats_rows = {row.rule_id: row for row in
+                          SmartRuleStat.query.filter(SmartRuleStat.rule_id.in_(list(existing_ids))).all()}
+            for rule_id in existing_ids:
+                entry = pending[rule_id]
+                row = stats_rows.get(rule_id)
+                if row is None:
+                    row = SmartRuleStat(rule_id=rule_id, evaluations=0, matches=0, actions_applied=0, total_seconds=0.0)
+                    db.session.add(row)
+                row.evaluations += entry['evaluations']
+                row.matches += entry['matches']
+                row.actions_applied += entry['actions_applied']
+                row.total_seconds += entry['seconds']
+                if entry['last_matched_at']:
+                    row.last_matched_at = datetime.utcfromtimestamp(entry['last_matched_at'])
+                row.updated_at = datetime.utcnow()
+            db.session.commit()
+            return len(existing_ids)
+    except Exception as e:
+        logger.error(f"خطأ في حفظ عدادات القواعد الذكية: {e}")
+        try:
+            with app.app_context():
+                db.session.rollback()
+        except Exception:
+            pass
+        # إعادة العدادات للمحاولة في المرة القادمة
+        with _lock:
+            _merge_pending(pending)
+        return 0
+
+
+def get_rule_stats() -> List[Dict]:
+    """
+    الحصول على عدادات جميع القواعد (بعد حفظ العدادات الحالية)
+
+    Returns:
+        list: لكل قاعدة: المعرف والاسم والحالة والأولوية ومرات التقييم والمطابقة والتطبيق والزمن
+    """
+    flush_stats()
+    try:
+        with app.app_context():
+            stats_rows = {row.rule_id: row for row in SmartRuleStat.query.all()}
+            result = []
+            for rule in SmartRule.query.order_by(SmartRule.priority).all():
+                row = stats_rows.get(rule.id)
+                evaluations = row.evaluations if row else 0
+                total_seconds = row.total_seconds if row else 0.0
+                result.append({
+                    'id': rule.id,
+                    'name': rule.name,
+                    'is_active': rule.is_active,
+                    'priority': rule.priority,
+                    'evaluations': evaluations,
+                    'matches': row.matches if row else 0,
+                    'actions_applied': row.actions_applied if row else 0,
+                    'total_ms': round(total_seconds * 1000, 2),
+                    'mean_us': round(total_seconds / evaluations * 1e6, 2) if evaluations else 0.0,
+                    'last_matched_at': row.last_matched_at if row else None
+                })
+            return result
+    except Exception as e:
+        logger.error(f"خطأ في قراءة عدادات القواعد الذكية: {e}")
+        return []
+
+
+def _watch_version():
+    """مراقبة رقم الإصدار المشترك دورياً في الخلفية لملاحظة تعديلات العمليات الأخرى وحفظ العدادات"""
+    while True:
+        time.sleep(Config.SMART_RULES_VERSION_CHECK_SECONDS)
+        try:
+            rule_set = _rule_set
+            if rule_set is not None and get_version() != rule_set.version:
+                logger.info("تم تعديل القواعد الذكية من عملية أخرى، سيتم إعادة تحميلها")
+                invalidate(local_only=True)
+        except Exception as e:
+            logger.error(f"خطأ في التحقق من إصدار القواعد الذكية: {e}")
+        if time.time() - _last_stats_flush >= Config.SMART_RULES_STATS_FLUSH_SECONDS:
+            flush_stats()
+
+
+def get_rule_set(user_id: Optional[int] = None) -> CompiledRuleSet:
+    """
+    الحصول على مجموعة القواعد المترجمة (يتم تحميلها من قاعدة البيانات فقط عند أول استخدام أو بعد تعديل القواعد)
+
+    Args:
+        user_id: معرف المستخدم لإضافة قواعده الخاصة إلى القواعد العامة (None للقواعد العامة فقط)
+
+    Returns:
+        CompiledRuleSet: مجموعة القواعد النشطة
+    """
+    global _rule_set, _stale, _watcher
+    with _lock:
+        if _rule_set is None or _stale:
+            # الاحتفاظ بعدادات المجموعات القديمة حتى تحفظ في قاعدة البيانات
+            _drain_all_locked()
+            _user_sets.clear()
+            _rule_set = _load_rule_set()
+            _stale = False
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch_version, name="smart-rules-version", daemon=True)
+            _watcher.start()
+        global_set = _rule_set
+        if user_id is None:
+            return global_set
+        user_set = _user_sets.get(user_id)
+        if user_set is not None:
+            _user_sets.move_to_end(user_id)
+            return user_set
+    
+    # تحميل قواعد المستخدم خارج القفل حتى لا ينتظر بقية المستخدمين استعلام قاعدة البيانات
+    user_set = _load_user_rule_set(global_set, user_id)
+    with _lock:
+        if _rule_set is not global_set:
+            # تمت إعادة تحميل القواعد أثناء التحميل، لا يتم حفظ المجموعة القديمة
+            return user_set
+        existing = _user_sets.get(user_id)
+        if existing is not None:
+            _user_sets.move_to_end(user_id)
+            return existing
+        _user_sets[user_id] = user_set
+        while len(_user_sets) > Config.SMART_RULES_USER_PARTITIONS:
+            _, evicted = _user_sets.popitem(last=False)
+            if evicted is not _rule_set:
+                _merge_pending(evicted.drain_stats())
+    return user_set
+
+
+def evaluate_batch(rows: List[Dict], user_id: Optional[int] = None) -> Dict:
+    """
+    تطبيق القواعد الذكية النشطة على قائمة من صفوف الوسوم (مثل نتيجة فحص مكتبة أو معالجة رجعية)
+
+    Args:
+        rows: قائمة قواميس الوسوم
+        user_id: معرف المستخدم لتطبيق قواعده الخاصة مع القواعد العامة
+
+    Returns:
+        dict: الوسوم المعدلة ومعرفات القواعد المطبقة لكل صف، وعدد مرات تطبيق كل قاعدة
+    """
+    return get_rule_set(user_id).evaluate_batch(rows)
+
+
+def get_cache_key(user_id: Optional[int] = None) -> str:
+    """
+    مفتاح يحدد نتيجة تطبيق القواعد على ملفات المستخدم (لبصمات التخزين المؤقت للنتائج)
+
+    يتغير عند أي تعديل على القواعد (رقم الإصدار)، ويتضمن معرف المستخدم إذا كانت له قواعد خاصة
+    حتى لا يستلم مستخدم آخر ملفاً طبقت عليه قواعد غيره.
+
+    Returns:
+        str: "رقم الإصدار:القسم"
+    """
+    rule_set = get_rule_set(user_id)
+    partition = user_id if user_id is not None and rule_set is not _rule_set else SCOPE_GLOBAL
+    return f"{rule_set.version}:{partition}"
+
+
+def evaluate(tags: Dict, user_id: Optional[int] = None) -> Tuple[Dict, List[str]]:
+    """
+    تطبيق القواعد الذكية النشطة على الوسوم دون الرجوع إلى قاعدة البيانات
+
+    Args:
+        tags: قاموس الوسوم
+        user_id: معرف المستخدم لتطبيق قواعده الخاصة مع القواعد العامة
+
+    Returns:
+        tuple: (الوسوم المعدلة، أسماء القواعد المطبقة)
+    """
+    tags, applied = get_rule_set(user_id).evaluate(tags, record_stats=True)
+    return tags, [rule.name for rule in applied]
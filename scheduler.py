@@ -0,0 +1,379 @@
+"""
+وحدة جدولة المهام الموقوتة
+- خيط واحد في الخلفية يملك كل العمل الموقوت: البث المجدول، وبدء يوم الحصص الجديد،
+  وتنظيف الملفات المؤقتة القديمة، والتقرير اليومي للمشرفين
+- المهام في كومة (heap) مرتبة حسب وقت التشغيل: إضافة بـ O(log n)، وإلغاء بتعليم المهمة
+  وحذفها عند وصولها لرأس الكومة (مع ضغط الكومة إذا كثرت المهام الملغاة)
+- المهام الدورية محاذاة لوقت ثابت (كل ساعة، أو يومياً في ساعة محددة) مع حفظ وقت آخر تشغيل
+  لمعرفة التشغيلات الفائتة أثناء توقف البوت
+- سياسة التشغيلات الفائتة لكل مهمة: تشغيل مرة واحدة، أو تشغيل كل الفائت، أو التخطي بعد مهلة
+"""
+
+import os
+import json
+import time
+import heapq
+import atexit
+import logging
+import itertools
+import threading
+from typing import Callable, Dict, List, Optional
+
+from config import Config
+
+# إعداد التسجيل
+logger = logging.getLogger('scheduler')
+
+# ملف حفظ أوقات آخر تشغيل للمهام الدورية
+SCHEDULER_STATE_FILE = 'scheduler_state.json'
+
+# سياسات التشغيلات الفائتة
+MISFIRE_RUN_ONCE = 'run_once'  # تشغيل مرة واحدة مهما كان عدد التشغيلات الفائتة
+MISFIRE_RUN_ALL = 'run_all'  # تشغيل كل تشغيل فائت بالترتيب
+MISFIRE_SKIP = 'skip'  # تخطي التشغيل إذا تأخر أكثر من المهلة
+
+# عند تجاوز عدد المهام الملغاة في الكومة هذه النسبة يتم ضغطها
+COMPACT_RATIO = 0.5
+
+
+class Job:
+    """مهمة مجدولة (لمرة واحدة أو دورية)"""
+
+    __slots__ = ('name', 'func', 'description', 'run_at', 'interval', 'offset', 'misfire', 'grace',
+                 'cancelled', 'runs', 'missed', 'last_run', 'last_duration', 'last_status', 'last_error')
+
+    def __init__(self, name: str, func: Callable, run_at: float, interval: float = None, offset: float = 0,
+                 misfire: str = MISFIRE_RUN_ONCE, grace: float = 60, description: str = ''):
+        self.name = name
+        self.func = func
+        self.description = description
+        self.run_at = run_at
+        self.interval = interval
+        self.offset = offset
+        self.misfire = misfire
+        self.grace = grace
+        self.cancelled = False
+        self.runs = 0
+        self.missed = 0
+        self.last_run = None
+        self.last_duration = 0.0
+        self.last_status = None
+        self.last_error = None
+
+    def next_after(self, timestamp: float) -> float:
+        """أول وقت تشغيل محاذى بعد الوقت المحدد (للمهام الدورية)"""
+        periods = (timestamp - self.offset) // self.interval + 1
+        return periods * self.interval + self.offset
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'description': self.description,
+            'next_run': self.run_at,
+            'interval': self.interval,
+            'misfire': self.misfire,
+            'runs': self.runs,
+            'missed': self.missed,
+            'last_run': self.last_run,
+            'last_duration': self.last_duration,
+            'last_status': self.last_status,
+            'last_error': self.last_error
+        }
+
+
+_heap: List[list] = []  # [وقت التشغيل، رقم تسلسلي، المهمة]
+_jobs: Dict[str, Job] = {}
+_cancelled_count = 0
+_sequence = itertools.count()
+_condition = threading.Condition()
+_last_runs: Dict[str, float] = {}
+_thread = None
+_bot = None
+
+
+def _load_state():
+    """تحميل أوقات آخر تشغيل المحفوظة"""
+    if not os.path.exists(SCHEDULER_STATE_FILE):
+        return
+    try:
+        with open(SCHEDULER_STATE_FILE, 'r', encoding='utf-8') as f:
+            _last_runs.update(json.load(f))
+    except Exception as e:
+        logger.error(f"خطأ في تحميل حالة جدولة المهام: {e}")
+
+
+def _save_state():
+    """حفظ أوقات آخر تشغيل للمهام الدورية بشكل ذري"""
+    if _bot is None:
+        # الجدولة لم تبدأ: عدم استبدال الحالة المحفوظة بحالة فارغة
+        return
+    with _condition:
+        data = dict(_last_runs)
+    try:
+        temp_path = SCHEDULER_STATE_FILE + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, SCHEDULER_STATE_FILE)
+    except Exception as e:
+        logger.error(f"خطأ في حفظ حالة جدولة المهام: {e}")
+
+
+def _push(job: Job):
+    """إضافة المهمة إلى الكومة (يستدعى مع القفل)"""
+    heapq.heappush(_heap, [job.run_at, next(_sequence), job])
+    _condition.notify()
+
+
+def _compact():
+    """حذف المهام الملغاة من الكومة دفعة واحدة (يستدعى مع القفل)"""
+    global _cancelled_count
+    _heap[:] = [entry for entry in _heap if not entry[2].cancelled]
+    heapq.heapify(_heap)
+    _cancelled_count = 0
+
+
+def add_job(name: str, func: Callable, run_at: float = None, interval: float = None, offset: float = 0,
+            misfire: str = MISFIRE_RUN_ONCE, grace: float = 60, description: str = '') -> Job:
+    """
+    إضافة مهمة مجدولة (تستبدل أي مهمة بنفس الاسم)
+
+    Args:
+        name: اسم فريد للمهمة
+        func: الدالة المنفذة، تستقبل كائن البوت
+        run_at: وقت التشغيل لمهمة لمرة واحدة (unix timestamp)
+        interval: الفترة بالثواني لمهمة دورية
+        offset: إزاحة المحاذاة بالثواني (مثلاً 8 * 3600 مع فترة يوم = يومياً الساعة 8 UTC)
+        misfire: سياسة التشغيلات الفائتة
+        grace: المهلة بالثواني قبل اعتبار التشغيل فائتاً (لسياسة التخطي)
+        description: وصف للعرض في لوحة الإدارة
+
+    Returns:
+        Job: المهمة المضافة
+    """
+    job = Job(name, func, run_at or 0, interval, offset, misfire, grace, description)
+    if interval:
+        # المهمة الدورية تبدأ من أول موعد بعد آخر تشغيل محفوظ (لاكتشاف ما فات أثناء التوقف)
+        last_run = _last_runs.get(name)
+        job.last_run = last_run
+        job.run_at = job.next_after(last_run if last_run is not None else time.time())
+    with _condition:
+        _cancel_locked(name)
+        _jobs[name] = job
+        _push(job)
+    return job
+
+
+def _cancel_locked(name: str) -> bool:
+    global _cancelled_count
+    job = _jobs.pop(name, None)
+    if job is None:
+        return False
+    job.cancelled = True
+    _cancelled_count += 1
+    if _cancelled_count > len(_heap) * COMPACT_RATIO:
+        _compact()
+    return True
+
+
+def cancel_job(name: str) -> bool:
+    """
+    إلغاء مهمة مجدولة
+
+    Returns:
+        bool: True إذا كانت المهمة موجودة
+    """
+    with _condition:
+        return _cancel_locked(name)
+
+
+def run_now(name: str) -> bool:
+    """تقديم موعد المهمة للتشغيل فوراً (من لوحة الإدارة)"""
+    global _cancelled_count
+    with _condition:
+        job = _jobs.get(name)
+        if job is None:
+            return False
+        job.cancelled = True
+        _cancelled_count += 1
+        replacement = Job(job.name, job.func, time.time(), job.interval, job.offset, job.misfire, job.grace,
+                          job.description)
+        for field in ('runs', 'missed', 'last_run', 'last_duration', 'last_status', 'last_error'):
+            setattr(replacement, field, getattr(job, field))
+        _jobs[name] = replacement
+        _push(replacement)
+        return True
+
+
+def get_jobs() -> List[Dict]:
+    """
+    المهام المجدولة حسب وقت التشغيل القادم
+
+    Returns:
+        list: بيانات المهام (الاسم، الوصف، التشغيل القادم، عدد التشغيلات والفائت، آخر نتيجة)
+    """
+    with _condition:
+        jobs = [job.to_dict() for job in _jobs.values()]
+    return sorted(jobs, key=lambda job: job['next_run'])
+
+
+def is_running() -> bool:
+    return _thread is not None and _thread.is_alive()
+
+
+def _due(job: Job, now: float) -> bool:
+    """
+    تطبيق سياسة التشغيلات الفائتة وتحديد موعد التشغيل التالي
+
+    Returns:
+        bool: هل يتم تشغيل المهمة الآن
+    """
+    late = now - job.run_at
+    missed = int(late // job.interval) if job.interval else 0
+    run = True
+    if job.misfire == MISFIRE_SKIP and late > job.grace:
+        run = False
+        missed += 1
+    if job.interval:
+        if job.misfire == MISFIRE_RUN_ALL:
+            job.run_at += job.interval
+            missed = 0
+        else:
+            job.run_at = job.next_after(now)
+    if missed:
+        job.missed += missed
+        logger.warning(f"المهمة المجدولة {job.name} فاتها {missed} تشغيل")
+    return run
+
+
+def _execute(job: Job):
+    started = time.time()
+    try:
+        job.func(_bot)
+        job.last_status = 'success'
+        job.last_error = None
+    except Exception as e:
+        job.last_status = 'failed'
+        job.last_error = str(e)
+        logger.error(f"خطأ في تنفيذ المهمة المجدولة {job.name}: {e}")
+    job.runs += 1
+    job.last_run = started
+    job.last_duration = time.time() - started
+
+
+def _loop():
+    """حلقة الجدولة: انتظار أقرب مهمة في الكومة ثم تنفيذها"""
+    global _cancelled_count
+    while True:
+        with _condition:
+            while True:
+                while _heap and _heap[0][2].cancelled:
+                    heapq.heappop(_heap)
+                    _cancelled_count = max(0, _cancelled_count - 1)
+                if not _heap:
+                    _condition.wait()
+                    continue
+                delay = _heap[0][0] - time.time()
+                if delay <= 0:
+                    break
+                _condition.wait(delay)
+            job = heapq.heappop(_heap)[2]
+            now = time.time()
+            run = _due(job, now)
+            if not job.interval and _jobs.get(job.name) is job:
+                del _jobs[job.name]
+
+        if run:
+            _execute(job)
+
+        with _condition:
+            if job.interval and not job.cancelled:
+                _last_runs[job.name] = job.last_run if run else now
+                _push(job)
+        if job.interval:
+            _save_state()
+
+
+# ----------------------------------------------------------------------
+# المهام المدمجة
+# ----------------------------------------------------------------------
+
+def _quota_rollover(bot):
+    import quota
+    removed = quota.rollover()
+    logger.info(f"بدء يوم حصص جديد: تم حذف {removed} عداد من الأيام السابقة")
+
+
+def _temp_janitor(bot):
+    import admin_panel
+    admin_panel.clean_temp_files(max_age_seconds=Config.TEMP_FILE_MAX_AGE_SECONDS)
+
+
+def _daily_report(bot):
+    import admin_panel
+    if not admin_panel.get_setting('notifications.daily_report', False):
+        return
+    from admin_handlers import get_daily_report_message
+    report = get_daily_report_message()
+    for admin_id in admin_panel.admin_data['admins']:
+        try:
+            bot.send_message(admin_id, report, parse_mode="Markdown")
+        except Exception as e:
+            logger.error(f"خطأ في إرسال التقرير اليومي للمشرف {admin_id}: {e}")
+
+
+def _broadcast_job(broadcast: Dict) -> Callable:
+    def run(bot):
+        import admin_panel
+        import broadcaster
+        broadcast_id = broadcaster.start_broadcast(bot, broadcast.get('message', ''),
+                                                   message_type=broadcast.get('type') or 'text',
+                                                   file_id=broadcast.get('file_id') or None)
+        if broadcast_id is None:
+            raise RuntimeError("فشل في بدء البث المجدول")
+        admin_panel.mark_broadcast_sent(broadcast['scheduled_id'])
+    return run
+
+
+def schedule_broadcast_job(broadcast: Dict):
+    """جدولة إرسال بث مجدول محفوظ في بيانات الإدارة"""
+    add_job(f"broadcast:{broadcast['scheduled_id']}", _broadcast_job(broadcast),
+            run_at=broadcast.get('time', 0), description="بث مجدول")
+
+
+def cancel_broadcast_job(scheduled_id: int) -> bool:
+    """إلغاء جدولة بث مجدول"""
+    return cancel_job(f"broadcast:{scheduled_id}")
+
+
+def start(bot):
+    """
+    بدء خيط الجدولة وتسجيل المهام المدمجة والبث المجدول غير المرسل
+
+    Args:
+        bot: كائن البوت (يمرر لكل مهمة)
+    """
+    global _thread, _bot
+    if is_running():
+        return
+    _bot = bot
+    _load_state()
+
+    add_job('quota_rollover', _quota_rollover, interval=86400, offset=5,
+            description="بدء يوم جديد لحصص الاستخدام")
+    add_job('temp_janitor', _temp_janitor, interval=Config.SCHEDULER_JANITOR_SECONDS,
+            description="تنظيف الملفات المؤقتة القديمة")
+    add_job('daily_report', _daily_report, interval=86400, offset=Config.DAILY_REPORT_HOUR_UTC * 3600,
+            misfire=MISFIRE_SKIP, grace=6 * 3600, description="التقرير اليومي للمشرفين")
+
+    import admin_panel
+    pending = [broadcast for broadcast in admin_panel.admin_data['scheduled_broadcasts'] if not broadcast.get('sent')]
+    for broadcast in pending:
+        schedule_broadcast_job(broadcast)
+
+    _thread = threading.Thread(target=_loop, name="scheduler", daemon=True)
+    _thread.start()
+    logger.info(f"تم بدء جدولة المهام ({len(_jobs)} مهمة، منها {len(pending)} بث مجدول)")
+
+
+# حفظ أوقات آخر تشغيل عند إيقاف البوت
+atexit.register(_save_state)
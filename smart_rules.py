@@ -2,11 +2,14 @@
 وحدة إدارة القواعد الذكية للبوت
 """
 
+import time
 import logging
 from datetime import datetime
+from types import SimpleNamespace
 from flask import current_app
-from models import db, SmartRule, User
+from models import db, SmartRule, SmartRuleStat, User
 from main import app
+import rule_engine
 
 # إعداد التسجيل
 logger = logging.getLogger(__name__)
@@ -16,7 +19,13 @@ CONDITION_OPERATORS = [
     {'id': 'contains', 'name': 'يحتوي على'},
     {'id': 'equals', 'name': 'يساوي تماماً'},
     {'id': 'starts_with', 'name': 'يبدأ بـ'},
-    {'id': 'ends_with', 'name': 'ينتهي بـ'}
+    {'id': 'ends_with', 'name': 'ينتهي بـ'},
+    {'id': 'regex', 'name': 'يطابق التعبير النمطي'}
+]
+
+RULE_SCOPES = [
+    {'id': rule_engine.SCOPE_GLOBAL, 'name': 'عامة (لجميع المستخدمين)'},
+    {'id': rule_engine.SCOPE_USER, 'name': 'خاصة (لملفات المنشئ فقط)'}
 ]
 
 ACTION_TYPES = [
@@ -39,8 +48,12 @@ TAG_FIELDS = [
     {'id': '*', 'name': 'جميع الحقول'} # فقط للاستبدال
 ]
 
+# معرف القاعدة المؤقتة عند تجربة قاعدة جديدة قبل حفظها
+DRY_RUN_RULE_ID = 0
+
 def create_rule(name, description, condition_field, condition_operator, condition_value,
-               action_type, action_field, action_value, creator_id, priority=10, is_active=True):
+               action_type, action_field, action_value, creator_id, priority=10, is_active=True,
+               scope=rule_engine.SCOPE_GLOBAL):
     """
     إنشاء قاعدة ذكية جديدة
     
@@ -56,6 +69,7 @@ def create_rule(name, description, condition_field, condition_operator, conditio
         creator_id: معرف المستخدم المنشئ
         priority: أولوية التنفيذ (الأقل يتم تنفيذه أولاً)
         is_active: هل القاعدة نشطة
+        scope: نطاق القاعدة (global لجميع المستخدمين، user لملفات المنشئ فقط)
         
     Returns:
         int: معرف القاعدة الجديدة، أو None في حالة الخطأ
@@ -73,6 +87,17 @@ def create_rule(name, description, condition_field, condition_operator, conditio
                         action_type, action_field, action_value]):
                 logger.error("بيانات القاعدة غير مكتملة")
                 return None
+            
+            if scope not in (rule_engine.SCOPE_GLOBAL, rule_engine.SCOPE_USER):
+                logger.error(f"نطاق القاعدة غير معروف: {scope}")
+                return None
+            
+            # التحقق من التعبير النمطي وترجمته مرة واحدة عند الحفظ
+            if condition_operator == 'regex':
+                error = rule_engine.validate_pattern(condition_value)
+                if error:
+                    logger.error(f"لا يمكن إنشاء القاعدة {name}: {error}")
+                    return None
                 
             # إنشاء القاعدة
             rule = SmartRule(
@@ -86,11 +111,13 @@ def create_rule(name, description, condition_field, condition_operator, conditio
                 action_value=action_value,
                 creator_id=creator_id,
                 priority=priority,
-                is_active=is_active
+                is_active=is_active,
+                scope=scope
             )
             
             db.session.add(rule)
             db.session.commit()
+            rule_engine.invalidate()
             
             logger.info(f"تم إنشاء قاعدة ذكية جديدة: {name} بواسطة المستخدم {creator_id}")
             return rule.id
@@ -135,12 +162,25 @@ def update_rule(rule_id, **kwargs):
                 logger.error(f"القاعدة {rule_id} غير موجودة")
                 return False
                 
+            # التحقق من التعبير النمطي إذا كانت القاعدة بعد التحديث تستخدمه
+            condition_operator = kwargs.get('condition_operator', rule.condition_operator)
+            condition_value = kwargs.get('condition_value', rule.condition_value)
+            if condition_operator == 'regex':
+                error = rule_engine.validate_pattern(condition_value)
+                if error:
+                    logger.error(f"لا يمكن تحديث القاعدة {rule_id}: {error}")
+                    return False
+            if kwargs.get('scope', rule.scope) not in (rule_engine.SCOPE_GLOBAL, rule_engine.SCOPE_USER):
+                logger.error(f"نطاق القاعدة غير معروف: {kwargs.get('scope')}")
+                return False
+            
             # تحديث الحقول المطلوبة
             for key, value in kwargs.items():
                 if hasattr(rule, key):
                     setattr(rule, key, value)
                     
             db.session.commit()
+            rule_engine.invalidate()
             logger.info(f"تم تحديث القاعدة {rule_id} بنجاح")
             return True
     except Exception as e:
@@ -165,8 +205,10 @@ def delete_rule(rule_id):
                 logger.error(f"القاعدة {rule_id} غير موجودة")
                 return False
                 
+            SmartRuleStat.query.filter_by(rule_id=rule_id).delete()
             db.session.delete(rule)
             db.session.commit()
+            rule_engine.invalidate()
             logger.info(f"تم حذف القاعدة {rule_id} بنجاح")
             return True
     except Exception as e:
@@ -220,6 +262,7 @@ def toggle_rule_status(rule_id):
                 
             rule.is_active = not rule.is_active
             db.session.commit()
+            rule_engine.invalidate()
             status = "نشطة" if rule.is_active else "غير نشطة"
             logger.info(f"تم تغيير حالة القاعدة {rule_id} إلى {status}")
             return True
@@ -228,19 +271,20 @@ def toggle_rule_status(rule_id):
         db.session.rollback()
         return False
         
-def apply_smart_rules(tags):
+def apply_smart_rules(tags, user_id=None):
     """
-    تطبيق جميع القواعد الذكية النشطة على مجموعة من الوسوم
+    تطبيق القواعد الذكية العامة النشطة وقواعد المستخدم الخاصة على مجموعة من الوسوم
     
     Args:
         tags: قاموس الوسوم الحالية
+        user_id: معرف المستخدم صاحب الملف (None للقواعد العامة فقط)
         
     Returns:
         tuple: (قاموس الوسوم المعدلة، قائمة بأسماء القواعد المطبقة)
     """
     try:
-        with app.app_context():
-            return SmartRule.apply_all_rules(tags)
+        # التقييم يتم من مجموعة القواعد المترجمة في الذاكرة دون استعلام قاعدة البيانات
+        return rule_engine.evaluate(tags, user_id)
     except Exception as e:
         logger.error(f"خطأ في تطبيق القواعد الذكية: {e}")
         return tags, []
@@ -254,13 +298,14 @@ def get_available_fields():
     """
     return TAG_FIELDS + [{'id': '*', 'name': 'جميع الحقول'}]
     
-def test_smart_rules_on_text(text, field_id):
+def test_smart_rules_on_text(text, field_id, user_id=None):
     """
     اختبار تطبيق القواعد الذكية على نص محدد
     
     Args:
         text: النص المراد اختباره
         field_id: معرف الحقل (مثل "title", "artist", إلخ)
+        user_id: معرف المستخدم لتضمين قواعده الخاصة (None للقواعد العامة فقط)
         
     Returns:
         tuple: (النص بعد التطبيق، قائمة القواعد المطبقة، عدد القواعد النشطة)
@@ -269,24 +314,28 @@ def test_smart_rules_on_text(text, field_id):
         # إنشاء قاموس وسوم افتراضي يحتوي فقط على الحقل المطلوب
         dummy_tags = {field_id: text}
         
-        # الحصول على عدد القواعد النشطة
-        active_rules_count = 0
+        # تطبيق جميع القواعد النشطة من المجموعة المترجمة (عدد القواعد النشطة متوفر دون استعلام)
+        rule_set = rule_engine.get_rule_set(user_id)
+        modified_tags, applied_rules = rule_set.evaluate(dummy_tags)
         
-        with app.app_context():
-            active_rules_count = SmartRule.query.filter_by(is_active=True).count()
-            
-            # تطبيق جميع القواعد النشطة
-            modified_tags, applied_rules = SmartRule.apply_all_rules(dummy_tags)
-            
-            # استرجاع النص المعدل
-            modified_text = modified_tags.get(field_id, text)
-            
-            return modified_text, applied_rules, active_rules_count
+        # استرجاع النص المعدل
+        modified_text = modified_tags.get(field_id, text)
+        
+        return modified_text, [rule.name for rule in applied_rules], len(rule_set.rules)
             
     except Exception as e:
         logger.error(f"خطأ في اختبار القواعد الذكية: {e}")
         return text, [], 0
     
+def get_available_scopes():
+    """
+    الحصول على قائمة نطاقات القواعد
+    
+    Returns:
+        list: قائمة بالنطاقات المتاحة
+    """
+    return RULE_SCOPES
+    
 def get_available_operators():
     """
     الحصول على قائمة العمليات المتاحة للقواعد
@@ -491,4 +540,110 @@ def test_rule_on_text(rule_id, sample_text, field_name='comment'):
             'modified_text': sample_text,
             'rule_applied': False,
             'error': str(e)
-        }
\ No newline at end of file
+        }
+
+
+def get_rule_activity():
+    """
+    الحصول على عدادات نشاط القواعد الذكية (مرات التقييم والمطابقة والتطبيق والزمن)
+    
+    Returns:
+        list: قائمة عدادات القواعد
+    """
+    return rule_engine.get_rule_stats()
+
+
+def apply_smart_rules_batch(rows, user_id=None):
+    """
+    تطبيق جميع القواعد الذكية النشطة على قائمة من صفوف الوسوم دفعة واحدة
+    
+    Args:
+        rows: قائمة قواميس الوسوم (مثل نتيجة فحص مكتبة أو معالجة رجعية)
+        user_id: معرف المستخدم لتطبيق قواعده الخاصة مع القواعد العامة
+        
+    Returns:
+        dict: {
+            'rows': [{'tags': الوسوم المعدلة, 'applied_rule_ids': معرفات القواعد المطبقة}, ...],
+            'hit_counts': {معرف القاعدة: عدد الصفوف التي طُبقت عليها}
+        }
+    """
+    try:
+        return rule_engine.evaluate_batch(rows, user_id)
+    except Exception as e:
+        logger.error(f"خطأ في تطبيق القواعد الذكية على دفعة من الوسوم: {e}")
+        return {'rows': [{'tags': dict(row), 'applied_rule_ids': []} for row in rows], 'hit_counts': {}}
+
+
+def dry_run_rule(rows, condition_field, condition_operator, condition_value,
+                 action_type, action_field, action_value, priority=10, sample_limit=10, user_id=None):
+    """
+    تجربة قاعدة جديدة على مجموعة من صفوف الوسوم قبل حفظها وتفعيلها
+    
+    يتم تقييم القواعد النشطة الحالية مع القاعدة الجديدة، ومقارنة النتيجة بالتقييم بدونها.
+    
+    Args:
+        rows: قائمة قواميس الوسوم
+        condition_field: الحقل الذي سيتم التحقق منه
+        condition_operator: نوع العملية
+        condition_value: القيمة المستخدمة في الشرط
+        action_type: نوع الإجراء
+        action_field: حقل الإجراء
+        action_value: قيمة الإجراء
+        priority: أولوية القاعدة بين القواعد الحالية
+        sample_limit: الحد الأقصى لأمثلة الصفوف المتغيرة في النتيجة
+        user_id: معرف المستخدم لتضمين قواعده الخاصة في التجربة
+        
+    Returns:
+        dict: {
+            'rows': عدد الصفوف,
+            'matches': عدد الصفوف التي طُبقت عليها القاعدة,
+            'changed_rows': عدد الصفوف التي تغيرت نتيجتها بسبب القاعدة,
+            'samples': أمثلة على الصفوف المتغيرة (قبل وبعد),
+            'hit_counts': عدد مرات تطبيق كل قاعدة مع القاعدة الجديدة,
+            'elapsed_seconds': زمن التجربة
+        }
+    """
+    started = time.perf_counter()
+    try:
+        if not all([condition_field, condition_operator, condition_value, action_type, action_field]):
+            return {'error': "بيانات القاعدة غير مكتملة"}
+        if condition_operator == 'regex':
+            error = rule_engine.validate_pattern(condition_value)
+            if error:
+                return {'error': error}
+        
+        candidate = rule_engine.CompiledRule(SimpleNamespace(
+            id=DRY_RUN_RULE_ID,
+            name="قاعدة تجريبية",
+            description=None,
+            condition_field=condition_field,
+            condition_operator=condition_operator,
+            condition_value=condition_value,
+            action_type=action_type,
+            action_field=action_field,
+            action_value=action_value,
+            priority=priority
+        ))
+        rule_set = rule_engine.get_rule_set(user_id)
+        baseline = rule_set.evaluate_batch(rows)
+        with_candidate = rule_set.with_rule(candidate).evaluate_batch(rows)
+        
+        changed_rows = 0
+        samples = []
+        for row, before, after in zip(rows, baseline['rows'], with_candidate['rows']):
+            if before['tags'] != after['tags']:
+                changed_rows += 1
+                if len(samples) < sample_limit:
+                    samples.append({'original': row, 'before': before['tags'], 'after': after['tags']})
+        
+        return {
+            'rows': len(rows),
+            'matches': with_candidate['hit_counts'].get(DRY_RUN_RULE_ID, 0),
+            'changed_rows': changed_rows,
+            'samples': samples,
+            'hit_counts': with_candidate['hit_counts'],
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        }
+    except Exception as e:
+        logger.error(f"خطأ في تجربة القاعدة الذكية: {e}")
+        return {'error': str(e)}
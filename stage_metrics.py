@@ -0,0 +1,212 @@
+"""
+وحدة قياس زمن مراحل المعالجة
+- مؤقتات لكل مرحلة (تنزيل، قراءة الوسوم، الاستبدال، كتابة الوسوم، الصورة المصغرة، الرفع، النشر...)
+- مدرجات تكرارية داخل الذاكرة لكل مرحلة وصيغة ملف وفئة حجم
+- حساب p50/p95/p99 والعدد للعرض في لوحة الإدارة وعبر واجهة JSON
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+
+# إعداد التسجيل
+logger = logging.getLogger('stage_metrics')
+
+# فئات حجم الملف (الحد الأعلى بالميجابايت، الاسم)
+SIZE_BUCKETS = [
+    (1, '<1MB'),
+    (5, '1-5MB'),
+    (20, '5-20MB'),
+    (50, '20-50MB'),
+    (float('inf'), '>50MB')
+]
+
+# القياسات: {(المسار، المرحلة، الصيغة، فئة الحجم): {'samples': deque, 'count': int, 'total': float, 'max': float}}
+_histograms = {}
+_lock = threading.Lock()
+_started_at = time.time()
+
+
+def get_size_bucket(size_bytes: Optional[int]) -> str:
+    """تحديد فئة حجم الملف"""
+    if not size_bytes:
+        return 'unknown'
+    size_mb = size_bytes / (1024 * 1024)
+    for limit, name in SIZE_BUCKETS:
+        if size_mb < limit:
+            return name
+    return SIZE_BUCKETS[-1][1]
+
+
+def get_file_format(file_path: Optional[str]) -> str:
+    """تحديد صيغة الملف من امتداده"""
+    if not file_path:
+        return 'unknown'
+    ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+    return ext or 'unknown'
+
+
+def record(stage: str, seconds: float, file_format: str = 'unknown', size_bytes: Optional[int] = None,
+           pipeline: str = 'channel'):
+    """
+    تسجيل زمن تنفيذ مرحلة
+
+    Args:
+        stage: اسم المرحلة
+        seconds: الزمن بالثواني
+        file_format: صيغة الملف
+        size_bytes: حجم الملف بالبايت
+        pipeline: مسار المعالجة ('channel' للقنوات، 'edit' لتعديل المستخدم)
+    """
+    key = (pipeline, stage, file_format or 'unknown', get_size_bucket(size_bytes))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {'samples': deque(maxlen=Config.STAGE_METRICS_WINDOW), 'count': 0, 'total': 0.0, 'max': 0.0}
+            _histograms[key] = histogram
+        histogram['samples'].append(seconds)
+        histogram['count'] += 1
+        histogram['total'] += seconds
+        histogram['max'] = max(histogram['max'], seconds)
+
+
+class StageTimer:
+    """
+    مؤقت لمرحلة واحدة، يستخدم كسياق (with) أو بالاستدعاء المباشر لـ stop()
+
+    إذا تم تمرير مسار الملف يتم تحديد الصيغة والحجم عند إيقاف المؤقت (بعد تنزيل الملف مثلاً).
+    """
+
+    def __init__(self, stage: str, file_path: str = None, file_format: str = None,
+                 size_bytes: int = None, pipeline: str = 'channel'):
+        self.stage = stage
+        self.file_path = file_path
+        self.file_format = file_format
+        self.size_bytes = size_bytes
+        self.pipeline = pipeline
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def stop(self) -> float:
+        """إيقاف المؤقت وتسجيل الزمن (مرة واحدة فقط)"""
+        if self.elapsed is not None:
+            return self.elapsed
+        self.elapsed = time.perf_counter() - self.started
+        try:
+            file_format = self.file_format or get_file_format(self.file_path)
+            size_bytes = self.size_bytes
+            if size_bytes is None and self.file_path and os.path.exists(self.file_path):
+                size_bytes = os.path.getsize(self.file_path)
+            record(self.stage, self.elapsed, file_format, size_bytes, self.pipeline)
+        except Exception as e:
+            logger.error(f"خطأ في تسجيل زمن المرحلة {self.stage}: {e}")
+        return self.elapsed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def stage_timer(stage: str, file_path: str = None, file_format: str = None,
+                size_bytes: int = None, pipeline: str = 'channel') -> StageTimer:
+    """
+    إنشاء مؤقت مرحلة
+
+    مثال:
+        with stage_timer('tag_write', file_path):
+            set_audio_tags(file_path, tags)
+    """
+    return StageTimer(stage, file_path, file_format, size_bytes, pipeline)
+
+
+def record_overlap(task_seconds: float, wait_seconds: float, file_path: str = None,
+                   size_bytes: int = None, pipeline: str = 'channel'):
+    """
+    تسجيل مقدار التداخل المحقق لمهمة تعمل بالتوازي (مثل تجهيز الصورة المصغرة أثناء كتابة الوسوم)
+
+    Args:
+        task_seconds: زمن تنفيذ المهمة المتوازية
+        wait_seconds: الزمن الذي انتظره المسار الرئيسي حتى انتهاء المهمة
+        file_path: مسار الملف (لتحديد الصيغة والحجم)
+        size_bytes: حجم الملف بالبايت
+        pipeline: مسار المعالجة
+    """
+    file_format = get_file_format(file_path)
+    if size_bytes is None and file_path and os.path.exists(file_path):
+        size_bytes = os.path.getsize(file_path)
+    record('thumbnail_wait', wait_seconds, file_format, size_bytes, pipeline)
+    record('overlap_saved', max(task_seconds - wait_seconds, 0.0), file_format, size_bytes, pipeline)
+
+
+def _percentile(sorted_samples: List[float], percent: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    # طريقة الرتبة الأقرب (nearest-rank)
+    index = min(len(sorted_samples) - 1, max(0, math.ceil(percent / 100.0 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def get_snapshot(group_by: Tuple[str, ...] = ('pipeline', 'stage')) -> List[Dict]:
+    """
+    الحصول على ملخص القياسات مجمعة حسب الحقول المطلوبة
+
+    Args:
+        group_by: الحقول المستخدمة للتجميع من ('pipeline', 'stage', 'format', 'size_bucket')
+
+    Returns:
+        list: قائمة قواميس تحتوي على الحقول والعدد وp50/p95/p99 والمتوسط والحد الأقصى (بالميلي ثانية)
+    """
+    fields = ('pipeline', 'stage', 'format', 'size_bucket')
+    groups = {}
+    with _lock:
+        for key, histogram in _histograms.items():
+            labels = dict(zip(fields, key))
+            group_key = tuple(labels[field] for field in group_by)
+            group = groups.setdefault(group_key, {'samples': [], 'count': 0, 'total': 0.0, 'max': 0.0})
+            group['samples'].extend(histogram['samples'])
+            group['count'] += histogram['count']
+            group['total'] += histogram['total']
+            group['max'] = max(group['max'], histogram['max'])
+
+    result = []
+    for group_key, group in sorted(groups.items()):
+        samples = sorted(group['samples'])
+        entry = dict(zip(group_by, group_key))
+        entry.update({
+            'count': group['count'],
+            'p50_ms': round(_percentile(samples, 50) * 1000, 1),
+            'p95_ms': round(_percentile(samples, 95) * 1000, 1),
+            'p99_ms': round(_percentile(samples, 99) * 1000, 1),
+            'mean_ms': round(group['total'] / group['count'] * 1000, 1) if group['count'] else 0.0,
+            'max_ms': round(group['max'] * 1000, 1)
+        })
+        result.append(entry)
+    return result
+
+
+def get_metrics_report() -> Dict:
+    """الحصول على تقرير كامل للقياسات (لواجهة JSON)"""
+    return {
+        'since': _started_at,
+        'window': Config.STAGE_METRICS_WINDOW,
+        'by_stage': get_snapshot(('pipeline', 'stage')),
+        'by_format': get_snapshot(('pipeline', 'stage', 'format')),
+        'by_size_bucket': get_snapshot(('pipeline', 'stage', 'size_bucket'))
+    }
+
+
+def reset():
+    """مسح جميع القياسات"""
+    global _started_at
+    with _lock:
+        _histograms.clear()
+        _started_at = time.time()
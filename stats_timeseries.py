@@ -0,0 +1,239 @@
+"""
+وحدة السلاسل الزمنية لإحصائيات المعالجة
+- عدادات لكل دقيقة (الملفات، البيانات، الإخفاقات، مجموع زمن المعالجة) تجمع في نفس الوقت في ساعات وأيام
+- كل دقة محفوظة في حلقة بحجم ثابت: آخر 24 ساعة بالدقائق، آخر 14 يوماً بالساعات، آخر سنة بالأيام
+- الاستعلام يمر على عدد ثابت من الخانات مهما طالت مدة التشغيل
+- حفظ مضغوط (الخانات غير الفارغة فقط) في ملف JSON بشكل دوري وعند الإيقاف
+"""
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from config import Config
+
+# إعداد التسجيل
+logger = logging.getLogger('stats_timeseries')
+
+# ملف حفظ السلاسل الزمنية
+TIMESERIES_FILE = 'stats_timeseries.json'
+
+# الدقات: {الاسم: (طول الخانة بالثواني، عدد الخانات)}
+RESOLUTIONS = {
+    'minute': (60, 24 * 60),
+    'hour': (3600, 14 * 24),
+    'day': (86400, 366)
+}
+
+# حقول كل خانة بعد رقم الخانة
+FIELDS = ('files', 'bytes', 'failures', 'latency_sum')
+
+
+class _Ring:
+    """حلقة خانات بحجم ثابت: كل خانة [رقم الخانة، الملفات، البيانات، الإخفاقات، مجموع الزمن]"""
+
+    __slots__ = ('seconds', 'slots')
+
+    def __init__(self, seconds: int, size: int):
+        self.seconds = seconds
+        self.slots = [None] * size
+
+    def _slot(self, bucket: int) -> Optional[list]:
+        index = bucket % len(self.slots)
+        slot = self.slots[index]
+        if slot is not None and slot[0] > bucket:
+            # وقت أقدم من مدى الحلقة
+            return None
+        if slot is None or slot[0] != bucket:
+            # خانة قديمة من دورة سابقة للحلقة
+            slot = self.slots[index] = [bucket, 0, 0, 0, 0.0]
+        return slot
+
+    def add(self, timestamp: float, files: int, size_bytes: int, failures: int, seconds: float):
+        slot = self._slot(int(timestamp // self.seconds))
+        if slot is None:
+            return
+        slot[1] += files
+        slot[2] += size_bytes
+        slot[3] += failures
+        slot[4] += seconds
+
+    def series(self, now: float, count: int) -> List[Dict]:
+        """آخر count خانة من الأقدم إلى الأحدث (الخانات الفارغة بقيم صفرية)"""
+        count = min(count, len(self.slots))
+        current = int(now // self.seconds)
+        result = []
+        for bucket in range(current - count + 1, current + 1):
+            slot = self.slots[bucket % len(self.slots)]
+            values = slot[1:] if slot is not None and slot[0] == bucket else [0, 0, 0, 0.0]
+            point = {'time': bucket * self.seconds}
+            point.update(zip(FIELDS, values))
+            result.append(point)
+        return result
+
+
+_rings = {name: _Ring(seconds, size) for name, (seconds, size) in RESOLUTIONS.items()}
+_lock = threading.Lock()
+_loaded = False
+_dirty = False
+_flusher = None
+
+
+def _ensure_loaded():
+    """تحميل السلاسل المحفوظة (مرة واحدة، يستدعى مع القفل)"""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    if not os.path.exists(TIMESERIES_FILE):
+        return
+    try:
+        with open(TIMESERIES_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for name, slots in data.items():
+            ring = _rings.get(name)
+            if ring is None:
+                continue
+            for slot in slots:
+                ring.slots[slot[0] % len(ring.slots)] = list(slot)
+    except Exception as e:
+        logger.error(f"خطأ في تحميل السلاسل الزمنية للإحصائيات: {e}")
+
+
+def record(success: bool = True, size_bytes: int = 0, seconds: float = 0.0, timestamp: float = None):
+    """
+    تسجيل معالجة ملف واحد في جميع الدقات
+
+    Args:
+        success: هل نجحت المعالجة
+        size_bytes: حجم الملف بالبايت
+        seconds: زمن المعالجة بالثواني
+        timestamp: وقت المعالجة (الوقت الحالي افتراضياً)
+    """
+    global _dirty
+    timestamp = time.time() if timestamp is None else timestamp
+    failures = 0 if success else 1
+    with _lock:
+        _ensure_loaded()
+        for ring in _rings.values():
+            ring.add(timestamp, 1, size_bytes or 0, failures, seconds or 0.0)
+        _dirty = True
+    _ensure_flusher()
+
+
+def get_series(resolution: str = 'minute', count: int = 60) -> List[Dict]:
+    """
+    الحصول على آخر خانات دقة معينة
+
+    Args:
+        resolution: الدقة (minute أو hour أو day)
+        count: عدد الخانات (لا يتجاوز حجم الحلقة)
+
+    Returns:
+        list: [{'time', 'files', 'bytes', 'failures', 'latency_sum'}] من الأقدم إلى الأحدث
+    """
+    ring = _rings.get(resolution)
+    if ring is None:
+        return []
+    with _lock:
+        _ensure_loaded()
+        return ring.series(time.time(), count)
+
+
+def get_summary(resolution: str = 'minute', count: int = 60) -> Dict:
+    """
+    ملخص آخر خانات دقة معينة
+
+    Returns:
+        dict: الملفات والبيانات والإخفاقات ومتوسط زمن المعالجة ومعدل الملفات لكل خانة
+    """
+    series = get_series(resolution, count)
+    files = sum(point['files'] for point in series)
+    latency_sum = sum(point['latency_sum'] for point in series)
+    return {
+        'resolution': resolution,
+        'buckets': len(series),
+        'files': files,
+        'bytes': sum(point['bytes'] for point in series),
+        'failures': sum(point['failures'] for point in series),
+        'avg_latency': latency_sum / files if files else 0.0,
+        'files_per_bucket': files / len(series) if series else 0.0
+    }
+
+
+def get_daily_report(day_offset: int = 1) -> Dict:
+    """
+    تقرير يوم كامل من حلقة الأيام
+
+    Args:
+        day_offset: 0 لليوم الحالي، 1 لليوم السابق...
+
+    Returns:
+        dict: وقت بداية اليوم، والملفات والبيانات والإخفاقات ومتوسط الزمن، وساعة الذروة
+    """
+    series = get_series('day', day_offset + 1)
+    point = series[0] if series else {'time': 0, 'files': 0, 'bytes': 0, 'failures': 0, 'latency_sum': 0.0}
+    day_start = point['time']
+    hours = [hour for hour in get_series('hour', 24 * (day_offset + 1))
+             if day_start <= hour['time'] < day_start + 86400]
+    peak = max(hours, key=lambda hour: hour['files'], default=None)
+    return {
+        'day_start': day_start,
+        'files': point['files'],
+        'bytes': point['bytes'],
+        'failures': point['failures'],
+        'avg_latency': point['latency_sum'] / point['files'] if point['files'] else 0.0,
+        'peak_hour': peak['time'] if peak and peak['files'] else None,
+        'peak_hour_files': peak['files'] if peak else 0
+    }
+
+
+def flush() -> bool:
+    """
+    حفظ السلاسل في الملف (الخانات غير الفارغة فقط) بشكل ذري
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return True
+        data = {name: [slot for slot in ring.slots if slot is not None and any(slot[1:])]
+                for name, ring in _rings.items()}
+        _dirty = False
+    try:
+        temp_path = TIMESERIES_FILE + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temp_path, TIMESERIES_FILE)
+        return True
+    except Exception as e:
+        logger.error(f"خطأ في حفظ السلاسل الزمنية للإحصائيات: {e}")
+        with _lock:
+            _dirty = True
+        return False
+
+
+def _flush_loop():
+    """خيط الحفظ في الخلفية كل STATS_TIMESERIES_FLUSH_SECONDS"""
+    while True:
+        time.sleep(Config.STATS_TIMESERIES_FLUSH_SECONDS)
+        flush()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name="stats-timeseries-flusher", daemon=True)
+                _flusher.start()
+
+
+# حفظ السلاسل عند إيقاف البوت
+atexit.register(flush)
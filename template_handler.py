@@ -8,6 +8,8 @@ import time
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional, Any
 
+from text_normalizer import normalize
+
 # إعداد التسجيل
 logger = logging.getLogger(__name__)
 
@@ -142,7 +144,7 @@ def list_templates(filter_artist=None):
                 }
                 
                 # تصفية حسب الفنان إذا تم تحديده
-                if not filter_artist or filter_artist.lower() == template_info["artist"].lower():
+                if not filter_artist or normalize(filter_artist) == normalize(template_info["artist"]):
                     templates.append(template_info)
             except Exception as e:
                 logger.error(f"خطأ في قراءة معلومات القالب {file}: {e}")
@@ -0,0 +1,13 @@
+"""
+إعداد بيئة الاختبارات
+- قاعدة بيانات SQLite في الذاكرة بدلاً من DATABASE_URL
+- مجلد عمل مؤقت حتى لا تكتب الوحدات السجلات وملفات الإدارة داخل المستودع
+"""
+
+import os
+import tempfile
+
+
+def pytest_sessionstart(session):
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.chdir(tempfile.mkdtemp(prefix='musictag-tests-'))
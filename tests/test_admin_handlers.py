@@ -0,0 +1,29 @@
+"""اختبارات رسائل حالة لوحة الإدارة"""
+
+import admin_handlers
+
+
+def make_broadcast(broadcast_id, state):
+    return {'id': broadcast_id, 'state': state, 'text': 'hello', 'done': 1, 'total': 10, 'percent': 10.0,
+            'sent_count': 1, 'failed_count': 0, 'blocked_count': 0, 'skipped_count': 0, 'rate_per_second': 1.0}
+
+
+def callbacks(markup):
+    return [button.callback_data for row in markup.keyboard for button in row]
+
+
+def test_broadcast_status_renders_requested_state(monkeypatch):
+    monkeypatch.setattr(admin_handlers.broadcaster, 'list_broadcasts',
+                        lambda limit=5: [make_broadcast(3, 'running')])
+
+    text, markup = admin_handlers.get_broadcast_status_message()
+    assert 'admin_broadcast_pause_3' in callbacks(markup)
+
+    # العامل ما زال يحفظ الحالة running حتى ينهي الرسائل الجارية
+    text, markup = admin_handlers.get_broadcast_status_message({3: 'paused'})
+    assert admin_handlers.BROADCAST_STATE_LABELS['paused'] in text
+    assert 'admin_broadcast_resume_3' in callbacks(markup)
+    assert 'admin_broadcast_pause_3' not in callbacks(markup)
+
+    text, markup = admin_handlers.get_broadcast_status_message({3: 'cancelled'})
+    assert not [data for data in callbacks(markup) if data.endswith('_3')]
@@ -0,0 +1,217 @@
+"""اختبارات المعالجة الرجعية: نقطة التقدم والاستكمال والتخطي وإعادة المحاولة"""
+
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import backfill
+
+
+class FakeApiError(Exception):
+    """خطأ تيليجرام مبسط بنفس خصائص ApiTelegramException"""
+
+    def __init__(self, error_code, description, retry_after=None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.result_json = {'parameters': {'retry_after': retry_after}} if retry_after is not None else {}
+
+
+class FakeBot:
+    """بوت وهمي: الرسائل الصوتية في audio_ids، والأخطاء المبرمجة في errors {رقم الرسالة: [أخطاء متتالية]}"""
+
+    def __init__(self, audio_ids, errors=None):
+        self.audio_ids = set(audio_ids)
+        self.errors = errors or {}
+        self.forwarded = []
+        self.deleted = []
+        self._next_id = 1000
+
+    def forward_message(self, chat_id, from_chat_id, message_id, disable_notification=False):
+        self.forwarded.append(message_id)
+        pending = self.errors.get(message_id)
+        if pending:
+            raise pending.pop(0)
+        self._next_id += 1
+        audio = SimpleNamespace(file_id=f"file-{message_id}") if message_id in self.audio_ids else None
+        return SimpleNamespace(message_id=self._next_id, audio=audio)
+
+    def delete_message(self, chat_id, message_id):
+        self.deleted.append(message_id)
+
+    def get_chat(self, chat_id):
+        return SimpleNamespace(id=chat_id, type='channel')
+
+
+class FakeProcessor:
+    """دالة معالجة وهمية تفشل للرسائل المحددة في fail_times {رقم الرسالة: عدد مرات الفشل}"""
+
+    def __init__(self, fail_times=None):
+        self.fail_times = dict(fail_times or {})
+        self.calls = []
+
+    def __call__(self, bot, message):
+        self.calls.append(message.message_id)
+        if self.fail_times.get(message.message_id, 0) > 0:
+            self.fail_times[message.message_id] -= 1
+            return False
+        return True
+
+
+def make_job(tmp_path, bot, processor, start_id=1, end_id=10, **kwargs):
+    kwargs.setdefault('workers', 1)
+    kwargs.setdefault('retry_seconds', 0)
+    return backfill.BackfillJob(bot, '@source', start_id, end_id, scratch_chat='1',
+                                rate_per_minute=60000, processor=processor,
+                                checkpoint_file=str(tmp_path / 'checkpoint.json'), **kwargs)
+
+
+def run(job):
+    job.start()
+    job.join(timeout=10)
+    assert not job.is_running()
+    # انتظار خيط المراقبة الذي يكتب الحالة النهائية ونقطة التقدم
+    for thread in threading.enumerate():
+        if thread.name == 'backfill-monitor':
+            thread.join(timeout=10)
+
+
+def test_skips_only_missing_and_non_audio_messages(tmp_path):
+    not_found = {3: [FakeApiError(400, 'Bad Request: message to forward not found')]}
+    bot = FakeBot(audio_ids=[1, 2, 4], errors=not_found)
+    processor = FakeProcessor()
+    job = make_job(tmp_path, bot, processor, end_id=5)
+
+    run(job)
+
+    assert job.status == 'completed'
+    assert sorted(processor.calls) == [1, 2, 4]
+    assert job.stats == {'processed': 3, 'skipped': 2, 'failed': 0}
+    assert job.watermark == 6
+    assert job.failed_ids == {}
+    # الرسائل المؤقتة تحذف من المحادثة المؤقتة
+    assert len(bot.deleted) == 4
+
+
+def test_processing_failures_are_retried_not_marked_done(tmp_path):
+    bot = FakeBot(audio_ids=range(1, 6))
+    processor = FakeProcessor(fail_times={2: 1, 4: 5})
+    job = make_job(tmp_path, bot, processor, end_id=5, max_attempts=3)
+
+    run(job)
+
+    # الرسالة 2 نجحت في المحاولة الثانية، والرسالة 4 بقيت في مجموعة إعادة المحاولة
+    assert processor.calls.count(2) == 2
+    assert processor.calls.count(4) == 3
+    assert job.failed_ids == {4: 3}
+    assert job.stats['processed'] == 4
+    assert job.stats['failed'] == 1
+    status = job.get_status()
+    assert status['done'] == 4
+    assert status['remaining'] == 1
+
+
+def test_rate_limit_pauses_and_retries_without_counting_attempt(tmp_path):
+    errors = {2: [FakeApiError(429, 'Too Many Requests: retry after 0', retry_after=0),
+                  FakeApiError(429, 'Too Many Requests: retry after 0', retry_after=0)]}
+    bot = FakeBot(audio_ids=range(1, 4), errors=errors)
+    processor = FakeProcessor()
+    job = make_job(tmp_path, bot, processor, end_id=3, max_attempts=1)
+
+    run(job)
+
+    assert bot.forwarded.count(2) == 3
+    assert sorted(processor.calls) == [1, 2, 3]
+    assert job.failed_ids == {}
+
+
+def test_transient_errors_are_retried(tmp_path):
+    errors = {1: [FakeApiError(500, 'Internal Server Error')]}
+    bot = FakeBot(audio_ids=[1], errors=errors)
+    processor = FakeProcessor()
+    job = make_job(tmp_path, bot, processor, end_id=1)
+
+    run(job)
+
+    assert processor.calls == [1]
+    assert job.stats['processed'] == 1
+    assert job.failed_ids == {}
+
+
+def test_checkpoint_round_trip_and_resume(tmp_path):
+    bot = FakeBot(audio_ids=range(1, 11))
+    processor = FakeProcessor(fail_times={3: 10})
+    job = make_job(tmp_path, bot, processor, end_id=10, max_attempts=1, pipeline_id='news')
+    run(job)
+    job.save_checkpoint()
+
+    with open(tmp_path / 'checkpoint.json', encoding='utf-8') as f:
+        data = json.load(f)
+    assert data['watermark'] == 11
+    assert data['failed_ids'] == {'3': 1}
+    assert data['pipeline_id'] == 'news'
+
+    # الاستكمال يعيد محاولة الرسائل الفاشلة فقط
+    processor.fail_times = {}
+    processor.calls = []
+    restored = backfill.BackfillJob.from_checkpoint(bot, str(tmp_path / 'checkpoint.json'),
+                                                    processor=processor, rate_per_minute=60000,
+                                                    workers=1, retry_seconds=0)
+    assert restored.pipeline_id == 'news'
+    assert restored.failed_ids == {3: 1}
+    run(restored)
+
+    assert processor.calls == [3]
+    assert restored.failed_ids == {}
+    assert restored.stats['processed'] == 10
+    assert restored.get_status()['done'] == 10
+
+
+def test_resume_continues_from_watermark(tmp_path):
+    checkpoint = tmp_path / 'checkpoint.json'
+    checkpoint.write_text(json.dumps({
+        'source_chat': '@source', 'start_id': 1, 'end_id': 8, 'scratch_chat': '1',
+        'watermark': 4, 'done_ids': [6], 'failed_ids': {},
+        'stats': {'processed': 4, 'skipped': 0, 'failed': 0}, 'status': 'stopped'
+    }), encoding='utf-8')
+    bot = FakeBot(audio_ids=range(1, 9))
+    processor = FakeProcessor()
+    job = backfill.BackfillJob.from_checkpoint(bot, str(checkpoint), processor=processor,
+                                               rate_per_minute=60000, workers=2)
+
+    run(job)
+
+    assert sorted(processor.calls) == [4, 5, 7, 8]
+    assert job.watermark == 9
+    assert job.stats['processed'] == 8
+
+
+def test_stop_keeps_unprocessed_messages_for_resume(tmp_path):
+    bot = FakeBot(audio_ids=range(1, 6))
+    job = make_job(tmp_path, bot, None, end_id=5)
+
+    def processor(bot, message):
+        if message.message_id == 2:
+            job.stop()
+        return True
+
+    job.processor = processor
+    run(job)
+
+    assert job.status == 'stopped'
+    assert job.watermark == 3
+    restored = backfill.BackfillJob.from_checkpoint(bot, str(tmp_path / 'checkpoint.json'))
+    assert restored.watermark == 3
+
+
+@pytest.mark.parametrize('error, expected', [
+    (FakeApiError(400, 'Bad Request: message to forward not found'), True),
+    (FakeApiError(400, 'Bad Request: MESSAGE_ID_INVALID'), True),
+    (FakeApiError(400, "Bad Request: message can't be forwarded"), False),
+    (FakeApiError(429, 'Too Many Requests'), False),
+    (ConnectionError('reset'), False),
+])
+def test_not_found_classification(error, expected):
+    assert backfill._is_not_found_error(error) is expected
@@ -0,0 +1,118 @@
+"""اختبارات سجل العمليات المقسم: التدوير والفهارس والتصفح بالمؤشر والاحتفاظ"""
+
+import time
+
+import pytest
+
+import oplog
+
+
+@pytest.fixture(autouse=True)
+def oplog_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(oplog, 'OPLOG_DIR', str(tmp_path / 'oplog'))
+    monkeypatch.setattr(oplog.Config, 'OPLOG_SEGMENT_SECONDS', 3600)
+    monkeypatch.setattr(oplog.Config, 'OPLOG_RETENTION_DAYS', 7)
+
+    def reset():
+        oplog._close_writer()
+        oplog._segments.clear()
+        oplog._segment_starts.clear()
+        oplog._loaded = False
+
+    reset()
+    yield tmp_path / 'oplog'
+    reset()
+
+
+def reload():
+    """محاكاة إعادة التشغيل: بناء الفهارس من الملفات"""
+    oplog._close_writer()
+    oplog._segments.clear()
+    oplog._segment_starts.clear()
+    oplog._loaded = False
+
+
+def fill(base, count=25):
+    # السجلات موزعة على ثلاثة مقاطع (ساعة لكل مقطع)
+    for i in range(count):
+        oplog.append(i % 3, 'edit' if i % 2 else 'upload', 'failed' if i % 5 == 0 else 'success',
+                     f"#{i}", timestamp=base + i * 500)
+
+
+def page_through(**filters):
+    details, cursor = [], None
+    while True:
+        entries, cursor = oplog.query(limit=4, cursor=cursor, **filters)
+        details += [entry['details'] for entry in entries]
+        if cursor is None:
+            return details
+
+
+def test_segments_rotate_by_period(oplog_dir):
+    base = oplog._segment_start(time.time()) - 3 * 3600
+    fill(base)
+    assert len(oplog._segments) == 4
+    assert len(list(oplog_dir.iterdir())) == 4
+
+
+def test_paging_returns_newest_first_without_gaps():
+    base = oplog._segment_start(time.time()) - 3 * 3600
+    fill(base)
+    assert page_through() == [f"#{i}" for i in range(24, -1, -1)]
+
+
+def test_paging_with_filters_crosses_segments():
+    base = oplog._segment_start(time.time()) - 3 * 3600
+    fill(base)
+    expected = [f"#{i}" for i in range(24, -1, -1) if i % 3 == 1 and i % 2 == 1]
+    assert page_through(user_id=1, action='edit') == expected
+    expected = [f"#{i}" for i in range(24, -1, -1) if i % 5 == 0 and i % 3 in (0, 2)]
+    assert page_through(user_id=[0, 2], status='failed') == expected
+    assert page_through(action='missing') == []
+
+
+def test_indexes_are_rebuilt_after_restart_and_partial_line_dropped(oplog_dir):
+    base = oplog._segment_start(time.time())
+    oplog.append(1, 'edit', timestamp=base + 1)
+    oplog.append(2, 'edit', timestamp=base + 2)
+    reload()
+    path = oplog._segment_path(base)
+    with open(path, 'ab') as f:
+        f.write(b'{"time": 3, "user_')
+
+    entries, cursor = oplog.query(action='edit')
+    assert [entry['user_id'] for entry in entries] == [2, 1]
+    assert cursor is None
+    # يضاف السجل التالي بعد حذف السطر غير المكتمل
+    oplog.append(3, 'edit', timestamp=base + 3)
+    reload()
+    assert [entry['user_id'] for entry in oplog.query()[0]] == [3, 2, 1]
+
+
+def test_retention_removes_old_segments(oplog_dir, monkeypatch):
+    now = time.time()
+    oplog.append(1, 'old', timestamp=now - 6 * 86400)
+    oplog.append(1, 'new', timestamp=now - 86400)
+    assert len(list(oplog_dir.iterdir())) == 2
+
+    # تقليل مدة الاحتفاظ: يحذف المقطع القديم عند التدوير التالي
+    monkeypatch.setattr(oplog.Config, 'OPLOG_RETENTION_DAYS', 5)
+    oplog.append(1, 'latest', timestamp=now)
+    assert [entry['action'] for entry in oplog.query()[0]] == ['latest', 'new']
+    assert len(list(oplog_dir.iterdir())) == 2
+
+
+def test_entries_older_than_retention_are_not_written(oplog_dir):
+    assert not oplog.append(1, 'ancient', timestamp=time.time() - 30 * 86400)
+    assert list(oplog_dir.iterdir()) == []
+    assert oplog.query() == ([], None)
+
+
+def test_import_merges_sorted_and_skips_duplicates():
+    base = oplog._segment_start(time.time())
+    oplog.append(1, 'edit', timestamp=base + 10)
+    imported = [{'time': base + 5, 'user_id': 2, 'action': 'edit', 'status': 'success', 'details': ''},
+                {'time': base + 10, 'user_id': 1, 'action': 'edit', 'status': 'success', 'details': ''}]
+    assert oplog.import_entries(imported) == 1
+    assert [entry['user_id'] for entry in oplog.iter_entries()] == [2, 1]
+    assert [entry['user_id'] for entry in oplog.query(user_id=2)[0]] == [2]
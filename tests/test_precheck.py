@@ -0,0 +1,59 @@
+"""اختبارات الفحص المسبق لبيانات تيليجرام قبل تنزيل ملفات القنوات"""
+
+from types import SimpleNamespace
+
+import auto_processor
+
+
+def make_context(**overrides):
+    context = {
+        'replacements': {},
+        'enabled_tags': {'title': True, 'artist': True},
+        'smart_templates': {},
+        'templates': {},
+        'remove_links': False,
+        'keep_caption': True,
+        'footer_enabled': False,
+        'footer_text': '',
+        'footer_tag_settings': {},
+        'fingerprint': 'test',
+    }
+    context.update(overrides)
+    return context
+
+
+AUDIO = SimpleNamespace(title='Song', performer='Singer')
+
+
+def test_no_change_when_replacement_does_not_touch_visible_tags():
+    context = make_context(replacements={'@spam': ''})
+    assert auto_processor.get_change_reason(AUDIO, None, context) is None
+
+
+def test_visible_tag_change_is_detected():
+    context = make_context(replacements={'Singer': 'Artist'})
+    assert auto_processor.get_change_reason(AUDIO, None, context) == 'artist'
+
+
+def test_unlisted_file_only_tags_do_not_force_download():
+    context = make_context(replacements={'@spam': ''}, remove_links=True)
+    assert auto_processor.get_file_only_targets(context['enabled_tags'], context['replacements'], True) == []
+    assert auto_processor.get_change_reason(AUDIO, None, context) is None
+
+
+def test_enabled_text_tag_forces_download():
+    context = make_context(replacements={'@spam': ''},
+                           enabled_tags={'title': True, 'artist': True, 'comment': True, 'album': False})
+    assert auto_processor.get_change_reason(AUDIO, None, context) == 'file_only_tags'
+
+
+def test_numeric_tags_only_targeted_by_numeric_replacements():
+    enabled = {'year': True, 'track': True}
+    assert auto_processor.get_file_only_targets(enabled, {'feat.': 'ft.'}, True) == []
+    assert auto_processor.get_file_only_targets(enabled, {'2020': '2021'}, False) == ['year', 'track']
+
+
+def test_caption_and_footer_still_force_processing():
+    assert auto_processor.get_change_reason(AUDIO, 'old caption', make_context(keep_caption=False)) == 'caption'
+    context = make_context(footer_enabled=True, footer_text='@channel')
+    assert auto_processor.get_change_reason(AUDIO, None, context) == 'footer'
@@ -0,0 +1,62 @@
+"""اختبارات حصص الاستخدام اليومي: الحجز والتأكيد والإرجاع"""
+
+import pytest
+
+import quota
+
+
+@pytest.fixture(autouse=True)
+def limit(monkeypatch):
+    settings = {'limit': 10.0}
+    monkeypatch.setattr(quota, '_daily_limit', lambda: settings['limit'])
+    monkeypatch.setattr(quota, '_load_usage', lambda user_id, day: 0.0)
+    monkeypatch.setattr(quota, '_ensure_flusher', lambda: None)
+    quota.reset()
+    yield settings
+    quota.reset()
+
+
+def test_reservations_count_against_the_limit():
+    first = quota.reserve(1, 6)
+    assert first is not None
+    # الحجز غير المؤكد يمنع تجاوز الحد بملف متزامن آخر
+    assert quota.reserve(1, 6) is None
+    assert quota.get_usage(1) == (0.0, 6.0)
+
+
+def test_commit_uses_actual_size():
+    reservation = quota.reserve(1, 6)
+    assert quota.commit(reservation, 2.5)
+    assert quota.get_usage(1) == (2.5, 0.0)
+    # الحجز يؤكد مرة واحدة فقط
+    assert not quota.commit(reservation, 2.5)
+    assert not quota.refund(reservation)
+    assert quota.get_usage(1) == (2.5, 0.0)
+
+
+def test_refund_releases_reservation():
+    reservation = quota.reserve(1, 8)
+    assert quota.reserve(1, 4) is None
+    assert quota.refund(reservation)
+    assert quota.get_usage(1) == (0.0, 0.0)
+    assert quota.reserve(1, 4) is not None
+
+
+def test_unlimited_when_limit_is_zero(limit):
+    limit['limit'] = 0
+    assert quota.reserve(1, 1000) is not None
+    assert quota.check(1, 10 ** 6)
+
+
+def test_new_day_starts_with_empty_counter(monkeypatch):
+    quota.commit(quota.reserve(1, 9), 9)
+    assert not quota.check(1, 2)
+    today = quota._today()
+    monkeypatch.setattr(quota, '_today', lambda: today + 1)
+    assert quota.check(1, 2)
+    assert quota.get_usage(1) == (0.0, 0.0)
+
+
+def test_users_are_independent():
+    quota.commit(quota.reserve(1, 9), 9)
+    assert quota.reserve(2, 9) is not None
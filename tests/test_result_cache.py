@@ -0,0 +1,109 @@
+"""اختبارات التخزين المؤقت لنتائج المعالجة: البصمة والتخزين والاسترجاع وانتهاء الصلاحية والحفظ"""
+
+from collections import OrderedDict
+
+import pytest
+
+from config import Config
+import auto_processor
+import result_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(result_cache, '_cache', OrderedDict())
+    monkeypatch.setattr(result_cache, '_stats', {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0})
+    monkeypatch.setattr(result_cache, '_dirty', False)
+    monkeypatch.setattr(result_cache, 'RESULT_CACHE_FILE', str(tmp_path / 'result_cache.json'))
+    # عدم تشغيل خيط الحفظ في الخلفية أثناء الاختبارات
+    monkeypatch.setattr(result_cache, '_flusher', object())
+    monkeypatch.setattr(Config, 'RESULT_CACHE_ENABLED', True)
+
+
+def test_fingerprint_ignores_dict_order_but_not_values():
+    first = result_cache.compute_fingerprint({'a': 1, 'b': 2}, True)
+    assert first == result_cache.compute_fingerprint({'b': 2, 'a': 1}, True)
+    assert first != result_cache.compute_fingerprint({'a': 1, 'b': 3}, True)
+    assert first != result_cache.compute_fingerprint({'a': 1, 'b': 2}, False)
+    assert first != result_cache.compute_fingerprint({'a': 1, 'b': 2}, True, None)
+
+
+def test_fingerprint_handles_bytes_and_sets():
+    picture = result_cache.compute_fingerprint({'picture': b'\x89PNG'})
+    assert picture == result_cache.compute_fingerprint({'picture': bytearray(b'\x89PNG')})
+    assert picture != result_cache.compute_fingerprint({'picture': b'\x89PNG2'})
+    assert result_cache.compute_fingerprint({'b', 'a'}) == result_cache.compute_fingerprint({'a', 'b'})
+
+
+def test_transform_fingerprint_ignores_footer_text_when_disabled(monkeypatch):
+    footer = {'enabled': False, 'text': 'one'}
+    monkeypatch.setattr(auto_processor, 'get_smart_templates', lambda pipeline=None: {})
+    monkeypatch.setattr(auto_processor, 'get_tag_replacements', lambda pipeline=None: {'x': 'y'})
+    monkeypatch.setattr(auto_processor, 'should_remove_links', lambda pipeline=None: False)
+    monkeypatch.setattr(auto_processor, 'get_enabled_tags', lambda pipeline=None: {'artist': True})
+    monkeypatch.setattr(auto_processor, 'get_footer_tag_settings', lambda pipeline=None: {'comment': True})
+    monkeypatch.setattr(auto_processor, 'should_add_footer', lambda pipeline=None: footer['enabled'])
+    monkeypatch.setattr(auto_processor, 'get_tag_footer', lambda pipeline=None: footer['text'])
+
+    disabled = auto_processor.get_transform_fingerprint()
+    footer['text'] = 'two'
+    assert auto_processor.get_transform_fingerprint() == disabled
+
+    footer['enabled'] = True
+    enabled = auto_processor.get_transform_fingerprint()
+    assert enabled != disabled
+    footer['text'] = 'one'
+    assert auto_processor.get_transform_fingerprint() != enabled
+
+
+def test_store_then_get_round_trip():
+    assert result_cache.get_cached_result('unique', 'fp') is None
+    assert result_cache.store_result('unique', 'fp', 'file-1', title='Song')
+
+    entry = result_cache.get_cached_result('unique', 'fp')
+    assert entry['file_id'] == 'file-1' and entry['title'] == 'Song'
+    # بصمة مختلفة لنفس الملف لا تعيد النتيجة
+    assert result_cache.get_cached_result('unique', 'other') is None
+    assert result_cache.get_cache_stats()['hits'] == 1
+    assert result_cache.get_cache_stats()['misses'] == 2
+
+
+def test_store_requires_ids_and_enabled_cache(monkeypatch):
+    assert not result_cache.store_result('', 'fp', 'file-1')
+    assert not result_cache.store_result('unique', 'fp', '')
+    monkeypatch.setattr(Config, 'RESULT_CACHE_ENABLED', False)
+    assert not result_cache.store_result('unique', 'fp', 'file-1')
+    assert result_cache.get_cache_stats()['size'] == 0
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    monkeypatch.setattr(Config, 'RESULT_CACHE_MAX_ENTRIES', 2)
+    result_cache.store_result('a', 'fp', 'file-a')
+    result_cache.store_result('b', 'fp', 'file-b')
+    result_cache.get_cached_result('a', 'fp')
+    result_cache.store_result('c', 'fp', 'file-c')
+
+    assert result_cache.get_cached_result('b', 'fp') is None
+    assert result_cache.get_cached_result('a', 'fp')['file_id'] == 'file-a'
+    assert result_cache.get_cache_stats()['evictions'] == 1
+
+
+def test_expired_entries_are_not_returned():
+    result_cache.store_result('a', 'fp', 'file-a')
+    result_cache.store_result('b', 'fp', 'file-b')
+    result_cache._cache['a:fp']['created'] -= Config.RESULT_CACHE_TTL_DAYS * 86400 + 1
+
+    assert result_cache.purge_expired() == 1
+    result_cache._cache['b:fp']['created'] = 0
+    assert result_cache.get_cached_result('b', 'fp') is None
+    assert result_cache.get_cache_stats()['size'] == 0
+
+
+def test_save_and_load_round_trip():
+    result_cache.store_result('a', 'fp', 'file-a', duration=30)
+    assert result_cache.save_cache()
+
+    result_cache._cache.clear()
+    result_cache.load_cache()
+    assert result_cache.get_cached_result('a', 'fp') == result_cache._cache['a:fp']
+    assert result_cache._cache['a:fp']['duration'] == 30
@@ -0,0 +1,146 @@
+"""اختبارات محرك القواعد الذكية: التحقق من التعبيرات النمطية والفهارس وتنفيذ الإجراءات"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import rule_engine
+
+
+def make_rule(rule_id=1, field='artist', operator='contains', value='', action_type='replace',
+              action_field='artist', action_value='', priority=10):
+    return rule_engine.CompiledRule(SimpleNamespace(
+        id=rule_id, name=f"rule {rule_id}", description=None,
+        condition_field=field, condition_operator=operator, condition_value=value,
+        action_type=action_type, action_field=action_field, action_value=action_value,
+        priority=priority
+    ))
+
+
+@pytest.mark.parametrize('pattern', [
+    r'(a+)+$',
+    r'(a*)*b',
+    r'(\w+\s?)+$',
+    r'(a|a)*',
+    r'(a|aa)+',
+    r'(.*)\1',
+    r'(',
+    '',
+])
+def test_validator_rejects_dangerous_or_invalid_patterns(pattern):
+    assert rule_engine.validate_pattern(pattern) is not None
+    with pytest.raises(ValueError):
+        rule_engine.compile_pattern(pattern)
+
+
+@pytest.mark.parametrize('pattern', [
+    r'^remix$',
+    r'feat\.? \w+',
+    r'(live|remix)',
+    r'(ab|cd)+',
+    r'\d{1,4}',
+    r'(a{2}){3}',
+])
+def test_validator_accepts_safe_patterns(pattern):
+    assert rule_engine.validate_pattern(pattern) is None
+
+
+def test_validator_limits_pattern_length():
+    assert rule_engine.validate_pattern('a' * (rule_engine.Config.SMART_RULES_REGEX_MAX_LENGTH + 1)) is not None
+
+
+def test_regex_rule_matches_and_replaces():
+    rule = make_rule(operator='regex', value=r'\s*\(remix\)', action_value='')
+    assert rule.matches('song (remix)')
+    tags = {'artist': 'Song (Remix)'}
+    assert rule.apply_action(tags) == ['artist']
+    assert tags['artist'] == 'Song'
+
+
+def test_regex_match_is_limited_to_max_input():
+    rule = make_rule(operator='regex', value='needle')
+    limit = rule_engine.Config.SMART_RULES_REGEX_MAX_INPUT
+    assert rule.matches('x' * (limit - 6) + 'needle')
+    assert not rule.matches('x' * limit + 'needle')
+
+
+def test_rejected_regex_rule_is_skipped():
+    # نص التعبير المرفوض لا يعامل كنص حرفي في الاستبدال
+    rule = make_rule(operator='regex', value=r'(a+)+', action_value='b')
+    assert rule.pattern is None
+    assert not rule.matches('aaaa')
+    tags = {'artist': '(a+)+ aaaa'}
+    assert rule.apply_action(tags) == []
+    assert tags['artist'] == '(a+)+ aaaa'
+
+
+def test_field_index_matches_each_operator():
+    rules = [
+        make_rule(1, operator='equals', value='fairuz'),
+        make_rule(2, operator='starts_with', value='fai'),
+        make_rule(3, operator='ends_with', value='ruz'),
+        make_rule(4, operator='contains', value='iru'),
+        make_rule(5, operator='contains', value='umm'),
+        make_rule(6, operator='regex', value='^f.*z$'),
+    ]
+    index = rule_engine.FieldIndex()
+    for position, rule in enumerate(rules):
+        index.add(position, rule)
+    index.build()
+
+    assert index.match('fairuz') == {0, 1, 2, 3, 5}
+    assert index.match('umm kulthum') == {4}
+    assert index.match('other') == set()
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matcher = rule_engine._AhoCorasick()
+    for position, pattern in enumerate(['he', 'she', 'his', 'hers']):
+        matcher.add(pattern, position)
+    matcher.build()
+    matched = set()
+    matcher.search('ushers', matched)
+    assert matched == {0, 1, 3}
+
+
+def test_replace_uses_normalized_match_span():
+    rule = make_rule(operator='contains', value='احمد', action_value='Ahmed')
+    tags = {'artist': 'الفنان أحمَد  (live)'}
+    assert rule.matches(rule_engine.text_normalizer.normalize(tags['artist']))
+    assert rule.apply_action(tags) == ['artist']
+    assert tags['artist'] == 'الفنان Ahmed  (live)'
+
+
+def test_replace_across_whitespace_and_case():
+    rule = make_rule(operator='equals', value='Umm  Kulthum', action_field='*', action_value='أم كلثوم')
+    tags = {'artist': 'UMM KULTHUM', 'album': 'Best of Umm\tKulthum', 'year': 1970}
+    assert sorted(rule.apply_action(tags)) == ['album', 'artist']
+    assert tags == {'artist': 'أم كلثوم', 'album': 'Best of أم كلثوم', 'year': 1970}
+
+
+def test_replace_value_is_literal():
+    rule = make_rule(operator='contains', value='feat', action_value=r'\1 ft')
+    tags = {'artist': 'A feat B'}
+    rule.apply_action(tags)
+    assert tags['artist'] == r'A \1 ft B'
+
+
+def test_compile_rule_is_cached_per_definition():
+    rule = SimpleNamespace(id=7, name='r', description=None, condition_field='artist',
+                           condition_operator='contains', condition_value='x', action_type='set',
+                           action_field='genre', action_value='Pop', priority=1)
+    first = rule_engine.compile_rule(rule)
+    assert rule_engine.compile_rule(rule) is first
+    rule.condition_value = 'y'
+    assert rule_engine.compile_rule(rule) is not first
+
+
+def test_smart_rule_apply_rule_matches_engine():
+    rule = rule_engine.SmartRule(id=8, name='r', condition_field='title', condition_operator='starts_with',
+                                 condition_value='اغنيه', action_type='replace', action_field='title',
+                                 action_value='Song', priority=1, is_active=True)
+    tags, applied = rule.apply_rule({'title': 'أغنية جديدة'})
+    assert applied
+    assert tags['title'] == 'Song جديدة'
+    tags, applied = rule.apply_rule({'title': 'other'})
+    assert not applied
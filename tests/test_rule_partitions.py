@@ -0,0 +1,100 @@
+"""اختبارات أقسام القواعد الذكية لكل مستخدم: مشاركة القواعد العامة وإخراج الأقسام الأقدم ومفاتيح التخزين المؤقت"""
+
+import pytest
+
+from config import Config
+from main import app
+from models import db, SmartRule, SmartRuleStat
+import rule_engine
+
+
+def add_rule(name, creator_id, scope, value, action_value):
+    with app.app_context():
+        rule = SmartRule(
+            name=name, condition_field='artist', condition_operator='contains', condition_value=value,
+            action_type='set', action_field='genre', action_value=action_value,
+            creator_id=creator_id, scope=scope
+        )
+        db.session.add(rule)
+        db.session.commit()
+        return rule.id
+
+
+@pytest.fixture(autouse=True)
+def clean_rules():
+    with app.app_context():
+        db.create_all()
+        SmartRuleStat.query.delete()
+        SmartRule.query.delete()
+        db.session.commit()
+    rule_engine.invalidate(local_only=True)
+    yield
+    rule_engine.invalidate(local_only=True)
+    with rule_engine._lock:
+        rule_engine._user_sets.clear()
+        rule_engine._pending_stats.clear()
+
+
+def test_user_without_rules_shares_global_set():
+    add_rule('global', 1, 'global', 'a', 'Pop')
+    global_set = rule_engine.get_rule_set()
+    assert rule_engine.get_rule_set(42) is global_set
+    assert rule_engine.get_cache_key(42) == rule_engine.get_cache_key()
+    assert rule_engine.get_cache_key(42).endswith(':global')
+
+
+def test_user_rules_apply_only_to_their_creator():
+    add_rule('global', 1, 'global', 'a', 'Pop')
+    add_rule('private', 7, 'user', 'b', 'Rock')
+
+    assert [rule.name for rule in rule_engine.get_rule_set().rules] == ['global']
+    user_set = rule_engine.get_rule_set(7)
+    assert sorted(rule.name for rule in user_set.rules) == ['global', 'private']
+    # القسم محفوظ ويعاد استخدامه في الطلب التالي
+    assert rule_engine.get_rule_set(7) is user_set
+
+    tags, applied = rule_engine.evaluate({'artist': 'b'}, user_id=7)
+    assert tags['genre'] == 'Rock' and applied == ['private']
+    tags, applied = rule_engine.evaluate({'artist': 'b'}, user_id=8)
+    assert 'genre' not in tags and applied == []
+
+    assert rule_engine.get_cache_key(7).endswith(':7')
+    assert rule_engine.get_cache_key(7) != rule_engine.get_cache_key(8)
+
+
+def test_least_recently_used_partition_is_evicted(monkeypatch):
+    monkeypatch.setattr(Config, 'SMART_RULES_USER_PARTITIONS', 2)
+    for user_id in (1, 2, 3):
+        add_rule(f'user {user_id}', user_id, 'user', 'x', str(user_id))
+
+    first = rule_engine.get_rule_set(1)
+    rule_engine.get_rule_set(2)
+    # استخدام القسم 1 مجدداً يجعل القسم 2 هو الأقدم
+    assert rule_engine.get_rule_set(1) is first
+    rule_engine.get_rule_set(3)
+    assert list(rule_engine._user_sets) == [1, 3]
+    assert rule_engine.get_rule_set(1) is first
+
+
+def test_evicted_partition_keeps_pending_stats(monkeypatch):
+    monkeypatch.setattr(Config, 'SMART_RULES_USER_PARTITIONS', 1)
+    rule_id = add_rule('private', 1, 'user', 'x', 'Rock')
+    add_rule('other', 2, 'user', 'x', 'Jazz')
+
+    rule_engine.evaluate({'artist': 'x'}, user_id=1)
+    rule_engine.get_rule_set(2)
+    assert 1 not in rule_engine._user_sets
+    assert rule_engine._pending_stats[rule_id]['matches'] == 1
+    assert rule_engine._pending_stats[rule_id]['actions_applied'] == 1
+
+
+def test_invalidate_rebuilds_partitions():
+    add_rule('private', 7, 'user', 'b', 'Rock')
+    old_set = rule_engine.get_rule_set(7)
+    add_rule('second', 7, 'user', 'c', 'Jazz')
+    assert rule_engine.get_rule_set(7) is old_set
+
+    rule_engine.invalidate(local_only=True)
+    new_set = rule_engine.get_rule_set(7)
+    assert new_set is not old_set
+    assert sorted(rule.name for rule in new_set.rules) == ['private', 'second']
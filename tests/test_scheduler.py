@@ -0,0 +1,112 @@
+"""اختبارات جدولة المهام: ترتيب الكومة والإلغاء والتشغيل الفوري وسياسات التشغيلات الفائتة"""
+
+import time
+
+import pytest
+
+import scheduler
+
+
+@pytest.fixture(autouse=True)
+def clean_scheduler(monkeypatch):
+    monkeypatch.setattr(scheduler, '_heap', [])
+    monkeypatch.setattr(scheduler, '_jobs', {})
+    monkeypatch.setattr(scheduler, '_last_runs', {})
+    monkeypatch.setattr(scheduler, '_cancelled_count', 0)
+
+
+def noop(bot):
+    pass
+
+
+def pop_order():
+    order = []
+    while scheduler._heap:
+        entry = scheduler.heapq.heappop(scheduler._heap)
+        if not entry[2].cancelled:
+            order.append(entry[2].name)
+    return order
+
+
+def test_heap_orders_jobs_by_run_time():
+    now = time.time()
+    scheduler.add_job('late', noop, run_at=now + 30)
+    scheduler.add_job('early', noop, run_at=now + 10)
+    scheduler.add_job('middle', noop, run_at=now + 20)
+    assert [job['name'] for job in scheduler.get_jobs()] == ['early', 'middle', 'late']
+    assert pop_order() == ['early', 'middle', 'late']
+
+
+def test_cancel_marks_job_and_compacts_heap():
+    now = time.time()
+    for i in range(4):
+        scheduler.add_job(f"job{i}", noop, run_at=now + i)
+    assert scheduler.cancel_job('job0')
+    assert not scheduler.cancel_job('missing')
+    assert len(scheduler._heap) == 4
+    assert scheduler.cancel_job('job1')
+    assert scheduler.cancel_job('job2')
+    # تجاوز نسبة الإلغاء يحذف المهام الملغاة من الكومة
+    assert len(scheduler._heap) == 1
+    assert scheduler._cancelled_count == 0
+    assert pop_order() == ['job3']
+
+
+def test_add_job_replaces_existing_job_with_same_name():
+    now = time.time()
+    scheduler.add_job('job', noop, run_at=now + 100)
+    scheduler.add_job('job', noop, run_at=now + 5)
+    assert [job['next_run'] for job in scheduler.get_jobs()] == [now + 5]
+    assert pop_order() == ['job']
+
+
+def test_run_now_moves_job_to_front_and_keeps_stats():
+    now = time.time()
+    scheduler.add_job('first', noop, run_at=now + 10)
+    job = scheduler.add_job('report', noop, interval=3600)
+    job.runs = 4
+    assert scheduler.run_now('report')
+    assert not scheduler.run_now('missing')
+
+    jobs = scheduler.get_jobs()
+    assert jobs[0]['name'] == 'report'
+    assert jobs[0]['next_run'] <= time.time()
+    assert jobs[0]['runs'] == 4
+    assert pop_order() == ['report', 'first']
+
+
+def test_periodic_job_is_aligned_and_detects_missed_runs():
+    job = scheduler.Job('hourly', noop, 0, interval=3600, offset=60)
+    assert job.next_after(7200) == 7260
+    assert job.next_after(7260) == 10860
+
+    # مواعيد 60 و3660 و7260 و10860 حلت أثناء التوقف: تشغيل واحد وثلاثة فائتة
+    job.run_at = job.next_after(0)
+    assert scheduler._due(job, 3 * 3600 + 100)
+    assert job.missed == 3
+    assert job.run_at == 3 * 3600 + 60 + 3600
+
+
+def test_run_all_policy_catches_up_one_interval_at_a_time():
+    job = scheduler.Job('hourly', noop, 3600, interval=3600, misfire=scheduler.MISFIRE_RUN_ALL)
+    assert scheduler._due(job, 3 * 3600 + 10)
+    assert job.run_at == 7200
+    assert job.missed == 0
+
+
+def test_skip_policy_skips_late_runs():
+    job = scheduler.Job('daily', noop, 1000, interval=86400, misfire=scheduler.MISFIRE_SKIP, grace=60)
+    assert scheduler._due(job, 1030)
+    assert not scheduler._due(job, job.run_at + 120)
+    assert job.missed == 1
+
+
+def test_execute_records_result():
+    def fail(bot):
+        raise ValueError('boom')
+
+    job = scheduler.Job('failing', fail, 0)
+    scheduler._execute(job)
+    assert job.last_status == 'failed'
+    assert job.last_error == 'boom'
+    assert job.runs == 1
@@ -0,0 +1,103 @@
+"""اختبارات السلاسل الزمنية للإحصائيات: حلقات الخانات والتجميع في الدقات والحفظ والتحميل"""
+
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import stats_timeseries
+from stats_timeseries import _Ring
+
+# بداية يوم كامل حتى تقع الساعات في اليوم نفسه
+DAY = 20000 * 86400
+
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    now = SimpleNamespace(value=DAY + 10 * 3600 + 1800)
+    monkeypatch.setattr(stats_timeseries, 'time', SimpleNamespace(time=lambda: now.value, sleep=time.sleep))
+    monkeypatch.setattr(stats_timeseries, '_rings', {
+        name: _Ring(seconds, size) for name, (seconds, size) in stats_timeseries.RESOLUTIONS.items()
+    })
+    monkeypatch.setattr(stats_timeseries, 'TIMESERIES_FILE', str(tmp_path / 'timeseries.json'))
+    monkeypatch.setattr(stats_timeseries, '_loaded', True)
+    monkeypatch.setattr(stats_timeseries, '_dirty', False)
+    # عدم تشغيل خيط الحفظ في الخلفية أثناء الاختبارات
+    monkeypatch.setattr(stats_timeseries, '_flusher', object())
+    return now
+
+
+def test_ring_reuses_slot_from_previous_cycle():
+    ring = _Ring(60, 3)
+    ring.add(0, 1, 100, 0, 0.5)
+    ring.add(30, 1, 100, 1, 0.5)
+    assert ring.series(59, 1)[0] == {'time': 0, 'files': 2, 'bytes': 200, 'failures': 1, 'latency_sum': 1.0}
+
+    # الخانة 3 تقع في مكان الخانة 0 نفسه فتبدأ من الصفر
+    ring.add(180, 1, 10, 0, 0.1)
+    series = ring.series(180, 3)
+    assert [point['time'] for point in series] == [60, 120, 180]
+    assert [point['files'] for point in series] == [0, 0, 1]
+
+
+def test_ring_ignores_times_older_than_its_range():
+    ring = _Ring(60, 3)
+    ring.add(180, 1, 0, 0, 0.0)
+    ring.add(0, 5, 0, 0, 0.0)
+    assert ring.slots[0][1] == 1
+
+
+def test_series_count_is_capped_to_ring_size():
+    ring = _Ring(60, 3)
+    assert len(ring.series(600, 100)) == 3
+
+
+def test_record_updates_every_resolution(clock):
+    stats_timeseries.record(True, 1000, 2.0)
+    stats_timeseries.record(False, 500, 1.0, timestamp=clock.value - 60)
+
+    minute = stats_timeseries.get_series('minute', 2)
+    assert [point['files'] for point in minute] == [1, 1]
+    assert minute[0]['failures'] == 1
+
+    summary = stats_timeseries.get_summary('hour', 1)
+    assert summary['files'] == 2
+    assert summary['bytes'] == 1500
+    assert summary['failures'] == 1
+    assert summary['avg_latency'] == 1.5
+    assert stats_timeseries.get_summary('day', 1)['files'] == 2
+    assert stats_timeseries.get_series('week') == []
+
+
+def test_daily_report_finds_peak_hour(clock):
+    for _ in range(3):
+        stats_timeseries.record(True, 10, 1.0, timestamp=DAY + 5 * 3600)
+    stats_timeseries.record(False, 10, 3.0, timestamp=DAY + 8 * 3600)
+    clock.value = DAY + 86400 + 60
+
+    report = stats_timeseries.get_daily_report(1)
+    assert report['day_start'] == DAY
+    assert report['files'] == 4
+    assert report['failures'] == 1
+    assert report['avg_latency'] == 1.5
+    assert report['peak_hour'] == DAY + 5 * 3600
+    assert report['peak_hour_files'] == 3
+
+    today = stats_timeseries.get_daily_report(0)
+    assert today['files'] == 0 and today['peak_hour'] is None
+
+
+def test_flush_writes_only_non_empty_slots_and_loads_them_back(clock, monkeypatch):
+    stats_timeseries.record(True, 10, 1.0)
+    assert stats_timeseries.flush()
+
+    with open(stats_timeseries.TIMESERIES_FILE, encoding='utf-8') as f:
+        data = json.load(f)
+    assert {name: len(slots) for name, slots in data.items()} == {'minute': 1, 'hour': 1, 'day': 1}
+
+    monkeypatch.setattr(stats_timeseries, '_rings', {
+        name: _Ring(seconds, size) for name, (seconds, size) in stats_timeseries.RESOLUTIONS.items()
+    })
+    monkeypatch.setattr(stats_timeseries, '_loaded', False)
+    assert stats_timeseries.get_summary('minute', 1)['files'] == 1
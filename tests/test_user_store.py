@@ -0,0 +1,44 @@
+"""اختبارات سجل المستخدمين: الإنشاء والعدادات التراكمية"""
+
+import pytest
+
+from main import app
+from models import db, User
+import user_store
+
+
+@pytest.fixture(autouse=True)
+def clean_users():
+    with app.app_context():
+        db.create_all()
+        User.query.delete()
+        db.session.commit()
+    yield
+
+
+def total_size(user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).total_file_size_mb
+
+
+def test_touch_user_creates_then_increments():
+    user, created = user_store.touch_user(5_000_000_000, 'name', 'First', file_size_mb=3.0)
+    assert created
+    assert user['files_processed'] == 0
+    assert total_size(5_000_000_000) == 3.0
+
+    user, created = user_store.touch_user(5_000_000_000, files_processed=1)
+    assert not created
+    assert user['files_processed'] == 1
+    assert total_size(5_000_000_000) == 3.0
+    # الاسم لا يمحى عند تحديث بدون بيانات المستخدم
+    assert user['username'] == 'name'
+
+
+def test_download_without_save_is_not_counted_as_processed():
+    user_store.touch_user(7, file_size_mb=2.0)
+    user_store.touch_user(7, file_size_mb=1.0)
+    user, _ = user_store.touch_user(7, files_processed=1)
+    assert user['files_processed'] == 1
+    assert total_size(7) == 3.0
+    assert user_store.sum_files_processed() == 1
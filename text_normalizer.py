@@ -0,0 +1,109 @@
+"""
+وحدة توحيد النصوص العربية للمطابقة
+- إنتاج مفتاح مطابقة موحد للنص: أحرف صغيرة، توحيد أشكال الألف والتاء المربوطة والألف المقصورة،
+  حذف التشكيل والتطويل وعلامات الاتجاه والمحارف غير المرئية، وتوحيد الأرقام والمسافات
+- تخزين المفاتيح المحسوبة (LRU) حسب النص الأصلي حتى لا يعاد حسابها لكل قاعدة أو قالب
+- ترجمة نص إلى تعبير نمطي يطابق مكافئاته في النص الأصلي (للاستبدال بعد المطابقة على المفاتيح الموحدة)
+"""
+
+import re
+from functools import lru_cache
+
+from config import Config
+
+# توحيد الأحرف: {المحرف: البديل} (None للحذف)
+_CHAR_MAP = {
+    # أشكال الألف
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    # التاء المربوطة والألف المقصورة
+    'ة': 'ه', 'ى': 'ي',
+    # التطويل
+    '\u0640': None,
+    # علامات الاتجاه والمحارف غير المرئية (ZWSP, ZWNJ, ZWJ, LRM, RLM, تضمين/تجاوز/عزل الاتجاه، BOM)
+    '\u200b': None, '\u200c': None, '\u200d': None, '\u200e': None, '\u200f': None,
+    '\u202a': None, '\u202b': None, '\u202c': None, '\u202d': None, '\u202e': None,
+    '\u2066': None, '\u2067': None, '\u2068': None, '\u2069': None, '\ufeff': None,
+}
+# التشكيل (الفتحة إلى السكون والعلامات الإضافية) والألف الخنجرية
+_CHAR_MAP.update({chr(code): None for code in range(0x064B, 0x0660)})
+_CHAR_MAP['\u0670'] = None
+# الأرقام العربية الهندية والفارسية إلى أرقام لاتينية
+_CHAR_MAP.update({chr(0x0660 + digit): str(digit) for digit in range(10)})
+_CHAR_MAP.update({chr(0x06F0 + digit): str(digit) for digit in range(10)})
+
+_TRANSLATION = str.maketrans(_CHAR_MAP)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_chars(text: str) -> str:
+    """
+    توحيد الأحرف العربية وحذف التشكيل والعلامات غير المرئية فقط (دون تغيير حالة الأحرف أو المسافات)
+
+    تستخدم للأنماط التي يجب ألا تتغير بنيتها مثل التعبيرات النمطية.
+
+    Args:
+        text: النص الأصلي
+
+    Returns:
+        str: النص بعد توحيد الأحرف
+    """
+    return text.translate(_TRANSLATION)
+
+
+@lru_cache(maxsize=Config.TEXT_NORMALIZER_CACHE_SIZE)
+def normalize(text: str) -> str:
+    """
+    إنتاج مفتاح المطابقة الموحد للنص
+
+    Args:
+        text: النص الأصلي
+
+    Returns:
+        str: مفتاح المطابقة (أحرف صغيرة، أحرف عربية موحدة، مسافات مفردة)
+    """
+    return _WHITESPACE.sub(' ', text.casefold().translate(_TRANSLATION)).strip()
+
+
+def matches_any_direction(first: str, second: str) -> bool:
+    """
+    التحقق مما إذا كان أحد النصين موجوداً داخل الآخر بعد التوحيد (مثل مطابقة اسم الفنان)
+
+    Returns:
+        bool: نتيجة المطابقة
+    """
+    first_key = normalize(first)
+    second_key = normalize(second)
+    return first_key in second_key or second_key in first_key
+
+
+# المحارف المكافئة لكل حرف بعد التوحيد: {الحرف الموحد: المحارف الأصلية}، والمحارف المحذوفة عند التوحيد
+_EQUIVALENTS = {}
+for _char, _replacement in _CHAR_MAP.items():
+    if _replacement is not None:
+        _EQUIVALENTS.setdefault(_replacement, set()).add(_char)
+_IGNORED = '[' + ''.join(re.escape(char) for char, replacement in _CHAR_MAP.items() if replacement is None) + ']*'
+
+
+@lru_cache(maxsize=Config.TEXT_NORMALIZER_CACHE_SIZE)
+def compile_equivalent(text: str) -> "re.Pattern":
+    """
+    ترجمة تعبير نمطي يطابق داخل النص الأصلي كل مقطع يساوي مفتاحه الموحد مفتاح text
+
+    يستخدم لاستبدال النص في القيمة الأصلية بعد أن تمت المطابقة على المفاتيح الموحدة
+    (مثل استبدال "احمد" داخل "أحمَد" مع الحفاظ على بقية النص كما هو).
+
+    Args:
+        text: النص المطلوب البحث عنه
+
+    Returns:
+        re.Pattern: التعبير المترجم (بدون حساسية لحالة الأحرف)
+    """
+    parts = []
+    for char in normalize(text):
+        if char == ' ':
+            parts.append(r'\s+')
+        else:
+            chars = {char} | _EQUIVALENTS.get(char, set())
+            parts.append('[' + ''.join(re.escape(item) for item in sorted(chars)) + ']' if len(chars) > 1 else re.escape(char))
+    return re.compile(_IGNORED.join(parts), re.IGNORECASE)
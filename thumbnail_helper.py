@@ -1,5 +1,12 @@
 import logging
 import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from collections import OrderedDict
+from PIL import Image
+from config import Config
 from mutagen.id3 import ID3
 from mutagen.flac import FLAC
 from mutagen.mp4 import MP4
@@ -116,4 +123,90 @@ def extract_album_art_as_bytes(file_path):
     
     except Exception as e:
         logger.error(f"خطأ في استخراج صورة الألبوم: {e}")
-        return None
\ No newline at end of file
+        return None
+# الصور المصغرة الجاهزة لتيليجرام مخزنة حسب بصمة صورة الغلاف (لتجنب إعادة فك نفس الغلاف)
+THUMBNAIL_CACHE_SIZE = 64
+_thumbnail_cache = OrderedDict()
+_thumbnail_lock = threading.Lock()
+
+def build_telegram_thumbnail(image_data, size=512):
+    """
+    تحويل صورة الألبوم إلى صورة مصغرة مربعة مناسبة لتيليجرام
+    
+    Args:
+        image_data: بيانات صورة الألبوم
+        size: طول ضلع الصورة المصغرة بالبكسل
+        
+    Returns:
+        bytes: بيانات الصورة المصغرة بصيغة JPEG، أو الصورة الأصلية في حالة الخطأ
+    """
+    try:
+        img = Image.open(BytesIO(image_data))
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        
+        # الحصول على مربع من وسط الصورة للحفاظ على التناسب
+        width, height = img.size
+        min_dim = min(width, height)
+        left = (width - min_dim) // 2
+        top = (height - min_dim) // 2
+        img = img.crop((left, top, left + min_dim, top + min_dim))
+        
+        # تغيير الحجم للحصول على أفضل نتيجة في تيليجرام
+        img = img.resize((size, size), Image.Resampling.LANCZOS)
+        
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=100, optimize=True)
+        logger.info(f"تم تحسين الصورة المصغرة بأبعاد {size}×{size} بكسل")
+        return output.getvalue()
+    except Exception as e:
+        logger.error(f"خطأ في معالجة الصورة المصغرة: {e}")
+        return image_data
+
+def get_telegram_thumbnail(image_data, size=512):
+    """
+    الحصول على الصورة المصغرة لصورة ألبوم مع إعادة استخدام النتائج السابقة لنفس الغلاف
+    
+    Args:
+        image_data: بيانات صورة الألبوم
+        size: طول ضلع الصورة المصغرة بالبكسل
+        
+    Returns:
+        bytes: بيانات الصورة المصغرة أو None إذا لم تكن هناك صورة
+    """
+    if not image_data:
+        return None
+    
+    key = (hashlib.sha1(image_data).hexdigest(), size)
+    with _thumbnail_lock:
+        thumbnail = _thumbnail_cache.get(key)
+        if thumbnail is not None:
+            _thumbnail_cache.move_to_end(key)
+            return thumbnail
+    
+    thumbnail = build_telegram_thumbnail(image_data, size)
+    with _thumbnail_lock:
+        _thumbnail_cache[key] = thumbnail
+        while len(_thumbnail_cache) > THUMBNAIL_CACHE_SIZE:
+            _thumbnail_cache.popitem(last=False)
+    return thumbnail
+
+# عمال تجهيز الصور المصغرة بالتوازي مع كتابة الوسوم
+_thumbnail_executor = None
+
+def submit_thumbnail_task(fn, *args, **kwargs):
+    """
+    تنفيذ مهمة تجهيز صورة مصغرة في الخلفية
+    
+    Args:
+        fn: الدالة المطلوب تنفيذها
+        *args, **kwargs: معاملات الدالة
+        
+    Returns:
+        Future: نتيجة المهمة
+    """
+    global _thumbnail_executor
+    with _thumbnail_lock:
+        if _thumbnail_executor is None:
+            _thumbnail_executor = ThreadPoolExecutor(max_workers=Config.THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+    return _thumbnail_executor.submit(fn, *args, **kwargs)
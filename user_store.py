@@ -0,0 +1,381 @@
+"""
+وحدة تخزين بيانات المستخدمين للوحة الإدارة في قاعدة البيانات (جدول User)
+- تحديث تدريجي لسجل المستخدم عند كل استخدام بدلاً من إعادة كتابة جميع المستخدمين
+- استعلامات المستخدمين النشطين والأكثر نشاطاً عبر فهارس last_activity و files_processed
+- ترحيل المستخدمين المحفوظين سابقاً في admin_data.json
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User
+from main import app
+
+# إعداد التسجيل
+logger = logging.getLogger('user_store')
+
+
+def _to_timestamp(value: Optional[datetime]) -> float:
+    """تحويل وقت UTC المخزن إلى طابع زمني"""
+    if value is None:
+        return 0
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _from_timestamp(value: Optional[float]) -> Optional[datetime]:
+    """تحويل طابع زمني إلى وقت UTC للتخزين"""
+    if not value:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+
+def _to_dict(user: User) -> Dict:
+    """تحويل سجل المستخدم إلى نفس شكل بيانات المستخدم السابق في admin_data"""
+    return {
+        'user_id': str(user.id),
+        'username': user.username or "",
+        'first_name': user.first_name or "",
+        'last_seen': _to_timestamp(user.last_activity),
+        'first_seen': _to_timestamp(user.created_at),
+        'files_processed': user.files_processed or 0,
+        'daily_usage': user.daily_usage_mb or 0,
+        'daily_reset': _to_timestamp(user.daily_reset_at)
+    }
+
+
+def touch_user(user_id: int, username: str = None, first_name: str = None,
+               files_processed: int = 0, file_size_mb: float = 0) -> Tuple[Optional[Dict], bool]:
+    """
+    إنشاء أو تحديث سجل المستخدم (آخر ظهور، عدد الملفات، إجمالي حجم البيانات)
+
+    الاستخدام اليومي تديره وحدة quota وتحفظه عبر save_daily_usage.
+
+    Args:
+        user_id: معرف المستخدم
+        username: اسم المستخدم
+        first_name: الاسم الأول
+        files_processed: عدد الملفات المضافة
+        file_size_mb: حجم البيانات المضافة إلى الإجمالي
+
+    Returns:
+        tuple: (بيانات المستخدم، هل المستخدم جديد)
+    """
+    for attempt in range(2):
+        try:
+            with app.app_context():
+                now = datetime.utcnow()
+                # الزيادة تحسب داخل قاعدة البيانات حتى لا تضيع الإضافات المتزامنة من خيوط أخرى
+                values = {
+                    'last_activity': now,
+                    # المستخدم عاد لاستخدام البوت بعد حظره
+                    'bot_blocked_at': None,
+                    'files_processed': db.func.coalesce(User.files_processed, 0) + files_processed,
+                    'total_file_size_mb': db.func.coalesce(User.total_file_size_mb, 0) + file_size_mb
+                }
+                if username:
+                    values['username'] = username
+                if first_name:
+                    values['first_name'] = first_name
+                result = db.session.execute(db.update(User).where(User.id == user_id).values(**values))
+                created = result.rowcount == 0
+                if created:
+                    db.session.add(User(id=user_id, username=username, first_name=first_name,
+                                        created_at=now, last_activity=now,
+                                        files_processed=files_processed, total_file_size_mb=file_size_mb,
+                                        daily_usage_mb=0.0, daily_reset_at=now))
+                db.session.commit()
+                user = User.query.get(user_id)
+                return _to_dict(user), created
+        except IntegrityError:
+            # تم إنشاء المستخدم من خيط آخر في نفس اللحظة، إعادة المحاولة كتحديث
+            with app.app_context():
+                db.session.rollback()
+        except Exception as e:
+            logger.error(f"خطأ في تحديث بيانات المستخدم {user_id}: {e}")
+            with app.app_context():
+                db.session.rollback()
+            return None, False
+    return None, False
+
+
+def get_user(user_id: int) -> Optional[Dict]:
+    """
+    الحصول على بيانات مستخدم
+
+    Returns:
+        dict: بيانات المستخدم، أو None إذا لم يكن موجوداً
+    """
+    try:
+        with app.app_context():
+            user = User.query.get(user_id)
+            return _to_dict(user) if user else None
+    except Exception as e:
+        logger.error(f"خطأ في قراءة بيانات المستخدم {user_id}: {e}")
+        return None
+
+
+def get_daily_usage(user_id: int, day_start: datetime) -> Optional[float]:
+    """
+    الحصول على الاستخدام اليومي المحفوظ للمستخدم
+
+    Args:
+        user_id: معرف المستخدم
+        day_start: بداية اليوم الحالي (الاستخدام المحفوظ قبلها لا يحتسب)
+
+    Returns:
+        float: الاستخدام اليومي بالميجابايت، أو None إذا لم يكن المستخدم موجوداً
+    """
+    try:
+        with app.app_context():
+            user = User.query.get(user_id)
+            if user is None:
+                return None
+            if user.daily_reset_at is None or user.daily_reset_at < day_start:
+                return 0
+            return user.daily_usage_mb or 0
+    except Exception as e:
+        logger.error(f"خطأ في قراءة الاستخدام اليومي للمستخدم {user_id}: {e}")
+        return None
+
+
+def save_daily_usage(usages: Dict[int, Tuple[float, datetime]]) -> bool:
+    """
+    حفظ الاستخدام اليومي لعدة مستخدمين دفعة واحدة
+
+    Args:
+        usages: {معرف المستخدم: (الاستخدام بالميجابايت، بداية اليوم)}
+
+    Returns:
+        bool: نتيجة العملية
+    """
+    try:
+        with app.app_context():
+            db.session.bulk_update_mappings(User, [
+                {'id': user_id, 'daily_usage_mb': usage, 'daily_reset_at': day_start}
+                for user_id, (usage, day_start) in usages.items()
+            ])
+            db.session.commit()
+        return True
+    except Exception as e:
+        logger.error(f"خطأ في حفظ الاستخدام اليومي: {e}")
+        with app.app_context():
+            db.session.rollback()
+        return False
+
+
+def reset_daily_usage(user_id: int = None) -> bool:
+    """
+    إعادة تعيين الاستخدام اليومي لمستخدم محدد أو لجميع المستخدمين
+
+    Returns:
+        bool: نتيجة العملية (False إذا لم يكن المستخدم المحدد موجوداً)
+    """
+    try:
+        with app.app_context():
+            query = User.query
+            if user_id:
+                query = query.filter_by(id=user_id)
+            updated = query.update({User.daily_usage_mb: 0.0, User.daily_reset_at: datetime.utcnow()},
+                                   synchronize_session=False)
+            db.session.commit()
+            return bool(updated) or not user_id
+    except Exception as e:
+        logger.error(f"خطأ في إعادة تعيين الاستخدام اليومي: {e}")
+        with app.app_context():
+            db.session.rollback()
+        return False
+
+
+def count_users() -> int:
+    """عدد المستخدمين المسجلين"""
+    try:
+        with app.app_context():
+            return User.query.count()
+    except Exception as e:
+        logger.error(f"خطأ في عد المستخدمين: {e}")
+        return 0
+
+
+def count_active_users(days: int = 7) -> int:
+    """عدد المستخدمين النشطين في الأيام الأخيرة (عبر فهرس last_activity)"""
+    try:
+        with app.app_context():
+            cutoff = datetime.utcnow() - timedelta(days=days)
+            return User.query.filter(User.last_activity >= cutoff).count()
+    except Exception as e:
+        logger.error(f"خطأ في عد المستخدمين النشطين: {e}")
+        return 0
+
+
+def sum_files_processed() -> int:
+    """إجمالي الملفات المعالجة لجميع المستخدمين"""
+    try:
+        with app.app_context():
+            return db.session.query(db.func.coalesce(db.func.sum(User.files_processed), 0)).scalar() or 0
+    except Exception as e:
+        logger.error(f"خطأ في حساب إجمالي الملفات المعالجة: {e}")
+        return 0
+
+
+def get_active_users(days: int = 7, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+    """
+    الحصول على المستخدمين النشطين في الأيام الأخيرة مرتبين حسب آخر ظهور (عبر فهرس last_activity)
+
+    Args:
+        days: عدد الأيام
+        limit: الحد الأقصى لعدد النتائج (None للجميع)
+        offset: عدد النتائج التي يتم تخطيها (للتصفح)
+
+    Returns:
+        list: بيانات المستخدمين
+    """
+    try:
+        with app.app_context():
+            cutoff = datetime.utcnow() - timedelta(days=days)
+            query = User.query.filter(User.last_activity >= cutoff).order_by(User.last_activity.desc())
+            if offset:
+                query = query.offset(offset)
+            if limit is not None:
+                query = query.limit(limit)
+            return [_to_dict(user) for user in query.all()]
+    except Exception as e:
+        logger.error(f"خطأ في الحصول على المستخدمين النشطين: {e}")
+        return []
+
+
+def get_top_users(limit: int = 10) -> List[Dict]:
+    """
+    الحصول على أكثر المستخدمين نشاطاً حسب عدد الملفات المعالجة (عبر فهرس files_processed)
+
+    Returns:
+        list: بيانات المستخدمين
+    """
+    try:
+        with app.app_context():
+            query = User.query.order_by(User.files_processed.desc()).limit(limit)
+            return [_to_dict(user) for user in query.all()]
+    except Exception as e:
+        logger.error(f"خطأ في الحصول على أكثر المستخدمين نشاطاً: {e}")
+        return []
+
+
+def get_user_ids_after(last_id: Optional[int], batch_size: int = 1000) -> List[int]:
+    """
+    دفعة من معرفات المستخدمين الذين يمكن مراسلتهم (لم يحظروا البوت) بعد معرف معين بترتيب تصاعدي
+
+    Args:
+        last_id: آخر معرف في الدفعة السابقة (None للبداية)
+        batch_size: حجم الدفعة
+
+    Returns:
+        list: معرفات المستخدمين
+    """
+    with app.app_context():
+        query = db.session.query(User.id).filter(User.bot_blocked_at.is_(None)).order_by(User.id)
+        if last_id is not None:
+            query = query.filter(User.id > last_id)
+        return [user_id for (user_id,) in query.limit(batch_size).all()]
+
+
+def iter_user_ids(batch_size: int = 1000) -> Iterator[int]:
+    """
+    المرور على معرفات المستخدمين على دفعات (للرسائل الجماعية) دون تحميل السجلات كاملة
+
+    Yields:
+        int: معرف المستخدم
+    """
+    last_id = None
+    while True:
+        batch = get_user_ids_after(last_id, batch_size)
+        if not batch:
+            return
+        yield from batch
+        last_id = batch[-1]
+
+
+def count_reachable_users() -> int:
+    """عدد المستخدمين الذين يمكن مراسلتهم (لم يحظروا البوت)"""
+    try:
+        with app.app_context():
+            return User.query.filter(User.bot_blocked_at.is_(None)).count()
+    except Exception as e:
+        logger.error(f"خطأ في عد المستخدمين: {e}")
+        return 0
+
+
+def mark_bot_blocked(user_ids: List[int]) -> int:
+    """
+    تحديد المستخدمين الذين حظروا البوت لاستبعادهم من البث الجماعي القادم
+
+    Returns:
+        int: عدد المستخدمين الذين تم تحديثهم
+    """
+    if not user_ids:
+        return 0
+    try:
+        with app.app_context():
+            updated = User.query.filter(User.id.in_(user_ids)).update(
+                {User.bot_blocked_at: datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            return updated
+    except Exception as e:
+        logger.error(f"خطأ في تحديد المستخدمين الذين حظروا البوت: {e}")
+        with app.app_context():
+            db.session.rollback()
+        return 0
+
+
+def export_users() -> Dict[str, Dict]:
+    """تصدير جميع المستخدمين بنفس شكل admin_data['users'] السابق"""
+    try:
+        with app.app_context():
+            return {str(user.id): _to_dict(user) for user in User.query.all()}
+    except Exception as e:
+        logger.error(f"خطأ في تصدير المستخدمين: {e}")
+        return {}
+
+
+def import_users(users: Dict[str, Dict]) -> int:
+    """
+    استيراد مستخدمين من بيانات admin_data['users'] (ترحيل البيانات السابقة أو استيراد نسخة احتياطية)
+
+    المستخدمون الموجودون مسبقاً يتم تحديثهم فقط إذا كانت بياناتهم المستوردة أحدث.
+
+    Args:
+        users: {معرف المستخدم: بيانات المستخدم}
+
+    Returns:
+        int: عدد المستخدمين الذين تم استيرادهم أو تحديثهم، أو None عند الفشل
+    """
+    imported = 0
+    try:
+        with app.app_context():
+            existing = {user.id: user for user in User.query.filter(
+                User.id.in_([int(user_id) for user_id in users])).all()} if users else {}
+            for user_id, data in users.items():
+                user_id = int(user_id)
+                last_seen = _from_timestamp(data.get('last_seen'))
+                user = existing.get(user_id)
+                if user is None:
+                    user = User(id=user_id, created_at=_from_timestamp(data.get('first_seen')) or last_seen)
+                    db.session.add(user)
+                elif user.last_activity and last_seen and user.last_activity >= last_seen:
+                    continue
+                user.username = data.get('username') or user.username
+                user.first_name = data.get('first_name') or user.first_name
+                user.last_activity = last_seen or user.last_activity
+                user.files_processed = data.get('files_processed', 0)
+                user.daily_usage_mb = data.get('daily_usage', 0)
+                user.daily_reset_at = _from_timestamp(data.get('daily_reset'))
+                imported += 1
+            db.session.commit()
+        logger.info(f"تم استيراد {imported} مستخدم إلى قاعدة البيانات")
+        return imported
+    except Exception as e:
+        logger.error(f"خطأ في استيراد المستخدمين: {e}")
+        with app.app_context():
+            db.session.rollback()
+        return None
@@ -14,6 +14,7 @@ from typing import List, Dict, Tuple, Optional, Any
 from datetime import datetime
 
 from models import db, User, UserTemplate
+from text_normalizer import normalize
 
 # إعداد التسجيل
 logger = logging.getLogger(__name__)
@@ -161,6 +162,48 @@ def get_user_template_by_name(user_id: int, template_name: str) -> Optional[Dict
         logger.error(f"خطأ في استرجاع قالب المستخدم حسب الاسم: {e}")
         return None
 
+def _filter_by_artist(query, filter_artist: str):
+    """
+    تصفية استعلام القوالب حسب اسم الفنان باستخدام اسم الفنان الموحد المخزن (artist_key)
+    
+    المطابقة تتم داخل قاعدة البيانات بـ LIKE على المفاتيح الموحدة بدلاً من ilike على الاسم الأصلي.
+    """
+    artist_key = normalize(filter_artist)
+    pattern = artist_key.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return query.filter(UserTemplate.artist_key.like(f"%{pattern}%", escape='\\'))
+
+def backfill_artist_keys(batch_size: int = 500) -> int:
+    """
+    حساب اسم الفنان الموحد للقوالب المحفوظة قبل إضافة عمود artist_key (يجب استدعاؤها داخل app.app_context())
+    
+    Args:
+        batch_size: عدد القوالب في كل دفعة
+        
+    Returns:
+        int: عدد القوالب التي تم تحديثها
+    """
+    updated = 0
+    try:
+        while True:
+            rows = (db.session.query(UserTemplate.id, UserTemplate.artist_name)
+                    .filter(UserTemplate.artist_key.is_(None))
+                    .limit(batch_size)
+                    .all())
+            if not rows:
+                break
+            db.session.bulk_update_mappings(UserTemplate, [
+                {'id': template_id, 'artist_key': normalize(artist_name or '')}
+                for template_id, artist_name in rows
+            ])
+            db.session.commit()
+            updated += len(rows)
+        if updated:
+            logger.info(f"تم حساب اسم الفنان الموحد لـ {updated} قالب")
+    except Exception as e:
+        logger.error(f"خطأ في حساب أسماء الفنانين الموحدة للقوالب: {e}")
+        db.session.rollback()
+    return updated
+
 def list_user_templates(user_id: int, filter_artist: str = None) -> List[Dict]:
     """
     استرجاع قائمة بجميع قوالب المستخدم المحدد
@@ -178,7 +221,7 @@ def list_user_templates(user_id: int, filter_artist: str = None) -> List[Dict]:
         
         # إضافة تصفية حسب الفنان إذا تم تحديده
         if filter_artist:
-            query = query.filter(UserTemplate.artist_name.ilike(f"%{filter_artist}%"))
+            query = _filter_by_artist(query, filter_artist)
             
         # تنفيذ الاستعلام
         templates = query.all()
@@ -493,7 +536,7 @@ def list_public_templates(filter_artist: str = None) -> List[Dict]:
         
         # إضافة تصفية حسب الفنان إذا تم تحديده
         if filter_artist:
-            query = query.filter(UserTemplate.artist_name.ilike(f"%{filter_artist}%"))
+            query = _filter_by_artist(query, filter_artist)
             
         # تنفيذ الاستعلام
         templates = query.all()